@@ -0,0 +1,16 @@
+# gunicorn.conf.py
+# gunicorn は起動ディレクトリの gunicorn.conf.py を自動で読み込む（同期・uvicornワーカーの両方に適用）。
+
+
+def post_worker_init(worker):
+    """
+    ワーカーがアプリケーションを読み込んだ直後にウォームアップし、デプロイ直後の最初のリクエストを速くする。
+    （post_fork の時点ではまだ Django の設定が読み込まれていないため、このフックを使う）
+    """
+    from language_archive.warmup import warm_up
+
+    for name, elapsed_ms, error in warm_up():
+        if error:
+            worker.log.warning("warmup %s failed after %.1f ms: %s", name, elapsed_ms, error)
+        else:
+            worker.log.info("warmup %s %.1f ms", name, elapsed_ms)
@@ -14,13 +14,18 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 import sys
-
-load_dotenv()
+import tempfile
+from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# .env の場所を明示して、ディレクトリ探索のコストを避ける（ファイルがなければ何もしない）
+load_dotenv(BASE_DIR / '.env')
+
+# 開発サーバー起動時のみ設定内容を表示する（ワーカーや管理コマンドの起動ごとには表示しない）
+VERBOSE_STARTUP = len(sys.argv) > 1 and sys.argv[1] == 'runserver'
+
 SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-change-this-in-production')
 
 DEBUG = os.environ.get('DEBUG', 'True') == 'True'
@@ -39,21 +44,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'language_archive.middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'language_archive.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'language_archive.middleware.ReadReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'kikai_archive_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates と同じ（描画の時間をトレースに記録する）
+        'BACKEND': 'language_archive.tracing.TracedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -68,19 +77,60 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'kikai_archive_project.wsgi.application'
+ASGI_APPLICATION = 'kikai_archive_project.asgi.application'
+
+# ASGIプロファイル（uvicorn）で動かす場合は True にして、読み取り系・アップロードのビューを非同期版に切り替える
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
 
 # Database
 DATABASE_URL = os.environ.get('DATABASE_URL')
+# 読み取り専用レプリカ（任意）。設定すると読み取り系ビューの参照先がレプリカになる
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+# 書き込み後、レプリカの遅延を避けてプライマリを読み続ける秒数（read-your-writes）
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', '10'))
+
+# 接続の再利用（秒）。psycopg3 のコネクションプールが使える場合はプールを優先する。
+# ASGI では永続接続がリクエスト間で使い回されないため（Django の推奨どおり）既定は 0 にし、再利用はプールで行う
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '0' if ASYNC_VIEWS else '600'))
+DB_POOL = os.environ.get('DB_POOL', 'True') == 'True'
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+
+
+def _database_config(url):
+    """接続URLからDATABASESの設定を作る（接続の再利用・ヘルスチェック・プール）"""
+    import dj_database_url
+    from importlib.util import find_spec
+
+    config = dj_database_url.parse(url, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=True)
+    if config['ENGINE'] != 'django.db.backends.postgresql':
+        return config
+    if DB_POOL and find_spec('psycopg') and find_spec('psycopg_pool'):
+        # psycopg3 のコネクションプール（CONN_MAX_AGE とは併用できない）。
+        # psycopg3 がない環境では psycopg2 + CONN_MAX_AGE による接続の再利用になる
+        config['CONN_MAX_AGE'] = 0
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': 10,
+        }
+    # Supabase のトランザクションプーラー（6543番ポート）ではサーバーサイドカーソルが使えない
+    if str(config.get('PORT')) == '6543':
+        config['DISABLE_SERVER_SIDE_CURSORS'] = True
+    return config
+
 
 if DATABASE_URL:
     # Supabase PostgreSQL
     try:
-        import dj_database_url
         DATABASES = {
-            'default': dj_database_url.parse(DATABASE_URL)
+            'default': _database_config(DATABASE_URL)
         }
+        if DATABASE_REPLICA_URL:
+            DATABASES['replica'] = _database_config(DATABASE_REPLICA_URL)
 #        DATABASES['default']['ENGINE'] = 'django_pg8000'
-        print(f"✅ Using Supabase PostgreSQL")
+        if VERBOSE_STARTUP:
+            print("✅ Using Supabase PostgreSQL")
     except ImportError:
         print("❌ dj_database_url not found")
         DATABASES = {
@@ -91,7 +141,8 @@ if DATABASE_URL:
         }
 else:
     # Development: SQLite
-    print("ℹ️  Using SQLite database")
+    if VERBOSE_STARTUP:
+        print("ℹ️  Using SQLite database")
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
@@ -99,8 +150,52 @@ else:
         }
     }
 
+# キャッシュ（管理画面のフィルター選択肢・データバージョンなど）。
+# 本番は全ワーカーで共有できるようDBキャッシュを使う（テーブルは build.sh の createcachetable で作成）
+if DATABASE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+if DATABASE_REPLICA_URL and 'replica' in DATABASES:
+    DATABASE_ROUTERS = ['language_archive.db_routers.ReadReplicaRouter']
+
+# 集落パッケージ（packages.py）を、ダウンロード要求を受けたワーカーの別スレッドで作成する。
+# 既定は False で、作成は build_village_packages コマンド（cron など）が行う（ワーカーの再起動で作成が中断されない）
+VILLAGE_PACKAGE_BUILD_IN_BACKGROUND = os.environ.get('VILLAGE_PACKAGE_BUILD_IN_BACKGROUND', 'False') == 'True'
+
+# 処理時間の記録（トレース）。'jsonl'（TRACING_FILE に追記）・'otlp'（TRACING_OTLP_ENDPOINT に送信）・
+# エクスポーターのクラスのパス、空なら無効（既定）。jsonl はファイルを切り替えないため、調査のあいだだけ有効にする
+TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', '')
+TRACING_FILE = os.environ.get('TRACING_FILE', str(BASE_DIR / 'traces.jsonl'))
+TRACING_OTLP_ENDPOINT = os.environ.get('TRACING_OTLP_ENDPOINT', 'http://localhost:4318')
+# 記録するリクエストの割合（0〜1）
+TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', '1.0'))
+
+# リクエストのサンプリングプロファイル（profiling.py）。署名付きヘッダー・スタッフの ?profile=1 で対象にする。
+# 無効（既定）。調査のあいだだけ PROFILING_ENABLED=True で有効にする
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+# この件数に1件のリクエストもプロファイルする（0 なら指定したリクエストだけ）
+PROFILING_SAMPLE_EVERY = int(os.environ.get('PROFILING_SAMPLE_EVERY', '0'))
+PROFILING_INTERVAL_MS = float(os.environ.get('PROFILING_INTERVAL_MS', '5'))
+# これより長いリクエストは、この秒数でサンプリングをやめる
+PROFILING_MAX_SECONDS = float(os.environ.get('PROFILING_MAX_SECONDS', '60'))
+# 残すプロファイルの件数（新しいものから）
+PROFILING_KEEP = int(os.environ.get('PROFILING_KEEP', '200'))
+# profiling_token コマンドで作る署名の有効期間（秒）
+PROFILING_TOKEN_MAX_AGE = int(os.environ.get('PROFILING_TOKEN_MAX_AGE', '3600'))
+
 # 本番環境チェック
-IS_PRODUCTION = "gunicorn" in sys.argv[0]
+IS_PRODUCTION = "gunicorn" in sys.argv[0] or "uvicorn" in sys.argv[0]
 if IS_PRODUCTION and not DATABASE_URL:
     print("FATAL ERROR: DATABASE_URL is not set in production!")
     sys.exit(1)
@@ -131,6 +226,18 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# ブラウザからの分割アップロード（chunked_upload.py）。受信中のファイルを置くディレクトリ・受け付ける最大サイズ・
+# 更新のないまま放置された受信中のアップロードを prune_chunked_uploads で消すまでの時間
+CHUNKED_UPLOAD_DIR = os.environ.get('CHUNKED_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'kikai_chunked_uploads'))
+CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', str(5 * 1024 ** 3)))
+CHUNKED_UPLOAD_EXPIRE_HOURS = int(os.environ.get('CHUNKED_UPLOAD_EXPIRE_HOURS', '48'))
+
+# 公開ページの静的書き出し（export_static）。既定の書き出し先・一覧ごとに書き出すページ数の上限（0 は無制限）・
+# 上限より深いページへのリンク先にする本サイトのURL（例: https://archive.example.com。空ならリンクはそのまま）
+STATIC_EXPORT_DIR = os.environ.get('STATIC_EXPORT_DIR', str(BASE_DIR / 'static_export'))
+STATIC_EXPORT_MAX_PAGES = int(os.environ.get('STATIC_EXPORT_MAX_PAGES', '100'))
+STATIC_EXPORT_ORIGIN = os.environ.get('STATIC_EXPORT_ORIGIN', '').rstrip('/')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -0,0 +1,13 @@
+# kikai_archive_project/test_settings.py
+# テスト用の設定（manage.py test の既定。pytest などほかの実行方法では DJANGO_SETTINGS_MODULE にこのモジュールを指定する）。
+# 2つ目のSQLiteをレプリカとして用意し、読み取りのルーティングをテストできるようにする
+# （ルーターはテスト側で override_settings により有効にする）。
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+if 'replica' not in DATABASES:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+    }
@@ -20,32 +20,54 @@ from django.contrib import admin
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from language_archive import views
+from language_archive import views, async_views
+
+# ASGIプロファイル（ASYNC_VIEWS=True）では読み取り系・アップロードのビューを非同期版に差し替える
+archive_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     # 管理画面
     path('admin/', admin.site.urls),
     
     # トップページ
-    path('', views.index, name='index'),
+    path('', archive_views.index, name='index'),
     
     # 地図
-    path('map/', views.map_view, name='map_view'),
+    path('map/', archive_views.map_view, name='map_view'),
     
     # 言語記録
-    path('records/', views.record_list, name='record_list'),
-    path('records/<int:record_id>/', views.record_detail, name='record_detail'),
-    path('records/upload/', views.upload_language_record, name='upload_language_record'),
+    path('records/', archive_views.record_list, name='record_list'),
+    path('records/<int:record_id>/', archive_views.record_detail, name='record_detail'),
+    path('records/upload/', archive_views.upload_language_record, name='upload_language_record'),
+    path('records/upload/batch/', views.upload_language_batch, name='upload_language_batch'),
+    path('api/uploads/', views.chunked_upload_start, name='chunked_upload_start'),
+    path('api/uploads/<str:upload_id>/', views.chunked_upload_detail, name='chunked_upload_detail'),
+    path('api/uploads/<str:upload_id>/finalize/', views.chunked_upload_finalize, name='chunked_upload_finalize'),
+    path('api/records/<int:record_id>/segments/', views.record_segments, name='record_segments'),
+    path('api/segments/search/', views.segment_search, name='segment_search'),
+    path('api/autocomplete/', views.autocomplete, name='autocomplete'),
+    path('api/nearby/', views.nearby, name='nearby'),
     
     # 地理環境データ
     path('geographic/', views.geographic_list, name='geographic_list'),
-    path('geographic/upload/', views.upload_geographic_record, name='upload_geographic_record'),
+    path('geographic/upload/', archive_views.upload_geographic_record, name='upload_geographic_record'),
     
     # 集落関連
-    path('village/<int:village_id>/records/', views.village_records, name='village_records'),
+    path('village/<int:village_id>/records/', archive_views.village_records, name='village_records'),
+    path('village/<int:village_id>/package/', views.village_package, name='village_package'),
+    
+    # 集計
+    path('analytics/', views.analytics, name='analytics'),
     
     # 話者関連
-    path('speaker/<int:speaker_id>/records/', views.speaker_records, name='speaker_records'),
+    path('speaker/<int:speaker_id>/records/', archive_views.speaker_records, name='speaker_records'),
+
+    # 端末向けの差分同期
+    path('api/sync/', views.sync_changes, name='sync_changes'),
+
+    # 読み取り専用API
+    path('api/v1/<str:resource>/', views.api_list, name='api_list'),
+    path('api/v1/<str:resource>/<int:pk>/', views.api_detail, name='api_detail'),
 ]
 # 開発環境でのメディアファイル配信
 if settings.DEBUG:
@@ -1,37 +1,46 @@
 # language_archive/admin.py
 
 from django.contrib import admin
-from .models import Village, Speaker, OnomatopoeiaType, LanguageRecord, GeographicRecord
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from .admin_utils import ArchiveModelAdmin, CachedRelatedFieldListFilter, cached_year_filter
+from .models import (Village, Speaker, OnomatopoeiaType, LanguageRecord, GeographicRecord, StorageDeletion,
+                     AudioFingerprintState, AudioMatch, BackfillProgress, RequestProfile)
 
 @admin.register(Village)
-class VillageAdmin(admin.ModelAdmin):
+class VillageAdmin(ArchiveModelAdmin):
     list_display = ['name', 'latitude', 'longitude']
     search_fields = ['name']
-    list_per_page = 20
+    autocomplete_source = 'village'
 
 
 @admin.register(Speaker)
-class SpeakerAdmin(admin.ModelAdmin):
+class SpeakerAdmin(ArchiveModelAdmin):
     list_display = ['speaker_id', 'age_range', 'gender', 'village', 'consent_video']
-    list_filter = ['gender', 'consent_video', 'village']
+    list_select_related = ['village']
+    list_filter = ['gender', 'consent_video', ('village', CachedRelatedFieldListFilter)]
     search_fields = ['speaker_id', 'age_range']
-    list_per_page = 20
+    autocomplete_source = 'speaker'
 
 
 @admin.register(OnomatopoeiaType)
-class OnomatopoeiaTypeAdmin(admin.ModelAdmin):
+class OnomatopoeiaTypeAdmin(ArchiveModelAdmin):
     list_display = ['type_code', 'type_name']
     search_fields = ['type_code', 'type_name']
-    list_per_page = 20
 
 
 @admin.register(LanguageRecord)
-class LanguageRecordAdmin(admin.ModelAdmin):
+class LanguageRecordAdmin(ArchiveModelAdmin):
     list_display = ['get_display_title', 'file_type', 'village', 'speaker', 'language_frequency', 'recorded_date']
-    list_filter = ['file_type', 'speaker__village', 'recorded_date', 'onomatopoeia_type', 'language_frequency']
+    list_select_related = ['village', 'speaker']
+    list_filter = [
+        'file_type',
+        ('village', CachedRelatedFieldListFilter),
+        cached_year_filter('recorded_date', '収録年'),
+        ('onomatopoeia_type', CachedRelatedFieldListFilter),
+        'language_frequency',
+    ]
     search_fields = ['onomatopoeia_text', 'meaning', 'title', 'description']
-    date_hierarchy = 'recorded_date'
-    list_per_page = 20
     readonly_fields = ['created_at', 'updated_at']
 
     autocomplete_fields = ['speaker', 'village', 'onomatopoeia_type']
@@ -80,24 +89,121 @@ class LanguageRecordAdmin(admin.ModelAdmin):
         # 編集時
         return self.FIELDSETS_BASE
 
-    def save_model(self, request, obj, form, change):
-        """
-        新規作成時・編集時ともに話者の集落を関連集落に自動設定
-        """
-        # 常に話者の集落に同期
-        if obj.speaker and obj.speaker.village:
-            obj.village = obj.speaker.village
-        super().save_model(request, obj, form, change)
-
 
 @admin.register(GeographicRecord)
-class GeographicRecordAdmin(admin.ModelAdmin):
+class GeographicRecordAdmin(ArchiveModelAdmin):
     list_display = ['title', 'content_type', 'village', 'captured_date']
-    list_filter = ['content_type', 'village', 'captured_date']
+    list_select_related = ['village']
+    list_filter = [
+        'content_type',
+        ('village', CachedRelatedFieldListFilter),
+        cached_year_filter('captured_date', '撮影年'),
+    ]
     search_fields = ['title', 'description']
-    date_hierarchy = 'captured_date'
-    list_per_page = 20
     readonly_fields = ['created_at']
     autocomplete_fields = ['village']
 
+
+@admin.register(StorageDeletion)
+class StorageDeletionAdmin(ArchiveModelAdmin):
+    """collect_storage_garbage の削除記録（閲覧のみ）"""
+    list_display = ['path', 'bucket', 'size', 'object_created_at', 'status', 'deleted_at']
+    list_filter = ['status', 'bucket', cached_year_filter('deleted_at', '削除年')]
+    search_fields = ['path']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AudioFingerprintState)
+class AudioFingerprintStateAdmin(ArchiveModelAdmin):
+    """fingerprint_audio・アップロード後の指紋の計算状態（閲覧のみ）"""
+    list_display = ['record', 'status', 'duration_ms', 'hash_count', 'fingerprinted_at']
+    list_select_related = ['record']
+    list_filter = ['status']
+    search_fields = ['record__onomatopoeia_text', 'file_path']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BackfillProgress)
+class BackfillProgressAdmin(ArchiveModelAdmin):
+    """backfill コマンドの進み具合（閲覧のみ）"""
+    list_display = ['name', 'status', 'last_id', 'max_id', 'changed', 'started_at', 'finished_at']
+    list_filter = ['status']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(ArchiveModelAdmin):
+    """リクエストのサンプリングプロファイル（新しい順。詳細でフレームグラフを表示する。閲覧のみ）"""
+    list_display = ['created_at', 'method', 'path', 'view_name', 'status', 'duration_ms', 'sample_count', 'trigger']
+    list_filter = ['trigger', 'view_name']
+    search_fields = ['path', 'request_id']
+    fields = [
+        'request_id', 'method', 'path', 'view_name', 'status', 'trigger', 'duration_ms', 'sample_count',
+        'interval_ms', 'created_at', 'flame_graph_display', 'collapsed_display',
+    ]
+    readonly_fields = fields
+
+    @admin.display(description='フレームグラフ')
+    def flame_graph_display(self, obj):
+        if not obj.flame_graph:
+            return 'サンプルがありません（サンプリング間隔より短いリクエスト）'
+        # profiling.flame_graph_svg が関数名をエスケープして作った SVG
+        return format_html('<div style="overflow-x: auto">{}</div>', mark_safe(obj.flame_graph))
+
+    @admin.display(description='collapsed stacks')
+    def collapsed_display(self, obj):
+        return format_html('<pre style="max-height: 30em; overflow: auto">{}</pre>', obj.collapsed)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+class CoverageFilter(admin.SimpleListFilter):
+    title = '一致の割合'
+    parameter_name = 'coverage'
+    THRESHOLDS = {'duplicate': 0.8, 'partial': 0.2}
+
+    def lookups(self, request, model_admin):
+        return [('duplicate', '重複の可能性が高い（80%以上）'), ('partial', '一部が重なる（20%以上）')]
+
+    def queryset(self, request, queryset):
+        if self.value() in self.THRESHOLDS:
+            return queryset.filter(coverage__gte=self.THRESHOLDS[self.value()])
+        return queryset
+
+
+@admin.register(AudioMatch)
+class AudioMatchAdmin(ArchiveModelAdmin):
+    """音声の指紋で見つかった重複の候補（一致の割合の高い順。閲覧のみ）"""
+    list_display = ['record', 'other', 'coverage_percent', 'aligned_hashes', 'offset_ms', 'detected_at']
+    list_select_related = ['record', 'other']
+    list_filter = [CoverageFilter]
+    search_fields = ['record__onomatopoeia_text', 'other__onomatopoeia_text']
+
+    @admin.display(description='一致の割合', ordering='coverage')
+    def coverage_percent(self, obj):
+        return f"{obj.coverage:.0%}"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Register your models here.
@@ -0,0 +1,92 @@
+# language_archive/admin_utils.py
+# 管理画面の一覧（changelist）を大きなテーブルでも軽く保つための部品。
+
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .data_version import versioned_cache_get_or_set
+
+# この件数以上のテーブルでは、絞り込みなしの一覧の件数を統計情報の推定値で表示する
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    PostgreSQL で絞り込みのない一覧の件数を pg_class.reltuples の推定値で返すページネーター。
+    絞り込み・検索がある場合や、推定値が小さい・未取得の場合は正確な件数を数える。
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [connection.ops.quote_name(queryset.model._meta.db_table)],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class CachedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """選択肢（関連テーブルの一覧）をデータバージョンごとにキャッシュする外部キーのフィルター"""
+
+    def field_choices(self, field, request, model_admin):
+        key = f'admin_filter:{model_admin.model._meta.label_lower}:{self.field_path}'
+        parent = super()
+        return versioned_cache_get_or_set(key, lambda: list(parent.field_choices(field, request, model_admin)))
+
+
+def cached_year_filter(field_name, title):
+    """
+    年で絞り込むフィルターを作る。
+    date_hierarchy は表示のたびに全件から年を集計するため、その代わりに使う（年の一覧はデータバージョンごとにキャッシュ）。
+    """
+
+    class YearListFilter(admin.SimpleListFilter):
+        parameter_name = f'{field_name}_year'
+
+        def lookups(self, request, model_admin):
+            key = f'admin_years:{model_admin.model._meta.label_lower}:{field_name}'
+            years = versioned_cache_get_or_set(key, lambda: [
+                d.year for d in model_admin.model._default_manager.dates(field_name, 'year', order='DESC')
+            ])
+            return [(str(year), f'{year}年') for year in years]
+
+        def queryset(self, request, queryset):
+            if self.value():
+                return queryset.filter(**{f'{field_name}__year': self.value()})
+            return queryset
+
+    YearListFilter.title = title
+    return YearListFilter
+
+
+class ArchiveModelAdmin(admin.ModelAdmin):
+    """アーカイブの ModelAdmin の共通設定（件数の推定・全件数の再集計をしない）"""
+    paginator = EstimatedCountPaginator
+    # 絞り込み時に「全○件」を出すための全件カウントを行わない
+    show_full_result_count = False
+    list_per_page = 20
+    # 他の管理画面の autocomplete_fields からの検索を、入力補完の索引（前方一致）で行う（autocomplete.SOURCES の名前）
+    autocomplete_source = None
+
+    def get_search_results(self, request, queryset, search_term):
+        match = request.resolver_match
+        if (
+            self.autocomplete_source and search_term.strip() and match is not None
+            and match.view_name == f'{self.admin_site.name}:autocomplete'
+        ):
+            from .autocomplete import MAX_LIMIT, SOURCES, suggest
+
+            # icontains で全行を調べる代わりに、索引で求めたIDだけを読む
+            results = suggest(self.autocomplete_source, search_term, MAX_LIMIT, with_ids=True)
+            ids = [object_id for _, _, object_ids in results for object_id in object_ids]
+            return queryset.filter(pk__in=ids).order_by(SOURCES[self.autocomplete_source][1], 'pk'), False
+        return super().get_search_results(request, queryset, search_term)
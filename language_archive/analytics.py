@@ -0,0 +1,228 @@
+# language_archive/analytics.py
+# コーパスの集計（クロス集計・分布）。
+# build_analytics コマンドが pandas で集計して AnalyticsSnapshot / AnalyticsCell に保存し、
+# 集計ページ（views.analytics）は保存済みのスナップショットを読むだけで、リクエスト時には集計しない。
+# pandas は起動時間に響くため、使う関数の中で読み込む。
+
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import AnalyticsCell, AnalyticsSnapshot, LanguageRecord, OnomatopoeiaType, Speaker, Village
+
+# 残しておくスナップショットの数（古いものから削除する）
+KEEP_SNAPSHOTS = 5
+
+MARGIN_LABEL = '合計'
+
+# 集計に使う表（SOURCE_FIELDS で読む表）。これらの件数・最終更新日時が変わったときだけ集計し直す
+SOURCE_MODELS = (LanguageRecord, Speaker, Village, OnomatopoeiaType)
+
+# 集計に使う列（1回の values() でまとめて読み込む）
+SOURCE_FIELDS = {
+    'language_frequency': 'language_frequency',
+    'file_type': 'file_type',
+    'recorded_date': 'recorded_date',
+    'age_range': 'speaker__age_range',
+    'gender': 'speaker__gender',
+    'village': 'village__name',
+    'type_code': 'onomatopoeia_type__type_code',
+    'type_name': 'onomatopoeia_type__type_name',
+}
+
+# 集計表の定義。kind が crosstab の表は 行 × 列 の件数、ranking の表は行ごとに1つの値（列名＝値の名前）
+ANALYTICS_TABLES = [
+    {'slug': 'frequency_by_age', 'kind': 'crosstab', 'row_field': 'age_range', 'column_field': 'language_frequency',
+     'title': '年代 × 言語使用頻度', 'description': '話者の年代ごとの言語使用頻度（記録数）'},
+    {'slug': 'frequency_by_village', 'kind': 'crosstab', 'row_field': 'village', 'column_field': 'language_frequency',
+     'title': '集落 × 言語使用頻度', 'description': '集落ごとの言語使用頻度（記録数）'},
+    {'slug': 'type_by_village', 'kind': 'crosstab', 'row_field': 'village', 'column_field': 'onomatopoeia_type',
+     'title': '集落 × オノマトペ型', 'description': '集落ごとのオノマトペ型（記録数）'},
+    {'slug': 'dominant_type_by_village', 'kind': 'ranking', 'row_field': 'village', 'column_field': 'onomatopoeia_type',
+     'title': '集落ごとに最も多いオノマトペ型', 'description': '型が登録された記録のうち、その型が占める割合（%）'},
+    {'slug': 'age_by_gender', 'kind': 'crosstab', 'row_field': 'age_range', 'column_field': 'gender',
+     'title': '年代 × 性別', 'description': '話者の年代・性別ごとの記録数'},
+    {'slug': 'file_type_by_year', 'kind': 'crosstab', 'row_field': 'year', 'column_field': 'file_type',
+     'title': '収録年 × ファイル種類', 'description': '収録年ごとの記録数'},
+]
+
+MISSING_LABELS = {
+    'age_range': '不明',
+    'gender': '不明',
+    'language_frequency': '未選択',
+    'village': '集落なし',
+    'onomatopoeia_type': '型なし',
+    'file_type': '不明',
+    'year': '不明',
+}
+
+
+def _ordered_categorical(series, order, missing_label):
+    """表示ラベルの列を、選択肢の順番（なければ出現値の昇順）で並ぶカテゴリ型にする"""
+    import pandas as pd
+
+    series = series.fillna(missing_label)
+    present = set(series)
+    categories = [label for label in order if label in present and label != missing_label]
+    categories += sorted(present - set(categories) - {missing_label})
+    if missing_label in present:
+        categories.append(missing_label)
+    return pd.Categorical(series, categories=categories, ordered=True)
+
+
+def load_frame():
+    """集計用の DataFrame を1回のクエリで作る（コードは表示ラベルに変換済み）"""
+    import pandas as pd
+
+    rows = LanguageRecord.objects.order_by().values_list(*SOURCE_FIELDS.values())
+    frame = pd.DataFrame.from_records(list(rows), columns=list(SOURCE_FIELDS))
+
+    age_labels = dict(Speaker.AGE_RANGE_CHOICES)
+    gender_labels = dict(Speaker.GENDER_CHOICES)
+    frequency_labels = dict(LanguageRecord.FREQUENCY_CHOICES)
+    file_type_labels = dict(LanguageRecord.FILE_TYPE_CHOICES)
+
+    type_labels = frame['type_code'].where(frame['type_code'].isna(), frame['type_code'] + ': ' + frame['type_name'])
+    years = pd.to_datetime(frame['recorded_date']).dt.year.astype('Int64').astype('string')
+
+    return pd.DataFrame({
+        'age_range': _ordered_categorical(frame['age_range'].map(age_labels), age_labels.values(), MISSING_LABELS['age_range']),
+        'gender': _ordered_categorical(frame['gender'].map(gender_labels), gender_labels.values(), MISSING_LABELS['gender']),
+        'language_frequency': _ordered_categorical(
+            frame['language_frequency'].fillna('').map(frequency_labels), frequency_labels.values(),
+            MISSING_LABELS['language_frequency'],
+        ),
+        'village': _ordered_categorical(frame['village'], [], MISSING_LABELS['village']),
+        'onomatopoeia_type': _ordered_categorical(type_labels, [], MISSING_LABELS['onomatopoeia_type']),
+        'file_type': _ordered_categorical(frame['file_type'].map(file_type_labels), file_type_labels.values(), MISSING_LABELS['file_type']),
+        'year': _ordered_categorical(years, [], MISSING_LABELS['year']),
+    })
+
+
+def _crosstab(frame, spec):
+    import pandas as pd
+
+    return pd.crosstab(
+        frame[spec['row_field']], frame[spec['column_field']],
+        margins=True, margins_name=MARGIN_LABEL, dropna=False,
+    )
+
+
+def _ranking(frame, spec):
+    """行ごとに最も多い列の値と、その割合（%）を1列の表にする（列が未設定の記録は除く）"""
+    import pandas as pd
+
+    missing = MISSING_LABELS[spec['column_field']]
+    counts = pd.crosstab(frame[spec['row_field']], frame[spec['column_field']], dropna=False)
+    counts = counts.drop(columns=[missing], errors='ignore')
+    counts = counts[counts.sum(axis=1) > 0]
+    top = counts.idxmax(axis=1)
+    share = (counts.max(axis=1) / counts.sum(axis=1) * 100).round(1)
+    return pd.DataFrame({'label': top.astype(str), 'value': share})
+
+
+def _cells(snapshot, spec, table):
+    """集計結果の DataFrame を AnalyticsCell の行に変換する"""
+    cells = []
+    if spec['kind'] == 'ranking':
+        for row_order, (row_label, row) in enumerate(table.iterrows()):
+            cells.append(AnalyticsCell(
+                snapshot=snapshot, table=spec['slug'], row_label=str(row_label), column_label=row['label'],
+                row_order=row_order, column_order=0, value=float(row['value']),
+            ))
+        return cells
+    for row_order, (row_label, row) in enumerate(table.iterrows()):
+        for column_order, (column_label, value) in enumerate(row.items()):
+            cells.append(AnalyticsCell(
+                snapshot=snapshot, table=spec['slug'], row_label=str(row_label), column_label=str(column_label),
+                row_order=row_order, column_order=column_order, value=float(value),
+            ))
+    return cells
+
+
+def source_version():
+    """
+    集計に使う表の件数・最終更新日時から作るバージョン（AnalyticsSnapshot.data_version に入る63ビットの整数）。
+    アーカイブ全体のデータバージョンと違い、地理環境データなど集計に使わない表への書き込みでは変わらない。
+    """
+    signature = [
+        list(model.objects.order_by().aggregate(count=Count('pk'), updated=Max('updated_at')).values())
+        for model in SOURCE_MODELS
+    ]
+    digest = hashlib.sha1(json.dumps(signature, cls=DjangoJSONEncoder).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') >> 1
+
+
+def build_analytics_snapshot(force=False, keep=KEEP_SNAPSHOTS):
+    """
+    集計に使う表が最新のスナップショットから変わった場合だけ、全件を集計し直して新しいスナップショットを保存する。
+
+    Args:
+        force: 変わっていなくても集計し直す
+        keep: 残しておくスナップショットの数
+
+    Returns:
+        作成したスナップショット。集計しなかった場合は None
+    """
+    version = source_version()
+    latest = AnalyticsSnapshot.objects.order_by('-created_at', '-id').first()
+    if latest and latest.data_version == version and not force:
+        return None
+
+    frame = load_frame()
+    with transaction.atomic():
+        snapshot = AnalyticsSnapshot.objects.create(data_version=version, record_count=len(frame))
+        cells = []
+        for spec in ANALYTICS_TABLES:
+            table = _ranking(frame, spec) if spec['kind'] == 'ranking' else _crosstab(frame, spec)
+            cells.extend(_cells(snapshot, spec, table))
+        AnalyticsCell.objects.bulk_create(cells, batch_size=2000)
+
+        stale = AnalyticsSnapshot.objects.order_by('-created_at', '-id').values_list('id', flat=True)[keep:]
+        AnalyticsSnapshot.objects.filter(id__in=list(stale)).delete()
+    return snapshot
+
+
+def _format_value(value, kind):
+    if kind == 'ranking':
+        return value
+    return int(value) if float(value).is_integer() else value
+
+
+def _load_tables(snapshot):
+    """スナップショットのセルを表示用の表に並べ直す（集計はしない）"""
+    tables = {spec['slug']: {**spec, 'columns': [], 'rows': []} for spec in ANALYTICS_TABLES}
+    row_index = {}
+    cells = snapshot.cells.order_by('table', 'row_order', 'column_order').values_list(
+        'table', 'row_label', 'column_label', 'row_order', 'column_order', 'value',
+    )
+    for slug, row_label, column_label, row_order, column_order, value in cells:
+        table = tables.get(slug)
+        if table is None:
+            continue
+        if table['kind'] == 'crosstab' and row_order == 0:
+            table['columns'].append(column_label)
+        key = (slug, row_order)
+        if key not in row_index:
+            row_index[key] = {'label': row_label, 'values': [], 'is_total': row_label == MARGIN_LABEL}
+            table['rows'].append(row_index[key])
+        if table['kind'] == 'ranking':
+            row_index[key]['top'] = column_label
+        row_index[key]['values'].append(_format_value(value, table['kind']))
+    return [table for table in tables.values() if table['rows']]
+
+
+def latest_analytics():
+    """
+    最新のスナップショットと表示用の表を返す（スナップショットがなければ (None, [])）。
+    スナップショットは作成後に変わらないため、表はスナップショットIDをキーにキャッシュする。
+    """
+    snapshot = AnalyticsSnapshot.objects.order_by('-created_at', '-id').first()
+    if snapshot is None:
+        return None, []
+    tables = cache.get_or_set(f'analytics:snapshot:{snapshot.id}', lambda: _load_tables(snapshot))
+    return snapshot, tables
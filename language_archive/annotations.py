@@ -0,0 +1,396 @@
+# language_archive/annotations.py
+# 言語記録の書き起こし（時間つきの区間）。
+# ELAN（.eaf）と Praat（.TextGrid）のファイルを1区間ずつ読み、数千件単位でまとめて保存する。
+# 詳細ページは再生位置のまわりの時間窓だけを、(層, 開始時刻) の索引の範囲検索で読む。
+# 語の検索は、区間の文字列を正規化して語に分けた AnnotationToken の索引で行う。
+# 日本語（かな・漢字）は空白で区切られないため、連なりを文字の2-gram に分けて索引し、語の途中の文字列でも探せるようにする。
+
+import bisect
+import io
+import re
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import AnnotationSegment, AnnotationTier, AnnotationToken
+from .similarity import normalize_text
+
+# まとめて保存する区間の数
+IMPORT_BATCH = 2000
+# 時間窓の API で返す最大の区間数
+WINDOW_LIMIT = 2000
+# 語の検索で返す最大の区間数
+SEARCH_LIMIT = 200
+
+# かな・漢字の連なり（グループ1）と、それ以外の語（ラテン文字・IPA・数字）
+CJK_CHARS = '\u3005\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+TOKEN_PATTERN = re.compile(rf'([{CJK_CHARS}]+)|[^\W{CJK_CHARS}]+')
+MAX_TOKEN_LENGTH = 100
+# 語の検索で索引を引く語の最大数（残りは取り出した区間の文字列で確かめる）
+MAX_QUERY_TOKENS = 8
+
+
+class AnnotationFormatError(ValueError):
+    """書き起こしのファイルが読めない"""
+
+
+def _words(text):
+    """正規化した文字列を (語, かな・漢字の連なりか) に分ける"""
+    for match in TOKEN_PATTERN.finditer(normalize_text(text)):
+        yield match.group(), match.group(1) is not None
+
+
+def tokenize(text):
+    """
+    区間の文字列を索引用の語に分ける（normalize_text で正規化し、空白・記号で区切る）。
+    かな・漢字の連なりは文字の2-gram にし、末尾の1文字も加える（どの文字もいずれかの語の先頭になり、1文字でも前方一致で探せる）。
+    """
+    tokens = set()
+    for word, cjk in _words(text):
+        if cjk:
+            tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+            tokens.add(word[-1])
+        elif len(word) <= MAX_TOKEN_LENGTH:
+            tokens.add(word)
+    return tokens
+
+
+def _interpolate(slots):
+    """時刻のない TIME_SLOT（ELAN で位置を合わせていない区切り）を、前後の時刻から直線で補う"""
+    known = [i for i, (_, value) in enumerate(slots) if value is not None]
+    times = {}
+    for i, (slot_id, value) in enumerate(slots):
+        if value is None:
+            position = bisect.bisect(known, i)
+            if position == 0 or position == len(known):
+                continue
+            before, after = known[position - 1], known[position]
+            low, high = slots[before][1], slots[after][1]
+            value = low + (high - low) * (i - before) // (after - before)
+        times[slot_id] = value
+    return times
+
+
+def parse_eaf(file):
+    """
+    ELAN の .eaf を iterparse で読み、区間を1つずつ返す（ファイル全体を木として読み込まない）。
+    参照注釈（REF_ANNOTATION）は参照先の区間の時刻を使う。文字列が空の区間は返さない。
+
+    Yields:
+        (層の名前, 開始[ミリ秒], 終了[ミリ秒], 文字列)
+    """
+    import xml.etree.ElementTree as ET
+
+    slots = []
+    times = None
+    spans = {}
+    pending = []
+    tier = None
+    root = None
+    try:
+        for event, element in ET.iterparse(file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                elif element.tag == 'TIER':
+                    tier = element.get('TIER_ID')
+                continue
+            if element.tag == 'TIME_SLOT':
+                value = element.get('TIME_VALUE')
+                slots.append((element.get('TIME_SLOT_ID'), int(value) if value is not None else None))
+            elif element.tag == 'TIME_ORDER':
+                times = _interpolate(slots)
+                slots = []
+            elif element.tag in ('ALIGNABLE_ANNOTATION', 'REF_ANNOTATION'):
+                text = (element.findtext('ANNOTATION_VALUE') or '').strip()
+                if element.tag == 'ALIGNABLE_ANNOTATION':
+                    start, end = (times or {}).get(element.get('TIME_SLOT_REF1')), (times or {}).get(element.get('TIME_SLOT_REF2'))
+                    span = (start, end) if start is not None and end is not None else None
+                else:
+                    span = spans.get(element.get('ANNOTATION_REF'))
+                    if span is None:
+                        # 参照先が後ろの層にあるときは、最後に時刻を解決する
+                        pending.append((element.get('ANNOTATION_ID'), element.get('ANNOTATION_REF'), tier, text))
+                if span is not None:
+                    spans[element.get('ANNOTATION_ID')] = span
+                    if text:
+                        yield tier, span[0], span[1], text
+            elif element.tag == 'TIER':
+                # 読み終わった層の要素を捨て、メモリを一定に保つ
+                root.clear()
+    except ET.ParseError as e:
+        raise AnnotationFormatError(f'EAF を読めません: {e}') from e
+
+    while pending:
+        unresolved = []
+        for annotation_id, reference, tier, text in pending:
+            span = spans.get(reference)
+            if span is None:
+                unresolved.append((annotation_id, reference, tier, text))
+                continue
+            spans[annotation_id] = span
+            if text:
+                yield tier, span[0], span[1], text
+        if len(unresolved) == len(pending):
+            break
+        pending = unresolved
+
+
+TEXTGRID_TOKEN = re.compile(r'"((?:[^"]|"")*)"|\[\d*\]|<(exists|absent)>|(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)')
+
+
+def _open_text(file):
+    """TextGrid の文字コードを BOM から判断する（Praat は ASCII 以外を含むと UTF-16 で保存する）"""
+    head = file.read(4)
+    file.seek(0)
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        encoding = 'utf-16'
+    elif head.startswith(b'\xef\xbb\xbf'):
+        encoding = 'utf-8-sig'
+    else:
+        encoding = 'utf-8'
+    return io.TextIOWrapper(file, encoding=encoding, newline='')
+
+
+def _textgrid_tokens(lines):
+    """
+    TextGrid の値（文字列・数・<exists>）を順に返す。xmin = などの見出しと [1] などの番号は読み飛ばす。
+    長い形式・短い形式のどちらも、値の並びは同じになる。
+    """
+    carried = ''
+    lines = iter(lines)
+    while True:
+        try:
+            line = next(lines)
+        except StopIteration:
+            return
+        except UnicodeDecodeError as e:
+            raise AnnotationFormatError(f'TextGrid を読めません: {e}') from e
+        line = carried + line
+        # 引用符が閉じていない行は、文字列が次の行に続いている
+        if line.count('"') % 2:
+            carried = line
+            continue
+        carried = ''
+        for match in TEXTGRID_TOKEN.finditer(line):
+            string, flag, number = match.groups()
+            if string is not None:
+                yield 'string', string.replace('""', '"')
+            elif flag is not None:
+                yield 'flag', flag
+            elif number is not None:
+                yield 'number', float(number)
+
+
+def parse_textgrid(file):
+    """
+    Praat の TextGrid（長い形式・短い形式、UTF-8/UTF-16）を1行ずつ読み、区間を1つずつ返す。
+    点の層（TextTier）の点は、開始と終了が同じ区間にする。文字列が空の区間は返さない。
+
+    Yields:
+        (層の名前, 開始[ミリ秒], 終了[ミリ秒], 文字列)
+    """
+    text_file = _open_text(file)
+    try:
+        yield from _parse_textgrid_tokens(_textgrid_tokens(text_file))
+    finally:
+        # 呼び出し側のファイルを閉じないよう、ラッパーだけを外す
+        text_file.detach()
+
+
+def _parse_textgrid_tokens(tokens):
+    """_textgrid_tokens の値の並びを区間にする"""
+
+    def take(kind):
+        try:
+            token_kind, value = next(tokens)
+        except StopIteration:
+            raise AnnotationFormatError('TextGrid が途中で終わっています') from None
+        if token_kind != kind:
+            raise AnnotationFormatError(f'TextGrid を読めません（{kind} の位置に {value!r}）')
+        return value
+
+    def ms(seconds):
+        return max(0, round(seconds * 1000))
+
+    if (take('string'), take('string')) != ('ooTextFile', 'TextGrid'):
+        raise AnnotationFormatError('TextGrid ではありません')
+    take('number')  # xmin
+    take('number')  # xmax
+    if take('flag') != 'exists':
+        return
+    for _ in range(int(take('number'))):
+        tier_class, name = take('string'), take('string')
+        take('number')  # xmin
+        take('number')  # xmax
+        count = int(take('number'))
+        for _ in range(count):
+            if tier_class == 'IntervalTier':
+                start, end, text = take('number'), take('number'), take('string').strip()
+            elif tier_class == 'TextTier':
+                start = take('number')
+                end, text = start, take('string').strip()
+            else:
+                raise AnnotationFormatError(f'対応していない層の種類です: {tier_class}')
+            if text:
+                yield name, ms(start), ms(end), text
+
+
+PARSERS = {
+    '.eaf': parse_eaf,
+    '.textgrid': parse_textgrid,
+}
+
+
+def get_parser(filename):
+    """ファイル名の拡張子から読み込み関数を選ぶ（対応していなければ AnnotationFormatError）"""
+    parser = PARSERS.get(Path(filename).suffix.lower())
+    if parser is None:
+        raise AnnotationFormatError(f"対応していない形式です（{', '.join(PARSERS)} のみ）: {filename}")
+    return parser
+
+
+def _save_batch(segments):
+    AnnotationSegment.objects.bulk_create(segments)
+    AnnotationToken.objects.bulk_create(
+        [AnnotationToken(token=token, segment_id=segment.pk) for segment in segments for token in tokenize(segment.text)],
+        batch_size=IMPORT_BATCH * 4,
+    )
+
+
+@transaction.atomic
+def import_annotations(record, file, filename=None, batch_size=IMPORT_BATCH):
+    """
+    書き起こしのファイルを record に取り込む。同じ名前の層がすでにあれば置き換える。
+    区間は batch_size 件ずつまとめて保存する（語の索引も同時に作る）。
+
+    Returns:
+        {層の名前: 区間の数}
+
+    Raises:
+        AnnotationFormatError: ファイルが読めない
+    """
+    filename = filename or getattr(file, 'name', '')
+    parser = get_parser(filename)
+    tiers = {}
+    batch = []
+    for tier_name, start_ms, end_ms, text in parser(file):
+        tier_name = tier_name or '(名前なし)'
+        entry = tiers.get(tier_name)
+        if entry is None:
+            AnnotationTier.objects.filter(record=record, name=tier_name[:100]).delete()
+            tier = AnnotationTier.objects.create(record=record, name=tier_name[:100], source=Path(filename).name[:255])
+            entry = tiers[tier_name] = [tier, 0, 0]
+        if end_ms < start_ms:
+            start_ms, end_ms = end_ms, start_ms
+        entry[1] += 1
+        entry[2] = max(entry[2], end_ms - start_ms)
+        batch.append(AnnotationSegment(tier=entry[0], start_ms=start_ms, end_ms=end_ms, text=text))
+        if len(batch) >= batch_size:
+            _save_batch(batch)
+            batch = []
+    if batch:
+        _save_batch(batch)
+
+    for tier, count, longest in tiers.values():
+        tier.segment_count, tier.max_duration_ms = count, longest
+        tier.save(update_fields=['segment_count', 'max_duration_ms'])
+    return {name: count for name, (_, count, _) in tiers.items()}
+
+
+def segments_in_window(record, start_ms, end_ms, tier_names=None, limit=WINDOW_LIMIT):
+    """
+    record の区間のうち、[start_ms, end_ms) と重なるものを開始時刻の順に返す。
+    層ごとに開始時刻を [start_ms − 最長の区間, end_ms) に絞るため、(層, 開始時刻) の索引の範囲だけを読む。
+
+    Returns:
+        (層の一覧, (層の名前, 開始, 終了, 文字列) のリスト, limit で切ったか)
+    """
+    tiers = list(record.annotation_tiers.all())
+    selected = [tier for tier in tiers if not tier_names or tier.name in tier_names]
+    if not selected or end_ms <= start_ms:
+        return tiers, [], False
+    condition = Q()
+    for tier in selected:
+        condition |= Q(tier=tier, start_ms__gte=max(0, start_ms - tier.max_duration_ms), start_ms__lt=end_ms)
+    names = {tier.id: tier.name for tier in selected}
+    # 点（開始と終了が同じ区間）は窓の開始と同じ時刻でも含める
+    rows = list(
+        AnnotationSegment.objects.filter(condition, Q(end_ms__gt=start_ms) | Q(start_ms=start_ms))
+        .order_by('start_ms', 'id').values_list('tier_id', 'start_ms', 'end_ms', 'text')[:limit + 1]
+    )
+    segments = [(names[tier_id], start, end, text) for tier_id, start, end, text in rows[:limit]]
+    return tiers, segments, len(rows) > limit
+
+
+def segments_at(record, time_ms, tier_names=None):
+    """再生位置 time_ms を含む区間"""
+    return segments_in_window(record, time_ms, time_ms + 1, tier_names)[1]
+
+
+def _query_terms(words):
+    """検索語を索引の照合条件 (lookup, 語) に分ける。1文字のかな・漢字は前方一致で探す"""
+    terms = []
+    for word, cjk in words:
+        if not cjk:
+            terms.append(('tokens__token', word))
+        elif len(word) == 1:
+            terms.append(('tokens__token__startswith', word))
+        else:
+            terms.extend(('tokens__token', word[i:i + 2]) for i in range(len(word) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def _matches(segment, words):
+    """2-gram がすべてそろっていても連続していないことがあるため、区間の文字列に検索語が含まれるかを確かめる"""
+    text = normalize_text(segment.text)
+    latin = None
+    for word, cjk in words:
+        if cjk:
+            if word not in text:
+                return False
+        else:
+            latin = tokenize(segment.text) if latin is None else latin
+            if word not in latin:
+                return False
+    return True
+
+
+def search_token(token, limit=SEARCH_LIMIT):
+    """
+    語 token を含む区間を探す（token は tokenize と同じく正規化してから照合する）。
+    かな・漢字は語の途中の文字列でも見つかり、空白で区切った複数の語はすべてを含む区間を返す。
+
+    Returns:
+        (正規化した語, 区間のリスト[tier を select_related 済み])
+    """
+    normalized = normalize_text(token).strip()
+    words = list(_words(normalized))
+    if not words:
+        return normalized, []
+    candidates = AnnotationSegment.objects.all()
+    terms = _query_terms(words)
+    for lookup, value in terms[:MAX_QUERY_TOKENS]:
+        # 語ごとに別の結合にし、すべての語を持つ区間に絞る
+        candidates = candidates.filter(**{lookup: value})
+    if any(lookup.endswith('startswith') for lookup, _ in terms):
+        candidates = candidates.distinct()
+    segments = []
+    for segment in candidates.select_related('tier').order_by('id').iterator(chunk_size=limit):
+        if _matches(segment, words):
+            segments.append(segment)
+            if len(segments) >= limit:
+                break
+    return normalized, segments
+
+
+def retokenize_segment_range(start, end):
+    """主キーが start より大きく end 以下の区間の語の索引を作り直す（backfill の annotation_tokens）"""
+    segments = list(AnnotationSegment.objects.filter(pk__gt=start, pk__lte=end).order_by().only('pk', 'text'))
+    AnnotationToken.objects.filter(segment_id__gt=start, segment_id__lte=end).delete()
+    AnnotationToken.objects.bulk_create(
+        [AnnotationToken(token=token, segment_id=segment.pk) for segment in segments for token in tokenize(segment.text)],
+        batch_size=IMPORT_BATCH * 4,
+    )
+    return len(segments)
@@ -0,0 +1,194 @@
+# language_archive/api.py
+# 外部向けの読み取り専用 JSON API（/api/v1/）。
+# 一覧・詳細は values_list で必要な列だけを読み、モデルのインスタンスを作らずに辞書にする。
+# fields で返す項目を絞り（参照先は fields[villages] のようにリソースごとに指定）、include で参照先をまとめて返す
+# （参照先ごとに1回の問い合わせ）。一覧は主キーの順に読み、続きはカーソル（最後の主キー）で指定する。
+
+import base64
+import json
+
+from .models import GeographicRecord, LanguageRecord, OnomatopoeiaType, Speaker, Village
+
+API_VERSION = 'v1'
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class ApiError(ValueError):
+    """要求のパラメータが正しくない（400 で返す）"""
+
+
+class Resource:
+    """
+    API のリソース。
+
+    Args:
+        model: モデル
+        fields: API の項目名 → values_list に渡す列名（先頭は id。外部キーは参照先のIDを返す）
+        relations: include できる項目名 → 参照先のリソース名（項目は fields の外部キー）
+    """
+
+    def __init__(self, model, fields, relations=None):
+        self.model = model
+        self.fields = fields
+        self.relations = relations or {}
+
+
+# 公開する項目。サイトに表示していない話者の備考は含めない
+RESOURCES = {
+    'villages': Resource(Village, {
+        'id': 'id', 'name': 'name', 'latitude': 'latitude', 'longitude': 'longitude',
+        'description': 'description', 'updated_at': 'updated_at',
+    }),
+    'speakers': Resource(Speaker, {
+        'id': 'id', 'speaker_id': 'speaker_id', 'age_range': 'age_range', 'gender': 'gender',
+        'village': 'village_id', 'consent_video': 'consent_video', 'updated_at': 'updated_at',
+    }, relations={'village': 'villages'}),
+    'onomatopoeia_types': Resource(OnomatopoeiaType, {
+        'id': 'id', 'type_code': 'type_code', 'type_name': 'type_name', 'description': 'description',
+        'updated_at': 'updated_at',
+    }),
+    'records': Resource(LanguageRecord, {
+        'id': 'id', 'onomatopoeia_text': 'onomatopoeia_text', 'meaning': 'meaning', 'usage_example': 'usage_example',
+        'phonetic_notation': 'phonetic_notation', 'language_frequency': 'language_frequency',
+        'file_type': 'file_type', 'file_path': 'file_path', 'thumbnail_path': 'thumbnail_path',
+        'youtube_url': 'youtube_url', 'title': 'title', 'description': 'description',
+        'speaker': 'speaker_id', 'onomatopoeia_type': 'onomatopoeia_type_id', 'village': 'village_id',
+        'recorded_date': 'recorded_date', 'notes': 'notes', 'created_at': 'created_at', 'updated_at': 'updated_at',
+    }, relations={'speaker': 'speakers', 'onomatopoeia_type': 'onomatopoeia_types', 'village': 'villages'}),
+    'geographic': Resource(GeographicRecord, {
+        'id': 'id', 'title': 'title', 'content_type': 'content_type', 'file_path': 'file_path',
+        'thumbnail_path': 'thumbnail_path', 'youtube_url': 'youtube_url', 'description': 'description',
+        'village': 'village_id', 'latitude': 'latitude', 'longitude': 'longitude',
+        'captured_date': 'captured_date', 'created_at': 'created_at', 'updated_at': 'updated_at',
+    }, relations={'village': 'villages'}),
+}
+
+
+def _parse_fields(name, value):
+    """fields の値（カンマ区切り）を項目名のリストにする。省略時はすべての項目。id は常に先頭に含める"""
+    resource = RESOURCES[name]
+    if not value:
+        return list(resource.fields)
+    requested = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in resource.fields]
+    if unknown:
+        raise ApiError(f"{name} に項目がありません: {', '.join(unknown)}")
+    return ['id'] + [field for field in dict.fromkeys(requested) if field != 'id']
+
+
+def _parse_request(name, params):
+    """(返す項目, include する項目, 参照先のリソースごとの返す項目)"""
+    resource = RESOURCES[name]
+    fields = _parse_fields(name, params.get('fields'))
+    includes = list(dict.fromkeys(
+        relation.strip() for relation in params.get('include', '').split(',') if relation.strip()
+    ))
+    unknown = [relation for relation in includes if relation not in resource.relations]
+    if unknown:
+        raise ApiError(f"{name} で include できない項目です: {', '.join(unknown)}（{', '.join(resource.relations) or 'なし'}）")
+    included_fields = {
+        target: _parse_fields(target, params.get(f'fields[{target}]'))
+        for target in {resource.relations[relation] for relation in includes}
+    }
+    return fields, includes, included_fields
+
+
+def _serialize(name, rows, fields, includes, included_fields):
+    """
+    values_list の行（fields の列の後に include する外部キーの列）を辞書にし、参照先を読み込む。
+
+    Returns:
+        (行の辞書のリスト, {参照先のリソース名: 行の辞書のリスト})
+    """
+    resource = RESOURCES[name]
+    width = len(fields)
+    data = [dict(zip(fields, row[:width])) for row in rows]
+    related_ids = {}
+    for position, relation in enumerate(includes, width):
+        ids = related_ids.setdefault(resource.relations[relation], set())
+        ids.update(row[position] for row in rows if row[position] is not None)
+
+    included = {}
+    for target, ids in related_ids.items():
+        target_resource = RESOURCES[target]
+        target_fields = included_fields[target]
+        target_rows = target_resource.model.objects.filter(pk__in=ids).order_by('pk').values_list(
+            *[target_resource.fields[field] for field in target_fields]
+        ) if ids else []
+        included[target] = [dict(zip(target_fields, row)) for row in target_rows]
+    return data, included
+
+
+def _queryset(name, fields, includes):
+    resource = RESOURCES[name]
+    columns = [resource.fields[field] for field in fields] + [resource.fields[relation] for relation in includes]
+    return resource.model.objects.order_by('pk').values_list(*columns)
+
+
+def encode_cursor(last_id):
+    raw = json.dumps({'after': last_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """encode_cursor の逆（最後に返した主キー）。読めなければ ApiError"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return int(payload['after'])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ApiError('cursor が正しくありません。') from e
+
+
+def list_resource(name, params):
+    """
+    リソースの一覧を主キーの順に最大 limit 件返す。
+
+    Returns:
+        {'data': 行, 'included': 参照先, 'cursor': 続きのカーソル（最後のページなら None）}
+
+    Raises:
+        KeyError: リソースがない
+        ApiError: パラメータが正しくない
+    """
+    if name not in RESOURCES:
+        raise KeyError(name)
+    fields, includes, included_fields = _parse_request(name, params)
+    try:
+        limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError as e:
+        raise ApiError('limit は整数で指定してください。') from e
+    queryset = _queryset(name, fields, includes)
+    if params.get('cursor'):
+        queryset = queryset.filter(pk__gt=decode_cursor(params['cursor']))
+
+    rows = list(queryset[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    data, included = _serialize(name, rows, fields, includes, included_fields)
+    return {
+        'data': data,
+        'included': included,
+        'cursor': encode_cursor(rows[-1][0]) if has_more else None,
+    }
+
+
+def get_resource(name, pk, params):
+    """
+    リソースの1行を返す。
+
+    Returns:
+        {'data': 行, 'included': 参照先}
+
+    Raises:
+        KeyError: リソースまたは行がない
+        ApiError: パラメータが正しくない
+    """
+    if name not in RESOURCES:
+        raise KeyError(name)
+    fields, includes, included_fields = _parse_request(name, params)
+    rows = list(_queryset(name, fields, includes).filter(pk=pk)[:1])
+    if not rows:
+        raise KeyError(pk)
+    data, included = _serialize(name, rows, fields, includes, included_fields)
+    return {'data': data[0], 'included': included}
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class LanguageArchiveConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'language_archive'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .tracing import install_db_wrapper
+        connection_created.connect(install_db_wrapper)
@@ -0,0 +1,121 @@
+# language_archive/async_views.py
+# ASGI（uvicorn）プロファイル用のビュー。settings.ASYNC_VIEWS が True のとき urls.py で使われる。
+# コンテキストの作成・フォームの処理は views.py の同期版と同じ関数を使い、ここではスレッドの切り替えだけを行う。
+# DBアクセスとテンプレートの描画は Django の非同期 ORM と同じく sync_to_async のスレッドで行う。
+# ストレージへのアップロードは非同期クライアントで、地図の生成（CPU処理）は別スレッドで行い、イベントループを止めない。
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect
+from django.contrib import messages
+from .forms import LanguageRecordForm, GeographicRecordForm
+from .db_routers import read_replica
+from .services import aupload_to_supabase, create_archive_map
+from .views import (
+    _form_error_messages, _index_context, _map_data, _map_context, _upload_context,
+    _prepare_language_record, _save_language_record, _prepare_geographic_record,
+    _record_list_context, _record_detail_context, _village_records_context, _speaker_records_context,
+)
+
+
+async def _arender(request, template_name, build_context, *args):
+    """
+    build_context(*args) のコンテキストでテンプレートを描画する。
+    コンテキストプロセッサ（メッセージ・認証）やフォームの選択肢もDBに触れるため、
+    コンテキストの作成と描画を1回の sync_to_async にまとめる。
+    """
+    def build_and_render():
+        return render(request, template_name, build_context(*args))
+    return await sync_to_async(build_and_render)()
+
+
+@read_replica
+async def index(request):
+    """トップページ"""
+    return await _arender(request, 'language_archive/index.html', _index_context, request)
+
+
+@read_replica
+async def map_view(request):
+    """地図ビュー"""
+    geographic_records, speakers, all_years, selected_year = await sync_to_async(_map_data)(request)
+
+    # 地図の生成（folium）はCPU処理なので、DBのスレッドを占有しないよう別スレッドで行う
+    map_html = await sync_to_async(create_archive_map, thread_sensitive=False)(
+        geographic_records=geographic_records,
+        speakers=speakers,
+    )
+    return await _arender(request, 'language_archive/map.html', _map_context, map_html, all_years, selected_year)
+
+
+async def upload_language_record(request):
+    """言語記録のアップロード"""
+    if request.method == 'POST':
+        form = LanguageRecordForm(request.POST, request.FILES)
+
+        if await sync_to_async(form.is_valid)():
+            try:
+                record, message, pending = _prepare_language_record(form)
+                if pending:
+                    # Supabaseにアップロード
+                    record.file_path = await aupload_to_supabase(*pending)
+                await sync_to_async(_save_language_record)(record, form)
+                messages.success(request, message)
+                return redirect('record_list')
+
+            except Exception as e:
+                messages.error(request, f'エラー: {str(e)}')
+        else:
+            _form_error_messages(request, form)
+    else:
+        form = LanguageRecordForm()
+
+    return await _arender(request, 'language_archive/upload_language.html', _upload_context, form)
+
+
+async def upload_geographic_record(request):
+    """地理環境データのアップロード"""
+    if request.method == 'POST':
+        form = GeographicRecordForm(request.POST, request.FILES)
+
+        if await sync_to_async(form.is_valid)():
+            try:
+                record, message, pending = _prepare_geographic_record(form)
+                if pending:
+                    # Supabaseにアップロード
+                    record.file_path = await aupload_to_supabase(*pending)
+                await record.asave()
+                messages.success(request, message)
+                return redirect('geographic_list')
+
+            except Exception as e:
+                messages.error(request, f'エラー: {str(e)}')
+        else:
+            _form_error_messages(request, form)
+    else:
+        form = GeographicRecordForm()
+
+    return await _arender(request, 'language_archive/upload_geographic.html', _upload_context, form)
+
+
+@read_replica
+async def record_list(request):
+    """言語記録一覧（一覧のカードの表だけを読む）"""
+    return await _arender(request, 'language_archive/record_list.html', _record_list_context, request)
+
+
+@read_replica
+async def record_detail(request, record_id):
+    """言語記録の詳細"""
+    return await _arender(request, 'language_archive/record_detail.html', _record_detail_context, request, record_id)
+
+
+@read_replica
+async def village_records(request, village_id):
+    """特定集落の言語記録一覧（radius を指定すると近くの集落の記録も含める）"""
+    return await _arender(request, 'language_archive/village_records.html', _village_records_context, request, village_id)
+
+
+@read_replica
+async def speaker_records(request, speaker_id):
+    """特定話者の言語記録一覧"""
+    return await _arender(request, 'language_archive/speaker_records.html', _speaker_records_context, request, speaker_id)
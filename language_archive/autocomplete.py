@@ -0,0 +1,202 @@
+# language_archive/autocomplete.py
+# オノマトペ・話者ID・集落名の入力補完（前方一致）。
+# 正規化した文字列（カタカナはひらがなに寄せる）を昇順のリストに持ち、二分探索で前方一致の範囲を取り出す。
+# 索引はプロセス内に保持する。データバージョンが変わったら、更新日時が前回の読み込み以降の行と墓標（削除）だけを読んで差分を反映する。
+
+import bisect
+import datetime
+import logging
+import threading
+
+from django.utils import timezone
+
+from .data_version import get_data_version
+from .models import LanguageRecord, Speaker, SyncTombstone, Village
+from .similarity import normalize_text
+from .sync import SETTLE_SECONDS, tombstone_name
+
+logger = logging.getLogger(__name__)
+
+# 補完の対象（名前: (モデル, 列)）
+SOURCES = {
+    'onomatopoeia': (LanguageRecord, 'onomatopoeia_text'),
+    'speaker': (Speaker, 'speaker_id'),
+    'village': (Village, 'name'),
+}
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+class PrefixIndex:
+    """
+    前方一致の索引。正規化した文字列（キー）の昇順のリストと、キーごとの {表記: 行IDの集合} を持つ。
+    表記の揺れ（カタカナとひらがななど）は同じキーにまとめ、候補には件数の多い表記を出す。
+    """
+
+    def __init__(self, rows=()):
+        self._owners = {}  # 行ID → (キー, 表記)
+        self._terms = {}  # キー → {表記: 行IDの集合}
+        for object_id, text in rows:
+            self._add(object_id, text)
+        self._keys = sorted(self._terms)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _add(self, object_id, text):
+        display = text or ''
+        key = normalize_text(display).strip()
+        if not key:
+            return False
+        self._owners[object_id] = (key, display)
+        spellings = self._terms.get(key)
+        if spellings is None:
+            self._terms[key] = {display: {object_id}}
+            return True
+        spellings.setdefault(display, set()).add(object_id)
+        return False
+
+    def remove(self, object_id):
+        owner = self._owners.pop(object_id, None)
+        if owner is None:
+            return
+        key, display = owner
+        spellings = self._terms[key]
+        spellings[display].discard(object_id)
+        if not spellings[display]:
+            del spellings[display]
+        if not spellings:
+            del self._terms[key]
+            del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def update(self, object_id, text):
+        """行の文字列を追加・変更する"""
+        if object_id in self._owners:
+            self.remove(object_id)
+        if self._add(object_id, text):
+            bisect.insort(self._keys, self._owners[object_id][0])
+
+    def _matching(self, prefix, limit):
+        """prefix で始まるキーの {表記: 行IDの集合} を、キーの昇順（入力と同じ語があれば先頭）に最大 limit 件返す"""
+        prefix = normalize_text(prefix).strip()
+        if not prefix:
+            return
+        position = bisect.bisect_left(self._keys, prefix)
+        for key in self._keys[position:position + limit]:
+            if not key.startswith(prefix):
+                break
+            yield self._terms[key]
+
+    def search(self, prefix, limit=DEFAULT_LIMIT, with_ids=False):
+        """
+        prefix で始まる語を最大 limit 件返す。
+
+        Returns:
+            (表記, 行数, 行IDのリスト) のリスト。表記は件数の最も多いもの（同数ならひらがなを先にするため、文字コードの小さいもの）。
+            行IDは表記の揺れを含めた全行の分で、with_ids=False なら None（よく使われる語で大きなリストを作らない）
+        """
+        results = []
+        for spellings in self._matching(prefix, limit):
+            display = min(spellings, key=lambda spelling: (-len(spellings[spelling]), spelling))
+            count = sum(len(ids) for ids in spellings.values())
+            ids = sorted(object_id for ids in spellings.values() for object_id in ids) if with_ids else None
+            results.append((display.strip(), count, ids))
+        return results
+
+    def spellings(self, prefix, limit=DEFAULT_LIMIT):
+        """prefix で始まる語の、DBに保存されているままの表記（表記の揺れをすべて含む）"""
+        return [spelling for spellings in self._matching(prefix, limit) for spelling in spellings]
+
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_indexes = None  # {名前: PrefixIndex}
+_version = None
+_loaded_until = None  # この時刻までに更新された行を読み込み済み
+
+
+def _rows(model, field, queryset=None):
+    queryset = model.objects.all() if queryset is None else queryset
+    return queryset.order_by().values_list('id', field).iterator(chunk_size=5000)
+
+
+def _load_all():
+    global _indexes, _loaded_until
+    started = timezone.now()
+    indexes = {name: PrefixIndex(_rows(model, field)) for name, (model, field) in SOURCES.items()}
+    with _lock:
+        _indexes, _loaded_until = indexes, started
+
+
+def _apply_changes():
+    """前回の読み込み以降の変更だけを反映する（コミットの遅れを見込み、SETTLE_SECONDS だけ前から読み直す）"""
+    global _loaded_until
+    started = timezone.now()
+    since = _loaded_until - datetime.timedelta(seconds=SETTLE_SECONDS)
+    changes = {
+        name: (
+            list(_rows(model, field, model.objects.filter(updated_at__gte=since))),
+            list(SyncTombstone.objects.filter(model=tombstone_name(model), deleted_at__gte=since).values_list('object_id', flat=True)),
+        )
+        for name, (model, field) in SOURCES.items()
+    }
+    with _lock:
+        for name, (rows, deleted) in changes.items():
+            index = _indexes[name]
+            for object_id in deleted:
+                index.remove(object_id)
+            for object_id, text in rows:
+                index.update(object_id, text)
+        _loaded_until = started
+
+
+def refresh():
+    """
+    データバージョンが変わっていれば索引を更新する。初回は全件を読み込むまで待つ。
+    ほかのスレッドが更新しているあいだは待たずに、更新前の索引で答える。
+    """
+    global _version
+    version = get_data_version()
+    if _indexes is not None and _version == version:
+        return
+    if not _refresh_lock.acquire(blocking=_indexes is None):
+        return
+    try:
+        if _indexes is None:
+            _load_all()
+        elif _version != version:
+            try:
+                _apply_changes()
+            except Exception:
+                logger.exception("入力補完の索引の更新に失敗しました")
+                return
+        _version = version
+    finally:
+        _refresh_lock.release()
+
+
+def suggest(source, prefix, limit=DEFAULT_LIMIT, with_ids=False):
+    """
+    source（SOURCES の名前）の文字列のうち prefix で始まるものを返す。
+
+    Returns:
+        PrefixIndex.search と同じ (表記, 行数, 行IDのリスト) のリスト
+
+    Raises:
+        KeyError: source が SOURCES にない
+    """
+    if source not in SOURCES:
+        raise KeyError(source)
+    refresh()
+    with _lock:
+        return _indexes[source].search(prefix, min(limit, MAX_LIMIT), with_ids)
+
+
+def matching_spellings(source, prefix, limit=MAX_LIMIT):
+    """source の文字列のうち prefix で始まる語の、DBに保存されているままの表記（絞り込みの IN に使う）"""
+    if source not in SOURCES:
+        raise KeyError(source)
+    refresh()
+    with _lock:
+        return _indexes[source].spellings(prefix, limit)
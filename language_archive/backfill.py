@@ -0,0 +1,183 @@
+# language_archive/backfill.py
+# 派生した列（話者の集落のコピー・geohash・一覧のカードなど）を既存の行に埋め直す作業（バックフィル）の実行。
+# データマイグレーションで表全体を1つのトランザクションで書き換えると、Postgres では長く表をロックし、デプロイも時間切れになる。
+# 作業は register で登録し、backfill コマンドから主キーの範囲ごとに短いトランザクションで実行する。
+# 範囲ごとの書き込みと進み具合（BackfillProgress）を同じトランザクションで保存するため、途中で止まっても続きから再開できる。
+# 新しく派生した列を追加するときは、マイグレーションでは列だけを追加し、既存の行の埋め直しはここに作業を登録する。
+
+import time
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .annotations import retokenize_segment_range
+from .data_version import bump_data_version
+from .geo import encode as encode_geohash
+from .models import AnnotationSegment, BackfillProgress, GeographicRecord, LanguageRecord, Village
+from .record_cards import refresh_card_range
+from .record_village import fix_record_village_range
+from .reference_data import REFERENCE_MODELS, bump_reference_version
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class Backfill:
+    """
+    登録された作業。
+
+    Args:
+        name: 作業名（BackfillProgress の name）
+        model: 対象のモデル（主キーの範囲で分ける）
+        run: (start, end) を受け取り、主キーが start より大きく end 以下の行を処理して更新件数を返す関数
+        description: backfill --list で表示する説明
+    """
+
+    def __init__(self, name, model, run, description):
+        self.name = name
+        self.model = model
+        self.run = run
+        self.description = description
+
+
+BACKFILLS = {}
+
+
+def register(name, model, description):
+    """作業を登録するデコレーター"""
+    def decorator(run):
+        BACKFILLS[name] = Backfill(name, model, run, description)
+        return run
+    return decorator
+
+
+def _start(state, backfill):
+    """進み具合を最初からにする（対象は今ある行まで）"""
+    state.status = 'running'
+    state.max_id = backfill.model.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+    state.last_id = state.changed = state.chunks = 0
+    state.error = ''
+    state.started_at = timezone.now()
+    state.finished_at = None
+
+
+def _run_chunk(backfill, state_id, chunk_size):
+    """
+    続きの1範囲を処理し、同じトランザクションで進み具合を保存する。
+    進み具合の行をロックしてから範囲を決めるため、同じ作業を複数のプロセスで実行しても範囲は重ならない。
+
+    Returns:
+        (保存した進み具合, この範囲の更新件数)
+    """
+    with transaction.atomic():
+        state = BackfillProgress.objects.select_for_update().get(pk=state_id)
+        if state.status != 'running' or state.last_id >= state.max_id:
+            return state, 0
+        start = state.last_id
+        end = min(start + chunk_size, state.max_id)
+        changed = backfill.run(start, end)
+        state.last_id = end
+        state.changed += changed
+        state.chunks += 1
+        if end >= state.max_id:
+            state.status = 'done'
+            state.finished_at = timezone.now()
+        state.save()
+    return state, changed
+
+
+def run_backfill(name, chunk_size=DEFAULT_CHUNK_SIZE, pause=0.0, max_seconds=None, restart=False, progress=None):
+    """
+    作業を前回の続きから実行する（完了済みなら何もしない）。
+
+    Args:
+        chunk_size: 1回のトランザクションで処理する主キーの範囲
+        pause: 範囲と範囲のあいだに待つ秒数（本番のDBの負荷を抑える）
+        max_seconds: この秒数を過ぎたら次の範囲に進まずに終える（続きは次回）
+        restart: True なら完了済み・途中でも最初からやり直す
+        progress: 範囲ごとに (BackfillProgress, この範囲の更新件数) で呼ばれる関数（オプション）
+
+    Returns:
+        BackfillProgress
+
+    Raises:
+        KeyError: 作業が登録されていない
+    """
+    backfill = BACKFILLS[name]
+    state, created = BackfillProgress.objects.get_or_create(name=name)
+    if created or restart:
+        _start(state, backfill)
+        state.save()
+    elif state.status == 'done':
+        return state
+    elif state.status == 'failed':
+        state.status = 'running'
+        state.error = ''
+        state.save(update_fields=['status', 'error', 'updated_at'])
+
+    deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+    changed_total = 0
+    try:
+        while state.status == 'running' and state.last_id < state.max_id:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            state, changed = _run_chunk(backfill, state.pk, chunk_size)
+            changed_total += changed
+            if progress:
+                progress(state, changed)
+            if pause and state.status == 'running':
+                time.sleep(pause)
+    except Exception as e:
+        BackfillProgress.objects.filter(pk=state.pk).update(status='failed', error=f"{type(e).__name__}: {e}", updated_at=timezone.now())
+        raise
+    finally:
+        if changed_total:
+            # update() で書き込むため post_save が送られない。各プロセスのキャッシュを捨てさせる
+            bump_data_version()
+            if backfill.model in REFERENCE_MODELS:
+                bump_reference_version()
+
+    if state.status == 'running' and state.last_id >= state.max_id:
+        # 対象の行がない場合
+        state.status = 'done'
+        state.finished_at = timezone.now()
+        state.save(update_fields=['status', 'finished_at', 'updated_at'])
+    return state
+
+
+@register('record_village', LanguageRecord, "言語記録の関連集落を話者の集落に合わせる")
+def backfill_record_village(start, end):
+    return fix_record_village_range(start, end)
+
+
+@register('record_cards', LanguageRecord, "一覧のカードを言語記録から作り直す")
+def backfill_record_cards(start, end):
+    return refresh_card_range(start, end)
+
+
+def _sync_geohash_range(model, start, end):
+    """緯度・経度から作った geohash が保存されているものと違う行を書き直す"""
+    rows = model.objects.filter(pk__gt=start, pk__lte=end).order_by().only('pk', 'latitude', 'longitude', 'geohash')
+    changed = []
+    for row in rows:
+        geohash = '' if row.latitude is None or row.longitude is None else encode_geohash(row.latitude, row.longitude)
+        if row.geohash != geohash:
+            row.geohash = geohash
+            changed.append(row)
+    model.objects.bulk_update(changed, ['geohash'])
+    return len(changed)
+
+
+@register('village_geohash', Village, "集落の geohash を緯度・経度から作り直す")
+def backfill_village_geohash(start, end):
+    return _sync_geohash_range(Village, start, end)
+
+
+@register('geographic_geohash', GeographicRecord, "地理環境データの geohash を緯度・経度から作り直す")
+def backfill_geographic_geohash(start, end):
+    return _sync_geohash_range(GeographicRecord, start, end)
+
+
+@register('annotation_tokens', AnnotationSegment, "書き起こしの語の索引を区間の文字列から作り直す")
+def backfill_annotation_tokens(start, end):
+    return retokenize_segment_range(start, end)
@@ -0,0 +1,236 @@
+# language_archive/chunked_upload.py
+# 大きな収録ファイルの分割アップロード（開始 → 分割して PUT → 完了）。
+# 1つの multipart POST で送ると、回線が途中で切れたときに最初から送り直しになり、Django も全体を一時ファイルに書いてから処理する。
+# 分割アップロードでは、受け取った分を SHA-256 を確かめながらスプールファイル（CHUNKED_UPLOAD_DIR）に追記し、
+# 受信済みのバイト数を ChunkedUpload に保存する。接続が切れたらブラウザは受信済みのバイト数を問い合わせて続きから送る。
+# 完了時はスプールファイルをそのままストレージに送り（メモリに読み込まない）、フォームは upload_id でそのURLを使う。
+# スプールファイルは1台のサーバーのディスクに置くため、複数台で動かす場合は同じアップロードを同じサーバーに向けること。
+
+import hashlib
+import os
+import secrets
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChunkedUpload, GeographicRecord, LanguageRecord
+from .services import get_bucket_name, upload_to_supabase
+
+# ブラウザに勧める1回の送信の大きさと、受け付ける上限
+CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+# リクエストの本文を読んでスプールファイルに書く単位
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# 登録先ごとの種類（バケットとストレージのパスを決める）
+CATEGORIES = {
+    'language': dict(LanguageRecord.FILE_TYPE_CHOICES),
+    'geographic': dict(GeographicRecord.CONTENT_TYPE_CHOICES),
+}
+
+
+class UploadError(ValueError):
+    """要求が正しくない（400 で返す）"""
+
+
+class OffsetMismatch(UploadError):
+    """送られた開始位置が受信済みのバイト数と合わない（409 で返し、ブラウザは expected から送り直す）"""
+
+    def __init__(self, expected):
+        super().__init__(f"開始位置が合いません（受信済み {expected} バイト）。")
+        self.expected = expected
+
+
+def spool_path(upload):
+    return Path(settings.CHUNKED_UPLOAD_DIR) / f"{upload.upload_id}.part"
+
+
+def get_upload(upload_id, lock=False):
+    """
+    Raises:
+        KeyError: アップロードがない
+    """
+    uploads = ChunkedUpload.objects.select_for_update() if lock else ChunkedUpload.objects
+    try:
+        return uploads.get(upload_id=upload_id)
+    except ChunkedUpload.DoesNotExist:
+        raise KeyError(upload_id) from None
+
+
+def describe(upload):
+    """ブラウザに返すアップロードの状態"""
+    return {
+        'upload_id': upload.upload_id,
+        'status': upload.status,
+        'offset': upload.offset,
+        'size': upload.size,
+        'chunk_size': CHUNK_SIZE,
+        'file_url': upload.file_url or None,
+        'error': upload.error or None,
+    }
+
+
+def start_upload(target, category, file_name, size, content_type=''):
+    """
+    アップロードを始める（空のスプールファイルを作る）。
+
+    Raises:
+        UploadError: 登録先・種類・サイズが正しくない
+    """
+    if category not in CATEGORIES.get(target, {}):
+        raise UploadError("登録先または種類が正しくありません。")
+    if not file_name:
+        raise UploadError("ファイル名がありません。")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("サイズは整数で指定してください。") from None
+    if not 0 < size <= settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError(f"ファイルの大きさは {settings.CHUNKED_UPLOAD_MAX_SIZE // (1024 ** 3)}GB までです。")
+
+    upload = ChunkedUpload(
+        upload_id=secrets.token_hex(16), target=target, category=category,
+        file_name=os.path.basename(file_name)[:255], content_type=(content_type or '')[:100], size=size,
+    )
+    path = spool_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    upload.save()
+    return upload
+
+
+def _copy(source, destination, length):
+    """source から length バイトまでを destination に書く。(書いたバイト数, SHA-256) を返す"""
+    digest = hashlib.sha256()
+    written = 0
+    while written < length:
+        block = source.read(min(COPY_BLOCK_SIZE, length - written))
+        if not block:
+            break
+        digest.update(block)
+        destination.write(block)
+        written += len(block)
+    return written, digest.hexdigest()
+
+
+def receive_chunk(upload_id, offset, stream, length, checksum=None):
+    """
+    offset から length バイトを stream から受け取り、スプールファイルに書く。
+    回線の遅い受信は一時ファイルに受けてから行い、アップロードの行をロックするのはスプールファイルに追記するあいだだけにする。
+    すでに受け取った分がもう一度届いた場合（応答が届かずにブラウザが送り直した場合）は、内容が同じなら書かずに受け付ける。
+
+    Args:
+        checksum: ブラウザが計算した SHA-256（16進）。あれば受け取った内容と照合する
+
+    Returns:
+        ChunkedUpload
+
+    Raises:
+        KeyError: アップロードがない
+        OffsetMismatch: offset が受信済みのバイト数と合わない
+        UploadError: 大きさ・SHA-256 が合わない、または完了済み
+    """
+    upload = get_upload(upload_id)
+    if upload.status != 'uploading':
+        raise UploadError("このアップロードは完了しています。")
+    if not 0 < length <= MAX_CHUNK_SIZE or offset < 0 or offset + length > upload.size:
+        raise UploadError("送信する大きさが正しくありません。")
+    if offset > upload.offset:
+        raise OffsetMismatch(upload.offset)
+
+    with tempfile.TemporaryFile(dir=settings.CHUNKED_UPLOAD_DIR) as part:
+        written, digest = _copy(stream, part, length)
+        if written != length:
+            raise UploadError("受信が途中で切れました。この分を送り直してください。")
+        if checksum and checksum.lower() != digest:
+            raise UploadError("受信した内容が送信された内容と一致しません。この分を送り直してください。")
+
+        with transaction.atomic():
+            upload = get_upload(upload_id, lock=True)
+            if upload.status != 'uploading':
+                raise UploadError("このアップロードは完了しています。")
+            if offset < upload.offset:
+                if [offset, length, digest] in upload.chunks:
+                    return upload
+                raise OffsetMismatch(upload.offset)
+            if offset != upload.offset:
+                raise OffsetMismatch(upload.offset)
+
+            part.seek(0)
+            with open(spool_path(upload), 'r+b') as spool:
+                spool.seek(offset)
+                _copy(part, spool, length)
+                # 前回の書き込みが途中で止まっていた場合の残りを捨てる
+                spool.truncate()
+                spool.flush()
+                os.fsync(spool.fileno())
+            upload.offset = offset + length
+            upload.chunks.append([offset, length, digest])
+            upload.save(update_fields=['offset', 'chunks', 'updated_at'])
+    return upload
+
+
+def finalize_upload(upload_id):
+    """
+    すべて受信したアップロードをストレージに送り、スプールファイルを消す。
+    送信はスプールファイルを開いたまま requests に渡し、ブロック単位で読みながら送る。
+
+    Returns:
+        ChunkedUpload（file_url にストレージのURL）
+
+    Raises:
+        KeyError: アップロードがない
+        UploadError: まだすべて受信していない
+    """
+    upload = get_upload(upload_id)
+    if upload.status == 'stored':
+        return upload
+    if upload.offset != upload.size:
+        raise UploadError(f"まだすべて受信していません（{upload.offset}/{upload.size} バイト）。")
+
+    path = spool_path(upload)
+    try:
+        with open(path, 'rb') as spool:
+            file = File(spool, name=upload.file_name)
+            file.content_type = upload.content_type
+            upload.file_url = upload_to_supabase(
+                file, get_bucket_name(upload.category), f"{upload.target}/{upload.category}/",
+            )
+    except Exception as e:
+        # スプールファイルは残し、完了をもう一度試せるようにする
+        upload.error = f"{type(e).__name__}: {e}"
+        upload.save(update_fields=['error', 'updated_at'])
+        raise
+    upload.status = 'stored'
+    upload.error = ''
+    upload.save(update_fields=['status', 'file_url', 'error', 'updated_at'])
+    path.unlink(missing_ok=True)
+    return upload
+
+
+def stored_upload(upload_id, target):
+    """フォームで使う、ストレージに送り終えたアップロード（なければ None）"""
+    return ChunkedUpload.objects.filter(upload_id=upload_id, target=target, status='stored').first()
+
+
+def prune_uploads(hours=None):
+    """
+    hours 時間以上更新のないアップロードの状態とスプールファイルを消す。
+    ストレージに送り終えたファイルのうち記録から使われなかったものは collect_storage_garbage が消す。
+
+    Returns:
+        削除した件数
+    """
+    hours = settings.CHUNKED_UPLOAD_EXPIRE_HOURS if hours is None else hours
+    expired = ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=hours))
+    count = 0
+    for upload in expired.iterator():
+        spool_path(upload).unlink(missing_ok=True)
+        upload.delete()
+        count += 1
+    return count
@@ -0,0 +1,60 @@
+# language_archive/data_version.py
+# アーカイブ全体のデータバージョン。
+# 記録・話者・集落などが書き込まれるたびに更新され、キャッシュのキーに含めることで古いキャッシュを無効にする。
+# バージョンは Django のキャッシュ（本番ではDBキャッシュ）に置き、全ワーカーで共有する。
+# 一部の表だけを読むキャッシュ（参照用のテーブルなど）は、key に別のキーを渡して、その表の書き込みでだけ更新するバージョンを使う。
+
+import threading
+import time
+
+from django.core.cache import cache
+
+DATA_VERSION_CACHE_KEY = 'language_archive:data_version'
+
+# 共有キャッシュへの問い合わせを減らすため、プロセス内で値を保持する秒数
+LOCAL_TTL = 2.0
+
+# バージョン付きキャッシュの有効期限（秒）
+VERSIONED_CACHE_TIMEOUT = 60 * 60 * 24
+
+_local = threading.local()
+
+
+def _remember(key, version):
+    if not hasattr(_local, 'versions'):
+        _local.versions = {}
+    _local.versions[key] = (version, time.monotonic())
+    return version
+
+
+def get_data_version(key=DATA_VERSION_CACHE_KEY):
+    """現在のデータバージョンを返す（プロセス内で LOCAL_TTL 秒キャッシュする）"""
+    version, checked_at = getattr(_local, 'versions', {}).get(key, (None, 0.0))
+    if version is not None and time.monotonic() - checked_at < LOCAL_TTL:
+        return version
+
+    version = cache.get(key)
+    if version is None:
+        # 共有キャッシュが空（初回・キャッシュ消去後）なら新しいバージョンを登録する
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return _remember(key, version)
+
+
+def bump_data_version(key=DATA_VERSION_CACHE_KEY):
+    """データが変わったことを記録し、新しいバージョンを返す"""
+    version = time.time_ns()
+    cache.set(key, version, timeout=None)
+    return _remember(key, version)
+
+
+def versioned_cache_get_or_set(key, default, timeout=VERSIONED_CACHE_TIMEOUT):
+    """
+    データバージョンごとにキャッシュする。データが変わると別のキーになるため、古い値は使われない。
+
+    Args:
+        key: キャッシュキー（バージョンは自動で付与される）
+        default: キャッシュがない場合に値を計算する関数
+        timeout: 有効期限（秒）。古いバージョンのキーは期限切れか通常のキャッシュ追い出しで消える
+    """
+    return cache.get_or_set(f'{key}:v{get_data_version()}', default, timeout=timeout)
@@ -0,0 +1,39 @@
+# language_archive/db_routers.py
+# 読み取り専用レプリカへのルーティング。
+# 読み取り系ビュー（@read_replica を付けたビュー）の GET/HEAD だけをレプリカに送り、
+# それ以外（アップロード・管理画面・セッション等）はすべてプライマリ（default）を使う。
+
+from contextvars import ContextVar
+
+REPLICA_DB_ALIAS = 'replica'
+
+# 現在のリクエストの読み取り先。ReadReplicaMiddleware が設定・解除する
+_read_db_alias = ContextVar('read_db_alias', default=None)
+
+
+def read_replica(view_func):
+    """読み取り系ビューであることを示すデコレーター（同期・非同期ビューの両方に使える）"""
+    view_func.use_read_replica = True
+    return view_func
+
+
+def set_read_db(alias):
+    """
+    このコンテキストでの読み取り先を設定する（None でルーターの既定＝プライマリ）。
+    ASGI ではミドルウェアの各メソッドが別スレッドで動くため、Token による reset ではなく値を直接戻す。
+    """
+    _read_db_alias.set(alias)
+
+
+class ReadReplicaRouter:
+    """読み取り系ビューの中だけレプリカを読み、書き込みは常にプライマリに送るルーター"""
+
+    def db_for_read(self, model, **hints):
+        return _read_db_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカはプライマリの複製なので、どちらから読んだオブジェクト同士でも関連付けてよい
+        return True
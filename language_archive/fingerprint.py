@@ -0,0 +1,318 @@
+# language_archive/fingerprint.py
+# 音声の指紋（fingerprint）による重複・重なりの検出。
+# 音声を 8kHz のモノラルにし、NumPy の短時間フーリエ変換（STFT）のスペクトログラムから局所的なピークを取り出す。
+# 近いピークの組（周波数1, 周波数2, 時間差）をハッシュにして AudioFingerprint（転置索引）に保存し、
+# 同じハッシュを持つ記録のうち「時刻のずれ」がそろうものを、同じ区間を含む記録とみなす。
+# 切り出し・再エンコード・別の機器での録音でもピークの位置は大きく変わらないため、バイト列のハッシュより強い。
+
+import logging
+import threading
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AudioFingerprint, AudioFingerprintState, AudioMatch, LanguageRecord
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 8000
+N_FFT = 1024
+HOP = 256  # 1フレーム = 32ms
+# ピークとみなす範囲（前後のフレーム数・上下の周波数ビン数）。この範囲で最大の点だけを残す
+PEAK_FRAMES = 10
+PEAK_BINS = 15
+# 直流付近と、ハッシュの9ビットに収まらない最上端のビンは使わない
+MIN_BIN = 8
+MAX_BIN = 511
+# 無音・小さな雑音のピークを除く（ブロック内の中央値からの差、dB）
+PEAK_MIN_DB = 10
+# 1つのピークと組にする後続のピークの数と、組にする時間差の上限（フレーム。6ビット）
+FAN_OUT = 5
+LOOKAHEAD = 15
+MAX_DT = 63
+# STFT とピークの検出をこのフレーム数ずつ行う（長い音声でもメモリを一定に保つ）
+BLOCK_FRAMES = 2048
+# WAV を読むときのフレーム数（入力側のサンプリング周波数で）
+READ_FRAMES = 1 << 18
+
+# 時刻のそろったハッシュがこの数以上あれば、同じ区間を含むとみなす
+MIN_ALIGNED = 20
+# 1つの記録について保存する一致の上限
+MAX_MATCHES = 10
+# 一度に照合するハッシュの数（SQL の IN の上限に合わせる）
+LOOKUP_BATCH = 500
+INSERT_BATCH = 5000
+
+WAV_SUFFIXES = {'.wav', '.wave'}
+
+# アップロード後の計算を別スレッドで行う（テストでは False にして同期的に行う）
+FINGERPRINT_IN_BACKGROUND = True
+
+
+class UnsupportedAudio(ValueError):
+    """指紋を計算できない形式（WAV の PCM 以外）"""
+
+
+def _pcm_to_float(raw, sample_width):
+    import numpy as np
+
+    if sample_width == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if sample_width == 2:
+        return np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    if sample_width == 3:
+        # 24ビットは下位に1バイト足して32ビットとして読む
+        triples = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(triples), 4), dtype=np.uint8)
+        padded[:, 1:] = triples
+        return padded.view('<i4').ravel().astype(np.float32) / 2 ** 31
+    if sample_width == 4:
+        return np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2 ** 31
+    raise UnsupportedAudio(f'{sample_width * 8}ビットの WAV には対応していません')
+
+
+def read_wav(file):
+    """
+    WAV（PCM）を少しずつ読み、8kHz のモノラル（float32）にして返す。
+
+    Raises:
+        UnsupportedAudio: WAV の PCM でない
+    """
+    import math
+    import wave
+
+    import numpy as np
+    from scipy.signal import resample_poly
+
+    try:
+        reader = wave.open(file, 'rb')
+    except (wave.Error, EOFError) as e:
+        raise UnsupportedAudio(f'WAV を読めません: {e}') from e
+    with reader:
+        channels, sample_width, rate = reader.getnchannels(), reader.getsampwidth(), reader.getframerate()
+        divisor = math.gcd(SAMPLE_RATE, rate)
+        up, down = SAMPLE_RATE // divisor, rate // divisor
+        chunks = []
+        while True:
+            raw = reader.readframes(READ_FRAMES)
+            if not raw:
+                break
+            samples = _pcm_to_float(raw, sample_width).reshape(-1, channels).mean(axis=1)
+            chunks.append(resample_poly(samples, up, down).astype(np.float32) if up != down else samples)
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+
+def spectral_peaks(samples):
+    """
+    スペクトログラム（対数振幅）の局所的なピークを返す。STFT はフレームを strides で並べて一度に計算する。
+
+    Returns:
+        (フレーム番号の配列, 周波数ビンの配列)。フレーム順
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+    from scipy.ndimage import maximum_filter
+
+    frame_count = (len(samples) - N_FFT) // HOP + 1
+    if frame_count <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    frames_view = sliding_window_view(samples, N_FFT)[::HOP]
+    window = np.hanning(N_FFT).astype(np.float32)
+
+    all_frames, all_bins = [], []
+    for block_start in range(0, frame_count, BLOCK_FRAMES):
+        block_end = min(block_start + BLOCK_FRAMES, frame_count)
+        # 境界のピークを正しく判定できるよう、前後に PEAK_FRAMES ずつ余分に計算する
+        low, high = max(0, block_start - PEAK_FRAMES), min(frame_count, block_end + PEAK_FRAMES)
+        spectrum = np.abs(np.fft.rfft(frames_view[low:high] * window, axis=1))
+        db = 20 * np.log10(spectrum + 1e-6)
+        is_peak = (
+            (db == maximum_filter(db, size=(2 * PEAK_FRAMES + 1, 2 * PEAK_BINS + 1), mode='constant', cval=-np.inf))
+            & (db > np.median(db) + PEAK_MIN_DB)
+        )
+        frames, bins = np.nonzero(is_peak)
+        frames += low
+        keep = (frames >= block_start) & (frames < block_end) & (bins >= MIN_BIN) & (bins <= MAX_BIN)
+        all_frames.append(frames[keep])
+        all_bins.append(bins[keep])
+    return np.concatenate(all_frames), np.concatenate(all_bins)
+
+
+def peak_hashes(frames, bins):
+    """
+    ピークを後続の FAN_OUT 個のピークと組にし、(周波数1:9ビット, 周波数2:9ビット, 時間差:6ビット) のハッシュにする。
+
+    Returns:
+        (ハッシュの配列, 組の最初のピークのフレーム番号の配列)
+    """
+    import numpy as np
+
+    order = np.lexsort((bins, frames))
+    frames, bins = frames[order], bins[order]
+    taken = np.zeros(len(frames), dtype=np.int64)
+    hashes, offsets = [], []
+    for step in range(1, LOOKAHEAD + 1):
+        anchors = np.arange(len(frames) - step)
+        targets = anchors + step
+        dt = frames[targets] - frames[anchors]
+        valid = (dt >= 1) & (dt <= MAX_DT) & (taken[anchors] < FAN_OUT)
+        taken[anchors[valid]] += 1
+        hashes.append((bins[anchors[valid]] << 15) | (bins[targets[valid]] << 6) | dt[valid])
+        offsets.append(frames[anchors[valid]])
+    if not hashes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(hashes), np.concatenate(offsets)
+
+
+def fingerprint_samples(samples):
+    """8kHz のモノラルの音声から (ハッシュ, フレーム番号) の配列を作る"""
+    return peak_hashes(*spectral_peaks(samples))
+
+
+def find_matches(hashes, offsets, exclude_record_id=None, min_aligned=MIN_ALIGNED, limit=MAX_MATCHES):
+    """
+    ハッシュを転置索引で引き、時刻のずれがそろうハッシュの多い記録を返す。
+    同じハッシュの (索引の時刻 − 問い合わせの時刻) を記録ごとに数え、最も多いずれの件数をその記録の一致数とする。
+
+    Returns:
+        (記録ID, 時刻のそろったハッシュの数, ずれ[ミリ秒。問い合わせの先頭が相手の記録の何ミリ秒目にあたるか]) のリスト（一致数の多い順）
+    """
+    import numpy as np
+
+    if not len(hashes):
+        return []
+    order = np.argsort(hashes, kind='stable')
+    query_hashes, query_offsets = hashes[order], offsets[order]
+    unique_hashes = np.unique(query_hashes)
+
+    found = []
+    for start in range(0, len(unique_hashes), LOOKUP_BATCH):
+        rows = AudioFingerprint.objects.filter(hash__in=unique_hashes[start:start + LOOKUP_BATCH].tolist())
+        if exclude_record_id is not None:
+            rows = rows.exclude(record_id=exclude_record_id)
+        found.extend(rows.values_list('hash', 'record_id', 'offset'))
+    if not found:
+        return []
+    found = np.array(found, dtype=np.int64)
+
+    # 索引の各行を、同じハッシュを持つ問い合わせ側の全ピークと組にする（repeat で展開）
+    left = np.searchsorted(query_hashes, found[:, 0], side='left')
+    counts = np.searchsorted(query_hashes, found[:, 0], side='right') - left
+    rows = np.repeat(np.arange(len(found)), counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    deltas = found[rows, 2] - query_offsets[left[rows] + within]
+
+    keys, votes = np.unique(np.stack([found[rows, 1], deltas], axis=1), axis=0, return_counts=True)
+    best = {}
+    for (record_id, delta), count in zip(keys.tolist(), votes.tolist()):
+        if count >= min_aligned and count > best.get(record_id, (0, 0))[0]:
+            best[record_id] = (count, delta)
+    ranked = sorted(best.items(), key=lambda item: -item[1][0])[:limit]
+    return [(record_id, count, round(delta * HOP * 1000 / SAMPLE_RATE)) for record_id, (count, delta) in ranked]
+
+
+def is_supported(url):
+    """指紋を計算する形式か（いまは WAV のみ）"""
+    return bool(url) and Path(url.split('?')[0]).suffix.lower() in WAV_SUFFIXES
+
+
+def fingerprint_record(record_id):
+    """
+    記録の音声の指紋を計算して索引を置き換え、同じ区間を含む記録を AudioMatch に保存する。
+
+    Returns:
+        AudioFingerprintState
+    """
+    import tempfile
+
+    from . import services
+
+    record = LanguageRecord.objects.get(id=record_id)
+    url = record.file_path or ''
+    state = AudioFingerprintState(record=record, file_path=url, fingerprinted_at=timezone.now())
+    hashes = offsets = None
+    if record.file_type != 'audio' or not is_supported(url):
+        state.status = 'unsupported'
+    else:
+        try:
+            with tempfile.TemporaryFile() as f:
+                for chunk in services.open_media_stream(url, 1 << 20):
+                    f.write(chunk)
+                f.seek(0)
+                samples = read_wav(f)
+            hashes, offsets = fingerprint_samples(samples)
+            state.status = 'ok'
+            state.duration_ms = round(len(samples) * 1000 / SAMPLE_RATE)
+            state.hash_count = len(hashes)
+        except UnsupportedAudio as e:
+            state.status, state.error = 'unsupported', str(e)
+        except Exception as e:
+            logger.warning("音声の指紋を計算できませんでした (#%s): %s", record_id, e)
+            state.status, state.error = 'failed', f'{type(e).__name__}: {e}'
+
+    matches = find_matches(hashes, offsets, exclude_record_id=record_id) if hashes is not None else []
+    other_counts = dict(
+        AudioFingerprintState.objects.filter(record_id__in=[other_id for other_id, _, _ in matches])
+        .values_list('record_id', 'hash_count')
+    )
+    with transaction.atomic():
+        AudioFingerprint.objects.filter(record=record).delete()
+        # 音声が変わったときに古い一致が残らないよう、相手側から見た一致も作り直す
+        AudioMatch.objects.filter(Q(record=record) | Q(other=record)).delete()
+        AudioFingerprintState.objects.filter(record=record).delete()
+        state.save()
+        if hashes is not None:
+            AudioFingerprint.objects.bulk_create(
+                (AudioFingerprint(hash=h, record=record, offset=o) for h, o in zip(hashes.tolist(), offsets.tolist())),
+                batch_size=INSERT_BATCH,
+            )
+        # 一致の割合はそれぞれの記録のハッシュの数に対する割合（短い切り出しは長い元の記録より大きくなる）
+        pairs = []
+        for other_id, count, offset_ms in matches:
+            pairs.append(AudioMatch(
+                record=record, other_id=other_id, aligned_hashes=count,
+                coverage=min(1.0, count / max(len(hashes), 1)), offset_ms=offset_ms,
+            ))
+            pairs.append(AudioMatch(
+                record_id=other_id, other=record, aligned_hashes=count,
+                coverage=min(1.0, count / max(other_counts.get(other_id) or 0, 1)), offset_ms=-offset_ms,
+            ))
+        AudioMatch.objects.bulk_create(pairs)
+    return state
+
+
+def _fingerprint_all(record_ids):
+    for record_id in record_ids:
+        try:
+            fingerprint_record(record_id)
+        except LanguageRecord.DoesNotExist:
+            pass
+        except Exception:
+            logger.exception("音声の指紋の計算に失敗しました (#%s)", record_id)
+
+
+def _fingerprint_in_background(record_ids):
+    from django.db import connections
+    try:
+        _fingerprint_all(record_ids)
+    finally:
+        # このスレッドで開いた接続を閉じる
+        connections.close_all()
+
+
+def schedule_fingerprint(records):
+    """
+    アップロードされた記録のうち WAV の音声の指紋を、コミット後に計算する（FINGERPRINT_IN_BACKGROUND なら別スレッドで）。
+    """
+    record_ids = [record.id for record in records if record.file_type == 'audio' and is_supported(record.file_path)]
+    if not record_ids:
+        return
+
+    def start():
+        if FINGERPRINT_IN_BACKGROUND:
+            threading.Thread(target=_fingerprint_in_background, args=(record_ids,), name='audio-fingerprint', daemon=True).start()
+        else:
+            _fingerprint_all(record_ids)
+    transaction.on_commit(start)
@@ -1,11 +1,31 @@
 # language_archive/forms.py
 
 from django import forms
-from .models import LanguageRecord, GeographicRecord, Speaker, Village
+from .chunked_upload import stored_upload
+from .models import LanguageRecord, GeographicRecord, Speaker, Village, OnomatopoeiaType
+from .reference_data import ReferenceChoiceField
+
+def _clean_upload(upload_id, target):
+    """分割アップロードの upload_id を、ストレージに送り終えた ChunkedUpload にする"""
+    if not upload_id:
+        return None
+    upload = stored_upload(upload_id, target)
+    if upload is None:
+        raise forms.ValidationError("アップロードが完了していません。ファイルを選び直してください。")
+    return upload
+
+
+def _check_upload_category(upload, category):
+    """分割アップロードの種類（保存したバケット）が、フォームで選んだ種類と同じか確かめる"""
+    if upload is not None and category and upload.category != category:
+        raise forms.ValidationError("アップロードしたファイルの種類が選択した種類と違います。ファイルを選び直してください。")
+
 
 class LanguageRecordForm(forms.ModelForm):
     """言語記録アップロードフォーム"""
     file = forms.FileField(label="ファイル", required=False)
+    # 分割アップロード（chunked_upload.py）で送り終えたファイル。ブラウザが file の代わりに設定する
+    upload_id = forms.CharField(required=False, widget=forms.HiddenInput)
     youtube_url = forms.URLField(
         label="YouTube URL", 
         required=False,
@@ -40,10 +60,13 @@ class LanguageRecordForm(forms.ModelForm):
         self.fields['onomatopoeia_type'].required = False
         self.fields['onomatopoeia_type'].empty_label = "オノマトペ型を選択"
 
+    def clean_upload_id(self):
+        return _clean_upload(self.cleaned_data.get('upload_id'), 'language')
+
     # サーバーサイドでのバリデーション
     def clean(self):
         cleaned_data = super().clean()
-        file = cleaned_data.get('file')
+        file = cleaned_data.get('file') or cleaned_data.get('upload_id')
         youtube_url = cleaned_data.get('youtube_url')
 
         # ファイルまたはYouTube URLのどちらかが必須
@@ -68,6 +91,7 @@ class LanguageRecordForm(forms.ModelForm):
                 raise forms.ValidationError("用例を入力してください。")
             if not cleaned_data.get('onomatopoeia_type'):
                 raise forms.ValidationError("オノマトペ型を選択してください。")
+            _check_upload_category(cleaned_data.get('upload_id'), cleaned_data.get('file_type'))
 
         return cleaned_data
 
@@ -79,6 +103,8 @@ class LanguageRecordForm(forms.ModelForm):
             'onomatopoeia_type', 'recorded_date', 'notes', 'youtube_url',
             'title', 'description'
         ]
+        # 選択肢は参照用のテーブルのキャッシュから作る（表示のたびに全件を読まない）
+        field_classes = {'speaker': ReferenceChoiceField, 'onomatopoeia_type': ReferenceChoiceField}
         widgets = {
             'title': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -91,7 +117,9 @@ class LanguageRecordForm(forms.ModelForm):
             }),
             'onomatopoeia_text': forms.TextInput(attrs={
                 'class': 'form-control',
-                'placeholder': 'オノマトペを入力'
+                'placeholder': 'オノマトペを入力',
+                # 既存の表記を入力補完で出し、表記の揺れを減らす
+                'data-autocomplete': 'onomatopoeia',
             }),
             'meaning': forms.Textarea(attrs={
                 'class': 'form-control',
@@ -124,9 +152,87 @@ class LanguageRecordForm(forms.ModelForm):
         }
 
 
+class MultipleFileInput(forms.ClearableFileInput):
+    """複数ファイルを選択できるファイル入力"""
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """複数ファイルを受け取り、UploadedFile のリストを返すフィールド"""
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(d, initial) for d in data]
+        return [single_file_clean(data, initial)] if data else []
+
+
+class LanguageRecordBatchForm(forms.Form):
+    """言語記録の一括アップロードフォーム（全ファイル共通の項目）"""
+    MAX_FILES = 100
+
+    files = MultipleFileField(label="ファイル")
+    speaker = ReferenceChoiceField(
+        queryset=Speaker.objects.all(), label="話者", empty_label="話者を選択",
+        widget=forms.Select(attrs={'class': 'form-control', 'required': True}),
+    )
+    recorded_date = forms.DateField(
+        label="収録日",
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    file_type = forms.ChoiceField(
+        label="ファイル種類",
+        choices=[("", "ファイル種類を選択")] + list(LanguageRecord.FILE_TYPE_CHOICES),
+        widget=forms.Select(attrs={'class': 'form-control', 'required': True}),
+    )
+    onomatopoeia_type = ReferenceChoiceField(
+        queryset=OnomatopoeiaType.objects.all(), label="オノマトペ型", required=False,
+        empty_label="オノマトペ型を選択",
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    language_frequency = forms.ChoiceField(
+        label="言語使用頻度", choices=LanguageRecord.FREQUENCY_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    notes = forms.CharField(
+        label="備考", required=False,
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 2, 'placeholder': '備考（オプション）'}),
+    )
+
+    def clean_files(self):
+        files = self.cleaned_data.get('files') or []
+        if not files:
+            raise forms.ValidationError("ファイルを1つ以上選択してください。")
+        if len(files) > self.MAX_FILES:
+            raise forms.ValidationError(f"一度にアップロードできるファイルは{self.MAX_FILES}件までです。")
+        return files
+
+
+class LanguageRecordBatchItemForm(forms.Form):
+    """
+    一括アップロードのファイルごとの項目。
+    prefix="items-<ファイルの順番>" で使う。空欄の種類・型は共通の値が使われる。
+    """
+    onomatopoeia_text = forms.CharField(max_length=100, label="オノマトペ")
+    meaning = forms.CharField(label="意味")
+    usage_example = forms.CharField(label="用例")
+    phonetic_notation = forms.CharField(label="音声記号", required=False)
+    file_type = forms.ChoiceField(
+        label="ファイル種類", choices=[("", "共通の種類")] + list(LanguageRecord.FILE_TYPE_CHOICES), required=False,
+    )
+    onomatopoeia_type = ReferenceChoiceField(
+        queryset=OnomatopoeiaType.objects.all(), label="オノマトペ型", required=False,
+    )
+
+
 class GeographicRecordForm(forms.ModelForm):
     """地理環境データアップロードフォーム"""
     file = forms.FileField(label="ファイル", required=False)  # ファイルは任意に変更
+    # 分割アップロード（chunked_upload.py）で送り終えたファイル。ブラウザが file の代わりに設定する
+    upload_id = forms.CharField(required=False, widget=forms.HiddenInput)
     youtube_url = forms.URLField(
         label="YouTube URL", 
         required=False,
@@ -157,9 +263,12 @@ class GeographicRecordForm(forms.ModelForm):
             raise forms.ValidationError("コンテンツ種類を選択してください。")
         return data
     
+    def clean_upload_id(self):
+        return _clean_upload(self.cleaned_data.get('upload_id'), 'geographic')
+
     def clean(self):
         cleaned_data = super().clean()
-        file = cleaned_data.get('file')
+        file = cleaned_data.get('file') or cleaned_data.get('upload_id')
         youtube_url = cleaned_data.get('youtube_url')
         
         # ファイルまたはYouTube URLのどちらかが必須
@@ -169,7 +278,8 @@ class GeographicRecordForm(forms.ModelForm):
         # 両方入力されている場合はエラー
         if file and youtube_url:
             raise forms.ValidationError("ファイルとYouTube URLの両方は指定できません。どちらか一方を選択してください。")
-        
+
+        _check_upload_category(cleaned_data.get('upload_id'), cleaned_data.get('content_type'))
         return cleaned_data
     
     class Meta:
@@ -178,6 +288,7 @@ class GeographicRecordForm(forms.ModelForm):
             'title', 'content_type', 'description', 'village',
             'latitude', 'longitude', 'captured_date', 'youtube_url'
         ]
+        field_classes = {'village': ReferenceChoiceField}
         widgets = {
             'title': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -208,6 +319,7 @@ class SpeakerForm(forms.ModelForm):
             'speaker_id', 'age_range', 'gender', 'village',
             'consent_video', 'notes'
         ]
+        field_classes = {'village': ReferenceChoiceField}
         widgets = {
             'speaker_id': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -0,0 +1,163 @@
+# language_archive/geo.py
+# 緯度・経度の近傍検索（半径 r 以内・近い順に k 件）。
+# 集落・地理環境データは緯度・経度から作った geohash（GEOHASH_PRECISION 桁）を索引付きの列に持つ。
+# 検索では、円を覆う geohash のセル（最大9つ）の範囲で索引から候補を絞り、候補の距離だけを numpy でまとめて計算する。
+# numpy は起動時間に響くため、使う関数の中で読み込む。
+
+import math
+
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_M = 6371008.8
+
+# 検索できる半径の上限（メートル）と、近い順の検索で最初に調べる半径（足りなければ広げていく）
+MAX_RADIUS_M = 100_000
+NEAREST_START_RADIUS_M = 500
+NEAREST_GROWTH = 4
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """緯度・経度の geohash"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    value = bits = 0
+    even = True  # 経度のビットから始める
+    while len(chars) < precision:
+        target, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (target[0] + target[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            target[0] = middle
+        else:
+            target[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            value = bits = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """precision 桁の geohash のセルの (緯度方向, 経度方向) の大きさ（度）"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def _bounding_box(latitude, radius_m):
+    """
+    中心から radius_m 以内の点が収まる (緯度の幅, 経度の幅)（度、片側）。
+    極を含む場合は経度で絞れないため、経度の幅は None。
+    """
+    angle = radius_m / EARTH_RADIUS_M
+    dlat = math.degrees(angle)
+    cos_lat = math.cos(math.radians(latitude))
+    if math.sin(angle) >= cos_lat:
+        return dlat, None
+    return dlat, math.degrees(math.asin(math.sin(angle) / cos_lat))
+
+
+def covering_cells(latitude, longitude, radius_m):
+    """
+    中心から radius_m 以内を覆う geohash のセル（接頭辞）の集合。絞り込めないほど広ければ None。
+    セルの縦横が円の外接矩形の半分以上になる最も細かい桁数を選ぶと、外接矩形は縦横3セル以内に収まり、
+    中心と矩形の辺・角の9点を含むセルで覆える。
+    """
+    dlat, dlon = _bounding_box(latitude, radius_m)
+    if dlon is None:
+        return None
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if height >= dlat and width >= dlon:
+            break
+    else:
+        return None
+    latitudes = [min(max(latitude + offset, -90.0), 90.0) for offset in (-dlat, 0.0, dlat)]
+    longitudes = [(longitude + offset + 180.0) % 360.0 - 180.0 for offset in (-dlon, 0.0, dlon)]
+    return {encode(lat, lon, precision) for lat in latitudes for lon in longitudes}
+
+
+def cell_filter(latitude, longitude, radius_m, field='geohash'):
+    """
+    covering_cells のセルに入る行の Q（絞り込めなければ None）。
+    LIKE ではなく範囲で書き、照合順序によらず geohash の列の通常の索引で引けるようにする。
+    """
+    cells = covering_cells(latitude, longitude, radius_m)
+    if cells is None:
+        return None
+    condition = Q()
+    for prefix in sorted(cells):
+        upper = prefix + BASE32[-1] * (GEOHASH_PRECISION - len(prefix))
+        condition |= Q(**{f'{field}__gte': prefix, f'{field}__lte': upper})
+    return condition
+
+
+def haversine_m(latitude, longitude, latitudes, longitudes):
+    """中心から各点までの大円距離（メートル、numpy の配列で返す）"""
+    import numpy as np
+
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(longitudes, dtype=np.float64) - longitude)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _nearest_rows(rows, latitude, longitude, radius_m):
+    import numpy as np
+
+    if not rows:
+        return []
+    ids, latitudes, longitudes = zip(*rows)
+    distances = haversine_m(latitude, longitude, latitudes, longitudes)
+    inside = np.flatnonzero(distances <= radius_m)
+    order = inside[np.argsort(distances[inside], kind='stable')]
+    return [(ids[i], float(distances[i])) for i in order]
+
+
+def within_radius(queryset, latitude, longitude, radius_m, prune=True):
+    """
+    queryset（latitude・longitude・geohash の列を持つモデル）のうち、中心から radius_m 以内の行。
+
+    Args:
+        prune: False なら geohash で絞らず全行の距離を計算する（比較・確認用）
+
+    Returns:
+        (主キー, 距離m) のリスト（近い順）
+    """
+    queryset = queryset.filter(latitude__isnull=False, longitude__isnull=False)
+    cells = cell_filter(latitude, longitude, radius_m) if prune else None
+    if cells is not None:
+        queryset = queryset.filter(cells)
+    rows = list(queryset.order_by().values_list('pk', 'latitude', 'longitude'))
+    return _nearest_rows(rows, latitude, longitude, radius_m)
+
+
+def nearest(queryset, latitude, longitude, k, max_radius_m=MAX_RADIUS_M):
+    """
+    中心に近い順に最大 k 件（max_radius_m より遠い行は含めない）。
+    半径を NEAREST_START_RADIUS_M から広げながら within_radius で探し、k 件見つかった半径で打ち切る
+    （その半径の内側はすべて調べているため、近い順の上位 k 件は確定する）。
+
+    Returns:
+        (主キー, 距離m) のリスト（近い順）
+    """
+    radius = min(NEAREST_START_RADIUS_M, max_radius_m)
+    while True:
+        found = within_radius(queryset, latitude, longitude, radius)
+        if len(found) >= k or radius >= max_radius_m:
+            return found[:k]
+        radius = min(radius * NEAREST_GROWTH, max_radius_m)
+
+
+def format_distance(distance_m):
+    """画面に表示する距離（1km 未満はメートル、それ以上は 0.1km 単位）"""
+    if distance_m < 1000:
+        return f"{distance_m:.0f}m"
+    return f"{distance_m / 1000:.1f}km"
@@ -0,0 +1,72 @@
+# language_archive/management/commands/backfill.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.backfill import BACKFILLS, DEFAULT_CHUNK_SIZE, run_backfill
+from language_archive.models import BackfillProgress
+
+
+class Command(BaseCommand):
+    help = (
+        "登録されたバックフィル（派生した列の埋め直し）を主キーの範囲ごとに短いトランザクションで実行します。"
+        "進み具合は範囲ごとに保存し、中断しても次回は続きから再開します。完了済みの作業は --restart を付けない限り実行しません。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='実行する作業名（省略時は --all か --list が必要）')
+        parser.add_argument('--all', action='store_true', help='登録されているすべての作業を実行する（完了済みは飛ばす）')
+        parser.add_argument('--list', action='store_true', help='作業と進み具合を表示する')
+        parser.add_argument('--restart', action='store_true', help='完了済み・途中の作業を最初からやり直す')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='1回のトランザクションで処理する主キーの範囲')
+        parser.add_argument('--pause', type=float, default=0.0, help='範囲と範囲のあいだに待つ秒数')
+        parser.add_argument('--max-seconds', type=float, help='この秒数を過ぎたら中断する（続きは次回。デプロイ時間の上限に合わせる）')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            self._show()
+            return
+        unknown = [name for name in options['names'] if name not in BACKFILLS]
+        if unknown:
+            raise CommandError(f"登録されていない作業です: {', '.join(unknown)}（{', '.join(BACKFILLS)}）")
+        names = list(BACKFILLS) if options['all'] else options['names']
+        if not names:
+            raise CommandError('作業名か --all を指定してください（一覧は --list）。')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size は1以上を指定してください。')
+        if options['pause'] < 0:
+            raise CommandError('--pause は0以上を指定してください。')
+
+        def progress(state, changed):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{state.name}: ID {state.last_id}/{state.max_id}: {changed}件")
+
+        remaining = options['max_seconds']
+        for name in names:
+            if remaining is not None and remaining <= 0:
+                self.stdout.write(self.style.WARNING(f"{name}: 時間切れのため次回に回します。"))
+                continue
+            started = time.monotonic()
+            state = run_backfill(
+                name, chunk_size=options['chunk_size'], pause=options['pause'], max_seconds=remaining,
+                restart=options['restart'], progress=progress,
+            )
+            if remaining is not None:
+                remaining -= time.monotonic() - started
+            if state.status == 'done':
+                self.stdout.write(self.style.SUCCESS(f"{name}: 完了（更新 {state.changed}件）"))
+            else:
+                self.stdout.write(self.style.WARNING(f"{name}: 中断（ID {state.last_id}/{state.max_id}、続きは次回）"))
+
+    def _show(self):
+        states = {state.name: state for state in BackfillProgress.objects.all()}
+        for name, backfill in BACKFILLS.items():
+            state = states.get(name)
+            if state is None:
+                status = '未実行'
+            else:
+                status = f"{state.get_status_display()} ID {state.last_id}/{state.max_id}、更新 {state.changed}件"
+                if state.error:
+                    status += f"、{state.error}"
+            self.stdout.write(f"{name}: {backfill.description}（{status}）")
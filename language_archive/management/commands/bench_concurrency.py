@@ -0,0 +1,81 @@
+# language_archive/management/commands/bench_concurrency.py
+
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/', '/records/', '/map/']
+
+
+def _percentile(sorted_values, pct):
+    """ソート済みリストのパーセンタイル値（最近傍法）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "起動中のサーバーに同時接続で負荷をかけ、スループットとレイテンシを計測します。"
+        "同期（gunicorn sync）とASGI（uvicorn）の各プロファイルで実行して比較します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='計測対象のURL')
+        parser.add_argument('--path', action='append', dest='paths', help='リクエストするパス（複数指定可）')
+        parser.add_argument('--concurrency', type=int, default=200, help='同時接続数')
+        parser.add_argument('--requests', type=int, default=2000, help='総リクエスト数')
+        parser.add_argument('--timeout', type=float, default=60.0, help='1リクエストのタイムアウト（秒）')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency と --requests は1以上を指定してください。')
+
+        paths = options['paths'] or DEFAULT_PATHS
+        latencies, errors, elapsed = asyncio.run(self._run(
+            options['base_url'].rstrip('/'), paths,
+            options['concurrency'], options['requests'], options['timeout'],
+        ))
+
+        latencies.sort()
+        completed = len(latencies)
+        self.stdout.write(f"対象: {options['base_url']} {', '.join(paths)}")
+        self.stdout.write(f"同時接続数: {options['concurrency']}  総リクエスト数: {options['requests']}")
+        self.stdout.write(f"成功: {completed}  失敗: {errors}  所要時間: {elapsed:.2f}s")
+        self.stdout.write(f"スループット: {completed / elapsed if elapsed else 0:.1f} req/s")
+        for pct in (50, 90, 95, 99):
+            self.stdout.write(f"p{pct}: {_percentile(latencies, pct) * 1000:.1f} ms")
+        if latencies:
+            self.stdout.write(f"max: {latencies[-1] * 1000:.1f} ms")
+
+    async def _run(self, base_url, paths, concurrency, total, timeout):
+        import httpx
+
+        latencies = []
+        errors = 0
+        counter = iter(range(total))
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+            async def worker():
+                nonlocal errors
+                for i in counter:
+                    url = f"{base_url}{paths[i % len(paths)]}"
+                    started = time.perf_counter()
+                    try:
+                        response = await client.get(url)
+                        if response.status_code >= 400:
+                            errors += 1
+                            continue
+                    except httpx.HTTPError:
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+        return latencies, errors, elapsed
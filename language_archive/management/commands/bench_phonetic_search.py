@@ -0,0 +1,74 @@
+# language_archive/management/commands/bench_phonetic_search.py
+
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.phonetic import FULL, PhoneticIndex, build_phonetic_index
+
+CONSONANTS = ['k', 'kʰ', 'kʲ', 'g', 't', 'tʰ', 'd', 's', 'ɕ', 't͡ɕ', 'ɸ', 'h', 'm', 'n', 'ɾ', 'j', 'w', 'p', 'pʰ', 'b', 'ʔ']
+VOWELS = ['a', 'aː', 'i', 'iː', 'u', 'uː', 'e', 'o', 'ɨ']
+
+
+def _synthetic_word(rng):
+    """オノマトペらしい合成の音声記号（CV音節を1〜2個、半分は重ねる）"""
+    syllables = ''.join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(1, 2)))
+    return syllables * 2 if rng.random() < 0.5 else syllables + rng.choice(CONSONANTS) + rng.choice(VOWELS)
+
+
+class Command(BaseCommand):
+    help = "音声記号のあいまい検索を、BK木と全件比較で比べます（既定は10万件の合成データ）。"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=100000, help='合成データの件数')
+        parser.add_argument('--from-db', action='store_true', help='合成データではなくDBの音声記号を使う')
+        parser.add_argument('--queries', type=int, default=50, help='検索の回数')
+        parser.add_argument('--distance', type=float, default=1.0, help='許容する距離（分節、0.5刻み）')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['records'] < 1 or options['queries'] < 1:
+            raise CommandError('--records と --queries は1以上を指定してください。')
+        rng = random.Random(options['seed'])
+
+        started = time.perf_counter()
+        if options['from_db']:
+            index = build_phonetic_index()
+            notations = list(self._terms(index))
+        else:
+            notations = [_synthetic_word(rng) for _ in range(options['records'])]
+            index = PhoneticIndex(enumerate(notations, start=1))
+        build_s = time.perf_counter() - started
+        if not index.size:
+            raise CommandError('音声記号のある記録がありません。')
+        self.stdout.write(f"索引: 記録 {index.size}件 / 異なる分節列 {index.nodes}件  構築 {build_s:.1f}s")
+
+        max_distance = int(round(options['distance'] * FULL))
+        queries = [rng.choice(notations) for _ in range(options['queries'])]
+        for label, brute_force in (('BK木', False), ('全件比較', True)):
+            started = time.perf_counter()
+            comparisons = 0
+            hits = 0
+            for query in queries:
+                results, compared = index.search_with_stats(query, max_distance, brute_force=brute_force)
+                comparisons += compared
+                hits += len(results)
+            elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+            self.stdout.write(
+                f"{label:<6} 1検索 {elapsed_ms:9.2f} ms  比較 {comparisons / len(queries):9.0f} ノード"
+                f"（{comparisons / len(queries) / index.nodes:6.1%}）  ヒット {hits / len(queries):.1f}件"
+            )
+
+        mismatches = sum(index.search(q, max_distance) != index.search_with_stats(q, max_distance, True)[0] for q in queries)
+        if mismatches:
+            raise CommandError(f'BK木と全件比較の結果が {mismatches} 件の検索で一致しません。')
+        self.stdout.write(self.style.SUCCESS("BK木と全件比較の結果はすべて一致しました。"))
+
+    def _terms(self, index):
+        """索引の全ノードの分節列を文字列に戻す（検索語に使う）"""
+        stack = [index.root] if index.root else []
+        while stack:
+            node = stack.pop()
+            yield ''.join(node[0][0])
+            stack.extend(node[2].values())
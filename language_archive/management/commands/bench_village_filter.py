@@ -0,0 +1,69 @@
+# language_archive/management/commands/bench_village_filter.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from language_archive.models import LanguageRecord, Village
+
+PAGE_SIZE = 6
+
+
+class Command(BaseCommand):
+    help = (
+        "言語記録一覧の集落絞り込みを、話者を JOIN する方法（speaker__village）と"
+        "関連集落の列を直接使う方法（village_id）で比較し、所要時間と実行計画を表示します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--village', type=int, help='絞り込む集落のID（省略時は記録の多い集落）')
+        parser.add_argument('--repeat', type=int, default=50, help='各方法の繰り返し回数')
+        parser.add_argument('--explain', action='store_true', help='実行計画を表示する')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat は1以上を指定してください。')
+
+        village_id = options['village'] or self._busiest_village_id()
+        if village_id is None:
+            raise CommandError('集落に紐づく言語記録がありません。')
+        village = Village.objects.get(id=village_id)
+        self.stdout.write(f"集落: {village.name} (id={village.id})  繰り返し: {options['repeat']}回")
+
+        variants = [
+            ('speaker__village', LanguageRecord.objects.filter(speaker__village_id=village_id)),
+            ('village_id', LanguageRecord.objects.filter(village_id=village_id)),
+        ]
+        for label, queryset in variants:
+            queryset = queryset.select_related('speaker', 'onomatopoeia_type', 'village').order_by('-recorded_date')
+            count_ms, page_ms, count = self._measure(queryset, options['repeat'])
+            joins_speaker = 'JOIN "language_archive_speaker"' in str(queryset.values('id').query)
+            self.stdout.write(
+                f"{label:<18} 件数 {count:>7}  COUNT {count_ms:8.2f} ms  1ページ目 {page_ms:8.2f} ms  "
+                f"絞り込みで話者をJOIN: {'あり' if joins_speaker else 'なし'}"
+            )
+            if options['explain']:
+                self.stdout.write(queryset[:PAGE_SIZE].explain())
+
+    def _busiest_village_id(self):
+        row = (
+            LanguageRecord.objects.filter(village__isnull=False)
+            .values('village_id').annotate(n=Count('id')).order_by('-n').first()
+        )
+        return row['village_id'] if row else None
+
+    def _measure(self, queryset, repeat):
+        """COUNT と1ページ目の取得それぞれの平均時間（ms）を返す"""
+        count = queryset.count()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            queryset.count()
+        count_ms = (time.perf_counter() - started) * 1000 / repeat
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            list(queryset[:PAGE_SIZE])
+        page_ms = (time.perf_counter() - started) * 1000 / repeat
+
+        return count_ms, page_ms, count
@@ -0,0 +1,32 @@
+# language_archive/management/commands/build_analytics.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.analytics import KEEP_SNAPSHOTS, build_analytics_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "言語記録のクロス集計・分布を pandas で計算し、集計ページ用のスナップショットとして保存します。"
+        "集計に使う表（言語記録・話者・集落・オノマトペ型）が前回のスナップショットから変わっていなければ何もしません。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='データが変わっていなくても集計し直す')
+        parser.add_argument('--keep', type=int, default=KEEP_SNAPSHOTS, help='残しておくスナップショットの数')
+
+    def handle(self, *args, **options):
+        if options['keep'] < 1:
+            raise CommandError('--keep は1以上を指定してください。')
+
+        started = time.perf_counter()
+        snapshot = build_analytics_snapshot(force=options['force'], keep=options['keep'])
+        elapsed = time.perf_counter() - started
+        if snapshot is None:
+            self.stdout.write("データに変更がないため、集計をスキップしました。")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"スナップショット #{snapshot.id} を作成しました（記録 {snapshot.record_count}件, {elapsed:.1f}s）"
+        ))
@@ -0,0 +1,44 @@
+# language_archive/management/commands/build_similar_records.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.similarity import BATCH_SIZE, MIN_SCORE, TOP_K, rebuild_similar_records, update_similar_records
+
+
+class Command(BaseCommand):
+    help = (
+        "言語記録の文字n-gram TF-IDF から類似記録（上位k件）を計算し、類似記録テーブルに保存します。"
+        "既定では前回以降に追加された記録だけを計算し、--full で語彙から作り直します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='語彙・IDF を作り直して全件計算する（本文の編集を反映する場合）')
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='記録ごとに保存する類似記録の数')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='類似度を一度に計算する記録の数')
+        parser.add_argument('--min-score', type=float, default=MIN_SCORE, help='保存する類似度の下限')
+
+    def handle(self, *args, **options):
+        if options['top_k'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--top-k と --batch-size は1以上を指定してください。')
+
+        def progress(done, total):
+            self.stdout.write(f"{done}/{total}", ending='\r')
+
+        build = rebuild_similar_records if options['full'] else update_similar_records
+        started = time.perf_counter()
+        result = build(
+            top_k=options['top_k'], batch_size=options['batch_size'], min_score=options['min_score'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        elapsed = time.perf_counter() - started
+
+        if result['mode'] == 'full':
+            message = f"全件計算: 記録 {result['records']}件 / 類似記録 {result['links']}件"
+        else:
+            message = (
+                f"追加分を計算: 記録 {result['records']}件 / 近傍を更新した既存の記録 {result['updated']}件"
+                f" / 類似記録 {result['links']}件"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{message}（{elapsed:.1f}s）"))
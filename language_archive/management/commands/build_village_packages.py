@@ -0,0 +1,51 @@
+# language_archive/management/commands/build_village_packages.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive import packages
+from language_archive.models import LanguageRecord, Village, VillagePackage
+
+
+class Command(BaseCommand):
+    help = (
+        "集落ごとのオフライン用パッケージ（ZIP）を作成し、ストレージに保存します。"
+        "データが前回のパッケージから変わっていない集落は何もしません。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--village', type=int, action='append', help='作成する集落のID（複数指定可。既定は記録のある全集落）')
+
+    def handle(self, *args, **options):
+        if options['village']:
+            villages = list(Village.objects.filter(id__in=options['village']).order_by('id'))
+            missing = set(options['village']) - {village.id for village in villages}
+            if missing:
+                raise CommandError(f"集落が見つかりません: {', '.join(map(str, sorted(missing)))}")
+        else:
+            village_ids = LanguageRecord.objects.filter(village__isnull=False).values_list('village_id', flat=True).distinct()
+            villages = list(Village.objects.filter(id__in=village_ids).order_by('id'))
+
+        failed = 0
+        for village in villages:
+            package, _ = VillagePackage.objects.get_or_create(village=village, version=packages.package_version(village))
+            if package.status == 'ready':
+                self.stdout.write(f"{village.name}: 最新のパッケージがあります")
+                continue
+            started = time.perf_counter()
+            try:
+                built = packages.build_package(package.id, retry_failed=True)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{village.name}: 作成に失敗しました: {e}")
+                continue
+            if built is None:
+                self.stdout.write(f"{village.name}: 他のワーカーが作成中です")
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"{village.name}: ファイル {built.file_count}件 / {built.size / 1024 / 1024:.1f} MB"
+                f"（{time.perf_counter() - started:.1f}s）"
+            ))
+        if failed:
+            raise CommandError(f"{failed}件の集落でパッケージを作成できませんでした。")
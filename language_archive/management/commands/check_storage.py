@@ -0,0 +1,68 @@
+# language_archive/management/commands/check_storage.py
+
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive import storage_check
+from language_archive.models import StorageObjectCheck
+
+REPORT_HEADER = ['モデル', 'ID', '列', 'URL', '状態', '内容', 'HTTPステータス', 'サイズ', 'Content-Type', '応答時間(ms)']
+
+
+class Command(BaseCommand):
+    help = (
+        "記録が参照するストレージのファイル（file_path・thumbnail_path）があるか、サイズや種類が合っているかを HEAD で確かめ、"
+        "ファイルがない・不一致・応答が遅いものを CSV に書き出します。中断したときは、次回は続きから確認します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=storage_check.DEFAULT_CONCURRENCY, help='同時に確認するファイル数')
+        parser.add_argument('--retries', type=int, default=storage_check.DEFAULT_RETRIES, help='一時的なエラー（429・5xx・接続エラー）を再試行する回数')
+        parser.add_argument('--rate', type=float, default=storage_check.DEFAULT_RATE, help='1秒あたりの要求数の上限（0 で制限なし）')
+        parser.add_argument('--slow-ms', type=float, default=storage_check.DEFAULT_SLOW_MS, help='この時間（ミリ秒）より遅い応答を「応答が遅い」とする')
+        parser.add_argument('--limit', type=int, help='この件数の記録を確認したら止める（次回は続きから）')
+        parser.add_argument('--restart', action='store_true', help='未完了の確認があっても、最初から確認し直す')
+        parser.add_argument('--report', help='問題のあったファイルを書き出す CSV（既定は storage_report_<確認のID>.csv）')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency は1以上を指定してください。')
+        if options['retries'] < 0:
+            raise CommandError('--retries は0以上を指定してください。')
+        if options['rate'] < 0:
+            raise CommandError('--rate は0以上を指定してください。')
+        if options['limit'] is not None and options['limit'] < 1:
+            raise CommandError('--limit は1以上を指定してください。')
+
+        run, resumed = storage_check.current_run(restart=options['restart'])
+        if resumed:
+            self.stdout.write(f"前回の続き（#{run.id}、{run.checked}件確認済み）から確認します")
+
+        started = time.perf_counter()
+        finished = storage_check.check_storage(
+            run, concurrency=options['concurrency'], retries=options['retries'], rate=options['rate'],
+            slow_ms=options['slow_ms'], limit=options['limit'],
+            progress=lambda r: self.stdout.write(f"  {r.checked}件確認（問題 {r.problem_count}件）"),
+        )
+
+        path = options['report'] or f'storage_report_{run.id}.csv'
+        problems = StorageObjectCheck.objects.filter(run=run).exclude(status='ok').order_by('model', 'object_id', 'field')
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(REPORT_HEADER)
+            for check in problems.iterator():
+                writer.writerow([
+                    check.model, check.object_id, check.field, check.url, check.get_status_display(), check.detail,
+                    check.http_status or '', '' if check.size is None else check.size, check.content_type,
+                    '' if check.elapsed_ms is None else f'{check.elapsed_ms:.0f}',
+                ])
+
+        summary = f"{run.checked}件のうち問題 {run.problem_count}件（{time.perf_counter() - started:.1f}s）。レポート: {path}"
+        if not finished:
+            self.stdout.write(f"{summary}\n未完了です。もう一度実行すると続きから確認します。")
+        elif run.problem_count:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,63 @@
+# language_archive/management/commands/collect_storage_garbage.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive import storage_gc
+from language_archive.services import MEDIA_BUCKETS
+
+
+class Command(BaseCommand):
+    help = (
+        "どの記録からも参照されていないストレージのファイル（記録の削除やファイルの差し替えで残ったもの）を削除します。"
+        "作成から --grace-hours 時間たっていないファイルは残します。削除したファイルは「ストレージのファイルの削除記録」に残ります。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bucket', action='append', help='対象のバケット（複数指定可。既定は記録のファイルを保存する全バケット）')
+        parser.add_argument('--grace-hours', type=float, default=storage_gc.GRACE_HOURS, help='作成からこの時間がたっていないファイルは残す')
+        parser.add_argument('--dry-run', action='store_true', help='削除せず、孤立ファイルの数とサイズだけを表示する（-v 2 でパスも表示）')
+        parser.add_argument('--workers', type=int, default=storage_gc.DELETE_WORKERS, help='同時に送る削除要求の数')
+        parser.add_argument('--batch-size', type=int, default=storage_gc.DELETE_BATCH, help='1回の削除要求に含めるファイル数')
+
+    def handle(self, *args, **options):
+        buckets = sorted(set(MEDIA_BUCKETS.values()))
+        if options['bucket']:
+            unknown = set(options['bucket']) - set(buckets)
+            if unknown:
+                raise CommandError(f"記録のファイルのバケットではありません: {', '.join(sorted(unknown))}")
+            buckets = [bucket for bucket in buckets if bucket in options['bucket']]
+        if options['grace_hours'] < 1:
+            raise CommandError('--grace-hours は1以上を指定してください（アップロード中のファイルを消さないため）。')
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers と --batch-size は1以上を指定してください。')
+
+        referenced = storage_gc.referenced_keys()
+        if not len(referenced):
+            # 接続先のDBを取り違えたときに全ファイルを消さないよう、参照が1件もなければ止める
+            raise CommandError('記録が参照するストレージのファイルがありません。DBの接続先を確認してください。')
+        self.stdout.write(f"参照されているファイル: {len(referenced)}件")
+
+        failed = 0
+        for bucket in buckets:
+            started = time.perf_counter()
+            stats = storage_gc.collect_garbage(
+                bucket, referenced, grace_hours=options['grace_hours'], dry_run=options['dry_run'],
+                batch_size=options['batch_size'], workers=options['workers'],
+            )
+            size = f"{stats['bytes'] / 1024 / 1024:.1f} MB"
+            if options['dry_run']:
+                self.stdout.write(f"{bucket}: 孤立ファイル {stats['orphans']}件 / {size}（削除していません）")
+                if options['verbosity'] >= 2:
+                    for path in stats['paths']:
+                        self.stdout.write(f"  {path}")
+                continue
+            failed += stats['failed']
+            message = (
+                f"{bucket}: 孤立ファイル {stats['orphans']}件 / {size} のうち {stats['deleted']}件を削除しました"
+                f"（失敗 {stats['failed']}件、{time.perf_counter() - started:.1f}s）"
+            )
+            self.stdout.write(self.style.WARNING(message) if stats['failed'] else self.style.SUCCESS(message))
+        if failed:
+            raise CommandError(f"{failed}件のファイルを削除できませんでした。")
@@ -0,0 +1,43 @@
+# language_archive/management/commands/export_static.py
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.static_export import export_site
+
+
+class Command(BaseCommand):
+    help = (
+        "公開ページ（トップ・地図・記録一覧と詳細・集落別・話者別・地理データ一覧）を、絞り込みとページの組み合わせごとに"
+        "静的な HTML（gzip・brotli の圧縮版付き）に書き出します。前回の書き出しから表示するデータが変わったページだけを書き直します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default=settings.STATIC_EXPORT_DIR, help='書き出し先のディレクトリ')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='並行して描画するプロセス数')
+        parser.add_argument(
+            '--max-pages', type=int, default=settings.STATIC_EXPORT_MAX_PAGES,
+            help='一覧ごとに書き出すページ数の上限（0 で無制限。それより深いページへのリンクは STATIC_EXPORT_ORIGIN に向ける）',
+        )
+        parser.add_argument('--full', action='store_true', help='変わっていないページも含めてすべて書き直す')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers は1以上を指定してください。')
+        if options['max_pages'] < 0:
+            raise CommandError('--max-pages は0以上を指定してください。')
+
+        def progress(rendered, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{rendered}/{total}ページ")
+
+        result = export_site(
+            options['output'], workers=options['workers'], full=options['full'],
+            max_pages=options['max_pages'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['output']}: {result['pages']}ページ（描画 {result['rendered']}、内容の変更 {result['written']}、"
+            f"削除 {result['removed']}、静的ファイル {result['static']}件）{result['seconds']:.1f}s"
+        ))
@@ -0,0 +1,54 @@
+# language_archive/management/commands/fingerprint_audio.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from language_archive.fingerprint import fingerprint_record, is_supported
+from language_archive.models import LanguageRecord
+
+
+class Command(BaseCommand):
+    help = (
+        "既存の音声の記録（WAV）の指紋を計算し、同じ区間を含む記録を「音声の一致」に保存します。"
+        "既定では、まだ計算していない記録と、計算後にファイルが差し替えられた記録だけを計算します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--record', type=int, action='append', help='計算する言語記録のID（複数指定可）')
+        parser.add_argument('--force', action='store_true', help='計算済みの記録も計算し直す')
+
+    def handle(self, *args, **options):
+        records = LanguageRecord.objects.filter(file_type='audio').exclude(file_path__isnull=True).exclude(file_path='')
+        if options['record']:
+            found = set(LanguageRecord.objects.filter(id__in=options['record']).values_list('id', flat=True))
+            missing = sorted(set(options['record']) - found)
+            if missing:
+                raise CommandError(f"言語記録が見つかりません: {', '.join(map(str, missing))}")
+            records = records.filter(id__in=options['record'])
+        if not options['force']:
+            records = records.filter(
+                Q(fingerprint_state__isnull=True) | ~Q(fingerprint_state__file_path=F('file_path'))
+            )
+        targets = [
+            record_id for record_id, url in records.order_by('id').values_list('id', 'file_path')
+            if is_supported(url)
+        ]
+
+        counts = {'ok': 0, 'unsupported': 0, 'failed': 0}
+        matched = 0
+        started = time.perf_counter()
+        for done, record_id in enumerate(targets, 1):
+            state = fingerprint_record(record_id)
+            counts[state.status] += 1
+            found = state.record.audio_matches.count()
+            matched += bool(found)
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{done}/{len(targets)} #{record_id}: {state.get_status_display()} / 一致 {found}件")
+
+        message = (
+            f"指紋を計算しました: {counts['ok']}件（対応していない形式 {counts['unsupported']}件、失敗 {counts['failed']}件）"
+            f" / 一致のある記録 {matched}件（{time.perf_counter() - started:.1f}s）"
+        )
+        self.stdout.write(self.style.WARNING(message) if counts['failed'] else self.style.SUCCESS(message))
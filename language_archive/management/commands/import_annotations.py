@@ -0,0 +1,37 @@
+# language_archive/management/commands/import_annotations.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.annotations import AnnotationFormatError, import_annotations
+from language_archive.models import LanguageRecord
+
+
+class Command(BaseCommand):
+    help = (
+        "ELAN（.eaf）または Praat（.TextGrid）の書き起こしを言語記録に取り込みます。"
+        "同じ名前の層がすでにあれば置き換えます。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('record_id', type=int, help='取り込み先の言語記録のID')
+        parser.add_argument('files', nargs='+', help='書き起こしのファイル（.eaf / .TextGrid）')
+
+    def handle(self, *args, **options):
+        try:
+            record = LanguageRecord.objects.get(id=options['record_id'])
+        except LanguageRecord.DoesNotExist:
+            raise CommandError(f"言語記録が見つかりません: {options['record_id']}")
+
+        for path in options['files']:
+            started = time.perf_counter()
+            try:
+                with open(path, 'rb') as f:
+                    counts = import_annotations(record, f, filename=path)
+            except OSError as e:
+                raise CommandError(f"ファイルを開けません: {e}")
+            except AnnotationFormatError as e:
+                raise CommandError(f"{path}: {e}")
+            tiers = '、'.join(f'{name} {count}区間' for name, count in counts.items()) or '区間なし'
+            self.stdout.write(self.style.SUCCESS(f"{path}: {tiers}（{time.perf_counter() - started:.1f}s）"))
@@ -0,0 +1,78 @@
+# language_archive/management/commands/import_profile.py
+
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# ワーカーの起動と同じ処理（アプリケーションの生成とURL設定の読み込み）を新しいプロセスで計測する
+BOOT_SCRIPT = """
+import time
+started = time.perf_counter()
+import {module}
+from django.urls import get_resolver
+get_resolver().url_patterns
+print('BOOT_MS', (time.perf_counter() - started) * 1000)
+"""
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        "ワーカー起動時のimportを python -X importtime で計測し、起動時間と"
+        "コストの大きいモジュールを表示します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['wsgi', 'asgi'], default='wsgi', help='計測するエントリーポイント')
+        parser.add_argument('--top', type=int, default=20, help='表示するモジュール数')
+        parser.add_argument('--sort', choices=['cumulative', 'self'], default='cumulative', help='並び替えの基準')
+        parser.add_argument('--runs', type=int, default=3, help='起動時間の計測回数（中央値を表示）')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs は1以上を指定してください。')
+
+        module = f"{settings.ROOT_URLCONF.split('.')[0]}.{options['target']}"
+        boot_times = []
+        imports = []
+        for _ in range(options['runs']):
+            boot_ms, imports = self._measure(module)
+            boot_times.append(boot_ms)
+
+        boot_times.sort()
+        self.stdout.write(f"エントリーポイント: {module}")
+        self.stdout.write(
+            f"起動時間（中央値 / {options['runs']}回）: {boot_times[len(boot_times) // 2]:.1f} ms"
+            f"  (min {boot_times[0]:.1f} / max {boot_times[-1]:.1f})"
+        )
+
+        key = 1 if options['sort'] == 'cumulative' else 0
+        imports.sort(key=lambda row: row[key], reverse=True)
+        self.stdout.write(f"\n{'self[ms]':>10} {'cumulative[ms]':>15}  module")
+        for self_us, cumulative_us, name in imports[:options['top']]:
+            self.stdout.write(f"{self_us / 1000:10.1f} {cumulative_us / 1000:15.1f}  {name}")
+
+    def _measure(self, module):
+        """新しいプロセスで起動を1回計測し、(起動時間[ms], [(self[us], cumulative[us], モジュール名)]) を返す"""
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'kikai_archive_project.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT.format(module=module)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"起動に失敗しました:\n{result.stderr[-2000:]}")
+
+        boot_ms = next(
+            float(line.split()[1]) for line in result.stdout.splitlines() if line.startswith('BOOT_MS')
+        )
+        imports = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                imports.append((int(match.group(1)), int(match.group(2)), match.group(3)))
+        return boot_ms, imports
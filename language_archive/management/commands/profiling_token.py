@@ -0,0 +1,21 @@
+# language_archive/management/commands/profiling_token.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.profiling import TOKEN_HEADER, make_token
+
+
+class Command(BaseCommand):
+    help = (
+        "リクエストをプロファイルさせる署名付きヘッダー（X-Profile-Token）の値を表示します。"
+        "有効期間は PROFILING_TOKEN_MAX_AGE 秒です。結果は管理画面の「リクエストのプロファイル」で見られます。"
+    )
+
+    def handle(self, *args, **options):
+        if not settings.PROFILING_ENABLED:
+            raise CommandError('PROFILING_ENABLED が False のため、プロファイルは記録されません。')
+        token = make_token()
+        self.stdout.write(token)
+        if options['verbosity'] > 1:
+            self.stdout.write(f"例: curl -H '{TOKEN_HEADER}: {token}' https://.../map/")
@@ -0,0 +1,25 @@
+# language_archive/management/commands/prune_chunked_uploads.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.chunked_upload import prune_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "分割アップロードのうち、一定時間更新のないもの（途中で放置されたもの・完了後にフォームが送られなかったもの）の"
+        "状態とスプールファイルを削除します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=settings.CHUNKED_UPLOAD_EXPIRE_HOURS,
+            help='更新がないまま残す時間（これを過ぎたアップロードは続きから送れなくなる）',
+        )
+
+    def handle(self, *args, **options):
+        if options['hours'] < 1:
+            raise CommandError('--hours は1以上を指定してください。')
+        deleted = prune_uploads(hours=options['hours'])
+        self.stdout.write(self.style.SUCCESS(f"分割アップロードを {deleted}件 削除しました。"))
@@ -0,0 +1,22 @@
+# language_archive/management/commands/prune_sync_tombstones.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.sync import TOMBSTONE_RETENTION_DAYS, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "差分同期用の削除記録（墓標）のうち、保存期間を過ぎたものを削除します。"
+        "保存期間より長く同期していない端末は、カーソルなしで全件を取得し直すことになります。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=TOMBSTONE_RETENTION_DAYS, help='墓標を残す日数')
+
+    def handle(self, *args, **options):
+        if options['days'] < TOMBSTONE_RETENTION_DAYS:
+            # 同期APIは TOMBSTONE_RETENTION_DAYS 以内のカーソルを受け付けるため、それより短くすると削除を伝え損なう
+            raise CommandError(f'--days は {TOMBSTONE_RETENTION_DAYS} 以上を指定してください。')
+        deleted = prune_tombstones(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f"墓標を {deleted}件 削除しました。"))
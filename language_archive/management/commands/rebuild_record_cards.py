@@ -0,0 +1,27 @@
+# language_archive/management/commands/rebuild_record_cards.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.record_cards import REBUILD_CHUNK_SIZE, rebuild_cards
+
+
+class Command(BaseCommand):
+    help = (
+        "一覧のカード（記録一覧・集落ごと・話者ごとの一覧が読む表）を言語記録から主キーの範囲ごとに作り直します。"
+        "--missing を付けると、カードのない記録の分だけを作ります（デプロイ時の補完用）。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='カードのない記録だけを作る')
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE, help='1回に読み込む主キーの範囲')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size は1以上を指定してください。')
+
+        def progress(done, max_id, saved):
+            if saved and options['verbosity'] > 1:
+                self.stdout.write(f"ID {done}/{max_id}: {saved}件")
+
+        total = rebuild_cards(chunk_size=options['chunk_size'], missing_only=options['missing'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"一覧のカードを作成しました: {total}件"))
@@ -0,0 +1,116 @@
+# language_archive/management/commands/show_traces.py
+
+import datetime
+import json
+from collections import defaultdict, deque
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PERCENTILES = (50, 90, 99)
+
+
+def _percentile(values, percent):
+    """最近傍順位法のパーセンタイル（values は昇順）"""
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "トレース（TRACING_FILE の JSON Lines）を読み、リクエストごとのスパンの木と、"
+        "スパン名ごとの処理時間のパーセンタイルを表示します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None, help='トレースのファイル（既定は settings.TRACING_FILE）')
+        parser.add_argument('--last', type=int, default=10, help='木を表示するリクエストの数（新しいものから）')
+        parser.add_argument('--trace', help='このトレースIDのリクエストだけを表示する')
+        parser.add_argument('--name', help='ルートのスパン名にこの文字列を含むリクエストだけを対象にする（例: /map/）')
+        parser.add_argument('--min-ms', type=float, default=0, help='この時間（ミリ秒）以上かかったリクエストだけを対象にする')
+        parser.add_argument('--stats', action='store_true', help='木を表示せず、パーセンタイルだけを表示する')
+
+    def handle(self, *args, **options):
+        path = Path(options['file'] or settings.TRACING_FILE)
+        if not path.exists():
+            raise CommandError(f'トレースのファイルがありません: {path}')
+        if options['last'] < 1:
+            raise CommandError('--last は1以上を指定してください。')
+
+        traces = deque(maxlen=None if options['trace'] else options['last'])
+        durations = defaultdict(list)
+        pending = defaultdict(list)
+        with path.open(encoding='utf-8') as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                # 子のスパンは親より先に終わるため、ルートが来た時点でそのトレースはそろっている
+                pending[span['trace_id']].append(span)
+                if span['parent_id'] is not None:
+                    continue
+                spans = pending.pop(span['trace_id'])
+                if not self._selected(span, options):
+                    continue
+                for child in spans:
+                    durations[child['name']].append(child['duration_ms'])
+                traces.append((span, spans))
+
+        if not durations:
+            self.stdout.write('条件に合うトレースはありません。')
+            return
+        if not options['stats']:
+            for root, spans in traces:
+                self._print_tree(root, spans)
+                self.stdout.write('')
+        self._print_stats(durations)
+
+    def _selected(self, root, options):
+        if options['trace'] and root['trace_id'] != options['trace']:
+            return False
+        if options['name'] and options['name'] not in root['name']:
+            return False
+        return root['duration_ms'] >= options['min_ms']
+
+    def _print_tree(self, root, spans):
+        children = defaultdict(list)
+        for span in spans:
+            if span['parent_id'] is not None:
+                children[span['parent_id']].append(span)
+        started = datetime.datetime.fromtimestamp(root['start_ns'] / 1e9).strftime('%Y-%m-%d %H:%M:%S')
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{started}  trace={root['trace_id']}"))
+
+        stack = [(root, 0)]
+        while stack:
+            span, depth = stack.pop()
+            self.stdout.write(f"{'  ' * depth}{self._describe(span)}")
+            for child in sorted(children[span['span_id']], key=lambda s: s['start_ns'], reverse=True):
+                stack.append((child, depth + 1))
+
+    def _describe(self, span):
+        attributes = dict(span['attributes'])
+        parts = [f"{span['name']}  {span['duration_ms']:.1f} ms"]
+        queries = attributes.pop('db.queries', None)
+        db_ms = attributes.pop('db.ms', None)
+        if queries:
+            parts.append(f"DB {queries}件 {db_ms:.1f} ms")
+        attributes.pop('path', None)
+        if attributes:
+            parts.append(' '.join(f'{key}={value}' for key, value in attributes.items()))
+        if span['error']:
+            parts.append(self.style.ERROR(span['error']))
+        return '  '.join(parts)
+
+    def _print_stats(self, durations):
+        header = f"{'スパン':<40}{'件数':>8}" + ''.join(f"{f'p{p}':>10}" for p in PERCENTILES) + f"{'最大':>10}"
+        self.stdout.write(self.style.MIGRATE_HEADING(header))
+        rows = sorted(durations.items(), key=lambda item: -sum(item[1]))
+        for name, values in rows:
+            values.sort()
+            self.stdout.write(
+                f"{name:<40}{len(values):>8}"
+                + ''.join(f"{_percentile(values, p):>10.1f}" for p in PERCENTILES)
+                + f"{values[-1]:>10.1f}"
+            )
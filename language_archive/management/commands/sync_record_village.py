@@ -0,0 +1,38 @@
+# language_archive/management/commands/sync_record_village.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from language_archive.record_village import BACKFILL_CHUNK_SIZE, backfill_record_village, inconsistent_records
+
+
+class Command(BaseCommand):
+    help = (
+        "言語記録の関連集落を話者の集落と照合し、ずれている記録を主キーの範囲ごとに補正します。"
+        "--check を付けると補正せずに件数だけを表示し、ずれがあれば終了コード1で終わります。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='補正せずに整合性だけを確認する')
+        parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE, help='1回の更新で対象にする主キーの範囲')
+        parser.add_argument('--show', type=int, default=10, help='--check で表示する記録IDの最大件数')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size は1以上を指定してください。')
+
+        if options['check']:
+            records = inconsistent_records().order_by('id')
+            count = records.count()
+            if not count:
+                self.stdout.write(self.style.SUCCESS("関連集落はすべて話者の集落と一致しています。"))
+                return
+            ids = list(records.values_list('id', flat=True)[:options['show']])
+            self.stdout.write(self.style.WARNING(f"関連集落がずれている記録: {count}件（例: {', '.join(map(str, ids))}）"))
+            raise CommandError("sync_record_village を --check なしで実行して補正してください。", returncode=1)
+
+        def progress(done, max_id, updated):
+            if updated:
+                self.stdout.write(f"ID {done}/{max_id}: {updated}件を更新")
+
+        total = backfill_record_village(chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"関連集落を補正しました: {total}件"))
@@ -0,0 +1,19 @@
+# language_archive/management/commands/warmup.py
+
+from django.core.management.base import BaseCommand
+
+from language_archive.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = "テンプレートのコンパイル・参照データのキャッシュ・既定の地図描画を行い、各ステップの所要時間を表示します。"
+
+    def handle(self, *args, **options):
+        total = 0.0
+        for name, elapsed_ms, error in warm_up():
+            total += elapsed_ms
+            if error:
+                self.stdout.write(self.style.WARNING(f"{name:<16} {elapsed_ms:8.1f} ms  失敗: {error}"))
+            else:
+                self.stdout.write(f"{name:<16} {elapsed_ms:8.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"{'total':<16} {total:8.1f} ms"))
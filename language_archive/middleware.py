@@ -0,0 +1,144 @@
+# language_archive/middleware.py
+
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.deprecation import MiddlewareMixin
+
+from . import profiling
+from .db_routers import REPLICA_DB_ALIAS, set_read_db
+from .tracing import span
+
+# 書き込み直後のクライアントに付けるCookie（有効な間はレプリカを使わずプライマリを読む）
+REPLICA_PIN_COOKIE = 'primary_pin'
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class ReadReplicaMiddleware(MiddlewareMixin):
+    """
+    読み取り系ビューの GET/HEAD をレプリカに向け、書き込みを行ったクライアントは
+    DATABASE_REPLICA_PIN_SECONDS の間プライマリに固定する（read-your-writes）。
+    レプリカが設定されていなければ無効になる。
+    """
+
+    def __init__(self, get_response):
+        if REPLICA_DB_ALIAS not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            getattr(view_func, 'use_read_replica', False)
+            and request.method in SAFE_METHODS
+            and REPLICA_PIN_COOKIE not in request.COOKIES
+        ):
+            set_read_db(REPLICA_DB_ALIAS)
+            request.uses_read_replica = True
+        return None
+
+    def process_response(self, request, response):
+        if getattr(request, 'uses_read_replica', False):
+            set_read_db(None)
+        # 書き込み（POST等）が成功したら、しばらくプライマリを読むようにする
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, '1',
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class TracingMiddleware:
+    """
+    リクエストごとにトレースを始める（ルートのスパン名は「メソッド URLパターン」、属性にステータスとビュー名）。
+    ほかのミドルウェアの時間も含めるため、MIDDLEWARE の先頭に置く。TRACING_EXPORTER が空なら無効になる。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TRACING_EXPORTER:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with span(request.method, path=request.path) as request_span:
+            response = self.get_response(request)
+            self._describe(request_span, request, response)
+        return response
+
+    async def __acall__(self, request):
+        with span(request.method, path=request.path) as request_span:
+            response = await self.get_response(request)
+            self._describe(request_span, request, response)
+        return response
+
+    def _describe(self, request_span, request, response):
+        match = request.resolver_match
+        if match is not None:
+            request_span.rename(f"{request.method} /{match.route}")
+            request_span.set(view=match.view_name)
+        request_span.set(status=response.status_code)
+
+
+class ProfilingMiddleware:
+    """
+    署名付きのヘッダー・スタッフの ?profile=1・PROFILING_SAMPLE_EVERY 件に1件のリクエストをサンプリングプロファイルし、
+    RequestProfile に保存する（応答の X-Profile-Id ヘッダーにリクエストID）。
+    スタッフかどうかを見るため AuthenticationMiddleware の後に置く。PROFILING_ENABLED が False なら無効になる。
+    ASGI では、ビュー・ORM・テンプレートの処理はイベントループではなく sync_to_async のスレッド（リクエストごと）で動くため、
+    そのスレッドをサンプリングする。thread_sensitive=False で別スレッドに出した処理（地図の生成）と、
+    イベントループ上の非同期の処理（ストレージへのアップロード）は含まれない。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = profiling.trigger_for(request, getattr(request, 'user', None))
+        if trigger is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        sampler = profiling.start_sampler()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        profile = profiling.save_profile(request, response, sampler, trigger, (time.perf_counter() - started) * 1000)
+        response['X-Profile-Id'] = profile.request_id
+        return response
+
+    async def __acall__(self, request):
+        user = await request.auser() if hasattr(request, 'auser') else None
+        trigger = profiling.trigger_for(request, user)
+        if trigger is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        # このリクエストの sync_to_async（thread_sensitive）の処理が動くスレッド
+        thread_id = await sync_to_async(threading.get_ident)()
+        sampler = profiling.start_sampler(thread_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+        profile = await sync_to_async(profiling.save_profile)(request, response, sampler, trigger, duration_ms)
+        response['X-Profile-Id'] = profile.request_id
+        return response
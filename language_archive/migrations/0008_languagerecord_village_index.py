@@ -0,0 +1,19 @@
+# Generated manually: index the denormalized LanguageRecord.village for village lists
+# 既存の記録の関連集落の埋め直しはマイグレーションでは行わず（Postgres では表全体を1トランザクションで書き換えるため）、
+# backfill.py に登録した record_village の作業（python manage.py backfill record_village、デプロイ時は build.sh）で行う。
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0007_languagerecord_title_description_nullable'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='languagerecord',
+            index=models.Index(fields=['village', '-recorded_date'], name='langrec_village_date_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0008_languagerecord_village_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityIndexState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vocabulary', models.JSONField(default=list, verbose_name='語彙')),
+                ('idf', models.JSONField(default=list, verbose_name='IDF')),
+                ('record_count', models.PositiveIntegerField(default=0, verbose_name='計算済みの記録数')),
+                ('last_record_id', models.PositiveBigIntegerField(default=0, verbose_name='計算済みの最大記録ID')),
+                ('built_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='全件計算日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '類似記録の計算状態',
+                'verbose_name_plural': '類似記録の計算状態',
+            },
+        ),
+        migrations.CreateModel(
+            name='SimilarRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='類似度')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='順位')),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='language_archive.languagerecord', verbose_name='言語記録')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='language_archive.languagerecord', verbose_name='類似記録')),
+            ],
+            options={
+                'verbose_name': '類似記録',
+                'verbose_name_plural': '類似記録',
+                'ordering': ['record', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('record', 'rank'), name='similar_record_rank_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0009_similar_records'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_version', models.BigIntegerField(verbose_name='データバージョン')),
+                ('record_count', models.PositiveIntegerField(default=0, verbose_name='集計した記録数')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='集計日時')),
+            ],
+            options={
+                'verbose_name': '集計スナップショット',
+                'verbose_name_plural': '集計スナップショット',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyticsCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=50, verbose_name='表')),
+                ('row_label', models.CharField(max_length=100, verbose_name='行')),
+                ('column_label', models.CharField(max_length=100, verbose_name='列')),
+                ('row_order', models.PositiveSmallIntegerField(verbose_name='行の順番')),
+                ('column_order', models.PositiveSmallIntegerField(verbose_name='列の順番')),
+                ('value', models.FloatField(verbose_name='値')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cells', to='language_archive.analyticssnapshot', verbose_name='スナップショット')),
+            ],
+            options={
+                'verbose_name': '集計セル',
+                'verbose_name_plural': '集計セル',
+                'indexes': [models.Index(fields=['snapshot', 'table', 'row_order', 'column_order'], name='analytics_cell_order_idx')],
+            },
+        ),
+    ]
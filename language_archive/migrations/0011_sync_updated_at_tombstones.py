@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0010_analytics_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=30, verbose_name='モデル')),
+                ('object_id', models.BigIntegerField(verbose_name='ID')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='削除日時')),
+            ],
+            options={
+                'verbose_name': '削除記録（同期用）',
+                'verbose_name_plural': '削除記録（同期用）',
+            },
+        ),
+        migrations.AddField(
+            model_name='geographicrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新日時'),
+        ),
+        migrations.AddField(
+            model_name='onomatopoeiatype',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新日時'),
+        ),
+        migrations.AddField(
+            model_name='speaker',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新日時'),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新日時'),
+        ),
+        migrations.AddIndex(
+            model_name='geographicrecord',
+            index=models.Index(fields=['updated_at', 'id'], name='georecord_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='languagerecord',
+            index=models.Index(fields=['updated_at', 'id'], name='langrec_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='onomatopoeiatype',
+            index=models.Index(fields=['updated_at', 'id'], name='onomatopoeiatype_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='speaker',
+            index=models.Index(fields=['updated_at', 'id'], name='speaker_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='village',
+            index=models.Index(fields=['updated_at', 'id'], name='village_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='sync_tombstone_idx'),
+        ),
+    ]
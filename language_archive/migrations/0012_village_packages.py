@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0011_sync_updated_at_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VillagePackage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=40, verbose_name='データのバージョン')),
+                ('status', models.CharField(choices=[('pending', '待機中'), ('building', '作成中'), ('ready', '完成'), ('failed', '失敗')], default='pending', max_length=10, verbose_name='状態')),
+                ('storage_path', models.CharField(blank=True, max_length=255, verbose_name='ストレージのパス')),
+                ('size', models.BigIntegerField(default=0, verbose_name='サイズ（バイト）')),
+                ('file_count', models.PositiveIntegerField(default=0, verbose_name='ファイル数')),
+                ('error', models.TextField(blank=True, verbose_name='エラー')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='登録日時')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='作成開始日時')),
+                ('built_at', models.DateTimeField(blank=True, null=True, verbose_name='作成日時')),
+                ('village', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='packages', to='language_archive.village', verbose_name='集落')),
+            ],
+            options={
+                'verbose_name': '集落パッケージ',
+                'verbose_name_plural': '集落パッケージ',
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(fields=('village', 'version'), name='village_package_version_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0012_village_packages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageCheckRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完了日時')),
+                ('position', models.JSONField(default=dict, verbose_name='確認済みの位置（モデルごとの最大ID）')),
+                ('checked', models.PositiveIntegerField(default=0, verbose_name='確認したファイル数')),
+                ('problem_count', models.PositiveIntegerField(default=0, verbose_name='問題のあったファイル数')),
+            ],
+            options={
+                'verbose_name': 'ストレージの確認',
+                'verbose_name_plural': 'ストレージの確認',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StorageObjectCheck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=30, verbose_name='モデル')),
+                ('object_id', models.BigIntegerField(verbose_name='ID')),
+                ('field', models.CharField(max_length=30, verbose_name='列')),
+                ('url', models.URLField(max_length=1024, verbose_name='URL')),
+                ('status', models.CharField(choices=[('ok', '正常'), ('missing', 'ファイルなし'), ('mismatch', '不一致'), ('slow', '応答が遅い'), ('error', 'エラー')], max_length=10, verbose_name='状態')),
+                ('detail', models.CharField(blank=True, max_length=255, verbose_name='内容')),
+                ('http_status', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='HTTPステータス')),
+                ('size', models.BigIntegerField(blank=True, null=True, verbose_name='サイズ（バイト）')),
+                ('content_type', models.CharField(blank=True, max_length=100, verbose_name='Content-Type')),
+                ('elapsed_ms', models.FloatField(blank=True, null=True, verbose_name='応答時間（ミリ秒）')),
+                ('checked_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='確認日時')),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='objects_checked', to='language_archive.storagecheckrun', verbose_name='確認')),
+            ],
+            options={
+                'verbose_name': 'ストレージのファイルの確認結果',
+                'verbose_name_plural': 'ストレージのファイルの確認結果',
+                'indexes': [models.Index(fields=['run', 'status'], name='storage_check_run_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('model', 'object_id', 'field'), name='storage_object_check_unique')],
+            },
+        ),
+    ]
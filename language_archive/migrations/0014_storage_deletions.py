@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0013_storage_checks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(max_length=63, verbose_name='バケット')),
+                ('path', models.CharField(max_length=1024, verbose_name='パス')),
+                ('size', models.BigIntegerField(blank=True, null=True, verbose_name='サイズ（バイト）')),
+                ('object_created_at', models.DateTimeField(blank=True, null=True, verbose_name='ファイルの作成日時')),
+                ('status', models.CharField(choices=[('deleted', '削除'), ('failed', '失敗')], max_length=10, verbose_name='結果')),
+                ('error', models.TextField(blank=True, verbose_name='エラー')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='削除日時')),
+            ],
+            options={
+                'verbose_name': 'ストレージのファイルの削除記録',
+                'verbose_name_plural': 'ストレージのファイルの削除記録',
+                'ordering': ['-deleted_at'],
+                'indexes': [models.Index(fields=['deleted_at'], name='storage_deletion_date_idx')],
+            },
+        ),
+    ]
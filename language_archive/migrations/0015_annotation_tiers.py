@@ -0,0 +1,70 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0014_storage_deletions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnotationTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='層の名前')),
+                ('source', models.CharField(blank=True, max_length=255, verbose_name='取り込んだファイル')),
+                ('segment_count', models.PositiveIntegerField(default=0, verbose_name='区間の数')),
+                ('max_duration_ms', models.PositiveIntegerField(default=0, verbose_name='最長の区間（ミリ秒）')),
+                ('imported_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='取り込み日時')),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='annotation_tiers', to='language_archive.languagerecord', verbose_name='言語記録')),
+            ],
+            options={
+                'verbose_name': '書き起こしの層',
+                'verbose_name_plural': '書き起こしの層',
+                'ordering': ['record', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AnnotationSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_ms', models.PositiveIntegerField(verbose_name='開始（ミリ秒）')),
+                ('end_ms', models.PositiveIntegerField(verbose_name='終了（ミリ秒）')),
+                ('text', models.TextField(blank=True, verbose_name='文字列')),
+                ('tier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='language_archive.annotationtier', verbose_name='層')),
+            ],
+            options={
+                'verbose_name': '書き起こしの区間',
+                'verbose_name_plural': '書き起こしの区間',
+            },
+        ),
+        migrations.CreateModel(
+            name='AnnotationToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100, verbose_name='語')),
+                ('segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to='language_archive.annotationsegment', verbose_name='区間')),
+            ],
+            options={
+                'verbose_name': '書き起こしの語',
+                'verbose_name_plural': '書き起こしの語',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='annotationtier',
+            constraint=models.UniqueConstraint(fields=('record', 'name'), name='annotation_tier_name_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='annotationsegment',
+            index=models.Index(fields=['tier', 'start_ms'], name='annotation_segment_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annotationtoken',
+            index=models.Index(fields=['token', 'segment'], name='annotation_token_idx'),
+        ),
+    ]
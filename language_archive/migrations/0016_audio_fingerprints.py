@@ -0,0 +1,64 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0015_annotation_tiers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioFingerprintState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.URLField(max_length=1024, verbose_name='計算したファイルのURL')),
+                ('status', models.CharField(choices=[('ok', '計算済み'), ('unsupported', '対応していない形式'), ('failed', '失敗')], max_length=15, verbose_name='状態')),
+                ('duration_ms', models.PositiveIntegerField(default=0, verbose_name='長さ（ミリ秒）')),
+                ('hash_count', models.PositiveIntegerField(default=0, verbose_name='ハッシュの数')),
+                ('error', models.TextField(blank=True, verbose_name='エラー')),
+                ('fingerprinted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='計算日時')),
+                ('record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint_state', to='language_archive.languagerecord', verbose_name='言語記録')),
+            ],
+            options={
+                'verbose_name': '音声の指紋の計算状態',
+                'verbose_name_plural': '音声の指紋の計算状態',
+            },
+        ),
+        migrations.CreateModel(
+            name='AudioFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.IntegerField(verbose_name='ハッシュ')),
+                ('offset', models.PositiveIntegerField(verbose_name='時刻（フレーム）')),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='language_archive.languagerecord', verbose_name='言語記録')),
+            ],
+            options={
+                'verbose_name': '音声の指紋',
+                'verbose_name_plural': '音声の指紋',
+                'indexes': [models.Index(fields=['hash', 'record', 'offset'], name='audio_fingerprint_hash_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AudioMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aligned_hashes', models.PositiveIntegerField(verbose_name='時刻のそろったハッシュの数')),
+                ('coverage', models.FloatField(verbose_name='一致の割合')),
+                ('offset_ms', models.IntegerField(verbose_name='ずれ（ミリ秒）')),
+                ('detected_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='検出日時')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='language_archive.languagerecord', verbose_name='一致した記録')),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audio_matches', to='language_archive.languagerecord', verbose_name='言語記録')),
+            ],
+            options={
+                'verbose_name': '音声の一致',
+                'verbose_name_plural': '音声の一致',
+                'ordering': ['-coverage'],
+                'constraints': [models.UniqueConstraint(fields=('record', 'other'), name='audio_match_pair_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0016_audio_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='languagerecord',
+            index=models.Index(fields=['onomatopoeia_text'], name='langrec_onomatopoeia_idx'),
+        ),
+    ]
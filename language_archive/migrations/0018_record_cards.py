@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0017_onomatopoeia_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordCard',
+            fields=[
+                ('record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='language_archive.languagerecord', verbose_name='言語記録')),
+                ('display_title', models.CharField(blank=True, max_length=200, verbose_name='タイトル')),
+                ('file_type', models.CharField(choices=[('audio', '音声'), ('video', '映像'), ('image', '画像')], max_length=10, verbose_name='ファイル種類')),
+                ('summary', models.TextField(blank=True, verbose_name='概要')),
+                ('thumbnail_url', models.URLField(blank=True, max_length=1024, verbose_name='サムネイルURL')),
+                ('video_url', models.URLField(blank=True, max_length=1024, verbose_name='プレビュー映像URL')),
+                ('youtube_url', models.URLField(blank=True, max_length=1024, verbose_name='YouTube URL')),
+                ('youtube_embed_url', models.URLField(blank=True, max_length=1024, verbose_name='YouTube 埋め込みURL')),
+                ('type_label', models.CharField(blank=True, max_length=20, verbose_name='型')),
+                ('type_description', models.TextField(blank=True, verbose_name='型の説明')),
+                ('village_name', models.CharField(blank=True, max_length=100, verbose_name='集落名')),
+                ('speaker_label', models.CharField(blank=True, max_length=100, verbose_name='話者')),
+                ('village_id', models.BigIntegerField(null=True, verbose_name='集落ID')),
+                ('speaker_id', models.BigIntegerField(null=True, verbose_name='話者ID')),
+                ('onomatopoeia_type_id', models.BigIntegerField(null=True, verbose_name='型ID')),
+                ('onomatopoeia_text', models.CharField(blank=True, max_length=100, null=True, verbose_name='オノマトペ')),
+                ('recorded_date', models.DateField(verbose_name='収録日')),
+            ],
+            options={
+                'verbose_name': '一覧のカード',
+                'verbose_name_plural': '一覧のカード',
+                'ordering': ['-recorded_date', '-record_id'],
+                'indexes': [models.Index(fields=['-recorded_date', '-record'], name='record_card_date_idx'), models.Index(fields=['village_id', '-recorded_date', '-record'], name='record_card_village_idx'), models.Index(fields=['speaker_id', '-recorded_date', '-record'], name='record_card_speaker_idx'), models.Index(fields=['type_label', '-recorded_date', '-record'], name='record_card_type_idx'), models.Index(fields=['onomatopoeia_text'], name='record_card_onomatopoeia_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:02
+# 既存の集落・地理環境データの geohash の埋め直しはマイグレーションでは行わず（Postgres では表全体を1トランザクションで書き換えるため）、
+# backfill.py に登録した village_geohash・geographic_geohash の作業（デプロイ時は build.sh の backfill --all）で行う。
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0018_record_cards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geographicrecord',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, verbose_name='geohash'),
+        ),
+        migrations.AddField(
+            model_name='village',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, verbose_name='geohash'),
+        ),
+        migrations.AddIndex(
+            model_name='geographicrecord',
+            index=models.Index(fields=['geohash'], name='georecord_geohash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='village',
+            index=models.Index(fields=['geohash'], name='village_geohash_idx'),
+        ),
+    ]
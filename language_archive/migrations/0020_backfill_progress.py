@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0019_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='作業')),
+                ('status', models.CharField(choices=[('running', '実行中'), ('done', '完了'), ('failed', '失敗')], default='running', max_length=10, verbose_name='状態')),
+                ('max_id', models.BigIntegerField(default=0, verbose_name='対象の最大ID')),
+                ('last_id', models.BigIntegerField(default=0, verbose_name='処理済みの最大ID')),
+                ('changed', models.PositiveIntegerField(default=0, verbose_name='更新件数')),
+                ('chunks', models.PositiveIntegerField(default=0, verbose_name='処理した範囲の数')),
+                ('error', models.TextField(blank=True, verbose_name='エラー')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='開始日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完了日時')),
+            ],
+            options={
+                'verbose_name': 'バックフィルの進み具合',
+                'verbose_name_plural': 'バックフィルの進み具合',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0020_backfill_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('request_id', models.CharField(max_length=32, unique=True, verbose_name='リクエストID')),
+                ('method', models.CharField(max_length=10, verbose_name='メソッド')),
+                ('path', models.CharField(max_length=1024, verbose_name='パス')),
+                ('view_name', models.CharField(blank=True, max_length=100, verbose_name='ビュー')),
+                ('status', models.PositiveSmallIntegerField(verbose_name='ステータス')),
+                ('trigger', models.CharField(choices=[('token', '署名付きヘッダー'), ('staff', 'スタッフの指定'), ('sampled', 'サンプリング')], max_length=10, verbose_name='理由')),
+                ('duration_ms', models.FloatField(verbose_name='処理時間（ミリ秒）')),
+                ('sample_count', models.PositiveIntegerField(verbose_name='サンプル数')),
+                ('interval_ms', models.FloatField(verbose_name='サンプリング間隔（ミリ秒）')),
+                ('collapsed', models.TextField(blank=True, verbose_name='collapsed stacks')),
+                ('flame_graph', models.TextField(blank=True, verbose_name='フレームグラフ（SVG）')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='記録日時')),
+            ],
+            options={
+                'verbose_name': 'リクエストのプロファイル',
+                'verbose_name_plural': 'リクエストのプロファイル',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='request_profile_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('language_archive', '0021_request_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.CharField(max_length=32, unique=True, verbose_name='アップロードID')),
+                ('target', models.CharField(choices=[('language', '言語記録'), ('geographic', '地理環境データ')], max_length=10, verbose_name='登録先')),
+                ('category', models.CharField(max_length=20, verbose_name='種類')),
+                ('file_name', models.CharField(max_length=255, verbose_name='ファイル名')),
+                ('content_type', models.CharField(max_length=100, verbose_name='Content-Type')),
+                ('size', models.BigIntegerField(verbose_name='サイズ（バイト）')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='受信済みのバイト数')),
+                ('chunks', models.JSONField(default=list, verbose_name='受信した分')),
+                ('status', models.CharField(choices=[('uploading', '受信中'), ('stored', '保存済み')], default='uploading', max_length=10, verbose_name='状態')),
+                ('file_url', models.URLField(blank=True, max_length=1024, verbose_name='ファイルURL')),
+                ('error', models.TextField(blank=True, verbose_name='エラー')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='開始日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '分割アップロード',
+                'verbose_name_plural': '分割アップロード',
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='chunked_upload_status_idx')],
+            },
+        ),
+    ]
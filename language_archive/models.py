@@ -5,20 +5,45 @@ from django.db import models
 from django.utils import timezone
 import re
 
+from .geo import GEOHASH_PRECISION, encode as encode_geohash
+
 class Village(models.Model):
     """集落情報テーブル"""
     name = models.CharField(max_length=100, verbose_name="集落名")
     latitude = models.FloatField(verbose_name="緯度")
     longitude = models.FloatField(verbose_name="経度")
+    # 近傍検索用（緯度・経度から save() で作る。geo.py）
+    geohash = models.CharField(max_length=GEOHASH_PRECISION, blank=True, editable=False, verbose_name="geohash")
     description = models.TextField(blank=True, verbose_name="説明")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
     
     class Meta:
         verbose_name = "集落"
         verbose_name_plural = "集落"
+        indexes = [
+            # 差分同期（更新日時・IDの順に読む）
+            models.Index(fields=['updated_at', 'id'], name='village_sync_idx'),
+            models.Index(fields=['geohash'], name='village_geohash_idx'),
+        ]
     
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        _sync_geohash(self, kwargs)
+        super().save(*args, **kwargs)
+
+
+def _sync_geohash(instance, save_kwargs):
+    """緯度・経度から geohash を作る（緯度・経度だけを update_fields で保存する場合も geohash を含める）"""
+    if instance.latitude is None or instance.longitude is None:
+        instance.geohash = ''
+    else:
+        instance.geohash = encode_geohash(instance.latitude, instance.longitude)
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+        save_kwargs['update_fields'] = {*update_fields, 'geohash'}
+
 
 class Speaker(models.Model):
     """話者情報テーブル"""
@@ -45,24 +70,41 @@ class Speaker(models.Model):
     village = models.ForeignKey(Village, on_delete=models.SET_NULL, null=True, verbose_name="集落")
     consent_video = models.BooleanField(default=False, verbose_name="映像公開同意")
     notes = models.TextField(blank=True, verbose_name="備考")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
     
     class Meta:
         verbose_name = "話者"
         verbose_name_plural = "話者"
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='speaker_sync_idx'),
+        ]
     
     def __str__(self):
         return f"{self.speaker_id} ({self.age_range}, {self.get_gender_display()})"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            # 言語記録の関連集落（非正規化）を話者の集落に合わせる
+            self.languagerecord_set.exclude(village_id=self.village_id).update(
+                village_id=self.village_id, updated_at=timezone.now(),
+            )
+
 
 class OnomatopoeiaType(models.Model):
     """オノマトペ型マスタ"""
     type_code = models.CharField(max_length=10, unique=True, verbose_name="型コード")
     type_name = models.CharField(max_length=100, verbose_name="型名")
     description = models.TextField(verbose_name="説明")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
     
     class Meta:
         verbose_name = "オノマトペ型"
         verbose_name_plural = "オノマトペ型"
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='onomatopoeiatype_sync_idx'),
+        ]
     
     def __str__(self):
         return f"{self.type_code}: {self.type_name}"
@@ -113,6 +155,13 @@ class LanguageRecord(models.Model):
         verbose_name = "言語記録"
         verbose_name_plural = "言語記録"
         ordering = ['-recorded_date']
+        indexes = [
+            # 集落ごとの一覧（関連集落で絞り込み、収録日の新しい順）
+            models.Index(fields=['village', '-recorded_date'], name='langrec_village_date_idx'),
+            models.Index(fields=['updated_at', 'id'], name='langrec_sync_idx'),
+            # 記録一覧のオノマトペでの絞り込み（入力補完の索引で求めた表記の IN）
+            models.Index(fields=['onomatopoeia_text'], name='langrec_onomatopoeia_idx'),
+        ]
     
     def __str__(self):
         if self.youtube_url and self.title:
@@ -121,6 +170,21 @@ class LanguageRecord(models.Model):
             return self.onomatopoeia_text
         return f"記録 #{self.pk}"
 
+    def sync_village_from_speaker(self):
+        """
+        関連集落を話者の集落に合わせる（話者がいない記録は手動で設定された集落のまま）。
+        一覧の集落絞り込みは話者を JOIN せずこの列を使うため、bulk_create など save() を通らない登録でも呼ぶこと。
+        """
+        if self.speaker_id is not None:
+            self.village_id = self.speaker.village_id
+
+    def save(self, *args, **kwargs):
+        self.sync_village_from_speaker()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'speaker' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'village'}
+        super().save(*args, **kwargs)
+
     @property
     def display_title(self):
         """一覧・詳細で表示するタイトル（YouTube の場合は title、それ以外は onomatopoeia_text）"""
@@ -167,17 +231,28 @@ class GeographicRecord(models.Model):
     village = models.ForeignKey(Village, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="集落")
     latitude = models.FloatField(null=True, blank=True, verbose_name="緯度")
     longitude = models.FloatField(null=True, blank=True, verbose_name="経度")
+    # 近傍検索用（緯度・経度から save() で作る。geo.py）
+    geohash = models.CharField(max_length=GEOHASH_PRECISION, blank=True, editable=False, verbose_name="geohash")
     
     captured_date = models.DateField(verbose_name="撮影日")
     created_at = models.DateTimeField(default=timezone.now, verbose_name="登録日時")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
     
     class Meta:
         verbose_name = "地理環境データ"
         verbose_name_plural = "地理環境データ"
         ordering = ['-captured_date']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='georecord_sync_idx'),
+            models.Index(fields=['geohash'], name='georecord_geohash_idx'),
+        ]
     
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        _sync_geohash(self, kwargs)
+        super().save(*args, **kwargs)
     
     def get_youtube_embed_url(self):
         """
@@ -197,3 +272,479 @@ class GeographicRecord(models.Model):
                 video_id = match.group(1)
                 return f"https://www.youtube-nocookie.com/embed/{video_id}?rel=0&modestbranding=1"
         return None
+
+
+class RecordCard(models.Model):
+    """
+    一覧のカード用の読み取りモデル（言語記録1件につき1行）。
+    カードに表示する短い値と絞り込み・並べ替えに使う列だけを持ち、一覧は JOIN せずこの表だけを読む。
+    言語記録・話者・集落・オノマトペ型の保存時に record_cards.py が更新し、rebuild_record_cards で作り直せる。
+    """
+    record = models.OneToOneField(LanguageRecord, on_delete=models.CASCADE, primary_key=True, related_name='card', verbose_name="言語記録")
+    display_title = models.CharField(max_length=200, blank=True, verbose_name="タイトル")
+    file_type = models.CharField(max_length=10, choices=LanguageRecord.FILE_TYPE_CHOICES, verbose_name="ファイル種類")
+    # 意味（YouTube の場合は説明）の先頭
+    summary = models.TextField(blank=True, verbose_name="概要")
+    thumbnail_url = models.URLField(max_length=1024, blank=True, verbose_name="サムネイルURL")
+    # サムネイルのない映像は、映像の先頭をプレビューにする
+    video_url = models.URLField(max_length=1024, blank=True, verbose_name="プレビュー映像URL")
+    youtube_url = models.URLField(max_length=1024, blank=True, verbose_name="YouTube URL")
+    youtube_embed_url = models.URLField(max_length=1024, blank=True, verbose_name="YouTube 埋め込みURL")
+    type_label = models.CharField(max_length=20, blank=True, verbose_name="型")
+    type_description = models.TextField(blank=True, verbose_name="型の説明")
+    village_name = models.CharField(max_length=100, blank=True, verbose_name="集落名")
+    speaker_label = models.CharField(max_length=100, blank=True, verbose_name="話者")
+
+    # 絞り込み・並べ替え用（外部キーにせず、一覧で JOIN しない）
+    village_id = models.BigIntegerField(null=True, verbose_name="集落ID")
+    speaker_id = models.BigIntegerField(null=True, verbose_name="話者ID")
+    onomatopoeia_type_id = models.BigIntegerField(null=True, verbose_name="型ID")
+    onomatopoeia_text = models.CharField(max_length=100, blank=True, null=True, verbose_name="オノマトペ")
+    recorded_date = models.DateField(verbose_name="収録日")
+
+    class Meta:
+        verbose_name = "一覧のカード"
+        verbose_name_plural = "一覧のカード"
+        # '-record' だと言語記録の並び順をたどって JOIN するため、列の値で並べる
+        ordering = ['-recorded_date', '-record_id']
+        indexes = [
+            models.Index(fields=['-recorded_date', '-record'], name='record_card_date_idx'),
+            models.Index(fields=['village_id', '-recorded_date', '-record'], name='record_card_village_idx'),
+            models.Index(fields=['speaker_id', '-recorded_date', '-record'], name='record_card_speaker_idx'),
+            models.Index(fields=['type_label', '-recorded_date', '-record'], name='record_card_type_idx'),
+            models.Index(fields=['onomatopoeia_text'], name='record_card_onomatopoeia_idx'),
+        ]
+
+    def __str__(self):
+        return self.display_title or f"記録 #{self.record_id}"
+
+    @property
+    def id(self):
+        """テンプレートでは言語記録と同じく record.id で詳細ページを指す"""
+        return self.record_id
+
+
+class SimilarRecord(models.Model):
+    """類似記録テーブル（build_similar_records で事前計算した近傍。記録ごとに類似度の高い順）"""
+    record = models.ForeignKey(LanguageRecord, on_delete=models.CASCADE, related_name='similar_links', verbose_name="言語記録")
+    similar = models.ForeignKey(LanguageRecord, on_delete=models.CASCADE, related_name='+', verbose_name="類似記録")
+    score = models.FloatField(verbose_name="類似度")
+    rank = models.PositiveSmallIntegerField(verbose_name="順位")
+
+    class Meta:
+        verbose_name = "類似記録"
+        verbose_name_plural = "類似記録"
+        ordering = ['record', 'rank']
+        constraints = [
+            # 詳細ページは (record, rank) の索引で1回のクエリで読む
+            models.UniqueConstraint(fields=['record', 'rank'], name='similar_record_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.record_id} → {self.similar_id} ({self.score:.3f})"
+
+
+class SimilarityIndexState(models.Model):
+    """
+    類似記録の計算状態（1行だけ使う）。
+    全件再計算時の語彙（文字n-gram）と IDF を保存し、追加された記録だけを同じ尺度でベクトル化できるようにする。
+    """
+    vocabulary = models.JSONField(default=list, verbose_name="語彙")
+    idf = models.JSONField(default=list, verbose_name="IDF")
+    record_count = models.PositiveIntegerField(default=0, verbose_name="計算済みの記録数")
+    last_record_id = models.PositiveBigIntegerField(default=0, verbose_name="計算済みの最大記録ID")
+    built_at = models.DateTimeField(default=timezone.now, verbose_name="全件計算日時")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        verbose_name = "類似記録の計算状態"
+        verbose_name_plural = "類似記録の計算状態"
+
+    def __str__(self):
+        return f"語彙 {len(self.vocabulary)} / 記録 {self.record_count} (〜#{self.last_record_id})"
+
+
+class AnalyticsSnapshot(models.Model):
+    """集計スナップショット（build_analytics が集計に使う表の変更ごとに作成する）"""
+    data_version = models.BigIntegerField(verbose_name="データバージョン")
+    record_count = models.PositiveIntegerField(default=0, verbose_name="集計した記録数")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="集計日時")
+
+    class Meta:
+        verbose_name = "集計スナップショット"
+        verbose_name_plural = "集計スナップショット"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M} ({self.record_count}件)"
+
+
+class AnalyticsCell(models.Model):
+    """集計表の1セル（スナップショット・表・行・列ごと）"""
+    snapshot = models.ForeignKey(AnalyticsSnapshot, on_delete=models.CASCADE, related_name='cells', verbose_name="スナップショット")
+    table = models.CharField(max_length=50, verbose_name="表")
+    row_label = models.CharField(max_length=100, verbose_name="行")
+    column_label = models.CharField(max_length=100, verbose_name="列")
+    row_order = models.PositiveSmallIntegerField(verbose_name="行の順番")
+    column_order = models.PositiveSmallIntegerField(verbose_name="列の順番")
+    value = models.FloatField(verbose_name="値")
+
+    class Meta:
+        verbose_name = "集計セル"
+        verbose_name_plural = "集計セル"
+        indexes = [
+            models.Index(fields=['snapshot', 'table', 'row_order', 'column_order'], name='analytics_cell_order_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.table}[{self.row_label}, {self.column_label}] = {self.value}"
+
+
+class SyncTombstone(models.Model):
+    """差分同期用の削除記録（墓標）。削除された行を端末に伝えるため、削除時に signals.py で作成する"""
+    model = models.CharField(max_length=30, verbose_name="モデル")
+    object_id = models.BigIntegerField(verbose_name="ID")
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name="削除日時")
+
+    class Meta:
+        verbose_name = "削除記録（同期用）"
+        verbose_name_plural = "削除記録（同期用）"
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='sync_tombstone_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} ({self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+class VillagePackage(models.Model):
+    """集落ごとのオフライン用パッケージ（ZIP）。集落のデータのバージョンごとに1つ作り、ストレージに保存する"""
+    STATUS_CHOICES = [
+        ('pending', '待機中'),
+        ('building', '作成中'),
+        ('ready', '完成'),
+        ('failed', '失敗'),
+    ]
+
+    village = models.ForeignKey(Village, on_delete=models.CASCADE, related_name='packages', verbose_name="集落")
+    version = models.CharField(max_length=40, verbose_name="データのバージョン")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="状態")
+    storage_path = models.CharField(max_length=255, blank=True, verbose_name="ストレージのパス")
+    size = models.BigIntegerField(default=0, verbose_name="サイズ（バイト）")
+    file_count = models.PositiveIntegerField(default=0, verbose_name="ファイル数")
+    error = models.TextField(blank=True, verbose_name="エラー")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="登録日時")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="作成開始日時")
+    built_at = models.DateTimeField(null=True, blank=True, verbose_name="作成日時")
+
+    class Meta:
+        verbose_name = "集落パッケージ"
+        verbose_name_plural = "集落パッケージ"
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['village', 'version'], name='village_package_version_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.village} ({self.version}, {self.get_status_display()})"
+
+
+class StorageCheckRun(models.Model):
+    """ストレージの整合性確認（check_storage）の1回分。中断しても position から続きを確認できる"""
+    started_at = models.DateTimeField(default=timezone.now, verbose_name="開始日時")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完了日時")
+    position = models.JSONField(default=dict, verbose_name="確認済みの位置（モデルごとの最大ID）")
+    checked = models.PositiveIntegerField(default=0, verbose_name="確認したファイル数")
+    problem_count = models.PositiveIntegerField(default=0, verbose_name="問題のあったファイル数")
+
+    class Meta:
+        verbose_name = "ストレージの確認"
+        verbose_name_plural = "ストレージの確認"
+        ordering = ['-started_at']
+
+    def __str__(self):
+        state = f"{self.finished_at:%Y-%m-%d %H:%M} 完了" if self.finished_at else "未完了"
+        return f"#{self.id} {self.started_at:%Y-%m-%d %H:%M} ({state}, {self.checked}件)"
+
+
+
+class StorageObjectCheck(models.Model):
+    """記録が参照するストレージのファイル（file_path・thumbnail_path）ごとの最新の確認結果"""
+    STATUS_CHOICES = [
+        ('ok', '正常'),
+        ('missing', 'ファイルなし'),
+        ('mismatch', '不一致'),
+        ('slow', '応答が遅い'),
+        ('error', 'エラー'),
+    ]
+
+    model = models.CharField(max_length=30, verbose_name="モデル")
+    object_id = models.BigIntegerField(verbose_name="ID")
+    field = models.CharField(max_length=30, verbose_name="列")
+    url = models.URLField(max_length=1024, verbose_name="URL")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, verbose_name="状態")
+    detail = models.CharField(max_length=255, blank=True, verbose_name="内容")
+    http_status = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="HTTPステータス")
+    size = models.BigIntegerField(null=True, blank=True, verbose_name="サイズ（バイト）")
+    content_type = models.CharField(max_length=100, blank=True, verbose_name="Content-Type")
+    elapsed_ms = models.FloatField(null=True, blank=True, verbose_name="応答時間（ミリ秒）")
+    run = models.ForeignKey(StorageCheckRun, on_delete=models.SET_NULL, null=True, blank=True, related_name='objects_checked', verbose_name="確認")
+    checked_at = models.DateTimeField(default=timezone.now, verbose_name="確認日時")
+
+    class Meta:
+        verbose_name = "ストレージのファイルの確認結果"
+        verbose_name_plural = "ストレージのファイルの確認結果"
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id', 'field'], name='storage_object_check_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['run', 'status'], name='storage_check_run_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} {self.field}: {self.get_status_display()}"
+
+
+class StorageDeletion(models.Model):
+    """collect_storage_garbage が削除した（または削除に失敗した）ストレージのファイルの記録"""
+    STATUS_CHOICES = [
+        ('deleted', '削除'),
+        ('failed', '失敗'),
+    ]
+
+    bucket = models.CharField(max_length=63, verbose_name="バケット")
+    path = models.CharField(max_length=1024, verbose_name="パス")
+    size = models.BigIntegerField(null=True, blank=True, verbose_name="サイズ（バイト）")
+    object_created_at = models.DateTimeField(null=True, blank=True, verbose_name="ファイルの作成日時")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, verbose_name="結果")
+    error = models.TextField(blank=True, verbose_name="エラー")
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name="削除日時")
+
+    class Meta:
+        verbose_name = "ストレージのファイルの削除記録"
+        verbose_name_plural = "ストレージのファイルの削除記録"
+        ordering = ['-deleted_at']
+        indexes = [
+            models.Index(fields=['deleted_at'], name='storage_deletion_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket}/{self.path} ({self.get_status_display()}, {self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+class AnnotationTier(models.Model):
+    """言語記録の書き起こしの層（ELAN の tier・Praat の TextGrid の tier）。import_annotations で作成する"""
+    record = models.ForeignKey(LanguageRecord, on_delete=models.CASCADE, related_name='annotation_tiers', verbose_name="言語記録")
+    name = models.CharField(max_length=100, verbose_name="層の名前")
+    source = models.CharField(max_length=255, blank=True, verbose_name="取り込んだファイル")
+    segment_count = models.PositiveIntegerField(default=0, verbose_name="区間の数")
+    # 時間窓の検索で、開始時刻の下限を「窓の開始 − 最長の区間」に絞るために使う
+    max_duration_ms = models.PositiveIntegerField(default=0, verbose_name="最長の区間（ミリ秒）")
+    imported_at = models.DateTimeField(default=timezone.now, verbose_name="取り込み日時")
+
+    class Meta:
+        verbose_name = "書き起こしの層"
+        verbose_name_plural = "書き起こしの層"
+        ordering = ['record', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['record', 'name'], name='annotation_tier_name_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.record_id}: {self.name} ({self.segment_count}区間)"
+
+
+class AnnotationSegment(models.Model):
+    """書き起こしの1区間（開始・終了時刻と文字列）"""
+    tier = models.ForeignKey(AnnotationTier, on_delete=models.CASCADE, related_name='segments', verbose_name="層")
+    start_ms = models.PositiveIntegerField(verbose_name="開始（ミリ秒）")
+    end_ms = models.PositiveIntegerField(verbose_name="終了（ミリ秒）")
+    text = models.TextField(blank=True, verbose_name="文字列")
+
+    class Meta:
+        verbose_name = "書き起こしの区間"
+        verbose_name_plural = "書き起こしの区間"
+        indexes = [
+            models.Index(fields=['tier', 'start_ms'], name='annotation_segment_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.start_ms}-{self.end_ms}] {self.text}"
+
+
+class AnnotationToken(models.Model):
+    """区間の文字列の語（正規化済み）の索引。「語 X を含む区間」の検索に使う"""
+    token = models.CharField(max_length=100, verbose_name="語")
+    segment = models.ForeignKey(AnnotationSegment, on_delete=models.CASCADE, related_name='tokens', verbose_name="区間")
+
+    class Meta:
+        verbose_name = "書き起こしの語"
+        verbose_name_plural = "書き起こしの語"
+        indexes = [
+            models.Index(fields=['token', 'segment'], name='annotation_token_idx'),
+        ]
+
+    def __str__(self):
+        return self.token
+
+
+class AudioFingerprintState(models.Model):
+    """言語記録の音声の指紋（fingerprint）の計算状態。file_path が変わったら計算し直す"""
+    STATUS_CHOICES = [
+        ('ok', '計算済み'),
+        ('unsupported', '対応していない形式'),
+        ('failed', '失敗'),
+    ]
+
+    record = models.OneToOneField(LanguageRecord, on_delete=models.CASCADE, related_name='fingerprint_state', verbose_name="言語記録")
+    file_path = models.URLField(max_length=1024, verbose_name="計算したファイルのURL")
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, verbose_name="状態")
+    duration_ms = models.PositiveIntegerField(default=0, verbose_name="長さ（ミリ秒）")
+    hash_count = models.PositiveIntegerField(default=0, verbose_name="ハッシュの数")
+    error = models.TextField(blank=True, verbose_name="エラー")
+    fingerprinted_at = models.DateTimeField(default=timezone.now, verbose_name="計算日時")
+
+    class Meta:
+        verbose_name = "音声の指紋の計算状態"
+        verbose_name_plural = "音声の指紋の計算状態"
+
+    def __str__(self):
+        return f"{self.record_id}: {self.get_status_display()} ({self.hash_count}件)"
+
+
+class AudioFingerprint(models.Model):
+    """音声の指紋の転置索引（スペクトルのピークの組のハッシュ → 記録と時刻）"""
+    hash = models.IntegerField(verbose_name="ハッシュ")
+    record = models.ForeignKey(LanguageRecord, on_delete=models.CASCADE, related_name='+', verbose_name="言語記録")
+    offset = models.PositiveIntegerField(verbose_name="時刻（フレーム）")
+
+    class Meta:
+        verbose_name = "音声の指紋"
+        verbose_name_plural = "音声の指紋"
+        indexes = [
+            models.Index(fields=['hash', 'record', 'offset'], name='audio_fingerprint_hash_idx'),
+        ]
+
+
+class AudioMatch(models.Model):
+    """音声の指紋で見つかった、同じ区間を含む記録の組（重複・一部の重なりの候補）"""
+    record = models.ForeignKey(LanguageRecord, on_delete=models.CASCADE, related_name='audio_matches', verbose_name="言語記録")
+    other = models.ForeignKey(LanguageRecord, on_delete=models.CASCADE, related_name='+', verbose_name="一致した記録")
+    aligned_hashes = models.PositiveIntegerField(verbose_name="時刻のそろったハッシュの数")
+    coverage = models.FloatField(verbose_name="一致の割合")
+    offset_ms = models.IntegerField(verbose_name="ずれ（ミリ秒）")
+    detected_at = models.DateTimeField(default=timezone.now, verbose_name="検出日時")
+
+    class Meta:
+        verbose_name = "音声の一致"
+        verbose_name_plural = "音声の一致"
+        ordering = ['-coverage']
+        constraints = [
+            models.UniqueConstraint(fields=['record', 'other'], name='audio_match_pair_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.record_id} ≈ {self.other_id} ({self.coverage:.0%})"
+
+
+class BackfillProgress(models.Model):
+    """backfill.py の作業（派生した列の埋め直し）ごとの進み具合。範囲ごとの書き込みと同じトランザクションで更新する"""
+    STATUS_CHOICES = [
+        ('running', '実行中'),
+        ('done', '完了'),
+        ('failed', '失敗'),
+    ]
+
+    name = models.CharField(max_length=50, unique=True, verbose_name="作業")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running', verbose_name="状態")
+    # 開始時の最大ID（それ以降に追加された行は save() が派生した列を作るため対象にしない）
+    max_id = models.BigIntegerField(default=0, verbose_name="対象の最大ID")
+    last_id = models.BigIntegerField(default=0, verbose_name="処理済みの最大ID")
+    changed = models.PositiveIntegerField(default=0, verbose_name="更新件数")
+    chunks = models.PositiveIntegerField(default=0, verbose_name="処理した範囲の数")
+    error = models.TextField(blank=True, verbose_name="エラー")
+    started_at = models.DateTimeField(default=timezone.now, verbose_name="開始日時")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完了日時")
+
+    class Meta:
+        verbose_name = "バックフィルの進み具合"
+        verbose_name_plural = "バックフィルの進み具合"
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name}: {self.get_status_display()} ({self.last_id}/{self.max_id})"
+
+
+class RequestProfile(models.Model):
+    """1件のリクエストのサンプリングプロファイル（profiling.py。管理画面でフレームグラフを見る）"""
+    TRIGGER_CHOICES = [
+        ('token', '署名付きヘッダー'),
+        ('staff', 'スタッフの指定'),
+        ('sampled', 'サンプリング'),
+    ]
+
+    request_id = models.CharField(max_length=32, unique=True, verbose_name="リクエストID")
+    method = models.CharField(max_length=10, verbose_name="メソッド")
+    path = models.CharField(max_length=1024, verbose_name="パス")
+    view_name = models.CharField(max_length=100, blank=True, verbose_name="ビュー")
+    status = models.PositiveSmallIntegerField(verbose_name="ステータス")
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES, verbose_name="理由")
+    duration_ms = models.FloatField(verbose_name="処理時間（ミリ秒）")
+    sample_count = models.PositiveIntegerField(verbose_name="サンプル数")
+    interval_ms = models.FloatField(verbose_name="サンプリング間隔（ミリ秒）")
+    collapsed = models.TextField(blank=True, verbose_name="collapsed stacks")
+    flame_graph = models.TextField(blank=True, verbose_name="フレームグラフ（SVG）")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="記録日時")
+
+    class Meta:
+        verbose_name = "リクエストのプロファイル"
+        verbose_name_plural = "リクエストのプロファイル"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='request_profile_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class ChunkedUpload(models.Model):
+    """
+    ブラウザからの分割アップロード（chunked_upload.py）の状態。
+    受け取った分はサーバーのスプールファイルに追記し、途中で切れても offset から続きを送れる。
+    """
+    TARGET_CHOICES = [
+        ('language', '言語記録'),
+        ('geographic', '地理環境データ'),
+    ]
+    STATUS_CHOICES = [
+        ('uploading', '受信中'),
+        ('stored', '保存済み'),
+    ]
+
+    upload_id = models.CharField(max_length=32, unique=True, verbose_name="アップロードID")
+    target = models.CharField(max_length=10, choices=TARGET_CHOICES, verbose_name="登録先")
+    # 言語記録のファイル種類・地理環境データのコンテンツ種類（バケットを決める）
+    category = models.CharField(max_length=20, verbose_name="種類")
+    file_name = models.CharField(max_length=255, verbose_name="ファイル名")
+    content_type = models.CharField(max_length=100, verbose_name="Content-Type")
+    size = models.BigIntegerField(verbose_name="サイズ（バイト）")
+    offset = models.BigIntegerField(default=0, verbose_name="受信済みのバイト数")
+    # 受け取った分ごとの [開始位置, バイト数, SHA-256]
+    chunks = models.JSONField(default=list, verbose_name="受信した分")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading', verbose_name="状態")
+    file_url = models.URLField(max_length=1024, blank=True, verbose_name="ファイルURL")
+    error = models.TextField(blank=True, verbose_name="エラー")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="開始日時")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        verbose_name = "分割アップロード"
+        verbose_name_plural = "分割アップロード"
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='chunked_upload_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.offset}/{self.size}, {self.get_status_display()})"
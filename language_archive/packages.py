@@ -0,0 +1,363 @@
+# language_archive/packages.py
+# 集落ごとのオフライン用パッケージ（「この集落で記録したものすべて」を USB メモリなどで配るための ZIP）。
+# ZIP はストリーミングで組み立て、メディアはストレージから並行して読み込みながら、そのままストレージに送信する
+# （パッケージ全体をメモリやディスクに置かない）。パッケージは集落のデータのバージョンごとに1つ作り、
+# ダウンロード（views.village_package）はストレージから Range 付きで中継する。
+
+import csv
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import zipfile
+from collections import deque
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import GeographicRecord, LanguageRecord, Speaker, VillagePackage
+from .tracing import traced
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_BUCKET = 'village-packages'
+
+# パッケージの中身の形式を変えたら上げる（既存のパッケージを作り直させる）
+PACKAGE_FORMAT = 1
+
+# メディアを同時に読み込むファイル数と、ファイルごとに先読みしておくチャンク数
+# （先読みのメモリは最大 FETCH_WORKERS × PREFETCH_CHUNKS × CHUNK_SIZE）
+FETCH_WORKERS = 4
+PREFETCH_CHUNKS = 8
+CHUNK_SIZE = 256 * 1024
+
+# この時間を過ぎても「作成中」のパッケージは、作成していたワーカーが止まったとみなして作り直す
+BUILD_TIMEOUT = datetime.timedelta(hours=2)
+# 作成に失敗したパッケージは、この時間が過ぎてから作り直す（ストレージの障害中にリクエストのたびに作り直さない）
+FAILED_RETRY_AFTER = datetime.timedelta(minutes=10)
+
+RECORD_CSV_COLUMNS = [
+    ('id', 'ID'), ('onomatopoeia_text', 'オノマトペ'), ('meaning', '意味'), ('usage_example', '用例'),
+    ('phonetic_notation', '音声記号'), ('onomatopoeia_type', '型'), ('speaker', '話者ID'), ('age_range', '年代'),
+    ('gender', '性別'), ('language_frequency', '言語使用頻度'), ('recorded_date', '収録日'), ('file_type', 'ファイル種類'),
+    ('file', 'ファイル'), ('youtube_url', 'YouTube URL'), ('title', 'タイトル'), ('description', '説明'), ('notes', '備考'),
+]
+
+
+def package_version(village):
+    """
+    集落のデータのバージョン（パッケージに含める行の件数・最終更新日時から作るハッシュ）。
+    記録の追加・編集・削除、話者・型・集落の編集で変わる。
+    """
+    records = LanguageRecord.objects.filter(village=village).aggregate(
+        count=Count('id'), updated=Max('updated_at'), type_updated=Max('onomatopoeia_type__updated_at'),
+    )
+    geographic = GeographicRecord.objects.filter(village=village).aggregate(count=Count('id'), updated=Max('updated_at'))
+    speakers = Speaker.objects.filter(village=village).aggregate(count=Count('id'), updated=Max('updated_at'))
+    source = json.dumps(
+        [PACKAGE_FORMAT, village.id, village.updated_at, records, geographic, speakers],
+        default=str, sort_keys=True,
+    )
+    return hashlib.sha1(source.encode()).hexdigest()[:16]
+
+
+class _Sink:
+    """
+    zipfile の書き込み先。書かれたバイト列をためておき、drain() で取り出す。
+    seek() を持たないため、zipfile はデータ記述子付きのストリーミング形式で書く。
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_DONE = object()
+
+
+def _prefetch(entries, workers=FETCH_WORKERS):
+    """
+    (ZIP内の名前, URL) の順に、ファイルのチャンクを返すキューを渡す。
+    後続の最大 workers 件は別スレッドで先に読み込み始め、ファイルごとのキューは PREFETCH_CHUNKS 件で止まる。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from .services import open_media_stream
+
+    stop = threading.Event()
+
+    def put(chunks, item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fetch(url, chunks):
+        stream = None
+        try:
+            stream = open_media_stream(url, CHUNK_SIZE)
+            for chunk in stream:
+                if not put(chunks, chunk):
+                    return
+            put(chunks, _DONE)
+        except Exception as e:
+            put(chunks, e)
+        finally:
+            if stream is not None:
+                stream.close()
+
+    entries = iter(entries)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='package-fetch') as pool:
+        pending = deque()
+
+        def submit():
+            for name, url in entries:
+                chunks = queue.Queue(PREFETCH_CHUNKS)
+                pool.submit(fetch, url, chunks)
+                pending.append((name, chunks))
+                return
+
+        for _ in range(workers):
+            submit()
+        try:
+            while pending:
+                name, chunks = pending.popleft()
+                yield name, chunks
+                submit()
+        finally:
+            # 途中で中断した場合に、読み込み中のスレッドを止める
+            stop.set()
+
+
+def _media_name(prefix, obj):
+    filename = os.path.basename(unquote(urlparse(obj.file_path).path)) or 'file'
+    return f"media/{prefix}/{obj.id}_{filename}"
+
+
+def _zip_info(name, updated_at, compress_type):
+    info = zipfile.ZipInfo(name, date_time=timezone.localtime(updated_at).timetuple()[:6])
+    info.compress_type = compress_type
+    return info
+
+
+def _record_row(record, files):
+    speaker = record.speaker
+    return {
+        'id': record.id,
+        'onomatopoeia_text': record.onomatopoeia_text or '',
+        'meaning': record.meaning or '',
+        'usage_example': record.usage_example or '',
+        'phonetic_notation': record.phonetic_notation or '',
+        'onomatopoeia_type': str(record.onomatopoeia_type) if record.onomatopoeia_type else '',
+        'speaker': speaker.speaker_id if speaker else '',
+        'age_range': speaker.get_age_range_display() if speaker else '',
+        'gender': speaker.get_gender_display() if speaker else '',
+        'language_frequency': record.get_language_frequency_display() if record.language_frequency else '',
+        'recorded_date': record.recorded_date.isoformat(),
+        'file_type': record.get_file_type_display(),
+        'file': files.get(('records', record.id), ''),
+        'youtube_url': record.youtube_url or '',
+        'title': record.title or '',
+        'description': record.description or '',
+        'notes': record.notes,
+    }
+
+
+def _geographic_row(geographic, files):
+    return {
+        'id': geographic.id,
+        'title': geographic.title,
+        'content_type': geographic.get_content_type_display(),
+        'description': geographic.description,
+        'latitude': geographic.latitude,
+        'longitude': geographic.longitude,
+        'captured_date': geographic.captured_date.isoformat(),
+        'file': files.get(('geographic', geographic.id), ''),
+        'youtube_url': geographic.youtube_url or '',
+    }
+
+
+def iter_package(village, stats=None):
+    """
+    集落のパッケージ（ZIP）のバイト列をチャンクで返す。
+    メディア（media/ 以下）は無圧縮、最後に records.csv（Excel 用に BOM 付き）と metadata.json を入れる。
+    読み込めなかったメディアは metadata.json の missing_files に記録して続ける。
+
+    Args:
+        stats: 渡すと 'files'（メディアの数）と 'missing'（読み込めなかったURL）を書き込む
+    """
+    stats = stats if stats is not None else {}
+    stats.update(files=0, missing=[])
+    records = list(
+        LanguageRecord.objects.filter(village=village)
+        .select_related('speaker', 'onomatopoeia_type').order_by('recorded_date', 'id')
+    )
+    geographic_records = list(GeographicRecord.objects.filter(village=village).order_by('captured_date', 'id'))
+
+    media = {}
+    for prefix, objects in (('records', records), ('geographic', geographic_records)):
+        for obj in objects:
+            if obj.file_path:
+                media[_media_name(prefix, obj)] = ((prefix, obj.id), obj)
+
+    sink = _Sink()
+    files = {}
+    with zipfile.ZipFile(sink, 'w') as archive:
+        for name, chunks in _prefetch([(name, obj.file_path) for name, (_, obj) in media.items()]):
+            key, obj = media[name]
+            first = chunks.get()
+            if isinstance(first, Exception):
+                logger.warning("パッケージにメディアを追加できません (%s): %s", obj.file_path, first)
+                stats['missing'].append(obj.file_path)
+                continue
+            # 書き始めたファイルの途中で失敗した場合は、壊れた ZIP を残さないよう作成を中止する
+            with archive.open(_zip_info(name, obj.updated_at, zipfile.ZIP_STORED), 'w', force_zip64=True) as entry:
+                chunk = first
+                while chunk is not _DONE:
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    entry.write(chunk)
+                    yield sink.drain()
+                    chunk = chunks.get()
+            files[key] = name
+            stats['files'] += 1
+
+        now = timezone.now()
+        with archive.open(_zip_info('records.csv', now, zipfile.ZIP_DEFLATED), 'w') as entry:
+            with io.TextIOWrapper(entry, encoding='utf-8-sig', newline='') as text:
+                writer = csv.writer(text)
+                writer.writerow([label for _, label in RECORD_CSV_COLUMNS])
+                for record in records:
+                    row = _record_row(record, files)
+                    writer.writerow([row[key] for key, _ in RECORD_CSV_COLUMNS])
+        yield sink.drain()
+
+        metadata = {
+            'village': {
+                'id': village.id, 'name': village.name, 'latitude': village.latitude,
+                'longitude': village.longitude, 'description': village.description,
+            },
+            'generated_at': now.isoformat(),
+            'language_records': [_record_row(record, files) for record in records],
+            'geographic_records': [_geographic_row(geographic, files) for geographic in geographic_records],
+            'missing_files': stats['missing'],
+        }
+        with archive.open(_zip_info('metadata.json', now, zipfile.ZIP_DEFLATED), 'w') as entry:
+            entry.write(json.dumps(metadata, ensure_ascii=False, indent=1).encode())
+    yield sink.drain()
+
+
+def current_package(village):
+    """
+    集落の現在のバージョンのパッケージを返す（なければ作成を予約する）。
+    VILLAGE_PACKAGE_BUILD_IN_BACKGROUND の場合、作成を始める権利を取れたときだけ別スレッドで作り始める
+    （同じパッケージを複数のリクエスト・ワーカーが同時に作らない）。
+    """
+    package, _ = VillagePackage.objects.get_or_create(village=village, version=package_version(village))
+    if settings.VILLAGE_PACKAGE_BUILD_IN_BACKGROUND and package.status != 'ready' and _claim(package.id):
+        threading.Thread(target=_build_in_background, args=(package.id,), name='village-package', daemon=True).start()
+    return package
+
+
+def latest_ready_package(village):
+    """集落の完成済みパッケージのうち最新のもの（なければ None）"""
+    return village.packages.filter(status='ready').order_by('-built_at').first()
+
+
+def _build_in_background(package_id):
+    from django.db import connections
+    try:
+        build_package(package_id, claimed=True)
+    except Exception:
+        logger.exception("集落パッケージの作成に失敗しました (#%s)", package_id)
+    finally:
+        # このスレッドで開いた接続を閉じる
+        connections.close_all()
+
+
+def _claim(package_id, retry_failed=False):
+    """
+    パッケージを作成する権利を取る（1つの UPDATE で「作成中」にするため、取れるのは1つのプロセスだけ）。
+    待機中・再試行できる失敗・BUILD_TIMEOUT を過ぎた作成中のパッケージだけを取れる。
+    """
+    now = timezone.now()
+    return bool(VillagePackage.objects.filter(
+        Q(status='pending')
+        | Q(status='failed', started_at__lt=now - (datetime.timedelta(0) if retry_failed else FAILED_RETRY_AFTER))
+        | Q(status='building', started_at__lt=now - BUILD_TIMEOUT),
+        id=package_id,
+    ).update(status='building', started_at=now, error=''))
+
+
+@traced('package.build')
+def build_package(package_id, retry_failed=False, claimed=False):
+    """
+    パッケージを作成してストレージに送信する。他のワーカーが作成中の場合は何もしない。
+    retry_failed=True では、失敗したパッケージを FAILED_RETRY_AFTER を待たずに作り直す。
+    claimed=True は、呼び出し側が _claim で作成する権利を取り済みであることを示す。
+
+    Returns:
+        作成したパッケージ（作成しなかった場合は None）
+    """
+    from .services import delete_from_supabase, upload_stream_to_supabase
+
+    if not claimed and not _claim(package_id, retry_failed):
+        return None
+
+    package = VillagePackage.objects.select_related('village').get(id=package_id)
+    storage_path = f"village-{package.village_id}/{package.version}.zip"
+    stats = {}
+
+    def counted(chunks):
+        package.size = 0
+        for chunk in chunks:
+            package.size += len(chunk)
+            yield chunk
+
+    try:
+        upload_stream_to_supabase(counted(iter_package(package.village, stats)), PACKAGE_BUCKET, storage_path, 'application/zip')
+    except Exception as e:
+        VillagePackage.objects.filter(id=package.id).update(status='failed', error=str(e)[:1000])
+        raise
+
+    package.status = 'ready'
+    package.storage_path = storage_path
+    package.file_count = stats['files']
+    package.built_at = timezone.now()
+    package.save(update_fields=['status', 'storage_path', 'size', 'file_count', 'built_at'])
+
+    # 古いバージョンのパッケージを削除する（作成中のものは、そのワーカーに任せる）
+    stale = package.village.packages.filter(created_at__lte=package.created_at).exclude(id=package.id).exclude(status='building')
+    stale_paths = [path for path in stale.values_list('storage_path', flat=True) if path]
+    try:
+        delete_from_supabase(PACKAGE_BUCKET, stale_paths)
+    except Exception as e:
+        logger.warning("古い集落パッケージを削除できません: %s", e)
+    else:
+        stale.delete()
+    return package
@@ -0,0 +1,243 @@
+# language_archive/phonetic.py
+# 音声記号（phonetic_notation）のあいまい検索。
+# IPA の文字列を分節（基底の文字＋補助記号）に分け、分節単位の重み付き編集距離で近いものを探す。
+# 索引は BK木（距離の三角不等式を使って比較する記録を絞る木）で、プロセス内に保持し、
+# 言語記録の件数・最終更新日時が変わったら次の検索時に作り直す（作り直している間は古い索引で答える）。
+# 件数・最終更新日時はデータバージョンが変わったときだけ読むため、地理環境データ・集落などの書き込みでは作り直さない。
+
+import logging
+import threading
+import unicodedata
+
+from .data_version import get_data_version
+
+logger = logging.getLogger(__name__)
+
+# 距離は「半分節」単位の整数で扱う（BK木の子を整数キーで持つため）
+# 補助記号だけが違う分節の置換（a と aː、t と tʰ など）は半分節、それ以外の置換・挿入・削除は1分節
+HALF = 1
+FULL = 2
+
+# 記録一覧の音声記号検索で返す最大件数
+SEARCH_LIMIT = 500
+
+# 分節の区切りとして読み飛ばす記号（角括弧・スラッシュ・強勢・音節境界など）
+IGNORED_CHARACTERS = set(' \t[]/|‖.,-ˈˌ')
+TIE_BARS = {'͡', '͜'}
+
+
+def _is_modifier(char):
+    """直前の分節に付く補助記号か（結合文字と、ʰ ʲ ː などの修飾文字）"""
+    return unicodedata.combining(char) != 0 or 0x02B0 <= ord(char) <= 0x02FF
+
+
+def tokenize_ipa(text):
+    """
+    IPA の文字列を分節のタプルに分ける。
+    分節は基底の文字とそれに続く補助記号からなり、連結記号（t͡s など）でつながった文字は1つの分節にする。
+    """
+    segments = []
+    join_next = False
+    for char in unicodedata.normalize('NFD', text or ''):
+        if char in IGNORED_CHARACTERS:
+            join_next = False
+            continue
+        if char in TIE_BARS:
+            join_next = bool(segments)
+            if segments:
+                segments[-1] += char
+            continue
+        if segments and (join_next or _is_modifier(char)):
+            segments[-1] += char
+            join_next = False
+            continue
+        segments.append(char)
+    return tuple(segments)
+
+
+def segment_base(segment):
+    """分節から補助記号を除いた基底の文字（t͡ɕʰ → tɕ）"""
+    return ''.join(c for c in segment if not _is_modifier(c))
+
+
+def _prepare(segments):
+    return segments, tuple(segment_base(s) for s in segments)
+
+
+def segment_distance(a, b):
+    """
+    分節列どうしの重み付き編集距離（半分節単位）。
+    a, b は _prepare した (分節のタプル, 基底のタプル)。
+    """
+    a_segments, a_bases = a
+    b_segments, b_bases = b
+    if len(a_segments) < len(b_segments):
+        a_segments, a_bases, b_segments, b_bases = b_segments, b_bases, a_segments, a_bases
+    previous = list(range(0, (len(b_segments) + 1) * FULL, FULL))
+    for i, (segment, base) in enumerate(zip(a_segments, a_bases), start=1):
+        current = [i * FULL]
+        for j, (other, other_base) in enumerate(zip(b_segments, b_bases), start=1):
+            if segment == other:
+                substitution = previous[j - 1]
+            elif base == other_base:
+                substitution = previous[j - 1] + HALF
+            else:
+                substitution = previous[j - 1] + FULL
+            current.append(min(substitution, previous[j] + FULL, current[j - 1] + FULL))
+        previous = current
+    return previous[-1]
+
+
+class PhoneticIndex:
+    """
+    音声記号の BK木。同じ分節列の記録は1つのノードにまとめる。
+    ノードは [分節列（_prepare 済み）, 記録IDのリスト, {距離: 子ノード}]。
+    size は登録した記録数、nodes は異なる分節列の数。
+    """
+
+    def __init__(self, entries=()):
+        self.root = None
+        self.size = 0
+        self.nodes = 0
+        for record_id, notation in entries:
+            self.add(record_id, notation)
+
+    def add(self, record_id, notation):
+        segments = tokenize_ipa(notation)
+        if not segments:
+            return
+        self.size += 1
+        term = _prepare(segments)
+        if self.root is None:
+            self.root = [term, [record_id], {}]
+            self.nodes = 1
+            return
+        node = self.root
+        while True:
+            distance = segment_distance(term, node[0])
+            if distance == 0:
+                node[1].append(record_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [term, [record_id], {}]
+                self.nodes += 1
+                return
+            node = child
+
+    def search(self, query, max_distance):
+        """
+        距離が max_distance（半分節単位）以内の記録を返す。
+
+        Returns:
+            (記録ID, 距離) のリスト（距離の近い順、同じ距離は記録ID順）
+        """
+        return self.search_with_stats(query, max_distance)[0]
+
+    def search_with_stats(self, query, max_distance, brute_force=False):
+        """
+        search と同じ検索をし、距離を計算したノード数も返す（ベンチマーク用）。
+        brute_force=True では枝刈りをせず全ノードと比較する。
+
+        Returns:
+            (search と同じ結果, 距離を計算したノード数)
+        """
+        segments = tokenize_ipa(query)
+        if not segments or self.root is None:
+            return [], 0
+        term = _prepare(segments)
+        results = []
+        comparisons = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = segment_distance(term, node[0])
+            comparisons += 1
+            if distance <= max_distance:
+                results.extend((record_id, distance) for record_id in node[1])
+            # 三角不等式により、子までの距離が [d - r, d + r] の枝だけを調べればよい
+            for child_distance, child in node[2].items():
+                if brute_force or distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda item: (item[1], item[0]))
+        return results, comparisons
+
+
+# データが変わったとき、作り直している間は古い索引で答える（10万件で20秒ほどかかるため）
+REBUILD_IN_BACKGROUND = True
+
+_lock = threading.Lock()
+_cached = None  # (データバージョン, 言語記録のバージョン, PhoneticIndex)
+_rebuilding = False
+
+
+def build_phonetic_index():
+    """音声記号のある全記録から索引を作る"""
+    from .models import LanguageRecord
+
+    entries = (
+        LanguageRecord.objects.exclude(phonetic_notation__isnull=True).exclude(phonetic_notation='')
+        .order_by('id').values_list('id', 'phonetic_notation').iterator(chunk_size=2000)
+    )
+    return PhoneticIndex(entries)
+
+
+def source_version():
+    """言語記録の件数・最終更新日時（索引の元にする表だけのバージョン。analytics.source_version と同じ考え方）"""
+    from django.db.models import Count, Max
+    from .models import LanguageRecord
+
+    aggregate = LanguageRecord.objects.order_by().aggregate(count=Count('pk'), updated=Max('updated_at'))
+    return aggregate['count'], aggregate['updated']
+
+
+def _rebuild(data_version, version):
+    global _cached, _rebuilding
+    from django.db import connections
+    try:
+        _cached = (data_version, version, build_phonetic_index())
+    except Exception:
+        logger.exception("音声記号の索引の作り直しに失敗しました")
+    finally:
+        _rebuilding = False
+        # このスレッドで開いた接続を閉じる
+        connections.close_all()
+
+
+def get_phonetic_index():
+    """
+    プロセス内の索引を返す。
+    初回は作成を待つ。データバージョンが変わっていれば言語記録のバージョンを読み、
+    変わっていれば別スレッドで作り直し、それまでは古い索引を返す。
+    """
+    global _cached, _rebuilding
+    data_version = get_data_version()
+    cached = _cached
+    if cached is not None and cached[0] == data_version:
+        return cached[2]
+
+    version = source_version()
+    with _lock:
+        if _cached is not None and _cached[1] == version:
+            # 言語記録以外の書き込み。索引はそのまま使い、次からはこのデータバージョンで照合する
+            _cached = (data_version, version, _cached[2])
+            return _cached[2]
+        if _cached is None or not REBUILD_IN_BACKGROUND:
+            _cached = (data_version, version, build_phonetic_index())
+            return _cached[2]
+        if not _rebuilding:
+            _rebuilding = True
+            threading.Thread(target=_rebuild, args=(data_version, version), name='phonetic-index', daemon=True).start()
+        return _cached[2]
+
+
+def phonetic_search(query, max_segments=1.0, limit=SEARCH_LIMIT):
+    """
+    音声記号が query から max_segments 分節以内の記録を探す（0.5 刻み。0.5 は補助記号の違い1つ）。
+
+    Returns:
+        (記録ID, 距離[分節]) のリスト（近い順、最大 limit 件）
+    """
+    max_distance = int(round(max_segments * FULL))
+    results = get_phonetic_index().search(query, max_distance)[:limit]
+    return [(record_id, distance / FULL) for record_id, distance in results]
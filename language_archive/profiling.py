@@ -0,0 +1,200 @@
+# language_archive/profiling.py
+# 1件のリクエストのサンプリングプロファイル（本番のデータでだけ遅い画面の調査用）。
+# 対象のリクエストのあいだ、別スレッドが PROFILING_INTERVAL_MS ごとにリクエストを処理しているスレッドの呼び出し履歴を読み、
+# 関数の呼び出し経路ごとの回数を数える。トレーサー（sys.setprofile）と違い、対象のコードには何も差し込まない。
+# 結果は collapsed stacks（「関数;関数;関数 回数」の行）とフレームグラフの SVG にして RequestProfile に保存し、管理画面で見る。
+# 対象にするのは、署名付きのヘッダー（X-Profile-Token）・スタッフの ?profile=1・PROFILING_SAMPLE_EVERY 件に1件のリクエスト。
+
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core import signing
+
+from .models import RequestProfile
+from .tracing import current_span
+
+TOKEN_HEADER = 'X-Profile-Token'
+TOKEN_SALT = 'language_archive.profiling'
+QUERY_PARAMETER = 'profile'
+
+FLAME_GRAPH_WIDTH = 1200
+FLAME_GRAPH_ROW_HEIGHT = 16
+# これより細い（ピクセル）関数はフレームグラフに描かない
+FLAME_GRAPH_MIN_WIDTH = 0.5
+
+_root = str(settings.BASE_DIR) + os.sep
+
+
+class Sampler:
+    """thread_id のスレッドの呼び出し履歴を interval 秒ごとに数える"""
+
+    def __init__(self, thread_id, interval, max_seconds):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.counts = Counter()  # (コードオブジェクト, ...)（外側から） → 回数
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                self.counts[tuple(reversed(stack))] += 1
+
+    def collapsed(self):
+        """collapsed stacks（回数の多い順）"""
+        labels = {}
+
+        def label(code):
+            if code not in labels:
+                filename = code.co_filename
+                if filename.startswith(_root):
+                    filename = filename[len(_root):]
+                elif 'site-packages' + os.sep in filename:
+                    filename = filename.split('site-packages' + os.sep, 1)[1]
+                labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+            return labels[code]
+
+        stacks = Counter()
+        for stack, count in self.counts.items():
+            stacks[';'.join(label(code) for code in stack)] += count
+        return '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+
+def parse_collapsed(collapsed):
+    """collapsed stacks を (関数名のリスト, 回数) のリストにする"""
+    stacks = []
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack:
+            stacks.append((stack.split(';'), int(count)))
+    return stacks
+
+
+def _color(name):
+    digest = hashlib.md5(name.encode()).digest()
+    return f"rgb({205 + digest[0] % 50},{80 + digest[1] % 120},{digest[2] % 60})"
+
+
+def flame_graph_svg(collapsed, width=FLAME_GRAPH_WIDTH):
+    """collapsed stacks のフレームグラフ（外側の関数を上にした SVG。幅はサンプル数に比例）"""
+    tree = {'count': 0, 'children': {}}
+    for stack, count in parse_collapsed(collapsed):
+        tree['count'] += count
+        node = tree
+        for name in stack:
+            node = node['children'].setdefault(name, {'count': 0, 'children': {}})
+            node['count'] += count
+    total = tree['count']
+    if not total:
+        return ''
+
+    rects = []
+    depth = 0
+    pending = [(tree['children'], 0.0, 0)]
+    while pending:
+        children, x, level = pending.pop()
+        for name, node in sorted(children.items()):
+            node_width = node['count'] / total * width
+            if node_width >= FLAME_GRAPH_MIN_WIDTH:
+                y = level * FLAME_GRAPH_ROW_HEIGHT
+                title = escape(f"{name}（{node['count']}回、{node['count'] / total:.1%}）")
+                # 文字の幅はおよそ7ピクセルとして、収まる分だけ表示する
+                text = name if node_width >= len(name) * 7 + 6 else name[:max(int((node_width - 6) / 7) - 1, 0)] + '…'
+                rects.append(
+                    f'<g><title>{title}</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{node_width:.1f}" height="{FLAME_GRAPH_ROW_HEIGHT - 1}" fill="{_color(name)}" rx="2"/>'
+                    + (f'<text x="{x + 3:.1f}" y="{y + FLAME_GRAPH_ROW_HEIGHT - 4}">{escape(text)}</text>' if node_width >= 20 else '')
+                    + '</g>'
+                )
+                depth = max(depth, level + 1)
+                pending.append((node['children'], x, level + 1))
+            x += node_width
+    height = depth * FLAME_GRAPH_ROW_HEIGHT
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+        f'font-family="monospace" font-size="11">' + ''.join(rects) + '</svg>'
+    )
+
+
+def make_token():
+    """X-Profile-Token ヘッダーに付ける署名（PROFILING_TOKEN_MAX_AGE 秒のあいだ有効）"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def check_token(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def trigger_for(request, user):
+    """リクエストをプロファイルする理由（RequestProfile.TRIGGER_CHOICES）。対象でなければ None"""
+    token = request.headers.get(TOKEN_HEADER)
+    if token and check_token(token):
+        return 'token'
+    if request.GET.get(QUERY_PARAMETER) == '1' and user is not None and user.is_staff:
+        return 'staff'
+    every = settings.PROFILING_SAMPLE_EVERY
+    if every > 0 and random.randrange(every) == 0:
+        return 'sampled'
+    return None
+
+
+def start_sampler(thread_id=None):
+    """thread_id のスレッド（既定はこのスレッド）のサンプリングを始める"""
+    if thread_id is None:
+        thread_id = threading.get_ident()
+    sampler = Sampler(thread_id, settings.PROFILING_INTERVAL_MS / 1000, settings.PROFILING_MAX_SECONDS)
+    sampler.start()
+    return sampler
+
+
+def save_profile(request, response, sampler, trigger, duration_ms):
+    """
+    サンプリングの結果を保存し、古いものは PROFILING_KEEP 件を残して消す。
+    リクエストIDはトレースが記録されていればそのトレースID（show_traces --trace と突き合わせられる）。
+    """
+    request_span = current_span()
+    request_id = request_span.trace_id if request_span.sampled else os.urandom(16).hex()
+    collapsed = sampler.collapsed()
+    match = request.resolver_match
+    profile = RequestProfile.objects.create(
+        request_id=request_id,
+        method=request.method,
+        path=request.get_full_path()[:RequestProfile._meta.get_field('path').max_length],
+        view_name=match.view_name if match else '',
+        status=response.status_code,
+        trigger=trigger,
+        duration_ms=duration_ms,
+        sample_count=sum(sampler.counts.values()),
+        interval_ms=settings.PROFILING_INTERVAL_MS,
+        collapsed=collapsed,
+        flame_graph=flame_graph_svg(collapsed),
+    )
+    expired = list(RequestProfile.objects.order_by('-created_at', '-id').values_list('id', flat=True)[settings.PROFILING_KEEP:])
+    if expired:
+        RequestProfile.objects.filter(id__in=expired).delete()
+    return profile
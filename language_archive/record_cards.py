@@ -0,0 +1,162 @@
+# language_archive/record_cards.py
+# 一覧のカード（RecordCard）の作成・更新。
+# 記録一覧・集落ごとの一覧・話者ごとの一覧は、話者・型・集落を JOIN せずカードの表だけを読む。
+# 言語記録・話者・集落・オノマトペ型の保存と削除は signals.py からここを呼んでカードに反映する。
+# bulk_create や QuerySet.update() など save() を通らない書き込みでは、書き込んだ側で refresh_cards を呼ぶこと。
+# ずれた場合や初回は rebuild_record_cards コマンドで作り直す。
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils.text import Truncator
+
+from .models import LanguageRecord, RecordCard
+
+REBUILD_CHUNK_SIZE = 1000
+# 一覧に表示する意味・説明の語数（テンプレートの truncatewords:10 と同じ）
+SUMMARY_WORDS = 10
+
+# カードの列（主キー以外）。カードを作り直すときに上書きする
+CARD_FIELDS = [
+    field.name for field in RecordCard._meta.concrete_fields if not field.primary_key
+]
+
+
+def speaker_label(speaker):
+    """カードに表示する話者（年代 / 性別）"""
+    return f"{speaker.age_range} / {speaker.get_gender_display()}"
+
+
+def build_card(record):
+    """
+    言語記録のカードを作る（保存はしない）。
+    speaker・onomatopoeia_type・village は select_related で読み込んでおくこと。
+    """
+    summary = record.description if record.youtube_url else record.meaning
+    onomatopoeia_type = record.onomatopoeia_type
+    thumbnail_url = video_url = ''
+    if record.file_type == 'image':
+        thumbnail_url = record.file_path or ''
+    elif record.file_type == 'video':
+        thumbnail_url = record.thumbnail_path
+        if not thumbnail_url:
+            video_url = record.file_path or ''
+    return RecordCard(
+        record=record,
+        display_title=record.display_title,
+        file_type=record.file_type,
+        summary=Truncator(summary).words(SUMMARY_WORDS, truncate=" …") if summary else '',
+        thumbnail_url=thumbnail_url,
+        video_url=video_url,
+        youtube_url=record.youtube_url or '',
+        youtube_embed_url=(record.get_youtube_embed_url() or '') if record.youtube_url else '',
+        type_label=onomatopoeia_type.type_code if onomatopoeia_type else '',
+        type_description=onomatopoeia_type.description if onomatopoeia_type else '',
+        village_name=record.village.name if record.village else '',
+        speaker_label=speaker_label(record.speaker) if record.speaker else '',
+        village_id=record.village_id,
+        speaker_id=record.speaker_id,
+        onomatopoeia_type_id=record.onomatopoeia_type_id,
+        onomatopoeia_text=record.onomatopoeia_text,
+        recorded_date=record.recorded_date,
+    )
+
+
+def _save_cards(records, using=None):
+    cards = [build_card(record) for record in records]
+    RecordCard.objects.using(using).bulk_create(
+        cards, update_conflicts=True, unique_fields=['record'], update_fields=CARD_FIELDS,
+    )
+    return len(cards)
+
+
+def refresh_cards(record_ids, using=None):
+    """
+    言語記録のカードを作り直す（なければ作る）。
+    using は書き込み先のDB（シグナルの using。省略時はルーターの書き込み先）。
+
+    Returns:
+        作り直したカードの件数
+    """
+    record_ids = list(record_ids)
+    total = 0
+    for start in range(0, len(record_ids), REBUILD_CHUNK_SIZE):
+        records = LanguageRecord.objects.using(using).filter(
+            pk__in=record_ids[start:start + REBUILD_CHUNK_SIZE],
+        ).select_related('speaker', 'onomatopoeia_type', 'village').order_by()
+        total += _save_cards(records, using)
+    return total
+
+
+def _card_records(missing_only=False):
+    records = LanguageRecord.objects.select_related('speaker', 'onomatopoeia_type', 'village').order_by()
+    return records.filter(card__isnull=True) if missing_only else records
+
+
+def refresh_card_range(start, end, missing_only=False):
+    """
+    主キーが start より大きく end 以下の言語記録のカードを作り直す（呼び出し側のトランザクションで実行する）。
+
+    Returns:
+        作成・更新した件数
+    """
+    return _save_cards(_card_records(missing_only).filter(id__gt=start, id__lte=end))
+
+
+def rebuild_cards(chunk_size=REBUILD_CHUNK_SIZE, missing_only=False, progress=None):
+    """
+    主キーの範囲ごとにカードを作り直す。
+    範囲ごとに別のトランザクションで書き込むため、大きなテーブルでも長いロックを取らず、途中で止めても再実行できる。
+
+    Args:
+        chunk_size: 1回に読み込む主キーの範囲
+        missing_only: True ならカードのない記録だけを作る（デプロイ時の補完用）
+        progress: 範囲ごとに (処理済みの最大ID, 最大ID, 作成・更新件数) で呼ばれる関数（オプション）
+
+    Returns:
+        作成・更新した件数
+    """
+    max_id = LanguageRecord.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+    total = 0
+    for start in range(0, max_id, chunk_size):
+        end = start + chunk_size
+        with transaction.atomic():
+            saved = refresh_card_range(start, end, missing_only)
+        total += saved
+        if progress:
+            progress(min(end, max_id), max_id, saved)
+    return total
+
+
+def update_speaker_cards(speaker, using=None):
+    """話者の変更（年代・性別・集落）をその話者のカードに反映する"""
+    village = speaker.village
+    RecordCard.objects.using(using).filter(speaker_id=speaker.pk).update(
+        speaker_label=speaker_label(speaker),
+        village_id=speaker.village_id,
+        village_name=village.name if village else '',
+    )
+
+
+def update_village_cards(village, using=None):
+    """集落名の変更を反映する"""
+    RecordCard.objects.using(using).filter(village_id=village.pk).exclude(village_name=village.name).update(village_name=village.name)
+
+
+def update_type_cards(onomatopoeia_type, using=None):
+    """オノマトペ型の変更を反映する"""
+    RecordCard.objects.using(using).filter(onomatopoeia_type_id=onomatopoeia_type.pk).update(
+        type_label=onomatopoeia_type.type_code, type_description=onomatopoeia_type.description,
+    )
+
+
+def clear_village(village_id, using=None):
+    """集落の削除を反映する（言語記録の関連集落は SET_NULL で空になる）"""
+    RecordCard.objects.using(using).filter(village_id=village_id).update(village_id=None, village_name='')
+
+
+def clear_type(type_id, using=None):
+    """オノマトペ型の削除を反映する（言語記録の型は SET_NULL で空になる）"""
+    RecordCard.objects.using(using).filter(onomatopoeia_type_id=type_id).update(
+        onomatopoeia_type_id=None, type_label='', type_description='',
+    )
@@ -0,0 +1,66 @@
+# language_archive/record_village.py
+# 言語記録の関連集落（LanguageRecord.village）の整合性チェックと一括補正。
+# 関連集落は話者の集落の非正規化コピーで、通常は LanguageRecord.save() / Speaker.save() が合わせる。
+# QuerySet.update() や生SQLなど save() を通らない書き込みでずれた場合に、ここで検出・補正する。
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import LanguageRecord, Speaker
+from .record_cards import refresh_cards
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def inconsistent_records():
+    """関連集落が話者の集落と一致しない言語記録（話者のいない記録は対象外）"""
+    return LanguageRecord.objects.filter(speaker__isnull=False).filter(
+        ~Q(village_id=F('speaker__village_id'))
+        | Q(village__isnull=True, speaker__village__isnull=False)
+        | Q(village__isnull=False, speaker__village__isnull=True)
+    )
+
+
+def fix_record_village_range(start, end):
+    """
+    主キーが start より大きく end 以下の言語記録の関連集落を話者の集落に合わせる（呼び出し側のトランザクションで実行する）。
+
+    Returns:
+        更新した件数
+    """
+    speaker_village = Subquery(Speaker.objects.filter(pk=OuterRef('speaker_id')).values('village_id')[:1])
+    # update() は post_save を送らないため、補正した記録の一覧のカードもここで作り直す
+    record_ids = list(inconsistent_records().filter(id__gt=start, id__lte=end).values_list('id', flat=True))
+    if not record_ids:
+        return 0
+    updated = LanguageRecord.objects.filter(id__in=record_ids).update(
+        village_id=speaker_village, updated_at=timezone.now(),
+    )
+    refresh_cards(record_ids)
+    return updated
+
+
+def backfill_record_village(chunk_size=BACKFILL_CHUNK_SIZE, progress=None):
+    """
+    主キーの範囲ごとに関連集落を話者の集落に合わせる。
+    範囲ごとに別のトランザクションで更新するため、大きなテーブルでも長いロックを取らず、途中で止めても再実行できる。
+
+    Args:
+        chunk_size: 1回の UPDATE で対象にする主キーの範囲
+        progress: 範囲ごとに (処理済みの最大ID, 最大ID, 更新件数) で呼ばれる関数（オプション）
+
+    Returns:
+        更新した件数
+    """
+    max_id = LanguageRecord.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+    total = 0
+    for start in range(0, max_id, chunk_size):
+        end = start + chunk_size
+        with transaction.atomic():
+            updated = fix_record_village_range(start, end)
+        total += updated
+        if progress:
+            progress(min(end, max_id), max_id, updated)
+    return total
@@ -0,0 +1,102 @@
+# language_archive/reference_data.py
+# 集落・話者・オノマトペ型（小さな参照用のテーブル）のプロセス内キャッシュ。
+# アップロード画面の集落の JSON やフォームの選択肢は、表示のたびに全件を読む代わりにここから作る。
+# 参照用のテーブルの書き込みでだけ更新するバージョン（全ワーカーで共有、signals.py で更新）が変わったら次の読み込みで取り直す。
+# 記録のアップロードで更新されるアーカイブ全体のデータバージョンとは別にし、アップロードのたびに読み直さないようにする。
+# 自分のプロセスで参照用のテーブルに書き込んだときは、コミットを待たずにすぐ捨てる（signals.py）。
+
+import threading
+
+from django.db import router
+from django.forms.models import ModelChoiceField, ModelChoiceIterator
+
+from .data_version import bump_data_version, get_data_version
+from .models import OnomatopoeiaType, Speaker, Village
+
+REFERENCE_MODELS = (Village, Speaker, OnomatopoeiaType)
+REFERENCE_VERSION_CACHE_KEY = 'language_archive:reference_data_version'
+
+_lock = threading.Lock()
+_cached = {}  # DBの別名 → (参照用のテーブルのバージョン, ReferenceData)
+
+
+class ReferenceData:
+    """参照用のテーブルの全行（ID順）と、そこから作る値"""
+
+    def __init__(self, using):
+        self.objects = {
+            model: list(model.objects.using(using).order_by('pk'))
+            for model in REFERENCE_MODELS
+        }
+        self.by_pk = {model: {obj.pk: obj for obj in objects} for model, objects in self.objects.items()}
+        # アップロード画面の地図・集落選択用
+        self.villages_data = [
+            {'id': v.id, 'name': v.name, 'latitude': v.latitude, 'longitude': v.longitude}
+            for v in self.objects[Village]
+        ]
+
+    @property
+    def villages(self):
+        return self.objects[Village]
+
+    @property
+    def speakers(self):
+        return self.objects[Speaker]
+
+    @property
+    def onomatopoeia_types(self):
+        return self.objects[OnomatopoeiaType]
+
+
+def get_reference_data():
+    """
+    参照用のテーブルのキャッシュを返す。参照用のテーブルのバージョンが変わっていれば読み直す（3つの表を1回ずつ読む）。
+    レプリカから読む要求とプライマリから読む要求で内容が混ざらないよう、読み込み先のDBごとに持つ。
+    """
+    using = router.db_for_read(Village)
+    version = get_data_version(REFERENCE_VERSION_CACHE_KEY)
+    cached = _cached.get(using)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _lock:
+        cached = _cached.get(using)
+        if cached is None or cached[0] != version:
+            cached = _cached[using] = (version, ReferenceData(using))
+    return cached[1]
+
+
+def invalidate():
+    """キャッシュを捨てる（次の読み込みで読み直す）"""
+    _cached.clear()
+
+
+def bump_reference_version():
+    """参照用のテーブルが変わったことを全ワーカーに伝える"""
+    return bump_data_version(REFERENCE_VERSION_CACHE_KEY)
+
+
+class ReferenceChoiceIterator(ModelChoiceIterator):
+    """選択肢を DB ではなく参照用のテーブルのキャッシュから作る"""
+
+    def _objects(self):
+        return get_reference_data().objects[self.queryset.model]
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self._objects():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self._objects()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self._objects())
+
+
+class ReferenceChoiceField(ModelChoiceField):
+    """
+    参照用のテーブル（集落・話者・オノマトペ型）の選択肢。表示は get_reference_data のキャッシュから作る。
+    送信された値の確認は、キャッシュの後に削除された行を選べないよう、これまでどおり DB で1行だけ読む。
+    """
+    iterator = ReferenceChoiceIterator
@@ -1,33 +1,38 @@
 # language_archive/services.py
 
+import contextvars
 import os
-import requests
 from pathlib import Path
+from asgiref.sync import sync_to_async
 from django.urls import reverse
 import mimetypes 
 from datetime import datetime
 import secrets
 import string
+import time
 
-def upload_to_supabase(file, bucket_name, file_prefix=""):
-    """
-    Supabaseストレージへのファイルアップロード（requests使用）
-    
-    Args:
-        file: アップロードするファイルオブジェクト
-        bucket_name: バケット名
-        file_prefix: ファイル名のプレフィックス
-    
-    Returns:
-        公開URL
-    """
+from .tracing import current_span, span, traced
+
+# 非同期ストレージクライアントのタイムアウト（秒）。大きな映像の送信を考慮して書き込みは長めにする
+STORAGE_TIMEOUT = 300
+# 一括アップロードで同時に送信するファイル数の上限
+STORAGE_UPLOAD_WORKERS = 4
+# ストレージの確認（HEAD）のタイムアウト（接続, 読み込み）秒
+STORAGE_PROBE_TIMEOUT = (5, 30)
+
+
+def _get_supabase_credentials():
+    """Supabaseの (URL, キー) を環境変数から取得する"""
     supabase_url = os.environ.get("SUPABASE_URL")
     supabase_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("SUPABASE_ANON_KEY")
     
     if not supabase_url or not supabase_key:
         raise Exception("Supabase環境変数が設定されていません")
+    return supabase_url, supabase_key
 
-    # ユニークなファイル名を生成 (タイムスタンプ + ランダム文字列)
+
+def _build_storage_file_name(file, file_prefix=""):
+    """ユニークなファイル名を生成 (プレフィックス + タイムスタンプ + ランダム文字列)"""
     extension = Path(file.name).suffix
     # タイムスタンプ文字列 (例: 20251030134530)
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
@@ -37,28 +42,53 @@ def upload_to_supabase(file, bucket_name, file_prefix=""):
     # ベースとなるファイル名を結合 
     base_file_name = f"{timestamp}_{random_str}{extension}"
     # プレフィックスと結合
-    storage_file_name = f"{file_prefix}{base_file_name}"
-    # ファイルをアップロード
-    file_bytes = file.read()
+    return f"{file_prefix}{base_file_name}"
+
 
-    # file.content_typeがNoneの場合に備えて、mimetypesで推測
+def _ensure_content_type(file):
+    """file.content_typeがNoneの場合に備えて、mimetypesで推測して設定する"""
     content_type, _ = mimetypes.guess_type(file.name)
     if not file.content_type and content_type:
         file.content_type = content_type
 
     if not file.content_type:
         file.content_type = 'application/octet-stream'  # デフォルトのMIMEタイプ
+    return file.content_type
+
+
+def upload_to_supabase(file, bucket_name, file_prefix=""):
+    """
+    Supabaseストレージへのファイルアップロード（requests使用）
+    
+    Args:
+        file: アップロードするファイルオブジェクト
+        bucket_name: バケット名
+        file_prefix: ファイル名のプレフィックス
+    
+    Returns:
+        公開URL
+    """
+    # requests はワーカー起動時の読み込みコストが大きいため、使うときに読み込む
+    import requests
+
+    supabase_url, supabase_key = _get_supabase_credentials()
+    storage_file_name = _build_storage_file_name(file, file_prefix)
+    content_type = _ensure_content_type(file)
     
     # Supabase Storage APIエンドポイント
     upload_url = f"{supabase_url}/storage/v1/object/{bucket_name}/{storage_file_name}"
     
     headers = {
         "Authorization": f"Bearer {supabase_key}",
-        "Content-Type": file.content_type,
+        "Content-Type": content_type,
     }
     
     try:
-        response = requests.post(upload_url, data=file_bytes, headers=headers)
+        # ファイルオブジェクトをそのまま渡し、メモリに読み込まずにブロック単位で送信する
+        file.seek(0)
+        with span('storage.upload', bucket=bucket_name, bytes=getattr(file, 'size', None)) as upload_span:
+            response = requests.post(upload_url, data=file, headers=headers)
+            upload_span.set(status=response.status_code)
         response.raise_for_status()
         
         # 公開URLを生成
@@ -70,6 +100,221 @@ def upload_to_supabase(file, bucket_name, file_prefix=""):
         raise
 
 
+async def aupload_to_supabase(file, bucket_name, file_prefix=""):
+    """
+    Supabaseストレージへのファイルアップロード（httpx の非同期クライアント使用）
+    
+    ASGIプロファイルのアップロードビューから使う。ファイルはチャンク単位で送信するため、
+    アップロード中もイベントループ（他のリクエスト）をブロックしない。
+    
+    Args:
+        file: アップロードするファイルオブジェクト（UploadedFile）
+        bucket_name: バケット名
+        file_prefix: ファイル名のプレフィックス
+    
+    Returns:
+        公開URL
+    """
+    import httpx
+
+    supabase_url, supabase_key = _get_supabase_credentials()
+    storage_file_name = _build_storage_file_name(file, file_prefix)
+    content_type = _ensure_content_type(file)
+
+    upload_url = f"{supabase_url}/storage/v1/object/{bucket_name}/{storage_file_name}"
+    
+    headers = {
+        "Authorization": f"Bearer {supabase_key}",
+        "Content-Type": content_type,
+    }
+    if file.size is not None:
+        headers["Content-Length"] = str(file.size)
+
+    async def file_chunks():
+        # ディスクからの読み込みは同期処理のため、チャンクごとに別スレッドで読む
+        chunks = iter(file.chunks())
+        read = sync_to_async(next, thread_sensitive=False)
+        while (chunk := await read(chunks, None)) is not None:
+            yield chunk
+
+    response = None
+    try:
+        with span('storage.upload', bucket=bucket_name, bytes=file.size) as upload_span:
+            async with httpx.AsyncClient(timeout=STORAGE_TIMEOUT) as client:
+                response = await client.post(upload_url, content=file_chunks(), headers=headers)
+            upload_span.set(status=response.status_code)
+        response.raise_for_status()
+        
+        # 公開URLを生成
+        public_url = f"{supabase_url}/storage/v1/object/public/{bucket_name}/{storage_file_name}"
+        return public_url
+    except Exception as e:
+        print(f"アップロードエラー: {e}")
+        print(f"レスポンス: {response.text if response is not None else 'No response'}")
+        raise
+
+
+def upload_files_concurrently(uploads, max_workers=STORAGE_UPLOAD_WORKERS):
+    """
+    複数ファイルをスレッドプールで並行してSupabaseにアップロードする。
+    1件の失敗で他のアップロードは中断しない。
+    
+    Args:
+        uploads: (キー, ファイルオブジェクト, バケット名, ファイル名のプレフィックス) のリスト
+        max_workers: 同時に送信するファイル数の上限
+    
+    Returns:
+        {キー: 公開URL、または失敗時の例外}
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = {}
+    if not uploads:
+        return results
+    with span('storage.upload_batch', files=len(uploads)), \
+            ThreadPoolExecutor(max_workers=min(max_workers, len(uploads))) as executor:
+        # 各スレッドの送信をこのリクエストのトレースに記録するため、コンテキストを引き継ぐ
+        futures = {
+            key: executor.submit(contextvars.copy_context().run, upload_to_supabase, file, bucket_name, file_prefix)
+            for key, file, bucket_name, file_prefix in uploads
+        }
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+    return results
+
+
+def open_media_stream(url, chunk_size):
+    """
+    公開URLのファイルをストリーミングで開く（本体をメモリに読み込まない）。
+
+    Returns:
+        チャンクのイテレータ（読み終わるか close() で接続を閉じる）
+    """
+    import requests
+
+    response = requests.get(url, stream=True, timeout=(10, STORAGE_TIMEOUT))
+    response.raise_for_status()
+
+    def chunks():
+        try:
+            yield from response.iter_content(chunk_size)
+        finally:
+            response.close()
+    return chunks()
+
+
+def upload_stream_to_supabase(chunks, bucket_name, storage_path, content_type):
+    """
+    チャンクのイテレータをSupabaseストレージに送信する（チャンク転送。全体をメモリやディスクに置かない）。
+    同じパスのファイルがあれば上書きする。
+
+    Returns:
+        ストレージ上のパス
+    """
+    import requests
+
+    supabase_url, supabase_key = _get_supabase_credentials()
+    headers = {
+        "Authorization": f"Bearer {supabase_key}",
+        "Content-Type": content_type,
+        "x-upsert": "true",
+    }
+    response = requests.post(
+        f"{supabase_url}/storage/v1/object/{bucket_name}/{storage_path}",
+        data=chunks, headers=headers, timeout=(10, STORAGE_TIMEOUT),
+    )
+    response.raise_for_status()
+    return storage_path
+
+
+def open_storage_object(bucket_name, storage_path, range_header=None):
+    """
+    ストレージのファイルを（非公開バケットでも）ストリーミングで開く。
+    range_header を渡すとストレージに Range 要求をそのまま送る（206 と Content-Range はストレージが返す）。
+
+    Returns:
+        requests のレスポンス（stream=True。呼び出し側で close() すること）
+    """
+    import requests
+
+    supabase_url, supabase_key = _get_supabase_credentials()
+    headers = {"Authorization": f"Bearer {supabase_key}"}
+    if range_header:
+        headers["Range"] = range_header
+    return requests.get(
+        f"{supabase_url}/storage/v1/object/authenticated/{bucket_name}/{storage_path}",
+        headers=headers, stream=True, timeout=(10, STORAGE_TIMEOUT),
+    )
+
+
+def delete_from_supabase(bucket_name, storage_paths):
+    """ストレージのファイルをまとめて削除する"""
+    import requests
+
+    if not storage_paths:
+        return
+    supabase_url, supabase_key = _get_supabase_credentials()
+    response = requests.delete(
+        f"{supabase_url}/storage/v1/object/{bucket_name}",
+        json={"prefixes": list(storage_paths)},
+        headers={"Authorization": f"Bearer {supabase_key}"}, timeout=30,
+    )
+    response.raise_for_status()
+
+
+def open_probe_session(pool_size):
+    """
+    probe_storage_object 用のセッション。接続を pool_size 本まで使い回す（スレッド間で共有してよい）。
+    再試行は呼び出し側で行うため、requests の再試行は使わない。
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def probe_storage_object(session, url, timeout=STORAGE_PROBE_TIMEOUT):
+    """
+    公開URLのファイルを HEAD で確かめる（本体は読まない）。
+
+    Returns:
+        (HTTPステータス, サイズ[Content-Length。なければ None], Content-Type, 応答時間[ミリ秒], Retry-After[秒。なければ None])
+    """
+    started = time.perf_counter()
+    response = session.head(url, timeout=timeout, allow_redirects=True)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    response.close()
+
+    length = response.headers.get("Content-Length")
+    retry_after = response.headers.get("Retry-After")
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    return (
+        response.status_code,
+        int(length) if length and length.isdigit() else None,
+        content_type,
+        elapsed_ms,
+        int(retry_after) if retry_after and retry_after.isdigit() else None,
+    )
+
+
+# ファイルの種類ごとのバケット（記録のファイルを保存する。集落パッケージのバケットは packages.py で管理する）
+MEDIA_BUCKETS = {
+    'audio': 'audio-files',
+    'video': 'video-files',
+    'image': 'image-files',
+    'drone_video': 'drone-video-files',
+    'drone_photo': 'drone-photo-files',
+    'other': 'other-geo-files',
+}
+
+
 def get_bucket_name(file_type):
     """
     ファイルタイプに応じたバケット名を返す
@@ -80,17 +325,72 @@ def get_bucket_name(file_type):
     Returns:
         バケット名
     """
-    bucket_map = {
-        'audio': 'audio-files',
-        'video': 'video-files',
-        'image': 'image-files',
-        'drone_video': 'drone-video-files',
-        'drone_photo': 'drone-photo-files',
-        'other': 'other-geo-files',
-        }
-    return bucket_map.get(file_type, 'image-files')
+    return MEDIA_BUCKETS.get(file_type, 'image-files')
+
+
+def storage_object_key(url):
+    """
+    Supabaseの公開URLを (バケット名, パス) にする。このプロジェクトのストレージ以外のURLは None。
+    """
+    from urllib.parse import unquote
+
+    supabase_url, _ = _get_supabase_credentials()
+    prefix = f"{supabase_url.rstrip('/')}/storage/v1/object/public/"
+    if not url or not url.startswith(prefix):
+        return None
+    bucket_name, _, storage_path = url[len(prefix):].split("?")[0].partition("/")
+    if not storage_path:
+        return None
+    return bucket_name, unquote(storage_path)
+
+
+def storage_public_url(bucket_name, storage_path):
+    """storage_object_key の逆（upload_to_supabase が返すURLと同じ形）"""
+    supabase_url, _ = _get_supabase_credentials()
+    return f"{supabase_url}/storage/v1/object/public/{bucket_name}/{storage_path}"
+
+
+def list_storage_objects(bucket_name, page_size=1000):
+    """
+    バケットのファイルを1ページずつ取得する（フォルダは中までたどる）。
+
+    Yields:
+        1ページ分の (パス, 作成日時[ISO 8601 の文字列], サイズ) のリスト
+    """
+    import requests
+
+    supabase_url, supabase_key = _get_supabase_credentials()
+    folders = [""]
+    with requests.Session() as session:
+        session.headers["Authorization"] = f"Bearer {supabase_key}"
+        while folders:
+            folder = folders.pop()
+            offset = 0
+            while True:
+                response = session.post(
+                    f"{supabase_url}/storage/v1/object/list/{bucket_name}",
+                    json={"prefix": folder, "limit": page_size, "offset": offset,
+                          "sortBy": {"column": "name", "order": "asc"}},
+                    timeout=30,
+                )
+                response.raise_for_status()
+                entries = response.json()
+                page = []
+                for entry in entries:
+                    path = f"{folder}/{entry['name']}" if folder else entry["name"]
+                    # フォルダは id のない項目として返される
+                    if entry.get("id") is None:
+                        folders.append(path)
+                    else:
+                        page.append((path, entry.get("created_at"), (entry.get("metadata") or {}).get("size")))
+                if page:
+                    yield page
+                if len(entries) < page_size:
+                    break
+                offset += page_size
 
 
+@traced('map.render')
 def create_archive_map(geographic_records, speakers):
     """
     話者データ、地理環境データを含む地図HTMLを生成
@@ -199,7 +499,9 @@ def create_archive_map(geographic_records, speakers):
             )
             marker.add_to(marker_cluster)
 
-    map_html = m._repr_html_()
+    current_span().set(markers=len(marker_cluster._children))
+    with span('map.html'):
+        map_html = m._repr_html_()
     map_html = map_html.replace('<div class="folium-map"', '<div class="folium-map" id="map"')
     
     return map_html 
\ No newline at end of file
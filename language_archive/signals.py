@@ -0,0 +1,91 @@
+# language_archive/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .data_version import bump_data_version
+from . import record_cards, reference_data
+from .models import Village, Speaker, OnomatopoeiaType, LanguageRecord, GeographicRecord, SyncTombstone
+from .sync import tombstone_name
+
+ARCHIVE_MODELS = (Village, Speaker, OnomatopoeiaType, LanguageRecord, GeographicRecord)
+
+
+def bump_data_version_on_change(sender, **kwargs):
+    """
+    アーカイブのデータが保存・削除されたらデータバージョンを更新する。
+    コミット前に更新すると、他のワーカーが古いデータを新しいバージョンでキャッシュしてしまうため、コミット後に行う。
+    キャッシュに書き込めなくても保存自体は済んでいるため、エラーはログに残すだけにする（robust=True）。
+    """
+    transaction.on_commit(bump_data_version, robust=True)
+
+
+def record_sync_tombstone(sender, instance, **kwargs):
+    """削除された行を差分同期で端末に伝えるため、墓標を残す（削除と同じトランザクションで）"""
+    name = tombstone_name(sender)
+    if name is not None:
+        SyncTombstone.objects.create(model=name, object_id=instance.pk)
+
+
+# 送信元のモデルを限定して接続する。どのモデルにも接続すると、書き起こしの区間などの大量の削除で
+# Django が1行ずつ読み込んでシグナルを送るようになり、まとめて削除できなくなる
+for model in ARCHIVE_MODELS:
+    post_save.connect(bump_data_version_on_change, sender=model)
+    post_delete.connect(bump_data_version_on_change, sender=model)
+    post_delete.connect(record_sync_tombstone, sender=model)
+
+
+def invalidate_reference_data(sender, **kwargs):
+    """
+    参照用のテーブルのプロセス内キャッシュを捨てる。他のワーカーはコミット後の参照用のテーブルのバージョンの更新で読み直すが、
+    書き込んだプロセスでは保存直後の画面に反映されるよう、ここですぐ捨てる（ロールバックされても読み直すだけ）。
+    """
+    reference_data.invalidate()
+    transaction.on_commit(reference_data.bump_reference_version, robust=True)
+
+
+for model in reference_data.REFERENCE_MODELS:
+    post_save.connect(invalidate_reference_data, sender=model)
+    post_delete.connect(invalidate_reference_data, sender=model)
+
+
+@receiver(post_save, sender=LanguageRecord)
+def refresh_record_card(sender, instance, raw=False, using=None, **kwargs):
+    """言語記録の一覧のカードを作り直す（保存と同じトランザクションで）"""
+    if not raw:
+        record_cards.refresh_cards([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Speaker)
+@receiver(post_save, sender=Village)
+@receiver(post_save, sender=OnomatopoeiaType)
+def update_record_cards(sender, instance, created=False, raw=False, using=None, **kwargs):
+    """話者・集落・型の表示名をカードに反映する（新規作成時はまだ参照するカードがない）"""
+    if raw or created:
+        return
+    if sender is Speaker:
+        record_cards.update_speaker_cards(instance, using)
+    elif sender is Village:
+        record_cards.update_village_cards(instance, using)
+    else:
+        record_cards.update_type_cards(instance, using)
+
+
+@receiver(pre_delete, sender=Village)
+@receiver(pre_delete, sender=OnomatopoeiaType)
+def touch_referencing_rows(sender, instance, using=None, **kwargs):
+    """
+    集落・型の削除で参照元の外部キーが NULL になる（SET_NULL は save() を通らず updated_at が変わらない）ため、
+    参照元の更新日時を進めて差分同期に含める。一覧のカードの集落名・型も空にする。
+    """
+    now = timezone.now()
+    if sender is Village:
+        Speaker.objects.filter(village=instance).update(updated_at=now)
+        LanguageRecord.objects.filter(village=instance).update(updated_at=now)
+        GeographicRecord.objects.filter(village=instance).update(updated_at=now)
+        record_cards.clear_village(instance.pk, using)
+    else:
+        LanguageRecord.objects.filter(onomatopoeia_type=instance).update(updated_at=now)
+        record_cards.clear_type(instance.pk, using)
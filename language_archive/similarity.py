@@ -0,0 +1,274 @@
+# language_archive/similarity.py
+# 類似記録（近傍）の事前計算。
+# onomatopoeia_text・meaning・phonetic_notation の文字n-gramで TF-IDF ベクトルを作り、
+# コサイン類似度の上位 k 件を SimilarRecord に保存する（manage.py build_similar_records から実行）。
+# numpy / scipy は起動時間に響くため、使う関数の中で読み込む。
+
+import math
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import LanguageRecord, SimilarRecord, SimilarityIndexState
+
+# ベクトル化する項目と、特徴量の接頭辞（意味の n-gram とオノマトペの n-gram を別の特徴として扱う）
+TEXT_FIELDS = (
+    ('onomatopoeia_text', 'o'),
+    ('meaning', 'm'),
+    ('phonetic_notation', 'p'),
+)
+NGRAM_SIZES = (2, 3)
+
+# 記録ごとに保存する近傍の数と、保存する類似度の下限
+TOP_K = 10
+MIN_SCORE = 0.1
+
+# 類似度を一度に計算する行数（密行列 BATCH_SIZE × 記録数 の float32 を作る）
+BATCH_SIZE = 256
+
+# 前回の計算後に追加された記録が計算済みの記録数のこの割合を超えたら、語彙と IDF を作り直すため全件再計算する
+FULL_REBUILD_RATIO = 0.2
+
+WRITE_BATCH_SIZE = 5000
+
+
+def normalize_text(text):
+    """全角・半角をそろえ（NFKC）、小文字にし、カタカナをひらがなに寄せる"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return ''.join(chr(ord(c) - 0x60) if 'ァ' <= c <= 'ヶ' else c for c in text)
+
+
+def record_ngrams(values):
+    """
+    1件の記録の文字n-gramの出現回数を返す。
+
+    Args:
+        values: 項目名 → 文字列 の辞書（TEXT_FIELDS の項目）
+    """
+    grams = Counter()
+    for field, prefix in TEXT_FIELDS:
+        text = normalize_text(values.get(field))
+        if not text:
+            continue
+        # 前後に空白を足し、語頭・語末を含む n-gram も作る（2文字のオノマトペでも特徴が出る）
+        padded = f' {text} '
+        for n in NGRAM_SIZES:
+            for i in range(len(padded) - n + 1):
+                grams[f'{prefix}:{padded[i:i + n]}'] += 1
+    return grams
+
+
+def _load_documents():
+    """全記録のIDと n-gram を ID順に読み込む"""
+    import numpy as np
+
+    ids = []
+    documents = []
+    fields = [field for field, _ in TEXT_FIELDS]
+    for row in LanguageRecord.objects.order_by('id').values('id', *fields).iterator(chunk_size=2000):
+        ids.append(row['id'])
+        documents.append(record_ngrams(row))
+    return np.array(ids, dtype=np.int64), documents
+
+
+def _fit_vocabulary(documents):
+    """語彙と IDF（平滑化あり）を作る"""
+    document_frequency = Counter()
+    for grams in documents:
+        document_frequency.update(grams.keys())
+    vocabulary = sorted(document_frequency)
+    total = len(documents)
+    idf = [math.log((1 + total) / (1 + document_frequency[gram])) + 1 for gram in vocabulary]
+    return vocabulary, idf
+
+
+def _tfidf_matrix(documents, vocabulary, idf):
+    """
+    TF-IDF の疎行列（CSR, 行ごとにL2正規化）を作る。語彙にない n-gram は無視する。
+    行同士の内積がそのままコサイン類似度になる。
+    """
+    import numpy as np
+    from scipy import sparse
+
+    index = {gram: i for i, gram in enumerate(vocabulary)}
+    idf = np.asarray(idf, dtype=np.float32)
+    indptr = [0]
+    indices = []
+    data = []
+    for grams in documents:
+        for gram, count in grams.items():
+            column = index.get(gram)
+            if column is not None:
+                indices.append(column)
+                data.append(1.0 + math.log(count))
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(documents), len(vocabulary)),
+    )
+    matrix = matrix.multiply(idf).tocsr()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(matrix).astype(np.float32).tocsr()
+
+
+def _similarity_batches(matrix, positions, batch_size):
+    """
+    指定した行と全行のコサイン類似度を batch_size 行ずつ密行列で返す（自分自身は -1）。
+
+    Yields:
+        (対象行の位置の配列, 類似度の密行列 [len(batch) × 全行数])
+    """
+    import numpy as np
+
+    for start in range(0, len(positions), batch_size):
+        batch = positions[start:start + batch_size]
+        # 結果はほぼ密になるため、疎×疎ではなく 疎行列 × 密行列（対象行を密にしたもの）で計算する
+        scores = np.ascontiguousarray((matrix @ matrix[batch].T.toarray()).T)
+        scores[np.arange(len(batch)), batch] = -1.0
+        yield batch, scores
+
+
+def _top_k(scores, k, min_score):
+    """類似度の密行列から、行ごとに上位 k 件の (列の位置, 類似度) を類似度の高い順に返す"""
+    import numpy as np
+
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    top = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-top, axis=1, kind='stable')
+    columns = np.take_along_axis(columns, order, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return [
+        [(int(c), float(s)) for c, s in zip(row_columns, row_scores) if s >= min_score]
+        for row_columns, row_scores in zip(columns, top)
+    ]
+
+
+def _neighbour_rows(record_id, neighbours):
+    return [
+        SimilarRecord(record_id=record_id, similar_id=similar_id, score=score, rank=rank)
+        for rank, (similar_id, score) in enumerate(neighbours, start=1)
+    ]
+
+
+def rebuild_similar_records(top_k=TOP_K, batch_size=BATCH_SIZE, min_score=MIN_SCORE, progress=None):
+    """
+    全記録の語彙・IDF を作り直し、類似記録テーブルを全件計算し直す。
+
+    Args:
+        progress: バッチごとに (処理済みの記録数, 全記録数) で呼ばれる関数（オプション）
+
+    Returns:
+        {'mode': 'full', 'records': 対象の記録数, 'links': 保存した近傍の数}
+    """
+    import numpy as np
+
+    ids, documents = _load_documents()
+    vocabulary, idf = _fit_vocabulary(documents)
+    matrix = _tfidf_matrix(documents, vocabulary, idf)
+
+    # 読み取り側が途中の状態を見ないよう、削除と登録を1つのトランザクションで行う
+    # （近傍はバッチごとに書き込み、全件分をメモリに持たない）
+    links = 0
+    with transaction.atomic():
+        SimilarRecord.objects.all().delete()
+        for batch, scores in _similarity_batches(matrix, np.arange(len(ids)), batch_size):
+            rows = []
+            for position, neighbours in zip(batch, _top_k(scores, top_k, min_score)):
+                rows.extend(_neighbour_rows(ids[position], [(ids[c], s) for c, s in neighbours]))
+            SimilarRecord.objects.bulk_create(rows, batch_size=WRITE_BATCH_SIZE)
+            links += len(rows)
+            if progress:
+                progress(int(batch[-1]) + 1, len(ids))
+        SimilarityIndexState.objects.update_or_create(pk=1, defaults={
+            'vocabulary': vocabulary,
+            'idf': idf,
+            'record_count': len(ids),
+            'last_record_id': int(ids.max()) if len(ids) else 0,
+            'built_at': timezone.now(),
+        })
+    return {'mode': 'full', 'records': len(ids), 'links': links}
+
+
+def update_similar_records(top_k=TOP_K, batch_size=BATCH_SIZE, min_score=MIN_SCORE, progress=None):
+    """
+    前回の計算以降に追加された記録だけを計算する（保存済みの語彙・IDF を使う）。
+    追加された記録の近傍を保存し、既存の記録の近傍のうち追加された記録が上位 k 件に入るものだけを書き換える。
+    計算状態がない場合や、追加が計算済みの記録数の FULL_REBUILD_RATIO を超える場合は全件計算する。
+    既存の記録の本文を編集した場合は反映されないため、定期的に全件計算すること。
+
+    Returns:
+        {'mode': 'incremental', 'records': 追加された記録の数, 'updated': 近傍を書き換えた既存の記録の数, 'links': 保存した近傍の数}
+        全件計算した場合は rebuild_similar_records の戻り値
+    """
+    import numpy as np
+
+    state = SimilarityIndexState.objects.filter(pk=1).first()
+    if state is None:
+        return rebuild_similar_records(top_k, batch_size, min_score, progress)
+
+    ids, documents = _load_documents()
+    new_positions = np.flatnonzero(ids > state.last_record_id)
+    if not len(new_positions):
+        return {'mode': 'incremental', 'records': 0, 'updated': 0, 'links': 0}
+    if len(new_positions) > FULL_REBUILD_RATIO * max(state.record_count, 1):
+        return rebuild_similar_records(top_k, batch_size, min_score, progress)
+
+    matrix = _tfidf_matrix(documents, state.vocabulary, state.idf)
+
+    # 既存の記録ごとの「近傍に入るための下限」（k件未満なら min_score、k件あれば現在のk位の類似度）
+    current = {
+        row['record_id']: row
+        for row in SimilarRecord.objects.values('record_id').annotate(count=Count('id'), lowest=Min('score'))
+    }
+    thresholds = np.full(len(ids), min_score, dtype=np.float32)
+    for position, record_id in enumerate(ids):
+        row = current.get(int(record_id))
+        if row and row['count'] >= top_k:
+            thresholds[position] = max(min_score, row['lowest'])
+    existing = ids <= state.last_record_id
+
+    new_rows = []
+    candidates = {}
+    done = 0
+    for batch, scores in _similarity_batches(matrix, new_positions, batch_size):
+        for position, neighbours in zip(batch, _top_k(scores, top_k, min_score)):
+            new_rows.extend(_neighbour_rows(ids[position], [(ids[c], s) for c, s in neighbours]))
+        # 追加された記録が、既存の記録の近傍に割り込むか
+        hit_rows, hit_columns = np.nonzero((scores > thresholds) & existing)
+        for r, c in zip(hit_rows, hit_columns):
+            candidates.setdefault(int(ids[c]), []).append((int(ids[batch[r]]), float(scores[r, c])))
+        done += len(batch)
+        if progress:
+            progress(done, len(new_positions))
+
+    # 割り込まれた既存の記録の近傍を、現在の近傍と候補から作り直す
+    replaced_rows = []
+    merged = {record_id: list(neighbours) for record_id, neighbours in candidates.items()}
+    for link in SimilarRecord.objects.filter(record_id__in=list(merged)).values('record_id', 'similar_id', 'score'):
+        merged[link['record_id']].append((link['similar_id'], link['score']))
+    for record_id, neighbours in merged.items():
+        neighbours.sort(key=lambda item: -item[1])
+        replaced_rows.extend(_neighbour_rows(record_id, neighbours[:top_k]))
+
+    with transaction.atomic():
+        SimilarRecord.objects.filter(record_id__gt=state.last_record_id).delete()
+        SimilarRecord.objects.filter(record_id__in=list(merged)).delete()
+        SimilarRecord.objects.bulk_create(new_rows + replaced_rows, batch_size=WRITE_BATCH_SIZE)
+        SimilarityIndexState.objects.filter(pk=1).update(
+            last_record_id=int(ids.max()), record_count=len(ids), updated_at=timezone.now(),
+        )
+    return {
+        'mode': 'incremental',
+        'records': len(new_positions),
+        'updated': len(merged),
+        'links': len(new_rows) + len(replaced_rows),
+    }
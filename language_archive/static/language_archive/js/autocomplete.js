@@ -0,0 +1,48 @@
+// language_archive/static/language_archive/js/autocomplete.js
+// data-autocomplete="onomatopoeia" などを付けた入力欄に、入力補完API の候補を datalist で出す。
+// API の URL は読み込む script 要素の data-url で渡す。
+(function () {
+    var script = document.currentScript;
+    var endpoint = script && script.dataset.url;
+    if (!endpoint) return;
+
+    function attach(input) {
+        var list = document.createElement('datalist');
+        list.id = input.id ? input.id + '-suggestions' : 'autocomplete-' + Math.random().toString(36).slice(2);
+        input.after(list);
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+
+        var timer = null;
+        var controller = null;
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            var query = input.value.trim();
+            if (!query) {
+                list.replaceChildren();
+                return;
+            }
+            // 打鍵ごとではなく、入力が止まってから問い合わせる。前の問い合わせは取り消す
+            timer = setTimeout(function () {
+                if (controller) controller.abort();
+                controller = new AbortController();
+                var params = new URLSearchParams({ source: input.dataset.autocomplete, q: query });
+                fetch(endpoint + '?' + params, { signal: controller.signal })
+                    .then(function (response) { return response.ok ? response.json() : { results: [] }; })
+                    .then(function (data) {
+                        list.replaceChildren.apply(list, data.results.map(function (result) {
+                            var option = document.createElement('option');
+                            option.value = result.text;
+                            if (result.count > 1) option.label = result.text + '（' + result.count + '件）';
+                            return option;
+                        }));
+                    })
+                    .catch(function () {});
+            }, 120);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('input[data-autocomplete]').forEach(attach);
+    });
+})();
@@ -0,0 +1,169 @@
+// language_archive/static/language_archive/js/chunked_upload.js
+// アップロードフォームのファイルを分割して送る（開始 → 分割して PUT → 完了）。
+// 回線が切れても、受信済みのバイト数をサーバーに問い合わせて続きから送る。ページを開き直しても、同じファイルなら続きから送る。
+// 送り終えたらファイル欄を空にして upload_id だけをフォームで送信する。
+// 読み込む script 要素の data-url（開始API）・data-form（フォームのID）・data-target（language / geographic）・
+// data-category（ファイル種類・コンテンツ種類の select のID）で設定する。
+(function () {
+    var script = document.currentScript;
+    var endpoint = script && script.dataset.url;
+    var form = endpoint && document.getElementById(script.dataset.form);
+    if (!form || !window.fetch || !window.Blob || !Blob.prototype.slice) return;
+
+    var fileInput = form.querySelector('input[type="file"][name="file"]');
+    var uploadIdInput = form.querySelector('input[name="upload_id"]');
+    var category = document.getElementById(script.dataset.category);
+    var submitButton = form.querySelector('button[type="submit"]');
+    var csrfToken = form.querySelector('input[name="csrfmiddlewaretoken"]').value;
+    var MAX_RETRY_DELAY = 30000;
+
+    var progress = document.createElement('div');
+    progress.className = 'progress mt-2 d-none';
+    progress.innerHTML = '<div class="progress-bar" role="progressbar" style="width: 0%"></div>';
+    var status = document.createElement('div');
+    status.className = 'small text-muted mt-1';
+    fileInput.parentNode.appendChild(progress);
+    fileInput.parentNode.appendChild(status);
+
+    function showProgress(sent, size, message) {
+        var percent = Math.floor(sent / size * 100);
+        progress.classList.remove('d-none');
+        progress.firstChild.style.width = percent + '%';
+        progress.firstChild.textContent = percent + '%';
+        status.textContent = message || (Math.round(sent / 1048576) + ' / ' + Math.round(size / 1048576) + ' MB');
+    }
+
+    function storageKey(file) {
+        return 'chunked-upload:' + script.dataset.target + ':' + category.value + ':' + file.name + ':' + file.size + ':' + file.lastModified;
+    }
+
+    function request(method, url, body, headers) {
+        var options = { method: method, headers: Object.assign({ 'X-CSRFToken': csrfToken }, headers || {}), body: body };
+        return fetch(url, options).then(function (response) {
+            return response.json().catch(function () { return {}; }).then(function (data) {
+                data.httpStatus = response.status;
+                return data;
+            });
+        });
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    // 通信が失敗したら、回線が戻るまで間隔を延ばしながら同じ要求を繰り返す（400 などサーバーが拒否した場合はそのまま返す）
+    function retrying(send) {
+        var delay = 1000;
+        function attempt() {
+            return send().then(function (data) {
+                if (data.httpStatus < 500) return data;
+                throw new Error(data.error || 'サーバーエラー');
+            }).catch(function () {
+                status.textContent = '接続が切れました。再開を待っています…';
+                var wait = Math.min(delay, MAX_RETRY_DELAY);
+                delay *= 2;
+                return Promise.race([
+                    sleep(wait),
+                    new Promise(function (resolve) { window.addEventListener('online', resolve, { once: true }); })
+                ]).then(attempt);
+            });
+        }
+        return attempt();
+    }
+
+    function sha256(blob) {
+        if (!window.crypto || !crypto.subtle) return Promise.resolve(null);
+        return blob.arrayBuffer().then(function (buffer) {
+            return crypto.subtle.digest('SHA-256', buffer);
+        }).then(function (digest) {
+            return Array.from(new Uint8Array(digest)).map(function (b) { return b.toString(16).padStart(2, '0'); }).join('');
+        });
+    }
+
+    function begin(file) {
+        var key = storageKey(file);
+        var saved = localStorage.getItem(key);
+        var resume = saved
+            ? retrying(function () { return request('GET', endpoint + saved + '/'); })
+            : Promise.resolve({ httpStatus: 404 });
+        return resume.then(function (data) {
+            if (data.httpStatus === 200 && data.status === 'uploading') return data;
+            return retrying(function () {
+                return request('POST', endpoint, JSON.stringify({
+                    target: script.dataset.target, category: category.value,
+                    file_name: file.name, size: file.size, content_type: file.type
+                }), { 'Content-Type': 'application/json' });
+            }).then(function (started) {
+                if (started.httpStatus !== 201) throw new Error(started.error || 'アップロードを開始できませんでした。');
+                localStorage.setItem(key, started.upload_id);
+                return started;
+            });
+        });
+    }
+
+    function sendChunks(file, upload) {
+        var url = endpoint + upload.upload_id + '/';
+        var failures = 0;
+        function next(offset) {
+            showProgress(offset, file.size);
+            if (offset >= file.size) return Promise.resolve();
+            var chunk = file.slice(offset, offset + upload.chunk_size);
+            return sha256(chunk).then(function (checksum) {
+                var headers = { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' };
+                if (checksum) headers['X-Chunk-Sha256'] = checksum;
+                return retrying(function () { return request('PUT', url, chunk, headers); });
+            }).then(function (data) {
+                if (data.httpStatus === 200) {
+                    failures = 0;
+                    return next(data.offset);
+                }
+                // 受信済みのバイト数が違う場合は、サーバーが受け取った位置から送り直す
+                if (data.httpStatus === 409) return next(data.offset);
+                // 内容が壊れて届いた場合は同じ分を送り直す
+                if (data.httpStatus === 400 && ++failures < 5) return next(offset);
+                throw new Error(data.error || 'ファイルを送信できませんでした。');
+            });
+        }
+        return next(upload.offset);
+    }
+
+    function finish(file, upload) {
+        status.textContent = 'ストレージに保存しています…';
+        return retrying(function () {
+            return request('POST', endpoint + upload.upload_id + '/finalize/');
+        }).then(function (data) {
+            if (data.httpStatus !== 200) throw new Error(data.error || 'ストレージに保存できませんでした。');
+            localStorage.removeItem(storageKey(file));
+            return data;
+        });
+    }
+
+    function fail(message) {
+        status.textContent = message;
+        status.className = 'small text-danger mt-1';
+        submitButton.disabled = false;
+        submitButton.innerHTML = '<i class="fas fa-upload"></i> アップロード';
+    }
+
+    form.addEventListener('submit', function (e) {
+        var file = fileInput.files[0];
+        if (!file || uploadIdInput.value) return;
+        e.preventDefault();
+        if (!category.value) {
+            fail('種類を選択してください。');
+            return;
+        }
+        status.className = 'small text-muted mt-1';
+        begin(file).then(function (upload) {
+            return sendChunks(file, upload).then(function () { return finish(file, upload); });
+        }).then(function (upload) {
+            uploadIdInput.value = upload.upload_id;
+            // ファイル本体はもう送ったため、フォームには含めない
+            fileInput.value = '';
+            status.textContent = '登録しています…';
+            form.submit();
+        }).catch(function (error) {
+            fail(error.message);
+        });
+    });
+})();
@@ -0,0 +1,488 @@
+# language_archive/static_export.py
+# 公開ページの静的書き出し（静的ホスティング・CDN で配る読み取り専用ミラー）。
+# 公開ページはアップロードのときにしか変わらないが、ビューは表示のたびに DB を読む。export_static コマンドで、
+# 公開ページを絞り込み・ページの組み合わせごとに HTML に書き出し、gzip（brotli があれば brotli も）を並べて置く。
+# ページごとのバージョンは、表示する行の件数・最終更新日時から作る（packages.package_version と同じ考え方）。
+# バージョンは書き出し先のマニフェストに保存し、次回はバージョンが変わったページだけを書き直す。
+# 静的ホストはクエリ文字列でファイルを選べないため、/records/?village=3&page=2 は /records/page=2/village=3/ に書き出し、
+# ページ内のリンクも書き換える。フォームの送信（? 付きのURL）は、各ページに埋め込むスクリプトが同じパスに移す。
+# 文字列での検索（オノマトペ・音声記号）はサーバーが必要なため、ミラーでは条件を外したページになる。
+# 一覧は STATIC_EXPORT_MAX_PAGES ページまで書き出し、それより深いページへのリンクは本サイト（STATIC_EXPORT_ORIGIN）に向ける。
+
+import hashlib
+import html
+import json
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import parse_qsl, quote, urlencode, urljoin, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.db.models import Count, Max
+from django.http import Http404, HttpRequest, QueryDict
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+
+from . import views
+from .geo import within_radius
+from .models import (
+    AnnotationTier, GeographicRecord, LanguageRecord, OnomatopoeiaType, SimilarRecord, Speaker, Village,
+)
+
+MANIFEST_NAME = '.export-manifest.json'
+# 書き出しの形式（パスの付け方・埋め込むスクリプト）を変えたら上げる（全ページを書き直させる）
+EXPORT_FORMAT = 1
+# 1つのワーカーにまとめて渡すページ数
+BATCH_SIZE = 100
+
+# 書き出すビューと、ページのURLに残すGETパラメータ（値は既定値。既定値と同じ値はURLから外す）
+PAGE_VIEWS = {
+    'index': (views.index, {}),
+    'map_view': (views.map_view, {'year': ''}),
+    'record_list': (views.record_list, {'village': '', 'file_type': '', 'onomatopoeia_type': '', 'page': '1'}),
+    'record_detail': (views.record_detail, {}),
+    'village_records': (views.village_records, {'radius': '0', 'page': '1'}),
+    'speaker_records': (views.speaker_records, {'page': '1'}),
+    'geographic_list': (views.geographic_list, {'village': '', 'content_type': '', 'page': '1'}),
+}
+
+HREF_PATTERN = re.compile(r'href="([^"]*\?[^"]*)"')
+
+# ? 付きで開かれたページ（フォームの送信など）を書き出したパスに移し、パスで開かれたページでは絞り込みの選択を復元する
+REDIRECT_SCRIPT = """<script>
+(function () {
+    var keys = %s, current = %s, path = %s;
+    if (location.search) {
+        var params = new URLSearchParams(location.search);
+        Object.keys(keys).sort().forEach(function (key) {
+            var value = params.get(key);
+            if (value && value !== keys[key]) path += key + '=' + encodeURIComponent(value) + '/';
+        });
+        location.replace(path);
+        return;
+    }
+    document.addEventListener('DOMContentLoaded', function () {
+        Object.keys(current).forEach(function (key) {
+            document.querySelectorAll('form[method="get"] select[name="' + key + '"]').forEach(function (field) {
+                field.value = current[key];
+            });
+        });
+    });
+})();
+</script>
+"""
+
+
+class Page:
+    """書き出すページ（url はクエリを正規化したURL、version は表示する行から作ったバージョン）"""
+
+    def __init__(self, url, version):
+        self.url = url
+        self.version = version
+
+
+def page_url(path, params):
+    """
+    ページのURL（クエリは書き出すビューのパラメータだけを名前順に並べ、空の値・既定値は外す）。
+    書き出すビューでなければ None。
+    """
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    if match.url_name not in PAGE_VIEWS:
+        return None
+    defaults = PAGE_VIEWS[match.url_name][1]
+    query = sorted(
+        (key, str(value)) for key, value in params.items()
+        if key in defaults and value not in (None, '') and str(value) != defaults[key]
+    )
+    return path + ('?' + urlencode(query) if query else '')
+
+
+def static_path(url):
+    """ページのURLを書き出し先のディレクトリ（相対パス）にする。/records/?page=2&village=3 → records/page=2/village=3"""
+    path, _, query = url.partition('?')
+    parts = [path.strip('/')] if path.strip('/') else []
+    parts += [f"{key}={value.replace('/', '_')}" for key, value in parse_qsl(query)]
+    return '/'.join(parts)
+
+
+def static_url(url):
+    """ミラーでのページのURL"""
+    path = static_path(url)
+    return '/' + (quote(path, safe='/=') + '/' if path else '')
+
+
+def _file(output_dir, url):
+    return Path(output_dir) / static_path(url) / 'index.html'
+
+
+def _code_version():
+    """テンプレートと静的ファイルのマニフェスト（ハッシュ付きのファイル名）から作るバージョン。デプロイで変われば全ページを書き直す"""
+    digest = hashlib.sha1(str(EXPORT_FORMAT).encode())
+    sources = sorted((Path(__file__).parent / 'templates').rglob('*.html'))
+    static_manifest = Path(settings.STATIC_ROOT) / 'staticfiles.json'
+    if static_manifest.exists():
+        sources.append(static_manifest)
+    for source in sources:
+        digest.update(source.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def _version(*parts):
+    return hashlib.sha1(json.dumps(parts, default=str, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _signature(queryset):
+    """行の件数・最終更新日時"""
+    return queryset.aggregate(count=Count('id'), updated=Max('updated_at'))
+
+
+def _grouped(queryset, fields, updated='updated_at', **extra):
+    """fields の値ごとの [件数, updated の最大, extra の集計...]"""
+    rows = queryset.order_by().values(*fields).annotate(count=Count('id'), updated=Max(updated), **extra)
+    return {
+        tuple(row[field] for field in fields): [row['count'], row['updated'], *(row[name] for name in extra)]
+        for row in rows
+    }
+
+
+def _generalizations(key):
+    """(値, 値, ...) の値を「すべて」（None）にしたすべての組み合わせ（値が NULL の列は「すべて」と同じになるため重ねない）"""
+    return {tuple(None if mask & (1 << i) else value for i, value in enumerate(key)) for mask in range(1 << len(key))}
+
+
+def _rollup(cells):
+    """(値, 値, ...) ごとの [件数, 最終更新日時] を、絞り込みの組み合わせ（値を「すべて」にしたもの）ごとに足し合わせる"""
+    totals = defaultdict(lambda: [0, None])
+    for key, (count, updated) in cells.items():
+        for general in _generalizations(key):
+            total = totals[general]
+            total[0] += count
+            if updated is not None and (total[1] is None or updated > total[1]):
+                total[1] = updated
+    return totals
+
+
+def _page_count(count, max_pages):
+    """一覧の書き出すページ数（0件でも1ページ目は書き出す）"""
+    pages = max(math.ceil(count / views.PAGINATE_BY), 1)
+    return min(pages, max_pages) if max_pages else pages
+
+
+def _paged(path, params, rows, max_pages, *shared):
+    """
+    一覧の各ページ。rows は一覧と同じ順の (ID, 更新日時)。
+    バージョンはそのページに表示する行と件数（ページ送りに表示する）から作るため、
+    記録を編集しても並びが変わらなければ、その記録を表示するページだけが変わる。
+    """
+    for page in range(1, _page_count(len(rows), max_pages) + 1):
+        shown = rows[(page - 1) * views.PAGINATE_BY:page * views.PAGINATE_BY]
+        yield Page(page_url(path, dict(params, page=page)), _version(*shared, len(rows), shown))
+
+
+def collect_pages(max_pages):
+    """書き出すすべてのページとバージョン（一覧は max_pages ページまで）"""
+    # ページの上限とリンク先の本サイトが変わると、上限の前後のページのリンクが変わる
+    code = _version(_code_version(), max_pages, settings.STATIC_EXPORT_ORIGIN)
+    reference = [_signature(Village.objects), _signature(Speaker.objects), _signature(OnomatopoeiaType.objects)]
+    records = _signature(LanguageRecord.objects)
+    geographic = _signature(GeographicRecord.objects)
+
+    yield Page(reverse('index'), _version(code, 'index', reference, records))
+
+    map_version = _version(code, 'map', reference, records, geographic)
+    years = set(LanguageRecord.objects.dates('recorded_date', 'year')) | set(GeographicRecord.objects.dates('captured_date', 'year'))
+    yield Page(reverse('map_view'), map_version)
+    for year in sorted({date.year for date in years}, reverse=True):
+        yield Page(page_url(reverse('map_view'), {'year': year}), map_version)
+
+    # 一覧のカードと同じ順（RecordCard の ordering）に記録を1回だけ読み、絞り込みの組み合わせ・集落・話者ごとに振り分ける
+    villages = list(Village.objects.order_by('id'))
+    radius_pages = defaultdict(list)  # 集落ID → その集落の記録を含める (集落ページ, 半径)
+    radius_villages = {}
+    for village in villages:
+        radius_pages[village.id].append((village.id, 0))
+        radius_villages[village.id, 0] = [village.id]
+        for radius in views.NEARBY_RADII:
+            village_ids = sorted(pk for pk, _ in within_radius(Village.objects.all(), village.latitude, village.longitude, radius))
+            radius_villages[village.id, radius] = village_ids
+            for village_id in village_ids:
+                radius_pages[village_id].append((village.id, radius))
+    filtered = defaultdict(list)
+    by_village = defaultdict(list)
+    by_speaker = defaultdict(list)
+    rows = LanguageRecord.objects.order_by('-recorded_date', '-id').values_list(
+        'id', 'updated_at', 'village_id', 'file_type', 'onomatopoeia_type__type_code', 'speaker_id',
+    )
+    for record_id, updated, village_id, file_type, type_code, speaker_id in rows.iterator(chunk_size=10000):
+        row = (record_id, updated)
+        for key in _generalizations((village_id, file_type, type_code)):
+            filtered[key].append(row)
+        for page in radius_pages.get(village_id, ()):
+            by_village[page].append(row)
+        by_speaker[speaker_id].append(row)
+
+    # 記録一覧：集落・ファイル種類・型のすべての組み合わせ（選択肢は画面と同じ）
+    record_villages = sorted({key[0] for key in filtered if key[0] is not None})
+    type_codes = sorted(OnomatopoeiaType.objects.values_list('type_code', flat=True))
+    options = [reference, record_villages]
+    for village_id in [None] + record_villages:
+        for file_type in [None] + [choice for choice, _ in LanguageRecord.FILE_TYPE_CHOICES]:
+            for type_code in [None] + type_codes:
+                params = {'village': village_id, 'file_type': file_type, 'onomatopoeia_type': type_code}
+                yield from _paged(
+                    reverse('record_list'), params, filtered.get((village_id, file_type, type_code), []), max_pages,
+                    code, 'record_list', options,
+                )
+
+    # 類似記録・書き起こしは作り直すと行のIDが変わる
+    similar = _grouped(SimilarRecord.objects, ['record_id'], updated='similar__updated_at', last_id=Max('id'))
+    tiers = _grouped(AnnotationTier.objects, ['record_id'], updated='imported_at', last_id=Max('id'))
+    for record_id, updated in LanguageRecord.objects.order_by('id').values_list('id', 'updated_at').iterator():
+        key = (record_id,)
+        yield Page(
+            reverse('record_detail', args=[record_id]),
+            _version(code, 'record_detail', reference, updated, similar.get(key), tiers.get(key)),
+        )
+
+    # 集落ごとの一覧（近くの集落を含める半径ごと）。近くの地理環境データも表示する
+    for village in villages:
+        for radius in (0,) + views.NEARBY_RADII:
+            yield from _paged(
+                reverse('village_records', args=[village.id]), {'radius': radius}, by_village.get((village.id, radius), []), max_pages,
+                code, 'village_records', reference, geographic, radius_villages[village.id, radius],
+            )
+
+    for speaker_id in Speaker.objects.order_by('id').values_list('id', flat=True):
+        yield from _paged(
+            reverse('speaker_records', args=[speaker_id]), {}, by_speaker.get(speaker_id, []), max_pages, code, 'speaker_records', reference,
+        )
+
+    # 地理環境データ一覧は撮影日だけで並べ（同じ日の順は決まらない）、ページに表示する行を決められないため、
+    # 組み合わせごとの件数・最終更新日時をすべてのページのバージョンにする
+    geographic_cells = _rollup(_grouped(GeographicRecord.objects, ['village_id', 'content_type']))
+    geographic_villages = sorted({key[0] for key in geographic_cells if key[0] is not None})
+    options = [reference, geographic_villages]
+    for village_id in [None] + geographic_villages:
+        for content_type in [None] + [choice for choice, _ in GeographicRecord.CONTENT_TYPE_CHOICES]:
+            count, updated = geographic_cells.get((village_id, content_type), (0, None))
+            params = {'village': village_id, 'content_type': content_type}
+            version = _version(code, 'geographic_list', options, count, updated)
+            for page in range(1, _page_count(count, max_pages) + 1):
+                yield Page(page_url(reverse('geographic_list'), dict(params, page=page)), version)
+
+
+def _rewrite_links(content, url, max_pages):
+    """
+    ? 付きのリンク（ページ送り・範囲の切り替え）を、書き出したページのパスにする。
+    max_pages より深いページは書き出さないため、STATIC_EXPORT_ORIGIN があれば本サイトのURLにする。
+    """
+    def replace(match):
+        target = urlsplit(urljoin(url, html.unescape(match.group(1))))
+        if target.netloc:
+            return match.group(0)
+        params = dict(parse_qsl(target.query))
+        exported = page_url(target.path, params)
+        if exported is None:
+            return match.group(0)
+        page = params.get('page', '1')
+        if max_pages and page.isdigit() and int(page) > max_pages:
+            origin = settings.STATIC_EXPORT_ORIGIN
+            return f'href="{html.escape(origin + exported)}"' if origin else match.group(0)
+        return f'href="{html.escape(static_url(exported))}"'
+    return HREF_PATTERN.sub(replace, content)
+
+
+def render_page(url, max_pages=0):
+    """
+    ページを描画し、リンクを書き換えた HTML を返す（ページが削除されていれば None）。
+    ビューは ASYNC_VIEWS の設定によらず同期版を直接呼び、ミドルウェアは通さない。
+    """
+    path, _, query = url.partition('?')
+    match = resolve(path)
+    view, defaults = PAGE_VIEWS[match.url_name]
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = path
+    request.GET = QueryDict(query)
+    request.META.update({'SERVER_NAME': 'localhost', 'SERVER_PORT': '80'})
+    request.user = AnonymousUser()
+    request.resolver_match = match
+    try:
+        response = view(request, *match.args, **match.kwargs)
+    except Http404:
+        return None
+    content = _rewrite_links(response.content.decode(response.charset), url, max_pages)
+    # </script> で閉じられないよう < をエスケープする
+    script = REDIRECT_SCRIPT % tuple(
+        json.dumps(value, sort_keys=True).replace('<', '\\u003c')
+        for value in (defaults, dict(parse_qsl(query)), static_url(path))
+    )
+    head, body_end, tail = content.rpartition('</body>')
+    return head + script + body_end + tail if body_end else content + script
+
+
+def _remove(output_dir, url):
+    """ページのファイルと圧縮版を消し、空になったディレクトリも消す"""
+    path = _file(output_dir, url)
+    for suffix in ('', '.gz', '.br'):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+    root = Path(output_dir).resolve()
+    directory = path.parent.resolve()
+    while directory != root and directory.is_dir() and not any(directory.iterdir()):
+        directory.rmdir()
+        directory = directory.parent
+
+
+def _write(output_dir, url, content):
+    """
+    HTML と圧縮版を書く（内容が前回と同じなら書かない）。
+    書き出し先を同期中の CDN が書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える。
+
+    Returns:
+        (SHA-256, バイト数, 書いたか)
+    """
+    from whitenoise.compress import Compressor
+
+    data = content.encode()
+    digest = hashlib.sha256(data).hexdigest()
+    path = _file(output_dir, url)
+    if path.exists() and hashlib.sha256(path.read_bytes()).hexdigest() == digest:
+        return digest, len(data), False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+    for suffix in ('.gz', '.br'):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+    list(Compressor(quiet=True).compress(str(path)))
+    return digest, len(data), True
+
+
+def _render_batch(output_dir, urls, max_pages):
+    """ワーカーで urls を描画して書く。[(url, SHA-256, バイト数, 書いたか)]（削除されたページは SHA-256 が None）"""
+    results = []
+    for url in urls:
+        content = render_page(url, max_pages)
+        if content is None:
+            _remove(output_dir, url)
+            results.append((url, None, 0, False))
+        else:
+            results.append((url, *_write(output_dir, url, content)))
+    return results
+
+
+def _sync_static(output_dir):
+    """collectstatic で集めた静的ファイルを STATIC_URL の位置に写す（大きさ・更新日時が変わったものだけ）。写した件数を返す"""
+    source = Path(settings.STATIC_ROOT)
+    if not source.is_dir() or not settings.STATIC_URL.startswith('/'):
+        return 0
+    destination = Path(output_dir) / settings.STATIC_URL.strip('/')
+    copied = 0
+    for path in source.rglob('*'):
+        if not path.is_file():
+            continue
+        target = destination / path.relative_to(source)
+        stat = path.stat()
+        if target.exists() and target.stat().st_size == stat.st_size and target.stat().st_mtime >= stat.st_mtime:
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path, target)
+        copied += 1
+    return copied
+
+
+def load_manifest(output_dir):
+    """前回の書き出しのマニフェスト（なければ空）"""
+    path = Path(output_dir) / MANIFEST_NAME
+    try:
+        manifest = json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return {'pages': {}}
+    return manifest if manifest.get('format') == EXPORT_FORMAT else {'pages': {}}
+
+
+def _save_manifest(output_dir, pages):
+    path = Path(output_dir) / MANIFEST_NAME
+    temporary = path.with_name(path.name + '.tmp')
+    temporary.write_text(json.dumps({
+        'format': EXPORT_FORMAT, 'exported_at': timezone.now().isoformat(), 'pages': pages,
+    }, ensure_ascii=False, sort_keys=True))
+    os.replace(temporary, path)
+
+
+def export_site(output_dir, workers=1, full=False, max_pages=None, progress=None):
+    """
+    公開ページを output_dir に書き出す。前回からバージョンが変わったページ（full なら全ページ）だけを描画し、
+    なくなったページ（削除された記録・減ったページ）のファイルは消す。
+    workers が2以上なら、描画をプロセスに分けて並行して行う（fork できない環境では1つずつ）。
+
+    Args:
+        max_pages: 一覧ごとに書き出すページ数の上限（None なら STATIC_EXPORT_MAX_PAGES、0 は無制限）
+        progress: 描画したページ数ごとに (描画済み, 描画するページ数) で呼ばれる関数（オプション）
+
+    Returns:
+        {'pages': ページ数, 'rendered': 描画した数, 'written': 内容が変わって書いた数, 'removed': 消した数,
+         'static': 写した静的ファイルの数, 'seconds': かかった秒数}
+    """
+    started = time.monotonic()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    max_pages = settings.STATIC_EXPORT_MAX_PAGES if max_pages is None else max_pages
+    previous = load_manifest(output_dir)['pages']
+    pages = {page.url: page.version for page in collect_pages(max_pages)}
+    stale = [
+        url for url, version in pages.items()
+        if full or previous.get(url, {}).get('version') != version or not _file(output_dir, url).exists()
+    ]
+    stale_urls = set(stale)
+    manifest = {url: previous[url] for url in pages if url in previous and url not in stale_urls}
+
+    batches = [stale[i:i + BATCH_SIZE] for i in range(0, len(stale), BATCH_SIZE)]
+    rendered = written = 0
+
+    def collect(results):
+        nonlocal rendered, written
+        for url, digest, size, changed in results:
+            rendered += 1
+            written += changed
+            if digest is not None:
+                manifest[url] = {'version': pages[url], 'sha256': digest, 'bytes': size}
+        if progress:
+            progress(rendered, len(stale))
+
+    if workers > 1 and len(batches) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        from concurrent.futures import ProcessPoolExecutor
+
+        # 子プロセスが親の DB 接続を引き継がないよう、fork の前に閉じる（子は必要になった時点で接続する）
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            for results in executor.map(_render_batch, [output_dir] * len(batches), batches, [max_pages] * len(batches)):
+                collect(results)
+    else:
+        for batch in batches:
+            collect(_render_batch(output_dir, batch, max_pages))
+
+    removed = 0
+    for url in previous:
+        if url not in pages:
+            _remove(output_dir, url)
+            removed += 1
+    removed += sum(1 for url in stale if url not in manifest)
+    _save_manifest(output_dir, manifest)
+    return {
+        'pages': len(manifest),
+        'rendered': rendered,
+        'written': written,
+        'removed': removed,
+        'static': _sync_static(output_dir),
+        'seconds': time.monotonic() - started,
+    }
@@ -0,0 +1,220 @@
+# language_archive/storage_check.py
+# ストレージの整合性確認。
+# 記録が参照するファイル（file_path・thumbnail_path）を ID 順に少しずつ読み、スレッドプールから HEAD で確かめる。
+# 同時接続数・1秒あたりの件数に上限を設け、一時的なエラー（429・5xx・接続エラー）は間隔を空けて再試行する。
+# 結果はファイルごとに StorageObjectCheck に保存し、確認の位置は StorageCheckRun に残すため、中断しても続きから確認できる。
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GeographicRecord, LanguageRecord, StorageCheckRun, StorageObjectCheck
+
+# 確認するモデル（モデル名は SyncTombstone と同じ）と、ファイルの種類を表す列
+CHECKED_MODELS = [
+    ('language_record', LanguageRecord, 'file_type'),
+    ('geographic_record', GeographicRecord, 'content_type'),
+]
+CHECKED_FIELDS = ('file_path', 'thumbnail_path')
+
+# ファイルの種類ごとに期待する Content-Type（サムネイルは常に画像）
+EXPECTED_CONTENT_TYPES = {
+    'audio': 'audio/',
+    'video': 'video/',
+    'image': 'image/',
+    'drone_video': 'video/',
+    'drone_photo': 'image/',
+}
+# 種類が分からずに送信されたファイル（_ensure_content_type の既定値）は不一致にしない
+GENERIC_CONTENT_TYPES = {'', 'application/octet-stream', 'binary/octet-stream'}
+
+# Supabase の公開URLは、ファイルがないとき 400 を返すことがある
+MISSING_STATUSES = {400, 404, 410}
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RETRIES = 2
+DEFAULT_RATE = 20
+DEFAULT_SLOW_MS = 2000
+# 1回に読む記録数（この単位で結果と位置を保存する）
+BATCH_SIZE = 200
+# 再試行の待ち時間（秒）。1回目はこの秒数、以降は倍にする。Retry-After はこの上限まで従う
+RETRY_BACKOFF = 0.5
+MAX_RETRY_AFTER = 30
+
+
+class RateLimiter:
+    """全スレッドの要求を1秒あたり rate 件までに抑える（rate が 0 なら抑えない）"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def probe(session, limiter, retries, url):
+    """
+    url を HEAD で確かめる。一時的なエラーは retries 回まで再試行する。
+
+    Returns:
+        (HTTPステータス, サイズ, Content-Type, 応答時間[ミリ秒], エラー)。接続できなかったときはエラーだけが入る
+    """
+    from . import services
+
+    for attempt in range(retries + 1):
+        limiter.wait()
+        delay = RETRY_BACKOFF * 2 ** attempt
+        try:
+            status, size, content_type, elapsed_ms, retry_after = services.probe_storage_object(session, url)
+        except Exception as e:
+            result = (None, None, '', None, f'{type(e).__name__}: {e}')
+        else:
+            result = (status, size, content_type, elapsed_ms, '')
+            if status not in RETRY_STATUSES:
+                return result
+            if retry_after is not None:
+                delay = min(retry_after, MAX_RETRY_AFTER)
+        if attempt < retries:
+            time.sleep(delay)
+    return result
+
+
+def classify(result, kind, field, previous, slow_ms):
+    """
+    probe の結果を判定する。previous は前回の確認結果（同じURLのときだけ。なければ None）。
+
+    Returns:
+        (状態, 内容)
+    """
+    status, size, content_type, elapsed_ms, error = result
+    if status is None:
+        return 'error', error[:255]
+    if status in MISSING_STATUSES:
+        return 'missing', f'HTTP {status}'
+    if not 200 <= status < 300:
+        return 'error', f'HTTP {status}'
+    if size == 0:
+        return 'mismatch', '空のファイルです'
+    if previous is not None and previous.size is not None and size is not None and previous.size != size:
+        return 'mismatch', f'サイズが変わりました（{previous.size} → {size}）'
+    expected = 'image/' if field == 'thumbnail_path' else EXPECTED_CONTENT_TYPES.get(kind)
+    if expected and content_type not in GENERIC_CONTENT_TYPES and not content_type.startswith(expected):
+        return 'mismatch', f'Content-Type が {expected}* ではありません（{content_type}）'
+    if elapsed_ms > slow_ms:
+        return 'slow', f'{elapsed_ms:.0f} ms'
+    return 'ok', ''
+
+
+def current_run(restart=False):
+    """
+    未完了の確認があればそれを返す（続きから確認する）。なければ、または restart なら新しく始める。
+
+    Returns:
+        (StorageCheckRun, 続きからか)
+    """
+    run = StorageCheckRun.objects.filter(finished_at__isnull=True).order_by('-started_at').first()
+    if run is not None and not restart:
+        return run, True
+    if run is not None:
+        run.finished_at = timezone.now()
+        run.save(update_fields=['finished_at'])
+    return StorageCheckRun.objects.create(), False
+
+
+def _targets(model, kind_field, after, limit):
+    """ID が after より後の記録から、確認するファイルを (ID, 列, URL, 種類) で返す"""
+    rows = list(
+        model.objects.filter(id__gt=after).order_by('id')
+        .values_list('id', kind_field, *CHECKED_FIELDS)[:limit]
+    )
+    targets = [
+        (object_id, field, url, kind)
+        for object_id, kind, *urls in rows
+        for field, url in zip(CHECKED_FIELDS, urls)
+        if url
+    ]
+    return (rows[-1][0] if rows else None), targets
+
+
+def _save(run, name, targets, results, slow_ms):
+    """1回分の結果を保存し、問題のあったファイル数を返す"""
+    previous = {
+        (check.object_id, check.field): check
+        for check in StorageObjectCheck.objects.filter(
+            model=name, object_id__in={object_id for object_id, _, _, _ in targets},
+        )
+    }
+    now = timezone.now()
+    checks = []
+    for (object_id, field, url, kind), result in zip(targets, results):
+        before = previous.get((object_id, field))
+        status, detail = classify(result, kind, field, before if before and before.url == url else None, slow_ms)
+        http_status, size, content_type, elapsed_ms, _ = result
+        checks.append(StorageObjectCheck(
+            model=name, object_id=object_id, field=field, url=url, status=status, detail=detail,
+            http_status=http_status, size=size, content_type=content_type[:100], elapsed_ms=elapsed_ms,
+            run=run, checked_at=now,
+        ))
+    StorageObjectCheck.objects.bulk_create(
+        checks, update_conflicts=True, unique_fields=['model', 'object_id', 'field'],
+        update_fields=['url', 'status', 'detail', 'http_status', 'size', 'content_type', 'elapsed_ms', 'run', 'checked_at'],
+    )
+    return sum(check.status != 'ok' for check in checks)
+
+
+def check_storage(run, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES, rate=DEFAULT_RATE,
+                  slow_ms=DEFAULT_SLOW_MS, limit=None, progress=None):
+    """
+    run の続きからファイルを確認する。limit を渡すと、その件数の記録を確認したところで止める（次回は続きから）。
+    progress は BATCH_SIZE 件ごとに run を渡して呼ぶ。
+
+    Returns:
+        全件を確認し終えたか
+    """
+    from . import services
+
+    session = services.open_probe_session(concurrency)
+    limiter = RateLimiter(rate)
+    remaining = limit
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for name, model, kind_field in CHECKED_MODELS:
+                while remaining is None or remaining > 0:
+                    batch = BATCH_SIZE if remaining is None else min(BATCH_SIZE, remaining)
+                    last_id, targets = _targets(model, kind_field, run.position.get(name, 0), batch)
+                    if last_id is None:
+                        break
+                    results = list(executor.map(lambda url: probe(session, limiter, retries, url), [t[2] for t in targets]))
+                    with transaction.atomic():
+                        problems = _save(run, name, targets, results, slow_ms)
+                        run.position[name] = last_id
+                        run.checked += len(targets)
+                        run.problem_count += problems
+                        run.save(update_fields=['position', 'checked', 'problem_count'])
+                    if remaining is not None:
+                        remaining -= batch
+                    if progress:
+                        progress(run)
+                if remaining is not None and remaining <= 0:
+                    return False
+    finally:
+        session.close()
+
+    run.finished_at = timezone.now()
+    run.save(update_fields=['finished_at'])
+    # 今回確認しなかった結果は、削除された記録か空になった列のもの
+    StorageObjectCheck.objects.exclude(run=run).delete()
+    return True
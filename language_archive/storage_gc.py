@@ -0,0 +1,182 @@
+# language_archive/storage_gc.py
+# ストレージの孤立ファイルの削除。
+# 記録の削除やファイルの差し替えではストレージのファイルは消えないため、どの記録からも参照されていないファイルを探して削除する。
+# 分割アップロードで送り終え、まだ記録に付けられていないファイル（ChunkedUpload の file_url）も参照されているものとして扱う
+# （フォームからは prune_chunked_uploads で消えるまで使えるため）。
+# 参照されているファイルの一覧は DB から読んで 64 ビットのハッシュの配列（1件8バイト）にし、バケットを1ページずつ照合する。
+# ハッシュが衝突したときはファイルを残す側に倒れるため、参照されているファイルを消すことはない。
+# 一覧は offset でページを進めるため、一覧の途中で削除すると後ろのページがずれて孤立ファイルを取りこぼす。
+# そのため孤立ファイルはバケットの最後まで一覧してから削除する。
+
+import datetime
+import hashlib
+import logging
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ChunkedUpload, GeographicRecord, LanguageRecord, StorageDeletion
+
+logger = logging.getLogger(__name__)
+
+# 作成からこの時間がたっていないファイルは消さない（アップロードしてから記録を保存するまでの間のファイルを守る）
+GRACE_HOURS = 24
+# 1回の削除要求に含めるファイル数と、同時に送る要求の数
+DELETE_BATCH = 100
+DELETE_WORKERS = 4
+
+REFERENCING_MODELS = (LanguageRecord, GeographicRecord)
+REFERENCING_FIELDS = ('file_path', 'thumbnail_path')
+
+
+def _digest(bucket_name, storage_path):
+    raw = hashlib.blake2b(f'{bucket_name}/{storage_path}'.encode(), digest_size=8).digest()
+    return int.from_bytes(raw, 'little')
+
+
+class ReferencedKeys:
+    """参照されているファイル（バケット, パス）の集合。ハッシュを昇順の numpy 配列で持ち、ページ単位でまとめて照合する"""
+
+    def __init__(self, keys=()):
+        import numpy as np
+
+        digests = array('Q', (_digest(bucket_name, storage_path) for bucket_name, storage_path in keys))
+        self._digests = np.unique(np.frombuffer(digests, dtype=np.uint64)) if digests else np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._digests)
+
+    def contains(self, bucket_name, storage_paths):
+        """storage_paths のそれぞれが参照されているか（bool の numpy 配列）"""
+        import numpy as np
+
+        digests = np.fromiter((_digest(bucket_name, path) for path in storage_paths), dtype=np.uint64, count=len(storage_paths))
+        if not len(self._digests):
+            return np.zeros(len(digests), dtype=bool)
+        # 昇順の配列なので二分探索で照合する（np.isin は呼ぶたびに全体を並べ替える）
+        positions = np.minimum(np.searchsorted(self._digests, digests), len(self._digests) - 1)
+        return self._digests[positions] == digests
+
+
+def _stored_uploads():
+    """送り終えた分割アップロード（記録に付けるまで、ストレージのファイルを消してはいけない）"""
+    return ChunkedUpload.objects.filter(status='stored').exclude(file_url='')
+
+
+def _referencing_urls():
+    for model in REFERENCING_MODELS:
+        rows = model.objects.order_by().values_list(*REFERENCING_FIELDS).iterator(chunk_size=5000)
+        for urls in rows:
+            yield from (url for url in urls if url)
+    yield from _stored_uploads().order_by().values_list('file_url', flat=True).iterator(chunk_size=5000)
+
+
+def referenced_keys():
+    """記録の file_path・thumbnail_path と、送り終えた分割アップロードが参照しているファイル"""
+    from .services import storage_object_key
+
+    return ReferencedKeys(key for key in map(storage_object_key, _referencing_urls()) if key is not None)
+
+
+def _parse_created_at(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def find_orphans(bucket_name, referenced, grace_hours=GRACE_HOURS, now=None):
+    """
+    bucket_name の孤立ファイルを1ページずつ探す。作成日時が分からないファイルは残す。
+
+    Yields:
+        1ページ分の (パス, 作成日時, サイズ) のリスト
+    """
+    from .services import list_storage_objects
+
+    cutoff = (now or timezone.now()) - datetime.timedelta(hours=grace_hours)
+    for page in list_storage_objects(bucket_name):
+        in_use = referenced.contains(bucket_name, [path for path, _, _ in page])
+        orphans = []
+        for (path, created_at, size), used in zip(page, in_use):
+            created_at = _parse_created_at(created_at)
+            if not used and created_at is not None and created_at < cutoff:
+                orphans.append((path, created_at, size))
+        if orphans:
+            yield orphans
+
+
+def _still_unreferenced(bucket_name, orphans):
+    """一覧を作った後に参照されたファイル（管理画面でURLを付け替えた・分割アップロードを送り終えたなど）を除く"""
+    from .services import storage_public_url
+
+    urls = {storage_public_url(bucket_name, path): (path, created_at, size) for path, created_at, size in orphans}
+    for model in REFERENCING_MODELS:
+        condition = Q(file_path__in=urls) | Q(thumbnail_path__in=urls)
+        for found in model.objects.filter(condition).values_list(*REFERENCING_FIELDS):
+            for url in found:
+                urls.pop(url, None)
+    for url in _stored_uploads().filter(file_url__in=urls).values_list('file_url', flat=True):
+        urls.pop(url, None)
+    return list(urls.values())
+
+
+def _delete_batch(bucket_name, batch):
+    from .services import delete_from_supabase
+
+    try:
+        delete_from_supabase(bucket_name, [path for path, _, _ in batch])
+    except Exception as e:
+        return batch, f'{type(e).__name__}: {e}'
+    return batch, ''
+
+
+def _audit(bucket_name, batch, error):
+    StorageDeletion.objects.bulk_create([
+        StorageDeletion(
+            bucket=bucket_name, path=path, size=size, object_created_at=created_at,
+            status='failed' if error else 'deleted', error=error,
+        )
+        for path, created_at, size in batch
+    ])
+    if error:
+        logger.warning("%s のファイル %d件を削除できませんでした: %s", bucket_name, len(batch), error)
+    else:
+        logger.info("%s のファイル %d件を削除しました", bucket_name, len(batch))
+
+
+def collect_garbage(bucket_name, referenced, grace_hours=GRACE_HOURS, dry_run=False,
+                    batch_size=DELETE_BATCH, workers=DELETE_WORKERS, now=None):
+    """
+    bucket_name の孤立ファイルを削除する。削除は batch_size 件ずつ workers 本の要求を並行して送り、
+    結果は StorageDeletion に記録する。dry_run では削除も記録もしない。
+
+    Returns:
+        {'orphans': 孤立ファイル数, 'bytes': その合計サイズ, 'deleted': 削除した数, 'failed': 削除に失敗した数,
+         'paths': dry_run のときだけ孤立ファイルのパス}
+    """
+    stats = {'orphans': 0, 'bytes': 0, 'deleted': 0, 'failed': 0, 'paths': []}
+
+    def record(batch, error):
+        _audit(bucket_name, batch, error)
+        stats['failed' if error else 'deleted'] += len(batch)
+
+    # 削除で一覧のページがずれないよう、孤立ファイルを最後まで集めてから削除する
+    orphans = [
+        orphan
+        for page in find_orphans(bucket_name, referenced, grace_hours, now)
+        for orphan in _still_unreferenced(bucket_name, page)
+    ]
+    stats['orphans'] = len(orphans)
+    stats['bytes'] = sum(size or 0 for _, _, size in orphans)
+    if dry_run:
+        stats['paths'] = [path for path, _, _ in orphans]
+        return stats
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batches = (orphans[start:start + batch_size] for start in range(0, len(orphans), batch_size))
+        for batch, error in executor.map(lambda batch: _delete_batch(bucket_name, batch), batches):
+            record(batch, error)
+    return stats
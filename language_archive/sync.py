@@ -0,0 +1,169 @@
+# language_archive/sync.py
+# 現地の端末（タブレット）向けの差分同期。
+# モデルごとに「更新日時・ID」の順で変更を読み、前回の続きからの差分だけを返す。削除は SyncTombstone（墓標）で伝える。
+# 続きの位置はカーソル（モデルごとの (更新日時, ID) を base64 にした文字列）で表し、端末は受け取ったカーソルを次の要求に付ける。
+
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import GeographicRecord, LanguageRecord, OnomatopoeiaType, Speaker, SyncTombstone, Village
+
+# 同期するモデルと列（端末は親→子の順に反映できるよう、参照される側を先に並べる）。
+# 先頭は id、最後は updated_at にする（カーソルに使う）。話者の備考はサイトに表示していないため含めない
+SYNC_MODELS = {
+    'village': (Village, ['id', 'name', 'latitude', 'longitude', 'description', 'updated_at']),
+    'onomatopoeia_type': (OnomatopoeiaType, ['id', 'type_code', 'type_name', 'description', 'updated_at']),
+    'speaker': (Speaker, ['id', 'speaker_id', 'age_range', 'gender', 'village_id', 'consent_video', 'updated_at']),
+    'language_record': (LanguageRecord, [
+        'id', 'onomatopoeia_text', 'meaning', 'usage_example', 'phonetic_notation', 'language_frequency',
+        'file_type', 'file_path', 'thumbnail_path', 'youtube_url', 'speaker_id', 'onomatopoeia_type_id',
+        'village_id', 'title', 'description', 'recorded_date', 'created_at', 'notes', 'updated_at',
+    ]),
+    'geographic_record': (GeographicRecord, [
+        'id', 'title', 'content_type', 'file_path', 'thumbnail_path', 'youtube_url', 'description',
+        'village_id', 'latitude', 'longitude', 'captured_date', 'created_at', 'updated_at',
+    ]),
+}
+TOMBSTONE_STREAM = 'deleted'
+
+# updated_at は保存時の時刻で、コミットはその後になる。コミット前の行を読み飛ばさないよう、
+# この秒数より前に更新された行だけを返す
+SETTLE_SECONDS = 60
+
+# 墓標を残す日数（prune_sync_tombstones で削除する）。これより古いカーソルは全件の取り直しになる
+TOMBSTONE_RETENTION_DAYS = 180
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    """カーソルが読めない"""
+
+
+class ExpiredCursor(ValueError):
+    """カーソルが古く、その後の削除が墓標に残っていない（全件を取り直す必要がある）"""
+
+
+def encode_cursor(positions, horizon):
+    """モデルごとの (更新日時, ID) と発行時の基準時刻を URL に使える文字列にする"""
+    payload = {
+        'h': horizon.isoformat(),
+        'p': {stream: [updated_at.isoformat(), object_id] for stream, (updated_at, object_id) in positions.items()},
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    encode_cursor の逆。
+
+    Returns:
+        (モデルごとの (更新日時, ID), 発行時の基準時刻)
+
+    Raises:
+        InvalidCursor: 形式が正しくない
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        horizon = datetime.datetime.fromisoformat(payload['h'])
+        positions = {
+            stream: (datetime.datetime.fromisoformat(updated_at), int(object_id))
+            for stream, (updated_at, object_id) in payload['p'].items()
+        }
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise InvalidCursor(str(e)) from e
+    if timezone.is_naive(horizon) or any(timezone.is_naive(updated_at) for updated_at, _ in positions.values()):
+        raise InvalidCursor('timezone is required')
+    return positions, horizon
+
+
+def _after(queryset, field, position):
+    """(field, id) が position より後の行を、その順に並べる"""
+    updated_at, object_id = position
+    return queryset.filter(
+        Q(**{f'{field}__gt': updated_at}) | Q(**{field: updated_at, 'id__gt': object_id})
+    ).order_by(field, 'id')
+
+
+def changes_since(cursor=None, limit=DEFAULT_LIMIT, now=None):
+    """
+    カーソル以降の変更を最大 limit 行返す。cursor が None なら全件の最初から。
+
+    Returns:
+        {'cursor': 次のカーソル, 'has_more': 続きがあるか, 'changes': {モデル: {'fields': 列名, 'rows': 行}},
+         'deleted': {モデル: [ID]}}
+
+    Raises:
+        InvalidCursor: カーソルが読めない
+        ExpiredCursor: カーソルが墓標の保存期間より古い
+    """
+    now = now or timezone.now()
+    horizon = now - datetime.timedelta(seconds=SETTLE_SECONDS)
+    if cursor:
+        positions, issued = decode_cursor(cursor)
+        if issued < now - datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS):
+            raise ExpiredCursor(issued.isoformat())
+    else:
+        # 初回は全件を送るため、それ以前の削除は伝えなくてよい
+        positions = {TOMBSTONE_STREAM: (horizon, 0)}
+
+    remaining = limit
+    has_more = False
+    changes = {}
+    for stream, (model, fields) in SYNC_MODELS.items():
+        if remaining <= 0:
+            has_more = True
+            break
+        position = positions.get(stream, (EPOCH, 0))
+        rows = list(_after(model.objects.filter(updated_at__lte=horizon), 'updated_at', position).values_list(*fields)[:remaining])
+        if rows:
+            changes[stream] = {'fields': fields, 'rows': rows}
+            positions[stream] = (rows[-1][-1], rows[-1][0])
+            remaining -= len(rows)
+            has_more = has_more or remaining <= 0
+
+    deleted = {}
+    if remaining > 0:
+        position = positions.get(TOMBSTONE_STREAM, (EPOCH, 0))
+        tombstones = list(
+            _after(SyncTombstone.objects.filter(deleted_at__lte=horizon), 'deleted_at', position)
+            .values_list('id', 'model', 'object_id', 'deleted_at')[:remaining]
+        )
+        for _, model, object_id, _ in tombstones:
+            deleted.setdefault(model, []).append(object_id)
+        if tombstones:
+            positions[TOMBSTONE_STREAM] = (tombstones[-1][3], tombstones[-1][0])
+        has_more = has_more or len(tombstones) == remaining
+    else:
+        has_more = True
+
+    return {
+        'cursor': encode_cursor(positions, horizon),
+        'has_more': has_more,
+        'changes': changes,
+        'deleted': deleted,
+    }
+
+
+def tombstone_name(model):
+    """墓標に記録するモデル名（SYNC_MODELS のキー）。同期対象外のモデルは None"""
+    for stream, (sync_model, _) in SYNC_MODELS.items():
+        if model is sync_model:
+            return stream
+    return None
+
+
+def prune_tombstones(days=TOMBSTONE_RETENTION_DAYS):
+    """保存期間を過ぎた墓標を削除し、削除した件数を返す"""
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    deleted, _ = SyncTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
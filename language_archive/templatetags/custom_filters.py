@@ -5,4 +5,10 @@ register = template.Library()
 @register.filter
 def is_equal(value, arg):
     """2つの値が等しいかチェック"""
-    return str(value) == str(arg)
\ No newline at end of file
+    return str(value) == str(arg)
+
+
+@register.filter
+def page_links(page_obj):
+    """ページ送りに表示するページ番号（先頭・末尾と現在のページの前後だけ。間は Paginator.ELLIPSIS）"""
+    return page_obj.paginator.get_elided_page_range(page_obj.number, on_each_side=2, on_ends=1)
@@ -1,3 +1,2132 @@
-from django.test import TestCase
+import datetime
+import importlib
+import inspect
+import io
+import os
+import threading
+from contextlib import contextmanager
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, router
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, reverse
+
+from .middleware import REPLICA_PIN_COOKIE
+from .models import GeographicRecord, LanguageRecord, OnomatopoeiaType, RecordCard, Speaker, Village
+
+
+class ArchiveFixtureMixin:
+    """
+    テストの共通データ（集落「小野津」・話者 SPK001・オノマトペ型 AABB）と、言語記録の作成。
+    キャッシュを消してから作るクラスがあるため、各クラスの setUp で create_fixture() を呼ぶ。
+    """
+
+    def create_fixture(self, village=None, type_description='', **speaker_fields):
+        self.village = village or Village.objects.create(name='小野津', latitude=28.3, longitude=129.9)
+        self.speaker = Speaker.objects.create(
+            **{'speaker_id': 'SPK001', 'age_range': '70-79', 'gender': 'F', 'village': self.village, **speaker_fields}
+        )
+        self.onomatopoeia_type = OnomatopoeiaType.objects.create(type_code='AABB', type_name='反復', description=type_description)
+
+    def create_record(self, onomatopoeia_text='ざーざー', **fields):
+        """言語記録を作る（指定しない項目は共通データの話者・型の、2024年1月1日収録の音声）"""
+        fields = {
+            'meaning': '雨', 'usage_example': '用例', 'file_type': 'audio', 'speaker': self.speaker,
+            'onomatopoeia_type': self.onomatopoeia_type, 'recorded_date': datetime.date(2024, 1, 1), **fields,
+        }
+        return LanguageRecord.objects.create(onomatopoeia_text=onomatopoeia_text, **fields)
+
+
+class AsyncViewsTests(ArchiveFixtureMixin, TestCase):
+    """ASGIプロファイル（ASYNC_VIEWS=True）の非同期ビューが、同期版と同じ内容のページを返し、同じように登録することを確認する"""
+
+    def setUp(self):
+        self.create_fixture()
+        self.records = [self.create_record(f'ざーざー{i}', recorded_date=datetime.date(2024, 1, i + 1)) for i in range(8)]
+        GeographicRecord.objects.create(
+            title='空撮', content_type='drone_video', description='', village=self.village, latitude=28.3, longitude=129.9,
+            captured_date=datetime.date(2023, 6, 1), youtube_url='https://youtu.be/abcdefg',
+        )
+
+    @contextmanager
+    def _async_views(self):
+        """urls.py は読み込み時にビューを選ぶため、設定を切り替えて読み込み直す"""
+        def reload_urls():
+            importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+            clear_url_caches()
+        try:
+            with override_settings(ASYNC_VIEWS=True):
+                reload_urls()
+                yield
+        finally:
+            reload_urls()
+
+    def _async_get(self, url):
+        with self._async_views():
+            response = async_to_sync(self.async_client.get)(url)
+            # resolver_match は遅延評価のため、urls.py を戻す前に確かめる
+            self.assertTrue(inspect.iscoroutinefunction(response.resolver_match.func), url)
+        return response
+
+    def _assert_same_context(self, url, keys):
+        expected = self.client.get(url)
+        response = self._async_get(url)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertEqual([t.name for t in response.templates], [t.name for t in expected.templates])
+        for key in keys:
+            value, expected_value = response.context[key], expected.context[key]
+            if not isinstance(value, (int, str, type(None), Village, Speaker, LanguageRecord)):
+                value, expected_value = list(value), list(expected_value)
+            self.assertEqual(value, expected_value, f'{url} {key}')
+
+    def test_read_views_match_sync_views(self):
+        record = self.records[0]
+        pages = [
+            (reverse('index'), ['total_records', 'total_villages', 'total_speakers', 'recent_records']),
+            (reverse('record_list') + '?page=2', ['records', 'villages', 'onomatopoeia_types', 'pagination_query']),
+            (reverse('record_list') + f'?onomatopoeia_type=AABB&village={self.village.id}', ['records', 'pagination_query']),
+            (reverse('record_detail', args=[record.id]), ['record', 'similar_links', 'annotation_tiers']),
+            (reverse('village_records', args=[self.village.id]) + '?radius=2000',
+             ['village', 'radius', 'nearby_villages', 'nearby_geographic', 'records']),
+            (reverse('speaker_records', args=[self.speaker.id]), ['speaker', 'records']),
+            (reverse('map_view') + '?year=2023', ['all_years', 'selected_year']),
+        ]
+        for url, keys in pages:
+            self._assert_same_context(url, keys)
+
+        self.assertEqual(self._async_get(reverse('record_detail', args=[0])).status_code, 404)
+        self.assertIn('folium', self._async_get(reverse('map_view')).context['map_html'])
+
+    def _post_both(self, url_name, data, file_name):
+        """同期版と非同期版に同じ内容を送り、登録されたレコードを返す"""
+        sync_url = 'https://storage.example/sync'
+        async_url = 'https://storage.example/async'
+        with mock.patch('language_archive.views.upload_to_supabase', return_value=sync_url) as upload, \
+                mock.patch('language_archive.async_views.aupload_to_supabase', return_value=async_url) as aupload, \
+                mock.patch('language_archive.views.schedule_fingerprint') as fingerprint:
+            response = self.client.post(reverse(url_name), dict(data, file=SimpleUploadedFile(file_name, b'a' * 10)))
+            self.assertEqual(response.status_code, 302)
+            with self._async_views():
+                response = async_to_sync(self.async_client.post)(
+                    reverse(url_name), dict(data, file=SimpleUploadedFile(file_name, b'a' * 10)),
+                )
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(upload.call_args.args[1:], aupload.call_args.args[1:])
+        return sync_url, async_url, fingerprint
+
+    def test_language_upload_matches_sync_view(self):
+        sync_url, async_url, fingerprint = self._post_both('upload_language_record', {
+            'file_type': 'audio', 'onomatopoeia_text': 'ぱらぱら', 'meaning': '小雨', 'usage_example': '用例',
+            'onomatopoeia_type': self.onomatopoeia_type.id, 'speaker': self.speaker.id, 'recorded_date': '2024-02-01',
+        }, 'para.wav')
+
+        fields = ['onomatopoeia_text', 'meaning', 'file_type', 'youtube_url', 'speaker_id', 'village_id', 'onomatopoeia_type_id']
+        sync_record, async_record = LanguageRecord.objects.filter(onomatopoeia_text='ぱらぱら').order_by('id')
+        self.assertEqual([getattr(sync_record, f) for f in fields], [getattr(async_record, f) for f in fields])
+        self.assertEqual((sync_record.file_path, async_record.file_path), (sync_url, async_url))
+        self.assertEqual(async_record.village, self.village)
+        self.assertEqual([call.args[0] for call in fingerprint.call_args_list], [[sync_record], [async_record]])
+        self.assertTrue(RecordCard.objects.filter(record=async_record).exists())
+
+    def test_geographic_upload_matches_sync_view(self):
+        sync_url, async_url, _ = self._post_both('upload_geographic_record', {
+            'title': '海岸', 'content_type': 'drone_photo', 'description': '海岸の空撮', 'village': self.village.id,
+            'captured_date': '2024-02-01',
+        }, 'coast.jpg')
+
+        fields = ['title', 'content_type', 'village_id', 'latitude', 'longitude', 'youtube_url']
+        sync_record, async_record = GeographicRecord.objects.filter(title='海岸').order_by('id')
+        self.assertEqual([getattr(sync_record, f) for f in fields], [getattr(async_record, f) for f in fields])
+        self.assertEqual((sync_record.file_path, async_record.file_path), (sync_url, async_url))
+        self.assertEqual(async_record.latitude, self.village.latitude)
+
+    def test_async_storage_upload_reads_file_off_the_event_loop(self):
+        import httpx
+        from .services import aupload_to_supabase
+
+        threads = {}
+
+        async def handler(request):
+            threads['loop'] = threading.current_thread()
+            threads['body'] = b''.join([chunk async for chunk in request.stream])
+            return httpx.Response(200)
+
+        file = SimpleUploadedFile('zaa.wav', b'a' * 100, content_type='audio/wav')
+        chunks = file.chunks
+
+        def recording_chunks(*args, **kwargs):
+            for chunk in chunks(chunk_size=10):
+                threads.setdefault('reads', set()).add(threading.current_thread())
+                yield chunk
+
+        file.chunks = recording_chunks
+        client = httpx.AsyncClient
+        with mock.patch.dict(os.environ, {'SUPABASE_URL': 'https://storage.example', 'SUPABASE_SERVICE_ROLE_KEY': 'key'}), \
+                mock.patch('httpx.AsyncClient', lambda **kwargs: client(transport=httpx.MockTransport(handler), **kwargs)):
+            url = async_to_sync(aupload_to_supabase)(file, 'audio-files', 'language/audio/')
+
+        self.assertTrue(url.startswith('https://storage.example/storage/v1/object/public/audio-files/language/audio/'))
+        self.assertEqual(threads['body'], b'a' * 100)
+        self.assertNotIn(threads['loop'], threads['reads'])
+
+
+class WarmupTests(TestCase):
+    """ウォームアップが各ステップを実行し、失敗したステップはログに記録して次に進むことを確認する"""
+
+    def test_steps_run_and_failures_are_skipped(self):
+        from . import warmup
+
+        def broken():
+            raise RuntimeError('folium がありません')
+
+        steps = [step for step in warmup.WARMUP_STEPS if step[0] in ('urls', 'templates', 'reference_data')]
+        steps.insert(1, ('broken', broken))
+        with mock.patch.object(warmup, 'WARMUP_STEPS', steps), \
+                mock.patch('language_archive.reference_data.get_reference_data') as get_reference_data, \
+                self.assertLogs('language_archive.warmup', 'WARNING') as logs:
+            results = warmup.warm_up()
+        self.assertEqual([name for name, _, _ in results], ['urls', 'broken', 'templates', 'reference_data'])
+        self.assertEqual([name for name, _, error in results if error], ['broken'])
+        self.assertIn('ウォームアップ失敗 (broken): folium がありません', logs.output[0])
+        # 失敗したステップの後のステップも実行される
+        get_reference_data.assert_called_once_with()
+
+    def test_phonetic_index_is_built_in_background(self):
+        from . import warmup
+
+        with mock.patch('language_archive.warmup.threading.Thread') as thread, \
+                mock.patch('language_archive.phonetic.get_phonetic_index') as get_phonetic_index:
+            warmup._build_phonetic_index()
+        # ワーカーの起動（post_worker_init）では索引の作成を待たない
+        get_phonetic_index.assert_not_called()
+        thread.return_value.start.assert_called_once_with()
+        self.assertIs(thread.call_args.kwargs['target'], warmup._build_phonetic_index_in_thread)
+
+
+@override_settings(DATABASE_ROUTERS=['language_archive.db_routers.ReadReplicaRouter'])
+class ReadReplicaRoutingTests(TestCase):
+    """読み取り系ビューはレプリカ、書き込みと書き込み直後の読み取りはプライマリを使うことを2つのSQLiteで確認する"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        # 同じ構成のデータをプライマリとレプリカに別々に作り、どちらを読んだか見分けられるようにする
+        for alias, label in (('default', 'プライマリ'), ('replica', 'レプリカ')):
+            village = Village.objects.using(alias).create(name=f'{label}集落', latitude=28.3, longitude=129.9)
+            speaker = Speaker.objects.using(alias).create(speaker_id='SPK001', age_range='70-79', gender='F', village=village)
+            onomatopoeia_type = OnomatopoeiaType.objects.using(alias).create(type_code='AABB', type_name='反復', description='')
+            LanguageRecord.objects.using(alias).create(
+                onomatopoeia_text=f'{label}の記録', meaning='意味', usage_example='用例', file_type='audio',
+                speaker=speaker, onomatopoeia_type=onomatopoeia_type, village=village,
+                recorded_date=datetime.date(2024, 1, 1),
+            )
+        self.record_id = LanguageRecord.objects.using('default').get().id
+
+    def test_read_views_use_replica(self):
+        response = self.client.get(reverse('record_list'))
+        self.assertContains(response, 'レプリカの記録')
+        self.assertNotContains(response, 'プライマリの記録')
+
+        response = self.client.get(reverse('record_detail', args=[self.record_id]))
+        self.assertContains(response, 'レプリカの記録')
+
+    def test_routing_is_reset_after_request(self):
+        self.client.get(reverse('record_list'))
+        self.assertEqual(router.db_for_read(LanguageRecord), 'default')
+
+    def test_upload_page_reads_primary(self):
+        response = self.client.get(reverse('upload_language_record'))
+        self.assertEqual([v['name'] for v in response.context['villages_data']], ['プライマリ集落'])
+
+    def test_upload_writes_primary_and_pins_reads_to_primary(self):
+        speaker = Speaker.objects.using('default').get()
+        response = self.client.post(reverse('upload_language_record'), {
+            'youtube_url': 'https://youtu.be/abcdefg',
+            'title': 'アップロード直後の記録',
+            'file_type': 'video',
+            'speaker': speaker.id,
+            'recorded_date': '2024-02-01',
+        })
+        self.assertRedirects(response, reverse('record_list'), fetch_redirect_response=False)
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(LanguageRecord.objects.using('default').count(), 2)
+        self.assertEqual(LanguageRecord.objects.using('replica').count(), 1)
+
+        # Cookie がある間はレプリカが追いついていなくても自分の書き込みが見える
+        response = self.client.get(reverse('record_list'))
+        self.assertContains(response, 'アップロード直後の記録')
+        self.assertContains(response, 'プライマリの記録')
+
+
+class LanguageRecordBatchUploadTests(ArchiveFixtureMixin, TestCase):
+    """一括アップロードで一部のファイルが失敗しても、成功したファイルの記録は登録されることを確認する"""
+
+    def setUp(self):
+        self.create_fixture()
+
+    def _post(self, files, items):
+        data = {
+            'files': files,
+            'speaker': self.speaker.id,
+            'recorded_date': '2024-03-01',
+            'file_type': 'audio',
+            'onomatopoeia_type': self.onomatopoeia_type.id,
+        }
+        for index, item in enumerate(items):
+            for key, value in item.items():
+                data[f'items-{index}-{key}'] = value
+        return self.client.post(reverse('upload_language_batch'), data, HTTP_ACCEPT='application/json')
+
+    def test_partial_failure_keeps_successful_uploads(self):
+        def fake_upload(file, bucket_name, file_prefix=""):
+            if file.name == 'broken.wav':
+                raise Exception('storage error')
+            return f'https://storage.example/{bucket_name}/{file_prefix}{file.name}'
+
+        files = [
+            SimpleUploadedFile('zaa.wav', b'a' * 10, content_type='audio/wav'),
+            SimpleUploadedFile('broken.wav', b'b' * 10, content_type='audio/wav'),
+            SimpleUploadedFile('goro.mp4', b'c' * 10, content_type='video/mp4'),
+            SimpleUploadedFile('missing.wav', b'd' * 10, content_type='audio/wav'),
+        ]
+        items = [
+            {'onomatopoeia_text': 'ざーざー', 'meaning': '雨', 'usage_example': '用例'},
+            {'onomatopoeia_text': 'ぱらぱら', 'meaning': '雨', 'usage_example': '用例'},
+            {'onomatopoeia_text': 'ごろごろ', 'meaning': '雷', 'usage_example': '用例', 'file_type': 'video'},
+            {'onomatopoeia_text': '', 'meaning': '', 'usage_example': ''},
+        ]
+        with mock.patch('language_archive.services.upload_to_supabase', side_effect=fake_upload):
+            response = self._post(files, items)
+
+        report = response.json()
+        self.assertEqual((report['succeeded'], report['failed']), (2, 2))
+        self.assertEqual([r['ok'] for r in report['results']], [True, False, True, False])
+        self.assertIn('storage error', report['results'][1]['error'])
+
+        records = LanguageRecord.objects.order_by('id')
+        self.assertEqual([r.onomatopoeia_text for r in records], ['ざーざー', 'ごろごろ'])
+        self.assertEqual(records[1].file_type, 'video')
+        self.assertEqual(records[1].file_path, 'https://storage.example/video-files/language/video/goro.mp4')
+        self.assertEqual(records[0].village, self.speaker.village)
+
+
+class AdminChangelistCacheTests(ArchiveFixtureMixin, TestCase):
+    """管理画面のフィルター選択肢がキャッシュされ、データの書き込みで更新されることを確認する"""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.create_fixture()
+        self._create_record(datetime.date(2023, 5, 1))
+
+    def _create_record(self, recorded_date):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_record(recorded_date=recorded_date)
+
+    def test_changelists_render(self):
+        for model in ('village', 'speaker', 'onomatopoeiatype', 'languagerecord', 'geographicrecord', 'storagedeletion'):
+            response = self.client.get(reverse(f'admin:language_archive_{model}_changelist'))
+            self.assertEqual(response.status_code, 200, model)
+
+    def test_filter_choices_are_cached_until_data_changes(self):
+        url = reverse('admin:language_archive_languagerecord_changelist')
+        self.client.get(url)
+        # 2回目はフィルターの選択肢（集落・オノマトペ型・収録年）をキャッシュから返す（セッション・ユーザー・件数・一覧のみ）
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertContains(response, '2023年')
+        self.assertNotContains(response, '2024年')
+
+        self._create_record(datetime.date(2024, 6, 1))
+        response = self.client.get(url)
+        self.assertContains(response, '2024年')
+
+        response = self.client.get(url, {'recorded_date_year': '2024'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class RecordVillageDenormalizationTests(ArchiveFixtureMixin, TestCase):
+    """言語記録の関連集落（非正規化）が話者の集落と一致し続けることを確認する"""
+
+    def setUp(self):
+        self.create_fixture()
+        self.onotsu = self.village
+        self.shidooke = Village.objects.create(name='志戸桶', latitude=28.3, longitude=129.9)
+
+    def test_save_copies_speaker_village(self):
+        record = self.create_record()
+        self.assertEqual(record.village, self.onotsu)
+
+        # 話者のいない記録は手動で設定した集落のまま
+        record = self.create_record(speaker=None, village=self.shidooke)
+        self.assertEqual(record.village, self.shidooke)
+
+    def test_speaker_village_change_updates_records(self):
+        record = self.create_record()
+        self.speaker.village = self.shidooke
+        self.speaker.save()
+        record.refresh_from_db()
+        self.assertEqual(record.village, self.shidooke)
+
+    def test_check_and_backfill(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from .record_village import backfill_record_village, inconsistent_records
+
+        records = [self.create_record() for _ in range(5)]
+        # save() を通らない書き込みでずれた状態を作る
+        LanguageRecord.objects.filter(id__in=[records[1].id, records[3].id]).update(village=self.shidooke)
+        LanguageRecord.objects.filter(id=records[4].id).update(village=None)
+        self.assertEqual(sorted(inconsistent_records().values_list('id', flat=True)), [records[1].id, records[3].id, records[4].id])
+        with self.assertRaises(CommandError):
+            call_command('sync_record_village', '--check', stdout=io.StringIO())
+
+        self.assertEqual(backfill_record_village(chunk_size=2), 3)
+        self.assertFalse(inconsistent_records().exists())
+        # 補正した記録の一覧のカードも作り直す
+        self.assertEqual(RecordCard.objects.get(record=records[4]).village_name, '小野津')
+        call_command('sync_record_village', '--check', stdout=io.StringIO())
+
+    def test_village_filters_do_not_join_speaker(self):
+        self.create_record()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('record_list'), {'village': self.onotsu.id})
+            self.client.get(reverse('village_records', args=[self.onotsu.id]))
+        self.assertContains(response, 'ざーざー')
+        # 一覧は一覧のカードの表だけを読み、話者を JOIN しない
+        card_queries = [q['sql'] for q in queries.captured_queries if 'language_archive_recordcard' in q['sql']]
+        self.assertTrue(card_queries)
+        for sql in card_queries:
+            self.assertNotIn('JOIN', sql)
+
+
+class SimilarRecordTests(ArchiveFixtureMixin, TestCase):
+    """類似記録の全件計算・追加分の計算と、詳細ページでの表示を確認する"""
+
+    def setUp(self):
+        self.create_fixture()
+        self.rain = self._create_record('ざーざー', '雨が強く降る様子')
+        self.rain_katakana = self._create_record('ザーザー', '雨が強く降るさま')
+        self.thunder = self._create_record('ごろごろ', '雷が鳴る音')
+        self._create_record('きらきら', '光る様子')
+
+    def _create_record(self, text, meaning):
+        return self.create_record(text, meaning=meaning)
+
+    def _neighbours(self, record):
+        return list(record.similar_links.order_by('rank').values_list('similar_id', flat=True))
+
+    def test_rebuild_ranks_closest_forms_first(self):
+        from .similarity import rebuild_similar_records
+        result = rebuild_similar_records(top_k=2)
+        self.assertEqual(result['records'], 4)
+        self.assertEqual(self._neighbours(self.rain)[0], self.rain_katakana.id)
+        self.assertNotIn(self.rain.id, self._neighbours(self.rain))
+
+    def test_incremental_update_adds_new_records_to_existing_neighbours(self):
+        from .models import SimilarityIndexState
+        from .similarity import rebuild_similar_records, update_similar_records
+        rebuild_similar_records(top_k=2)
+        drizzle = self._create_record('ざーざー', '雨が降る様子')
+
+        # 記録が少ないため、追加分の割合で全件計算に切り替わらないようにする
+        with mock.patch('language_archive.similarity.FULL_REBUILD_RATIO', 1.0), \
+                mock.patch('language_archive.similarity.rebuild_similar_records') as rebuild:
+            result = update_similar_records(top_k=2)
+        rebuild.assert_not_called()
+        self.assertEqual((result['mode'], result['records']), ('incremental', 1))
+        self.assertEqual(self._neighbours(drizzle)[0], self.rain.id)
+        self.assertIn(drizzle.id, self._neighbours(self.rain))
+        self.assertEqual(list(self.rain.similar_links.values_list('rank', flat=True).order_by('rank')), [1, 2])
+        # 次回の割合の判定は、追加分を含めた記録数に対して行う
+        self.assertEqual(SimilarityIndexState.objects.get().record_count, 5)
+
+    def test_detail_page_shows_similar_records(self):
+        from .similarity import rebuild_similar_records
+        rebuild_similar_records()
+        response = self.client.get(reverse('record_detail', args=[self.rain.id]))
+        self.assertContains(response, '似ている記録')
+        self.assertEqual(response.context['similar_links'][0].similar, self.rain_katakana)
+
+
+class AnalyticsSnapshotTests(ArchiveFixtureMixin, TestCase):
+    """集計スナップショットの作成と、集計ページがリクエスト時に集計しないことを確認する"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.create_fixture(age_range='80-89')
+        elder, repeat = self.speaker, self.onomatopoeia_type
+        shidooke = Village.objects.create(name='志戸桶', latitude=28.3, longitude=129.9)
+        other = OnomatopoeiaType.objects.create(type_code='ABCD', type_name='その他', description='')
+        younger = Speaker.objects.create(speaker_id='SPK002', age_range='40-49', gender='M', village=shidooke)
+        for speaker, onomatopoeia_type, frequency in [
+            (elder, repeat, 'daily'), (elder, repeat, 'daily'), (elder, other, 'often'),
+            (younger, other, 'rarely'), (younger, other, ''),
+        ]:
+            self.create_record(speaker=speaker, onomatopoeia_type=onomatopoeia_type, language_frequency=frequency)
+
+    def _table(self, tables, slug):
+        return next(table for table in tables if table['slug'] == slug)
+
+    def test_build_and_show_snapshot(self):
+        from .analytics import build_analytics_snapshot, latest_analytics
+
+        snapshot = build_analytics_snapshot()
+        self.assertEqual(snapshot.record_count, 5)
+        # データが変わっていなければ作り直さない
+        self.assertIsNone(build_analytics_snapshot())
+        # 集計に使わない表への書き込みでは作り直さない
+        from .data_version import bump_data_version
+        GeographicRecord.objects.create(
+            title='空撮', content_type='drone_video', description='', village=Village.objects.first(),
+            latitude=28.3, longitude=129.9, captured_date=datetime.date(2024, 1, 1), youtube_url='https://youtu.be/abcdefg',
+        )
+        bump_data_version()
+        self.assertIsNone(build_analytics_snapshot())
+
+        _, tables = latest_analytics()
+        by_age = self._table(tables, 'frequency_by_age')
+        self.assertEqual(by_age['columns'], ['日常的に使用', 'よく使用', 'ほとんど使用しない', '未選択', '合計'])
+        self.assertEqual([row['label'] for row in by_age['rows']], ['40代', '80代', '合計'])
+        self.assertEqual(by_age['rows'][1]['values'], [2, 1, 0, 0, 3])
+        dominant = self._table(tables, 'dominant_type_by_village')
+        self.assertEqual([(row['label'], row['top'], row['values'][0]) for row in dominant['rows']], [
+            ('小野津', 'AABB: 反復', 66.7), ('志戸桶', 'ABCD: その他', 100.0),
+        ])
+
+        # ページはスナップショットを読むだけ（集計のクエリを発行しない）
+        self.client.get(reverse('analytics'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('analytics'))
+        self.assertContains(response, '集落 × オノマトペ型')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('language_archive_analyticssnapshot', queries[0]['sql'])
+
+    def test_new_data_creates_new_snapshot(self):
+        from .analytics import build_analytics_snapshot
+
+        first = build_analytics_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            LanguageRecord.objects.filter(language_frequency='').update(language_frequency='sometimes')
+            Village.objects.first().save()
+        second = build_analytics_snapshot()
+        self.assertNotEqual(first.id, second.id)
+        self.assertNotEqual(first.data_version, second.data_version)
+
+
+class PhoneticSearchTests(ArchiveFixtureMixin, TestCase):
+    """音声記号の分節化・距離、BK木の検索結果、記録一覧の音声記号検索を確認する"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from . import phonetic
+        cache.clear()
+        phonetic._cached = None
+        self.create_fixture()
+        self.kaka = self._create_record('かかー', 'kaka')
+        self.long_kaka = self._create_record('かーか', '[kaːka]')
+        self.gaka = self._create_record('がか', 'gaka')
+        self._create_record('ぴかぴか', 'pʰikapʰika')
+
+    def tearDown(self):
+        from . import phonetic
+        phonetic._cached = None
+
+    def _create_record(self, text, notation):
+        return self.create_record(text, phonetic_notation=notation)
+
+    def test_tokenize_and_distance(self):
+        from .phonetic import _prepare, segment_distance, tokenize_ipa
+
+        self.assertEqual(tokenize_ipa('[t͡ɕʰaː.ˈka]'), ('t͡ɕʰ', 'aː', 'k', 'a'))
+        distance = lambda a, b: segment_distance(_prepare(tokenize_ipa(a)), _prepare(tokenize_ipa(b)))
+        # 補助記号だけの違いは半分節、それ以外の置換・挿入・削除は1分節（半分節単位で 1 と 2）
+        self.assertEqual(distance('kaka', 'kaːka'), 1)
+        self.assertEqual(distance('kaka', 'gaka'), 2)
+        self.assertEqual(distance('kaka', 'kak'), 2)
+        self.assertEqual(distance('kaka', 'kaka'), 0)
+
+    def test_bk_tree_matches_brute_force(self):
+        from .phonetic import PhoneticIndex
+
+        words = ['kaka', 'kaːka', 'gaka', 'pʰikapʰika', 'pikapika', 'goɾogoɾo', 'koɾokoɾo', 'zaːzaː', 'saːsaː', 'ka']
+        index = PhoneticIndex(enumerate(words, start=1))
+        self.assertEqual(index.nodes, len(words))
+        for query in words + ['kiki', 'goɾo']:
+            for max_distance in range(0, 6):
+                results, _ = index.search_with_stats(query, max_distance)
+                expected, _ = index.search_with_stats(query, max_distance, brute_force=True)
+                self.assertEqual(results, expected)
+
+    def test_search_and_rebuild_after_data_change(self):
+        from .phonetic import phonetic_search
+
+        with mock.patch('language_archive.phonetic.REBUILD_IN_BACKGROUND', False):
+            self.assertEqual(phonetic_search('kaka', 0.5), [(self.kaka.id, 0.0), (self.long_kaka.id, 0.5)])
+            with self.captureOnCommitCallbacks(execute=True):
+                kakka = self._create_record('かっか', 'kakka')
+            self.assertIn((kakka.id, 1.0), phonetic_search('kaka', 1))
+
+    def test_other_writes_keep_the_index(self):
+        from .phonetic import build_phonetic_index, phonetic_search
+
+        with mock.patch('language_archive.phonetic.REBUILD_IN_BACKGROUND', False):
+            phonetic_search('kaka')
+            # 集落の保存でデータバージョンは変わるが、言語記録は変わっていないため索引を作り直さない
+            with self.captureOnCommitCallbacks(execute=True):
+                self.speaker.village.save()
+            with mock.patch('language_archive.phonetic.build_phonetic_index', side_effect=build_phonetic_index) as build:
+                self.assertEqual(phonetic_search('kaka', 0)[0], (self.kaka.id, 0.0))
+                phonetic_search('kaka', 0)
+            build.assert_not_called()
+
+    def test_record_list_orders_by_distance(self):
+        with mock.patch('language_archive.phonetic.REBUILD_IN_BACKGROUND', False):
+            response = self.client.get(reverse('record_list'), {'phonetic': 'kaka', 'distance': '1'})
+        self.assertEqual([record.id for record in response.context['records']], [
+            self.kaka.id, self.long_kaka.id, self.gaka.id,
+        ])
+
+
+@mock.patch('language_archive.sync.SETTLE_SECONDS', 0)
+class DeltaSyncTests(ArchiveFixtureMixin, TestCase):
+    """差分同期APIのカーソル・墓標・gzip 圧縮を確認する"""
+
+    def setUp(self):
+        self.create_fixture(notes='非公開')
+        self.records = [self.create_record(f'記録{i}') for i in range(3)]
+
+    def _sync(self, cursor=None, **params):
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get(reverse('sync_changes'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def _ids(self, payload, stream):
+        return [row[0] for row in payload['changes'].get(stream, {}).get('rows', [])]
+
+    def test_initial_sync_pages_through_everything(self):
+        first = self._sync(limit=3)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(self._ids(first, 'village'), [self.village.id])
+        self.assertNotIn('notes', first['changes']['speaker']['fields'])
+        rest = self._sync(first['cursor'], limit=3)
+        self.assertEqual(self._ids(first, 'language_record') + self._ids(rest, 'language_record'),
+                         [record.id for record in self.records])
+        self.assertFalse(self._sync(rest['cursor'])['changes'])
+
+    def test_resync_returns_only_changes_and_tombstones(self):
+        cursor = self._sync()['cursor']
+        deleted_record_id, village_id = self.records[1].id, self.village.id
+        self.records[0].meaning = '新しい意味'
+        self.records[0].save()
+        self.records[1].delete()
+        self.village.delete()
+
+        payload = self._sync(cursor)
+        self.assertEqual(self._ids(payload, 'language_record'), [self.records[0].id, self.records[2].id])
+        self.assertEqual(self._ids(payload, 'speaker'), [self.speaker.id])
+        speaker_row = dict(zip(payload['changes']['speaker']['fields'], payload['changes']['speaker']['rows'][0]))
+        self.assertIsNone(speaker_row['village_id'])
+        self.assertEqual(payload['deleted'], {'language_record': [deleted_record_id], 'village': [village_id]})
+        self.assertEqual(self._sync(payload['cursor'])['deleted'], {})
+
+    def test_gzip_and_bad_cursors(self):
+        response = self.client.get(reverse('sync_changes'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(self.client.get(reverse('sync_changes'), {'cursor': 'xyz'}).status_code, 400)
+
+        from .sync import encode_cursor
+        old = encode_cursor({}, datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(self.client.get(reverse('sync_changes'), {'cursor': old}).status_code, 410)
+
+
+class VillagePackageTests(ArchiveFixtureMixin, TestCase):
+    """集落パッケージ（ZIP）の作成と、ダウンロードの Range 転送を確認する"""
+
+    def setUp(self):
+        self.create_fixture()
+        self.audio = self.create_record(file_path='https://storage.example/audio-files/rain.mp3')
+        self.broken = self.create_record(
+            'ごろごろ', meaning='雷', file_path='https://storage.example/audio-files/missing.mp3',
+            recorded_date=datetime.date(2024, 1, 2),
+        )
+
+    def _media(self, url, chunk_size):
+        if url.endswith('missing.mp3'):
+            raise OSError('404')
+        return iter([b'ID3', b'-audio'])
+
+    def _build(self):
+        from .packages import build_package, current_package
+
+        uploaded = io.BytesIO()
+
+        def upload(chunks, bucket_name, storage_path, content_type):
+            for chunk in chunks:
+                uploaded.write(chunk)
+            return storage_path
+
+        package = current_package(self.village)
+        with mock.patch('language_archive.services.open_media_stream', side_effect=self._media), \
+                mock.patch('language_archive.services.upload_stream_to_supabase', side_effect=upload), \
+                mock.patch('language_archive.services.delete_from_supabase'), \
+                self.assertLogs('language_archive.packages', 'WARNING'):
+            package = build_package(package.id)
+        return package, uploaded
+
+    def test_package_contains_media_and_metadata(self):
+        import json
+        import zipfile
+
+        package, uploaded = self._build()
+        self.assertEqual((package.status, package.file_count, package.size), ('ready', 1, len(uploaded.getvalue())))
+        with zipfile.ZipFile(uploaded) as archive:
+            self.assertEqual(archive.namelist(), [f'media/records/{self.audio.id}_rain.mp3', 'records.csv', 'metadata.json'])
+            self.assertEqual(archive.read(f'media/records/{self.audio.id}_rain.mp3'), b'ID3-audio')
+            self.assertTrue(archive.read('records.csv').decode('utf-8-sig').startswith('ID,オノマトペ,意味'))
+            metadata = json.loads(archive.read('metadata.json'))
+        self.assertEqual(metadata['missing_files'], [self.broken.file_path])
+        self.assertEqual([row['file'] for row in metadata['language_records']], [f'media/records/{self.audio.id}_rain.mp3', ''])
+
+    def test_version_follows_village_data(self):
+        from .packages import package_version
+
+        version = package_version(self.village)
+        self.assertEqual(package_version(self.village), version)
+        self.audio.meaning = '大雨'
+        self.audio.save()
+        self.assertNotEqual(package_version(self.village), version)
+
+    def test_download_forwards_range_and_checks_if_range(self):
+        package, _ = self._build()
+        upstream = mock.Mock(status_code=206, headers={'Content-Length': '4', 'Content-Range': 'bytes 10-13/100'})
+        upstream.iter_content.return_value = iter([b'data'])
+
+        url = reverse('village_package', args=[self.village.id])
+        with mock.patch('language_archive.views.open_storage_object', return_value=upstream) as open_object:
+            response = self.client.get(url, HTTP_RANGE='bytes=10-', HTTP_IF_RANGE=f'"{package.version}"')
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join(response.streaming_content), b'data')
+            self.assertEqual(response['Content-Range'], 'bytes 10-13/100')
+            self.assertEqual(response['ETag'], f'"{package.version}"')
+            self.assertEqual(open_object.call_args.args[2], 'bytes=10-')
+
+            # 作り直し前のパッケージを指す If-Range では、Range を転送せず全体を返す
+            self.client.get(url, HTTP_RANGE='bytes=10-', HTTP_IF_RANGE='"old"')
+            self.assertIsNone(open_object.call_args.args[2])
+
+    def test_download_before_build_queues_package(self):
+        response = self.client.get(reverse('village_package', args=[self.village.id]))
+        self.assertRedirects(response, reverse('village_records', args=[self.village.id]))
+        self.assertEqual(self.village.packages.get().status, 'pending')
+
+    @override_settings(VILLAGE_PACKAGE_BUILD_IN_BACKGROUND=True)
+    def test_background_build_starts_once(self):
+        from .packages import current_package
+
+        with mock.patch('language_archive.packages.threading.Thread') as thread:
+            package = current_package(self.village)
+            current_package(self.village)
+        # 2回目の要求では作成中のため、スレッドを始めない
+        self.assertEqual(thread.call_count, 1)
+        self.assertEqual(thread.call_args.kwargs['args'], (package.id,))
+        self.assertEqual(self.village.packages.get().status, 'building')
+
+
+class TracingTests(TestCase):
+    """リクエストごとのトレース（テンプレート・DB・ストレージのスパン）と show_traces の表示を確認する"""
+
+    def setUp(self):
+        import tempfile
+        from . import tracing
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.trace_file = f'{directory.name}/traces.jsonl'
+        settings_override = override_settings(TRACING_EXPORTER='jsonl', TRACING_FILE=self.trace_file)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        tracing.reset_exporter()
+        self.addCleanup(tracing.reset_exporter)
+
+    def _spans(self):
+        import json
+        from .tracing import flush
+
+        flush()
+        with open(self.trace_file, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_request_trace_and_viewer(self):
+        from django.core.management import call_command
+
+        self.client.get(reverse('record_list'))
+        spans = {span['name']: span for span in self._spans()}
+        root = spans['GET /records/']
+        self.assertIsNone(root['parent_id'])
+        self.assertEqual(root['attributes']['status'], 200)
+        self.assertGreater(root['attributes']['db.queries'], 0)
+        template = spans['template.render']
+        self.assertEqual((template['parent_id'], template['attributes']['template']),
+                         (root['span_id'], 'language_archive/record_list.html'))
+
+        out = io.StringIO()
+        call_command('show_traces', file=self.trace_file, stdout=out)
+        self.assertIn('GET /records/', out.getvalue())
+        self.assertIn('template.render', out.getvalue())
+        self.assertIn('p99', out.getvalue())
+
+    @mock.patch.dict('os.environ', {'SUPABASE_URL': 'https://storage.example', 'SUPABASE_ANON_KEY': 'key'})
+    def test_concurrent_uploads_join_the_trace(self):
+        from .services import upload_files_concurrently
+        from .tracing import span
+
+        uploads = [
+            (i, SimpleUploadedFile(f'{i}.mp3', b'ID3', content_type='audio/mpeg'), 'audio-files', '')
+            for i in range(3)
+        ]
+        with mock.patch('requests.post', return_value=mock.Mock(status_code=200)), span('job'):
+            upload_files_concurrently(uploads)
+        spans = self._spans()
+        batch = next(span for span in spans if span['name'] == 'storage.upload_batch')
+        uploads = [span for span in spans if span['name'] == 'storage.upload']
+        self.assertEqual(len(uploads), 3)
+        self.assertTrue(all(span['parent_id'] == batch['span_id'] for span in uploads))
+        self.assertEqual({span['trace_id'] for span in spans}, {batch['trace_id']})
+
+
+@mock.patch('language_archive.storage_check.RETRY_BACKOFF', 0.01)
+class StorageCheckTests(ArchiveFixtureMixin, TestCase):
+    """check_storage をローカルのスタブサーバーに対して実行し、判定・レポート・続きからの確認を確かめる"""
+
+    def setUp(self):
+        import http.server
+        import tempfile
+        import threading
+        import time
+
+        # パス → (ステータス, Content-Type, サイズ, 待ち時間)。値がリストなら要求ごとに先頭から使う
+        self.responses = {
+            '/ok.mp3': (200, 'audio/mpeg', 5, 0),
+            '/thumb.jpg': (200, 'image/jpeg', 3, 0),
+            '/gone.mp3': (404, 'application/json', 0, 0),
+            '/flaky.mp3': [(503, 'text/plain', 0, 0), (200, 'audio/mpeg', 7, 0)],
+            '/wrong.mp3': (200, 'text/html', 120, 0),
+            '/slow.jpg': (200, 'image/jpeg', 3, 0.3),
+        }
+        responses = self.responses
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                response = responses.get(self.path, (404, 'text/plain', 0, 0))
+                if isinstance(response, list):
+                    response = response.pop(0) if len(response) > 1 else response[0]
+                status, content_type, size, delay = response
+                time.sleep(delay)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(size))
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.report = f'{directory.name}/report.csv'
+
+        self.create_fixture()
+        self.records = [
+            self.create_record(f'記録{i}', file_path=f'{base}{path}', thumbnail_path=thumbnail)
+            for i, (path, thumbnail) in enumerate([
+                ('/ok.mp3', f'{base}/thumb.jpg'), ('/gone.mp3', ''), ('/flaky.mp3', ''), ('/wrong.mp3', ''),
+            ])
+        ]
+        from .models import GeographicRecord
+        self.geographic = GeographicRecord.objects.create(
+            title='空撮', content_type='drone_photo', file_path=f'{base}/thumb.jpg', thumbnail_path=f'{base}/slow.jpg',
+            description='', captured_date=datetime.date(2024, 1, 1),
+        )
+
+    def _check(self, *args):
+        from django.core.management import call_command
+
+        out = io.StringIO()
+        call_command('check_storage', '--slow-ms', '200', '--rate', '0', '--report', self.report, *args, stdout=out)
+        return out.getvalue()
+
+    def _report(self):
+        import csv
+
+        with open(self.report, encoding='utf-8-sig', newline='') as f:
+            return [(row['モデル'], row['URL'].rsplit('/', 1)[1], row['状態']) for row in csv.DictReader(f)]
+
+    def test_report_lists_missing_mismatched_and_slow_objects(self):
+        from .models import StorageCheckRun, StorageObjectCheck
+
+        self._check()
+        self.assertEqual(self._report(), [
+            ('geographic_record', 'slow.jpg', '応答が遅い'),
+            ('language_record', 'gone.mp3', 'ファイルなし'),
+            ('language_record', 'wrong.mp3', '不一致'),
+        ])
+        run = StorageCheckRun.objects.get()
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual((run.checked, run.problem_count), (7, 3))
+        flaky = StorageObjectCheck.objects.get(object_id=self.records[2].id, field='file_path')
+        self.assertEqual((flaky.status, flaky.size), ('ok', 7))
+
+        # 前回から大きさが変わったファイルは不一致になる
+        self.responses['/ok.mp3'] = (200, 'audio/mpeg', 9, 0)
+        self._check()
+        self.assertIn(('language_record', 'ok.mp3', '不一致'), self._report())
+
+    def test_interrupted_check_resumes(self):
+        from .models import StorageCheckRun
+
+        out = self._check('--limit', '2')
+        self.assertIn('未完了', out)
+        run = StorageCheckRun.objects.get()
+        self.assertEqual((run.position, run.checked), ({'language_record': self.records[1].id}, 3))
+
+        out = self._check()
+        self.assertIn('前回の続き', out)
+        run.refresh_from_db()
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(run.checked, 7)
+        self.assertEqual(StorageCheckRun.objects.count(), 1)
+
+
+@mock.patch.dict('os.environ', {'SUPABASE_URL': 'https://storage.example', 'SUPABASE_ANON_KEY': 'key'})
+class StorageGarbageCollectionTests(ArchiveFixtureMixin, TestCase):
+    """collect_storage_garbage が参照されていない古いファイルだけを削除し、削除記録を残すことを確認する"""
+
+    def setUp(self):
+        self.create_fixture()
+        self.create_record(
+            file_path='https://storage.example/storage/v1/object/public/audio-files/language/audio/kept.mp3',
+            thumbnail_path='https://storage.example/storage/v1/object/public/image-files/thumb%20nail.jpg',
+        )
+        old = '2024-01-01T00:00:00.000Z'
+        new = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.buckets = {
+            'audio-files': [[
+                ('language/audio/kept.mp3', old, 100),
+                ('language/audio/orphan.mp3', old, 2048),
+                ('language/audio/uploading.mp3', new, 10),
+            ]],
+            'image-files': [[('thumb nail.jpg', old, 5), ('orphan.jpg', old, 7)]],
+        }
+        self.deleted = []
+
+    def _gc(self, *args, delete=None):
+        from django.core.management import call_command
+
+        out = io.StringIO()
+        with mock.patch('language_archive.services.list_storage_objects', side_effect=lambda b: iter(self.buckets.get(b, []))), \
+                mock.patch('language_archive.services.delete_from_supabase', side_effect=delete) as delete_mock:
+            call_command('collect_storage_garbage', '--bucket', 'audio-files', '--bucket', 'image-files', *args, stdout=out)
+        return out.getvalue(), delete_mock
+
+    def test_deletes_only_old_unreferenced_objects(self):
+        from .models import StorageDeletion
+
+        with self.assertLogs('language_archive.storage_gc', 'INFO'):
+            out, delete = self._gc()
+        self.assertEqual(
+            sorted((c.args[0], sorted(c.args[1])) for c in delete.call_args_list),
+            [('audio-files', ['language/audio/orphan.mp3']), ('image-files', ['orphan.jpg'])],
+        )
+        self.assertEqual(
+            sorted(StorageDeletion.objects.values_list('bucket', 'path', 'size', 'status')),
+            [('audio-files', 'language/audio/orphan.mp3', 2048, 'deleted'), ('image-files', 'orphan.jpg', 7, 'deleted')],
+        )
+        self.assertIn('参照されているファイル: 2件', out)
+
+    def test_failed_deletions_are_recorded(self):
+        from django.core.management.base import CommandError
+        from .models import StorageDeletion
+
+        with self.assertLogs('language_archive.storage_gc', 'WARNING'), self.assertRaises(CommandError):
+            self._gc(delete=OSError('503'))
+        self.assertEqual(
+            sorted(StorageDeletion.objects.values_list('path', 'status')),
+            [('language/audio/orphan.mp3', 'failed'), ('orphan.jpg', 'failed')],
+        )
+
+    def test_offset_paging_does_not_skip_orphans(self):
+        from .storage_gc import ReferencedKeys, collect_garbage
+
+        # offset でページを進める一覧を、削除がその場で反映されるストレージの上で再現する
+        objects = [(f'orphan{i:02d}.mp3', '2024-01-01T00:00:00.000Z', 1) for i in range(10)]
+
+        def list_objects(bucket_name, page_size=3):
+            offset = 0
+            while True:
+                page = objects[offset:offset + page_size]
+                if not page:
+                    return
+                yield page
+                offset += page_size
+
+        def delete(bucket_name, paths):
+            objects[:] = [o for o in objects if o[0] not in paths]
+
+        with mock.patch('language_archive.services.list_storage_objects', side_effect=list_objects), \
+                mock.patch('language_archive.services.delete_from_supabase', side_effect=delete), \
+                self.assertLogs('language_archive.storage_gc', 'INFO'):
+            stats = collect_garbage('audio-files', ReferencedKeys(), batch_size=2)
+        self.assertEqual((stats['orphans'], stats['deleted']), (10, 10))
+        self.assertEqual(objects, [])
+
+    def test_dry_run_deletes_nothing(self):
+        from .models import StorageDeletion
+
+        out, delete = self._gc('--dry-run', '-v', '2')
+        delete.assert_not_called()
+        self.assertFalse(StorageDeletion.objects.exists())
+        self.assertIn('audio-files: 孤立ファイル 1件', out)
+        self.assertIn('language/audio/orphan.mp3', out)
+
+
+EAF_SAMPLE = '''<?xml version="1.0" encoding="UTF-8"?>
+<ANNOTATION_DOCUMENT AUTHOR="" FORMAT="3.0" VERSION="3.0">
+    <HEADER MEDIA_FILE="" TIME_UNITS="milliseconds"/>
+    <TIME_ORDER>
+        <TIME_SLOT TIME_SLOT_ID="ts1" TIME_VALUE="0"/>
+        <TIME_SLOT TIME_SLOT_ID="ts2"/>
+        <TIME_SLOT TIME_SLOT_ID="ts3" TIME_VALUE="2000"/>
+        <TIME_SLOT TIME_SLOT_ID="ts4" TIME_VALUE="65000"/>
+        <TIME_SLOT TIME_SLOT_ID="ts5" TIME_VALUE="66500"/>
+    </TIME_ORDER>
+    <TIER LINGUISTIC_TYPE_REF="utterance" TIER_ID="発話">
+        <ANNOTATION><ALIGNABLE_ANNOTATION ANNOTATION_ID="a1" TIME_SLOT_REF1="ts1" TIME_SLOT_REF2="ts2">
+            <ANNOTATION_VALUE>ザーザー 降る</ANNOTATION_VALUE></ALIGNABLE_ANNOTATION></ANNOTATION>
+        <ANNOTATION><ALIGNABLE_ANNOTATION ANNOTATION_ID="a2" TIME_SLOT_REF1="ts2" TIME_SLOT_REF2="ts3">
+            <ANNOTATION_VALUE>ごろごろ 鳴る</ANNOTATION_VALUE></ALIGNABLE_ANNOTATION></ANNOTATION>
+        <ANNOTATION><ALIGNABLE_ANNOTATION ANNOTATION_ID="a3" TIME_SLOT_REF1="ts4" TIME_SLOT_REF2="ts5">
+            <ANNOTATION_VALUE>ざーざー</ANNOTATION_VALUE></ALIGNABLE_ANNOTATION></ANNOTATION>
+    </TIER>
+    <TIER LINGUISTIC_TYPE_REF="translation" PARENT_REF="発話" TIER_ID="訳">
+        <ANNOTATION><REF_ANNOTATION ANNOTATION_ID="a4" ANNOTATION_REF="a1">
+            <ANNOTATION_VALUE>rain pours</ANNOTATION_VALUE></REF_ANNOTATION></ANNOTATION>
+        <ANNOTATION><REF_ANNOTATION ANNOTATION_ID="a5" ANNOTATION_REF="a2">
+            <ANNOTATION_VALUE></ANNOTATION_VALUE></REF_ANNOTATION></ANNOTATION>
+    </TIER>
+</ANNOTATION_DOCUMENT>
+'''.encode()
+
+TEXTGRID_SAMPLE = '''File type = "ooTextFile"
+Object class = "TextGrid"
+
+xmin = 0
+xmax = 3.5
+tiers? <exists>
+size = 2
+item []:
+    item [1]:
+        class = "IntervalTier"
+        name = "words"
+        xmin = 0
+        xmax = 3.5
+        intervals: size = 3
+        intervals [1]:
+            xmin = 0
+            xmax = 1.25
+            text = "pika ""pika"""
+        intervals [2]:
+            xmin = 1.25
+            xmax = 2
+            text = ""
+        intervals [3]:
+            xmin = 2
+            xmax = 3.5
+            text = "ぴか
+ぴか"
+    item [2]:
+        class = "TextTier"
+        name = "events"
+        xmin = 0
+        xmax = 3.5
+        points: size = 1
+        points [1]:
+            number = 2.5
+            mark = "雷"
+'''
+
+
+class AnnotationTests(ArchiveFixtureMixin, TestCase):
+    """書き起こし（EAF・TextGrid）の取り込みと、時間窓・語の検索を確認する"""
+
+    def setUp(self):
+        self.create_fixture()
+        self.record = self.create_record(file_path='https://storage.example/audio-files/session.mp3')
+
+    def _import(self, data, filename):
+        from .annotations import import_annotations
+
+        return import_annotations(self.record, io.BytesIO(data), filename=filename)
+
+    def test_eaf_import_and_window_queries(self):
+        from .annotations import search_token, segments_at, segments_in_window
+
+        self.assertEqual(self._import(EAF_SAMPLE, 'session.eaf'), {'発話': 3, '訳': 1})
+        # 時刻のない ts2 は ts1 と ts3 の間に補う。空の訳は取り込まない
+        tiers, segments, truncated = segments_in_window(self.record, 0, 60000)
+        self.assertEqual(segments, [
+            ('発話', 0, 1000, 'ザーザー 降る'), ('訳', 0, 1000, 'rain pours'), ('発話', 1000, 2000, 'ごろごろ 鳴る'),
+        ])
+        self.assertFalse(truncated)
+        self.assertEqual({tier.name: tier.max_duration_ms for tier in tiers}, {'発話': 1500, '訳': 1000})
+        self.assertEqual(segments_at(self.record, 66000), [('発話', 65000, 66500, 'ざーざー')])
+        self.assertEqual(segments_in_window(self.record, 500, 1500, tier_names=['訳'])[1], [('訳', 0, 1000, 'rain pours')])
+
+        # カタカナ・ひらがなを区別せず、語の単位で探す
+        token, found = search_token('ざーざー')
+        self.assertEqual([(s.tier.record_id, s.start_ms) for s in found], [(self.record.id, 0), (self.record.id, 65000)])
+
+        # かな・漢字は2-gram で索引するため、語の途中の文字列や1文字でも見つかる。ラテン文字は語の単位で探す
+        starts = lambda query: [s.start_ms for s in search_token(query)[1]]
+        self.assertEqual(starts('ざー'), [0, 65000])
+        self.assertEqual(starts('ろご'), [1000])
+        self.assertEqual(starts('鳴'), [1000])
+        self.assertEqual(starts('ざーざー 降る'), [0])
+        self.assertEqual(starts('ざーご'), [])
+        self.assertEqual(starts('rain'), [0])
+        self.assertEqual(starts('rai'), [])
+
+        # 同じ名前の層は置き換える
+        self.assertEqual(self._import(EAF_SAMPLE, 'session.eaf'), {'発話': 3, '訳': 1})
+        self.assertEqual(self.record.annotation_tiers.count(), 2)
+        self.assertEqual(len(search_token('ざーざー')[1]), 2)
+
+    def test_backfill_rebuilds_tokens(self):
+        from .annotations import search_token
+        from .backfill import BACKFILLS
+        from .models import AnnotationSegment, AnnotationToken
+
+        self._import(EAF_SAMPLE, 'session.eaf')
+        # 2-gram にする前の索引（区間の文字列を語に分けただけのもの）を再現する
+        AnnotationToken.objects.all().delete()
+        AnnotationToken.objects.bulk_create(
+            [AnnotationToken(token=token, segment=segment) for segment in AnnotationSegment.objects.all() for token in segment.text.split()]
+        )
+        self.assertEqual(search_token('ごろ')[1], [])
+
+        BACKFILLS['annotation_tokens'].run(0, AnnotationSegment.objects.latest('pk').pk)
+        self.assertEqual([s.start_ms for s in search_token('ごろ')[1]], [1000])
+
+    def test_textgrid_import(self):
+        from .annotations import AnnotationFormatError, segments_in_window
+
+        # Praat は ASCII 以外を含む TextGrid を UTF-16 で保存する
+        counts = self._import(TEXTGRID_SAMPLE.encode('utf-16'), 'session.TextGrid')
+        self.assertEqual(counts, {'words': 2, 'events': 1})
+        self.assertEqual(segments_in_window(self.record, 0, 10000)[1], [
+            ('words', 0, 1250, 'pika "pika"'), ('words', 2000, 3500, 'ぴか\nぴか'), ('events', 2500, 2500, '雷'),
+        ])
+        with self.assertRaises(AnnotationFormatError):
+            self._import(b'File type = "ooTextFile"\nObject class = "Pitch"\n', 'pitch.TextGrid')
+        with self.assertRaises(AnnotationFormatError):
+            self._import(b'', 'notes.txt')
+
+    def test_segments_api_returns_only_the_window(self):
+        self._import(EAF_SAMPLE, 'session.eaf')
+        url = reverse('record_segments', args=[self.record.id])
+        data = self.client.get(url, {'start': 60000, 'end': 120000}).json()
+        self.assertEqual(data['segments'], [['発話', 65000, 66500, 'ざーざー']])
+        self.assertEqual([tier['name'] for tier in data['tiers']], ['発話', '訳'])
+        self.assertEqual(self.client.get(url, {'start': 'x'}).status_code, 400)
+
+        results = self.client.get(reverse('segment_search'), {'token': 'ゴロゴロ'}).json()['results']
+        self.assertEqual([(r['record'], r['tier'], r['start_ms']) for r in results], [(self.record.id, '発話', 1000)])
+
+        response = self.client.get(reverse('record_detail', args=[self.record.id]))
+        self.assertContains(response, 'id="annotation-timeline"')
+
+
+def _synth_speech(seed, seconds, rate):
+    """倍音を重ねた音節が並ぶ、発話に似た合成音声"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    out = np.zeros(int(seconds * rate))
+    position = 0
+    while position < len(out):
+        n = int(rng.uniform(0.08, 0.4) * rate)
+        t = np.arange(n) / rate
+        f0 = rng.uniform(90, 300)
+        syllable = sum(np.sin(2 * np.pi * f0 * k * t + rng.uniform(0, 6)) * rng.uniform(0.1, 1) / k for k in range(1, 12))
+        syllable *= np.hanning(n) * rng.uniform(0.2, 1)
+        out[position:position + n] += syllable[:len(out) - position]
+        position += n + int(rng.uniform(0, 0.1) * rate)
+    return out / np.abs(out).max() * 0.8
+
+
+def _wav_bytes(samples, rate, channels=1):
+    import wave
+
+    import numpy as np
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+        writer.writeframes(np.repeat(pcm, channels).tobytes())
+    return buffer.getvalue()
+
+
+class AudioFingerprintTests(ArchiveFixtureMixin, TestCase):
+    """音声の指紋で、切り出し・雑音・サンプリング周波数の違う録音を同じ区間として見つけることを確認する"""
+
+    def setUp(self):
+        import numpy as np
+
+        self.create_fixture()
+        original = _synth_speech(1, 30, 22050)
+        # 7.5秒目から15秒を切り出し、音量を下げて雑音を足し、16kHz に変換したもの
+        start = int(7.5 * 22050)
+        excerpt = original[start:start + 15 * 22050] * 0.5 + np.random.default_rng(9).normal(0, 0.02, 15 * 22050)
+        from scipy.signal import resample_poly
+        self.media = {
+            'original.wav': _wav_bytes(original, 22050, channels=2),
+            'excerpt.wav': _wav_bytes(resample_poly(excerpt, 320, 441), 16000),
+            'other.wav': _wav_bytes(_synth_speech(2, 20, 22050), 22050),
+        }
+
+    def _media(self, url, chunk_size=None):
+        data = self.media[url.rsplit('/', 1)[-1]]
+        return iter([data[i:i + 65536] for i in range(0, len(data), 65536)])
+
+    def _record(self, name):
+        return self.create_record(name, file_path=f'https://storage.example/audio-files/language/audio/{name}')
+
+    def _fingerprint(self, *records):
+        from .fingerprint import schedule_fingerprint
+
+        with mock.patch('language_archive.fingerprint.FINGERPRINT_IN_BACKGROUND', False), \
+                mock.patch('language_archive.services.open_media_stream', side_effect=self._media), \
+                self.captureOnCommitCallbacks(execute=True):
+            schedule_fingerprint(records)
+
+    def test_excerpt_matches_original(self):
+        from .models import AudioMatch
+
+        original, other = self._record('original.wav'), self._record('other.wav')
+        self._fingerprint(original, other)
+        self.assertEqual(original.fingerprint_state.status, 'ok')
+        self.assertEqual(original.fingerprint_state.duration_ms, 30000)
+        self.assertFalse(AudioMatch.objects.exists())
+
+        excerpt = self._record('excerpt.wav')
+        self._fingerprint(excerpt)
+        match = excerpt.audio_matches.get()
+        self.assertEqual(match.other, original)
+        self.assertGreater(match.coverage, 0.2)
+        # 切り出し位置（7.5秒）のずれを、1フレーム（32ms）程度の誤差で求める
+        self.assertAlmostEqual(match.offset_ms, 7500, delta=64)
+        reverse_match = original.audio_matches.get()
+        self.assertEqual((reverse_match.other, reverse_match.offset_ms), (excerpt, -match.offset_ms))
+        self.assertLess(reverse_match.coverage, match.coverage)
+
+        # ファイルを差し替えて計算し直すと、古い一致は両側から消える
+        self.media['retake.wav'] = _wav_bytes(_synth_speech(3, 10, 22050), 22050)
+        excerpt.file_path = excerpt.file_path.replace('excerpt.wav', 'retake.wav')
+        excerpt.save()
+        self._fingerprint(excerpt)
+        self.assertEqual(excerpt.fingerprint_state.file_path, excerpt.file_path)
+        self.assertFalse(AudioMatch.objects.exists())
+
+    def test_unsupported_formats_are_recorded(self):
+        from django.core.management import call_command
+
+        from .fingerprint import fingerprint_record
+
+        record = self._record('session.mp3')
+        self.assertEqual(fingerprint_record(record.id).status, 'unsupported')
+
+        self.media['broken.wav'] = b'RIFF0000WAVEdata'
+        broken = self._record('broken.wav')
+        with mock.patch('language_archive.services.open_media_stream', side_effect=self._media):
+            call_command('fingerprint_audio', stdout=io.StringIO())
+        broken.refresh_from_db()
+        self.assertEqual(broken.fingerprint_state.status, 'unsupported')
+        self.assertFalse(broken.fingerprint_state.hash_count)
+
+
+class AutocompleteTests(ArchiveFixtureMixin, TestCase):
+    """入力補完の前方一致・表記の揺れのまとめ方と、データ変更時の差分更新を確認する"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from . import autocomplete
+        cache.clear()
+        autocomplete._indexes = None
+        self.create_fixture()
+        Village.objects.create(name='志戸桶', latitude=28.3, longitude=129.9)
+        self.other_speaker = Speaker.objects.create(speaker_id='SPK002', age_range='60-69', gender='M', village=self.village)
+        for text in ('ざーざー', 'ざーざー', 'ザーザー', 'ざあざあ', 'ごろごろ'):
+            self._create_record(text)
+
+    def tearDown(self):
+        from . import autocomplete
+        autocomplete._indexes = None
+
+    def _create_record(self, text):
+        return self.create_record(text)
+
+    def _suggest(self, source, q):
+        response = self.client.get(reverse('autocomplete'), {'source': source, 'q': q})
+        return [(r['text'], r['count'], r.get('id')) for r in response.json()['results']]
+
+    def test_prefix_index(self):
+        from .autocomplete import PrefixIndex
+
+        index = PrefixIndex([(1, 'ぴかぴか'), (2, 'ぴかっ'), (3, 'ピカピカ'), (4, 'ぱらぱら'), (5, '')])
+        self.assertEqual(index.search('ピカ'), [('ぴかっ', 1, None), ('ぴかぴか', 2, None)])
+        index.update(2, 'ぴかーっ')
+        index.remove(4)
+        self.assertEqual(index.search('ぴか', with_ids=True), [('ぴかぴか', 2, [1, 3]), ('ぴかーっ', 1, [2])])
+        self.assertEqual(index.search('ぱ'), [])
+        self.assertEqual(sorted(index.spellings('ぴかぴ')), ['ぴかぴか', 'ピカピカ'])
+        self.assertEqual(len(index), 2)
+
+    def test_api_and_incremental_refresh(self):
+        from . import autocomplete
+
+        # カタカナ・ひらがなの違いは1つの語にまとめ、件数の多い表記を出す
+        self.assertEqual(self._suggest('onomatopoeia', 'ザー'), [('ざーざー', 3, None)])
+        self.assertEqual(self._suggest('onomatopoeia', 'ざ'), [('ざあざあ', 1, None), ('ざーざー', 3, None)])
+        self.assertEqual(self._suggest('speaker', 'spk'), [('SPK001', 1, self.speaker.id), ('SPK002', 1, self.other_speaker.id)])
+        self.assertEqual(self._suggest('village', '小'), [('小野津', 1, self.village.id)])
+        self.assertEqual(self.client.get(reverse('autocomplete'), {'source': 'meaning', 'q': 'あ'}).status_code, 400)
+
+        # データが変わらなければDBは読まない
+        with self.assertNumQueries(0):
+            autocomplete.suggest('onomatopoeia', 'ご')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            added = self._create_record('ざーっ')
+        with self.captureOnCommitCallbacks(execute=True):
+            LanguageRecord.objects.filter(onomatopoeia_text='ざあざあ').delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.speaker.speaker_id = 'SPK010'
+            self.speaker.save()
+        # 全件を読み直さず、変更された行と墓標だけを読む
+        with mock.patch('language_archive.autocomplete._load_all') as load_all:
+            self.assertEqual(self._suggest('onomatopoeia', 'ざ'), [('ざーざー', 3, None), ('ざーっ', 1, None)])
+        load_all.assert_not_called()
+        self.assertEqual(self._suggest('speaker', 'spk00'), [('SPK002', 1, self.other_speaker.id)])
+        self.assertEqual(autocomplete.matching_spellings('onomatopoeia', 'ざーっ'), [added.onomatopoeia_text])
+
+    def test_record_list_filters_by_prefix_across_kana(self):
+        response = self.client.get(reverse('record_list'), {'onomatopoeia': 'ザー'})
+        self.assertEqual(sorted(r.onomatopoeia_text for r in response.context['records']), ['ざーざー', 'ざーざー', 'ザーザー'])
+
+    def test_admin_autocomplete_uses_index(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        url = reverse('admin:autocomplete')
+        params = {'app_label': 'language_archive', 'model_name': 'languagerecord', 'field_name': 'speaker'}
+        from . import autocomplete
+
+        with mock.patch('language_archive.autocomplete.suggest', wraps=autocomplete.suggest) as suggest:
+            results = self.client.get(url, {**params, 'term': 'spk002'}).json()['results']
+        self.assertEqual([r['id'] for r in results], [str(self.other_speaker.id)])
+        suggest.assert_called_once()
+        results = self.client.get(url, {**params, 'field_name': 'village', 'term': '志'}).json()['results']
+        self.assertEqual([r['text'] for r in results], ['志戸桶'])
+
+
+class ReferenceDataCacheTests(ArchiveFixtureMixin, TestCase):
+    """アップロード画面・記録一覧が、キャッシュが温まっていれば参照用のテーブル（集落・話者・オノマトペ型）を読まないことを確認する"""
+    REFERENCE_TABLES = ('language_archive_village', 'language_archive_speaker', 'language_archive_onomatopoeiatype')
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.create_fixture()
+
+    def _reference_queries(self, url, **params):
+        self.client.get(url, params)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in queries if any(table in q['sql'] for table in self.REFERENCE_TABLES)]
+
+    def test_warm_pages_do_not_query_reference_tables(self):
+        response, queries = self._reference_queries(reverse('upload_language_record'))
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'SPK001')
+        self.assertContains(response, 'AABB: 反復')
+        self.assertEqual([v['name'] for v in response.context['villages_data']], ['小野津'])
+
+        response, queries = self._reference_queries(reverse('upload_geographic_record'))
+        self.assertEqual(queries, [])
+        self.assertContains(response, '<option value="%d">小野津</option>' % self.village.id, html=True)
+
+        response, queries = self._reference_queries(reverse('upload_language_batch'))
+        self.assertEqual(queries, [])
+
+        # 記録一覧は集落の絞り込み（記録のある集落）だけを読む
+        _, queries = self._reference_queries(reverse('record_list'))
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('onomatopoeiatype', queries[0])
+
+    def test_cache_follows_reference_version(self):
+        from .reference_data import bump_reference_version
+
+        url = reverse('upload_language_record')
+        self.client.get(url)
+        # 他のワーカーでの変更（このプロセスのシグナルは通らない）は、共有の参照用のテーブルのバージョンの更新で読み直す
+        Speaker.objects.filter(id=self.speaker.id).update(speaker_id='SPK099')
+        self.assertNotContains(self.client.get(url), 'SPK099')
+        bump_reference_version()
+        self.assertContains(self.client.get(url), 'SPK099')
+
+        # このプロセスでの保存は、コミットを待たずに反映する
+        Speaker.objects.create(speaker_id='SPK100', age_range='60-69', gender='M', village=self.village)
+        self.assertContains(self.client.get(url), 'SPK100')
+
+    def test_record_writes_keep_the_cache(self):
+        from .data_version import get_data_version
+        from .reference_data import REFERENCE_VERSION_CACHE_KEY
+
+        url = reverse('upload_language_record')
+        self.client.get(url)
+        version, reference_version = get_data_version(), get_data_version(REFERENCE_VERSION_CACHE_KEY)
+        # 記録の保存はアーカイブ全体のデータバージョンを更新するが、参照用のテーブルは読み直さない
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_record()
+        self.assertNotEqual(get_data_version(), version)
+        self.assertEqual(get_data_version(REFERENCE_VERSION_CACHE_KEY), reference_version)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([q for q in queries if any(table in q['sql'] for table in self.REFERENCE_TABLES)])
+
+        # 参照用のテーブルの保存は、コミット後に参照用のテーブルのバージョンを更新して他のワーカーにも伝える
+        with self.captureOnCommitCallbacks(execute=True):
+            self.village.save()
+        self.assertNotEqual(get_data_version(REFERENCE_VERSION_CACHE_KEY), reference_version)
+
+    def test_submitted_choice_is_checked_against_database(self):
+        from .forms import LanguageRecordForm
+
+        self.client.get(reverse('upload_language_record'))
+        Speaker.objects.filter(id=self.speaker.id).delete()
+        form = LanguageRecordForm({'speaker': self.speaker.id, 'youtube_url': 'https://youtu.be/abc', 'title': 't',
+                                   'file_type': 'video', 'recorded_date': '2024-01-01'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('speaker', form.errors)
+
+
+class RecordCardTests(ArchiveFixtureMixin, TestCase):
+    """一覧のカードが保存・削除に追従することと、一覧がカードの表だけを読むことを確認する"""
+
+    def setUp(self):
+        self.create_fixture(type_description='同じ音の繰り返し')
+        self.record = self.create_record(meaning='雨が 強く 降る 様子', file_type='video', file_path='https://example.com/v.mp4')
+
+    def test_card_follows_saves(self):
+        card = RecordCard.objects.get(record=self.record)
+        self.assertEqual(
+            (card.display_title, card.summary, card.video_url, card.thumbnail_url),
+            ('ざーざー', '雨が 強く 降る 様子', 'https://example.com/v.mp4', ''),
+        )
+        self.assertEqual((card.village_name, card.speaker_label, card.type_label), ('小野津', '70-79 / 女性', 'AABB'))
+
+        self.record.thumbnail_path = 'https://example.com/v.jpg'
+        self.record.save()
+        self.village.name = '小野津集落'
+        self.village.save()
+        self.onomatopoeia_type.description = '反復形'
+        self.onomatopoeia_type.save()
+        other = Village.objects.create(name='志戸桶', latitude=28.3, longitude=129.9)
+        self.speaker.gender = 'M'
+        self.speaker.village = other
+        self.speaker.save()
+        card.refresh_from_db()
+        self.assertEqual((card.thumbnail_url, card.video_url, card.type_description), ('https://example.com/v.jpg', '', '反復形'))
+        self.assertEqual((card.village_id, card.village_name, card.speaker_label), (other.id, '志戸桶', '70-79 / 男性'))
+
+        other.delete()
+        self.onomatopoeia_type.delete()
+        card.refresh_from_db()
+        self.assertEqual((card.village_id, card.village_name, card.onomatopoeia_type_id, card.type_label), (None, '', None, ''))
+
+        self.record.delete()
+        self.assertFalse(RecordCard.objects.exists())
+
+    def test_list_views_read_only_cards(self):
+        urls = [
+            reverse('record_list'),
+            reverse('village_records', args=[self.village.id]),
+            reverse('speaker_records', args=[self.speaker.id]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertContains(response, 'ざーざー')
+                self.assertContains(response, 'https://example.com/v.mp4')
+                sql = [q['sql'] for q in queries.captured_queries]
+                self.assertFalse([q for q in sql if 'language_archive_languagerecord' in q])
+                for q in sql:
+                    if 'language_archive_recordcard' in q:
+                        self.assertNotIn('JOIN', q)
+
+        response = self.client.get(reverse('record_list'), {'onomatopoeia_type': 'AABB'})
+        self.assertContains(response, '70-79 / 女性')
+        self.assertContains(response, 'data-tooltip="同じ音の繰り返し"')
+        self.assertNotContains(self.client.get(reverse('record_list'), {'onomatopoeia_type': 'ABAB'}), 'https://example.com/v.mp4')
+
+    def test_rebuild_command(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        # save() を通らない書き込みでずれた・なくなったカードを作り直す
+        LanguageRecord.objects.filter(id=self.record.id).update(onomatopoeia_text='ぱらぱら')
+        call_command('rebuild_record_cards', '--missing', stdout=io.StringIO())
+        self.assertEqual(RecordCard.objects.get().display_title, 'ざーざー')
+        RecordCard.objects.all().delete()
+        call_command('rebuild_record_cards', '--missing', '--chunk-size', '1', stdout=io.StringIO())
+        self.assertEqual(RecordCard.objects.get().display_title, 'ぱらぱら')
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_record_cards', '--chunk-size', '0', stdout=io.StringIO())
+
+
+class GeoSearchTests(ArchiveFixtureMixin, TestCase):
+    """geohash で絞った半径・近い順の検索が全件の距離計算と一致することと、近傍検索API・集落ページを確認する"""
+
+    def setUp(self):
+        import random
+        from .geo import encode
+
+        # 喜界島の周辺（約20km四方）にばらまく。bulk_create は save() を通らないため geohash はここで作る
+        rng = random.Random(0)
+        self.points = []
+        for i in range(300):
+            latitude, longitude = 28.3 + rng.uniform(-0.1, 0.1), 129.95 + rng.uniform(-0.1, 0.1)
+            self.points.append(GeographicRecord(
+                title=f'映像{i}', content_type='drone_video', description='', latitude=latitude, longitude=longitude,
+                geohash=encode(latitude, longitude), captured_date=datetime.date(2024, 1, 1),
+            ))
+        GeographicRecord.objects.bulk_create(self.points)
+        self.onotsu = Village.objects.create(name='小野津', latitude=28.3, longitude=129.95)
+        self.shidooke = Village.objects.create(name='志戸桶', latitude=28.31, longitude=129.95)  # 約1.1km北
+        self.far = Village.objects.create(name='湾', latitude=28.3, longitude=130.05)  # 約10km東
+
+    def test_encode(self):
+        from .geo import encode
+
+        self.assertEqual(encode(42.6, -5.6, 5), 'ezs42')
+        self.assertEqual(encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(self.onotsu.geohash, encode(28.3, 129.95))
+
+        self.onotsu.latitude = 28.2
+        self.onotsu.save(update_fields=['latitude'])
+        self.onotsu.refresh_from_db()
+        self.assertEqual(self.onotsu.geohash, encode(28.2, 129.95))
+
+    def test_pruned_search_matches_full_scan(self):
+        from .geo import nearest, within_radius
+
+        records = GeographicRecord.objects.all()
+        for latitude, longitude in ((28.3, 129.95), (28.37, 129.88), (28.25, 130.02)):
+            for radius in (300, 2000, 7500, 30000):
+                with self.subTest(center=(latitude, longitude), radius=radius):
+                    self.assertEqual(
+                        within_radius(records, latitude, longitude, radius),
+                        within_radius(records, latitude, longitude, radius, prune=False),
+                    )
+            full = within_radius(records, latitude, longitude, 100_000, prune=False)
+            self.assertEqual(nearest(records, latitude, longitude, 7), full[:7])
+        # max_radius_m より遠い行は k 件に満たなくても返さない
+        self.assertEqual(nearest(records, 28.3, 129.95, 5, max_radius_m=100), within_radius(records, 28.3, 129.95, 100, prune=False))
+
+    def test_nearby_api(self):
+        url = reverse('nearby')
+        results = self.client.get(url, {'kind': 'village', 'lat': 28.3, 'lon': 129.95, 'radius': 2000}).json()['results']
+        self.assertEqual([r['name'] for r in results], ['小野津', '志戸桶'])
+        self.assertAlmostEqual(results[1]['distance_m'], 1112, delta=5)
+
+        results = self.client.get(url, {'kind': 'village', 'lat': 28.3, 'lon': 130.04, 'k': 2}).json()['results']
+        self.assertEqual([r['name'] for r in results], ['湾', '小野津'])
+
+        self.create_fixture(village=self.shidooke)
+        record = self.create_record()
+        results = self.client.get(url, {'kind': 'record', 'lat': 28.3, 'lon': 129.95, 'radius': 2000}).json()['results']
+        self.assertEqual([(r['id'], r['village']) for r in results], [(record.id, '志戸桶')])
+
+        results = self.client.get(url, {'lat': 28.3, 'lon': 129.95, 'k': 3}).json()['results']
+        self.assertEqual(len(results), 3)
+        self.assertEqual([r['distance_m'] for r in results], sorted(r['distance_m'] for r in results))
+
+        for params in ({'lat': 'x', 'lon': 1}, {'lat': 95, 'lon': 1}, {'lat': 28, 'lon': 129, 'radius': 0},
+                       {'lat': 28, 'lon': 129, 'k': 500}, {'kind': 'record', 'lat': 28, 'lon': 129, 'k': 3},
+                       {'kind': 'speaker', 'lat': 28, 'lon': 129}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_village_page_includes_nearby(self):
+        self.create_fixture(village=self.shidooke)
+        self.create_record('ぱらぱら')
+        url = reverse('village_records', args=[self.onotsu.id])
+        response = self.client.get(url)
+        self.assertEqual(response.context['paginator'].count, 0)
+        self.assertEqual(len(response.context['nearby_geographic']), 6)
+
+        response = self.client.get(url, {'radius': 2000})
+        self.assertEqual(response.context['paginator'].count, 1)
+        self.assertContains(response, 'ぱらぱら')
+        self.assertEqual([v.name for v in response.context['nearby_villages']], ['志戸桶'])
+
+
+class ReadOnlyApiTests(ArchiveFixtureMixin, TestCase):
+    """読み取り専用APIの fields・include・カーソル・ETag を確認する"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.create_fixture(notes='非公開のメモ')
+        self.records = [
+            self.create_record(
+                f'ざーざー{i}', onomatopoeia_type=self.onomatopoeia_type if i % 2 else None,
+                recorded_date=datetime.date(2024, 1, i + 1),
+            )
+            for i in range(5)
+        ]
+
+    def test_sparse_fields_and_include(self):
+        url = reverse('api_list', args=['records'])
+        with CaptureQueriesContext(connection) as queries:
+            payload = self.client.get(url, {
+                'fields': 'onomatopoeia_text,speaker', 'include': 'speaker,onomatopoeia_type',
+                'fields[speakers]': 'speaker_id',
+            }).json()
+        # 記録1回と、参照先ごとに1回
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(payload['data'][0], {'id': self.records[0].id, 'onomatopoeia_text': 'ざーざー0', 'speaker': self.speaker.id})
+        self.assertEqual(payload['included']['speakers'], [{'id': self.speaker.id, 'speaker_id': 'SPK001'}])
+        self.assertEqual([t['type_code'] for t in payload['included']['onomatopoeia_types']], ['AABB'])
+        self.assertIsNone(payload['cursor'])
+
+        payload = self.client.get(reverse('api_detail', args=['speakers', self.speaker.id])).json()
+        self.assertEqual(payload['data']['village'], self.village.id)
+        self.assertNotIn('notes', payload['data'])
+
+        for params in ({'fields': 'notes,secret'}, {'include': 'village.speaker'}, {'cursor': '!!'}, {'limit': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_list', args=['users'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_detail', args=['records', 0])).status_code, 404)
+
+    def test_cursor_pagination(self):
+        url = reverse('api_list', args=['records'])
+        seen = []
+        payload = self.client.get(url, {'limit': 2, 'fields': 'id'}).json()
+        while True:
+            seen.extend(row['id'] for row in payload['data'])
+            if not payload['cursor']:
+                break
+            self.assertIn('cursor=', payload['next'])
+            payload = self.client.get(payload['next']).json()
+        self.assertEqual(seen, [record.id for record in self.records])
+
+    def test_etag(self):
+        from .data_version import bump_data_version
+
+        url = reverse('api_list', args=['villages'])
+        response = self.client.get(url)
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+        # パラメータが違えば別の ETag、データが変われば取り直す
+        self.assertNotEqual(self.client.get(url, {'fields': 'name'})['ETag'], etag)
+        bump_data_version()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BackfillTests(ArchiveFixtureMixin, TestCase):
+    """バックフィルが範囲ごとに進み具合を保存し、中断・失敗の後に続きから再開することを確認する"""
+
+    def setUp(self):
+        self.create_fixture()
+        self.onotsu = self.village
+        self.shidooke = Village.objects.create(name='志戸桶', latitude=28.32, longitude=129.93)
+        self.records = [self.create_record(f'ざーざー{i}') for i in range(6)]
+        # save() を通らない書き込みでずれた状態を作る
+        LanguageRecord.objects.filter(id__in=[self.records[0].id, self.records[5].id]).update(village=self.shidooke)
+
+    def test_resume_after_interruption_and_failure(self):
+        from .backfill import BACKFILLS, run_backfill
+        from .models import BackfillProgress
+
+        first_id = self.records[0].id
+        state = run_backfill('record_village', chunk_size=2, max_seconds=0)
+        self.assertEqual((state.status, state.last_id, state.chunks), ('running', 0, 0))
+
+        # 2つ目の範囲で失敗させる。1つ目の範囲の書き込みと進み具合は残る
+        backfill = BACKFILLS['record_village']
+        original = backfill.run
+        calls = []
+
+        def failing(start, end):
+            calls.append(start)
+            if len(calls) == 2:
+                raise RuntimeError('接続が切れました')
+            return original(start, end)
+
+        with mock.patch.object(backfill, 'run', failing), self.assertRaises(RuntimeError):
+            run_backfill('record_village', chunk_size=first_id + 1)
+        state = BackfillProgress.objects.get(name='record_village')
+        self.assertEqual((state.status, state.last_id, state.changed), ('failed', first_id + 1, 1))
+        self.assertIn('接続が切れました', state.error)
+        self.assertEqual(LanguageRecord.objects.get(id=self.records[5].id).village, self.shidooke)
+
+        # 続きから最後まで。完了後は --restart なしでは何もしない
+        state = run_backfill('record_village', chunk_size=2)
+        self.assertEqual((state.status, state.last_id, state.changed, state.error), ('done', self.records[-1].id, 2, ''))
+        self.assertEqual(LanguageRecord.objects.get(id=self.records[5].id).village, self.onotsu)
+        self.assertEqual(RecordCard.objects.get(record=self.records[5]).village_name, '小野津')
+        with mock.patch.object(backfill, 'run') as run:
+            run_backfill('record_village')
+        run.assert_not_called()
+        state = run_backfill('record_village', restart=True)
+        self.assertEqual((state.status, state.changed), ('done', 0))
+
+    def test_command(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from .geo import encode
+
+        GeographicRecord.objects.create(
+            title='空撮', content_type='drone_photo', description='', latitude=28.3, longitude=129.9,
+            captured_date=datetime.date(2024, 1, 1),
+        )
+        GeographicRecord.objects.update(geohash='')
+        Village.objects.filter(pk=self.onotsu.pk).update(geohash='x')
+        out = io.StringIO()
+        call_command('backfill', '--all', '--chunk-size', '3', stdout=out)
+        self.assertIn('village_geohash: 完了（更新 1件）', out.getvalue())
+        self.assertIn('geographic_geohash: 完了（更新 1件）', out.getvalue())
+        self.assertEqual(Village.objects.get(pk=self.onotsu.pk).geohash, encode(28.3, 129.9))
+        self.assertEqual(GeographicRecord.objects.get().geohash, encode(28.3, 129.9))
+
+        out = io.StringIO()
+        call_command('backfill', '--list', stdout=out)
+        self.assertIn('record_cards: 一覧のカードを言語記録から作り直す（完了', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('backfill', 'unknown', stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command('backfill', stdout=io.StringIO())
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_EVERY=0, PROFILING_INTERVAL_MS=1)
+class ProfilingTests(TestCase):
+    """指定したリクエストだけをサンプリングプロファイルし、管理画面でフレームグラフを表示することを確認する"""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.staff = User.objects.create(username='staff', is_staff=True, is_superuser=True)
+
+    def test_sampler_and_flame_graph(self):
+        import threading
+        import time
+        from .profiling import Sampler, flame_graph_svg, parse_collapsed
+
+        def busy_wait():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+
+        sampler = Sampler(threading.get_ident(), 0.001, 10)
+        sampler.start()
+        busy_wait()
+        sampler.stop()
+        stacks = parse_collapsed(sampler.collapsed())
+        self.assertGreater(sum(count for _, count in stacks), 10)
+        self.assertTrue(any(stack[-1].startswith('busy_wait (language_archive/tests.py:') for stack, _ in stacks))
+
+        svg = flame_graph_svg('main (a.py:1);<lambda> (b.py:2) 3\nmain (a.py:1) 1')
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertIn('&lt;lambda&gt;', svg)
+        self.assertIn('75.0%', svg)
+
+    def test_triggers_and_admin(self):
+        from .models import RequestProfile
+        from .profiling import TOKEN_HEADER, make_token
+
+        self.client.get(reverse('record_list'), {'profile': '1'})
+        self.client.get(reverse('record_list'), HTTP_X_PROFILE_TOKEN=make_token() + 'x')
+        self.assertFalse(RequestProfile.objects.exists())
+
+        response = self.client.get(reverse('record_list'), headers={TOKEN_HEADER: make_token()})
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile-Id'], profile.request_id)
+        self.assertEqual((profile.trigger, profile.view_name, profile.status), ('token', 'record_list', 200))
+
+        self.client.force_login(self.staff)
+        self.client.get(reverse('map_view'), {'profile': '1'})
+        self.assertEqual(RequestProfile.objects.latest('created_at').trigger, 'staff')
+
+        profile.collapsed = 'record_list (language_archive/views.py:1) 4'
+        profile.flame_graph = '<svg id="flame"></svg>'
+        profile.save()
+        response = self.client.get(reverse('admin:language_archive_requestprofile_change', args=[profile.pk]))
+        self.assertContains(response, '<svg id="flame"></svg>')
+        self.assertContains(response, 'record_list (language_archive/views.py:1) 4')
+
+    def test_async_requests_sample_the_view_thread(self):
+        import time
+        from .models import RequestProfile
+        from .profiling import TOKEN_HEADER, make_token
+        from .views import _record_list_context
+
+        def slow_record_list_context(request):
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+            return _record_list_context(request)
+
+        # AsyncClient ではミドルウェアが非同期で動き、ビューは sync_to_async のスレッドで動く
+        with mock.patch('language_archive.views._record_list_context', slow_record_list_context):
+            response = async_to_sync(self.async_client.get)(reverse('record_list'), headers={TOKEN_HEADER: make_token()})
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile-Id'], profile.request_id)
+        self.assertIn('slow_record_list_context (language_archive/tests.py:', profile.collapsed)
+
+    @override_settings(PROFILING_ENABLED=False, PROFILING_SAMPLE_EVERY=1)
+    def test_disabled_records_nothing(self):
+        from .models import RequestProfile
+        from .profiling import TOKEN_HEADER, make_token
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('record_list'), {'profile': '1'}, headers={TOKEN_HEADER: make_token()})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_EVERY=1, PROFILING_KEEP=2)
+    def test_sampling_keeps_recent_profiles(self):
+        from .models import RequestProfile
+
+        for _ in range(3):
+            self.client.get(reverse('record_list'))
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(set(RequestProfile.objects.values_list('trigger', flat=True)), {'sampled'})
+
+
+class ChunkedUploadTests(ArchiveFixtureMixin, TestCase):
+    """大きなファイルを分割して送り、接続が切れても続きから送れて、完了時にストレージへそのまま渡すことを確認する"""
+
+    def setUp(self):
+        import tempfile
+
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        settings_override = override_settings(CHUNKED_UPLOAD_DIR=spool_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.content = bytes(range(256)) * 40
+
+    def _start(self, target='language', category='audio'):
+        response = self.client.post(reverse('chunked_upload_start'), {
+            'target': target, 'category': category, 'file_name': 'recording.wav', 'size': len(self.content),
+            'content_type': 'audio/wav',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload_id']
+
+    def _put(self, upload_id, offset, data, checksum=None):
+        import hashlib
+
+        return self.client.put(
+            reverse('chunked_upload_detail', args=[upload_id]), data, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(data).hexdigest(),
+        )
+
+    def _send_all(self, upload_id):
+        for offset in range(0, len(self.content), 4096):
+            self.assertEqual(self._put(upload_id, offset, self.content[offset:offset + 4096]).status_code, 200)
+
+    def _finalize(self, upload_id, url='https://storage.example/audio/recording.wav'):
+        received = {}
+
+        def fake_upload(file, bucket_name, file_prefix=''):
+            # メモリ上のデータではなく、スプールファイルを開いたまま渡される
+            received['path'] = file.file.name
+            received['content'] = file.read()
+            received['content_type'] = file.content_type
+            received['prefix'] = file_prefix
+            return url
+
+        with mock.patch('language_archive.chunked_upload.upload_to_supabase', side_effect=fake_upload):
+            response = self.client.post(reverse('chunked_upload_finalize', args=[upload_id]))
+        return response, received
+
+    def _record_form(self, upload_id):
+        """分割アップロードしたファイルで言語記録を登録するフォームの値"""
+        self.create_fixture()
+        return {
+            'onomatopoeia_text': 'ぐるぐる', 'meaning': '回る様子', 'usage_example': '用例', 'file_type': 'audio',
+            'speaker': self.speaker.id, 'onomatopoeia_type': self.onomatopoeia_type.id, 'recorded_date': '2024-02-01',
+            'upload_id': upload_id,
+        }
+
+    def test_resume_after_dropped_connection(self):
+        from .chunked_upload import get_upload, spool_path
+
+        upload_id = self._start()
+        self.assertEqual(self._put(upload_id, 0, self.content[:4096]).json()['offset'], 4096)
+
+        # 応答が届かずに同じ分を送り直しても、二重には書かない
+        self.assertEqual(self._put(upload_id, 0, self.content[:4096]).json()['offset'], 4096)
+        # 先の位置から送ると、受信済みのバイト数を返して拒否する
+        response = self._put(upload_id, 8192, self.content[8192:12288])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4096)
+        # 壊れて届いた分は書かない
+        response = self._put(upload_id, 4096, self.content[4096:8192], checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+
+        # 再開時は受信済みのバイト数を問い合わせて続きから送る
+        offset = self.client.get(reverse('chunked_upload_detail', args=[upload_id])).json()['offset']
+        self.assertEqual(offset, 4096)
+        for offset in range(offset, len(self.content), 4096):
+            self.assertEqual(self._put(upload_id, offset, self.content[offset:offset + 4096]).status_code, 200)
+
+        upload = get_upload(upload_id)
+        self.assertEqual(spool_path(upload).read_bytes(), self.content)
+        self.assertEqual([chunk[0] for chunk in upload.chunks], list(range(0, len(self.content), 4096)))
+
+    def test_finalize_streams_spool_to_storage(self):
+        from .chunked_upload import get_upload, spool_path
+
+        upload_id = self._start()
+        self._put(upload_id, 0, self.content[:4096])
+        response, _ = self._finalize(upload_id)
+        self.assertEqual(response.status_code, 400)
+
+        self._send_all(upload_id)
+        path = spool_path(get_upload(upload_id))
+        with mock.patch('language_archive.chunked_upload.upload_to_supabase', side_effect=RuntimeError('timeout')):
+            response = self.client.post(reverse('chunked_upload_finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, 502)
+        # 失敗してもスプールファイルは残り、完了をもう一度試せる
+        self.assertTrue(path.exists())
+
+        response, received = self._finalize(upload_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['file_url'], 'https://storage.example/audio/recording.wav')
+        self.assertEqual(received['path'], str(path))
+        self.assertEqual(received['content'], self.content)
+        self.assertEqual(received['content_type'], 'audio/wav')
+        self.assertEqual(received['prefix'], 'language/audio/')
+        self.assertFalse(path.exists())
+        self.assertEqual(get_upload(upload_id).status, 'stored')
+
+    def test_upload_form_uses_finished_upload(self):
+        upload_id = self._start()
+        data = self._record_form(upload_id)
+        self._send_all(upload_id)
+        # ストレージに送り終えていないアップロードは使えない
+        response = self.client.post(reverse('upload_language_record'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(LanguageRecord.objects.exists())
+
+        self._finalize(upload_id)
+        response = self.client.post(reverse('upload_language_record'), dict(data, file_type='video'))
+        self.assertContains(response, 'アップロードしたファイルの種類が選択した種類と違います')
+
+        response = self.client.post(reverse('upload_language_record'), data)
+        self.assertRedirects(response, reverse('record_list'), fetch_redirect_response=False)
+        self.assertEqual(LanguageRecord.objects.get().file_path, 'https://storage.example/audio/recording.wav')
+
+        # 別の登録先のフォームでは使えない
+        response = self.client.post(reverse('upload_geographic_record'), {
+            'title': '空撮', 'content_type': 'drone_video', 'upload_id': upload_id,
+        })
+        self.assertContains(response, 'アップロードが完了していません')
+        self.assertFalse(GeographicRecord.objects.exists())
+
+    @mock.patch.dict('os.environ', {'SUPABASE_URL': 'https://storage.example', 'SUPABASE_ANON_KEY': 'key'})
+    def test_storage_gc_keeps_stored_uploads(self):
+        from django.core.management import call_command
+        from .storage_gc import ReferencedKeys, collect_garbage
+
+        url = 'https://storage.example/storage/v1/object/public/audio-files/language/audio/recording.wav'
+        upload_id = self._start()
+        self._send_all(upload_id)
+        self._finalize(upload_id, url=url)
+        # 送り終えてから記録に付けるまでに GC の猶予（24時間）を過ぎても消さない
+        listing = lambda bucket_name: iter([[('language/audio/recording.wav', '2024-01-01T00:00:00.000Z', len(self.content))]])
+        with mock.patch('language_archive.services.list_storage_objects', side_effect=listing), \
+                mock.patch('language_archive.services.delete_from_supabase') as delete:
+            call_command('collect_storage_garbage', '--bucket', 'audio-files', stdout=io.StringIO())
+            # 参照の一覧を作った後に送り終えたアップロードも、削除の直前の確認で除く
+            stats = collect_garbage('audio-files', ReferencedKeys())
+        delete.assert_not_called()
+        self.assertEqual(stats['orphans'], 0)
+
+        response = self.client.post(reverse('upload_language_record'), self._record_form(upload_id))
+        self.assertRedirects(response, reverse('record_list'), fetch_redirect_response=False)
+        self.assertEqual(LanguageRecord.objects.get().file_path, url)
+
+    def test_prune_expired_uploads(self):
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .chunked_upload import spool_path
+        from .models import ChunkedUpload
+
+        stale_id = self._start()
+        fresh_id = self._start()
+        ChunkedUpload.objects.filter(upload_id=stale_id).update(updated_at=timezone.now() - datetime.timedelta(hours=72))
+        stale_path = spool_path(ChunkedUpload.objects.get(upload_id=stale_id))
+
+        call_command('prune_chunked_uploads', stdout=io.StringIO())
+        self.assertFalse(stale_path.exists())
+        self.assertEqual(list(ChunkedUpload.objects.values_list('upload_id', flat=True)), [fresh_id])
+
+
+class StaticExportTests(ArchiveFixtureMixin, TestCase):
+    """公開ページを静的な HTML に書き出し、次回は表示するデータが変わったページだけを書き直すことを確認する"""
+
+    def setUp(self):
+        import tempfile
+
+        output = tempfile.TemporaryDirectory()
+        self.addCleanup(output.cleanup)
+        self.output = output.name
+        self.create_fixture()
+        # 1ページ6件なので2ページになる（新しい順に並び、最も古い記録が2ページ目）
+        self.records = [
+            self.create_record(f'ざーざー{i}', meaning=f'意味{i}', recorded_date=datetime.date(2024, 1, i + 1))
+            for i in range(8)
+        ]
+        GeographicRecord.objects.create(
+            title='空撮', content_type='drone_video', description='', village=self.village, latitude=28.3, longitude=129.9,
+            captured_date=datetime.date(2024, 1, 1), youtube_url='https://youtu.be/abcdefg',
+        )
+
+    def _export(self, **kwargs):
+        from .static_export import export_site, render_page
+
+        with mock.patch('language_archive.static_export.render_page', wraps=render_page) as render:
+            result = export_site(self.output, **kwargs)
+        return result, {call.args[0] for call in render.call_args_list}
+
+    def _read(self, path):
+        with open(f'{self.output}/{path}', encoding='utf-8') as f:
+            return f.read()
+
+    def test_page_urls(self):
+        from .static_export import page_url, static_url
+
+        self.assertEqual(
+            page_url('/records/', {'page': '1', 'village': '', 'phonetic': 'kaɾa', 'onomatopoeia_type': 'AABB', 'file_type': 'audio'}),
+            '/records/?file_type=audio&onomatopoeia_type=AABB',
+        )
+        self.assertEqual(page_url('/village/1/records/', {'radius': '0', 'page': '2'}), '/village/1/records/?page=2')
+        self.assertIsNone(page_url('/records/upload/', {}))
+        self.assertEqual(static_url('/records/?file_type=audio&page=2'), '/records/file_type=audio/page=2/')
+        self.assertEqual(static_url('/'), '/')
+
+    def _exists(self, path):
+        return os.path.exists(f'{self.output}/{path}')
+
+    def test_export_writes_pages(self):
+        import gzip
+        from django.core.management import call_command
+
+        output = io.StringIO()
+        call_command('export_static', self.output, '--workers', '1', stdout=output)
+        self.assertIn('描画', output.getvalue())
+
+        records_page = self._read('records/index.html')
+        self.assertIn('ざーざー7', records_page)
+        # ページ送りのリンクは書き出したパスを指し、? 付きで開かれたときに移すスクリプトが入る
+        self.assertIn('href="/records/page=2/"', records_page)
+        self.assertIn('location.replace', records_page)
+        self.assertIn('ざーざー0', self._read('records/page=2/index.html'))
+        with gzip.open(f'{self.output}/records/index.html.gz', 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), records_page)
+
+        village = self.village.id
+        for path in (
+            'index.html', 'map/index.html', 'map/year=2024/index.html', f'records/{self.records[0].id}/index.html',
+            f'records/file_type=audio/onomatopoeia_type=AABB/page=2/village={village}/index.html',
+            'records/file_type=video/index.html',
+            f'village/{village}/records/index.html', f'village/{village}/records/page=2/radius=2000/index.html',
+            f'speaker/{self.speaker.id}/records/page=2/index.html',
+            'geographic/index.html', f'geographic/content_type=drone_video/village={village}/index.html',
+        ):
+            self.assertTrue(self._exists(path), path)
+        self.assertIn(f'href="/village/{village}/records/radius=2000/"', self._read(f'village/{village}/records/index.html'))
+
+    def test_incremental_export(self):
+        result, rendered = self._export()
+        self.assertEqual(result['rendered'], result['pages'])
+        result, rendered = self._export()
+        self.assertEqual(rendered, set())
+
+        # 2ページ目の記録を編集すると、その記録を表示するページだけを書き直す
+        oldest = self.records[0]
+        oldest.meaning = '編集した意味'
+        oldest.save()
+        result, rendered = self._export()
+        self.assertIn(f'/records/{oldest.id}/', rendered)
+        self.assertIn('/records/?page=2', rendered)
+        self.assertIn(f'/speaker/{self.speaker.id}/records/?page=2', rendered)
+        self.assertNotIn('/records/', rendered)
+        self.assertNotIn(f'/records/{self.records[1].id}/', rendered)
+        self.assertNotIn('/geographic/', rendered)
+        self.assertIn('編集した意味', self._read(f'records/{oldest.id}/index.html'))
+
+        # 削除された記録のページと、件数が減ってなくなったページは消す
+        for record in self.records[:3]:
+            record.delete()
+        result, rendered = self._export()
+        self.assertGreater(result['removed'], 0)
+        self.assertFalse(self._exists(f'records/{oldest.id}'))
+        self.assertFalse(self._exists('records/page=2'))
+        self.assertTrue(self._exists('records/index.html'))
+
+        result, rendered = self._export(full=True)
+        self.assertEqual(result['rendered'], result['pages'])
+
+    def test_max_pages(self):
+        # 上限より深いページは書き出さず、リンクは本サイトに向ける
+        with self.settings(STATIC_EXPORT_ORIGIN='https://archive.example.org'):
+            self._export(max_pages=1)
+        self.assertFalse(self._exists('records/page=2'))
+        records_page = self._read('records/index.html')
+        self.assertIn('href="https://archive.example.org/records/?page=2"', records_page)
+        self.assertNotIn('href="/records/page=2/"', records_page)
+
+        # 上限を変えると、リンクが変わるページも書き直す
+        result, rendered = self._export(max_pages=0)
+        self.assertIn('/records/', rendered)
+        self.assertTrue(self._exists('records/page=2/index.html'))
+        self.assertIn('href="/records/page=2/"', self._read('records/index.html'))
@@ -0,0 +1,308 @@
+# language_archive/tracing.py
+# 処理時間の記録（スパン）。
+# リクエストごとに1つのトレースを作り、ストレージ送信・地図の描画・テンプレートの描画などをスパン（入れ子の区間）で記録する。
+# 現在のスパンは contextvars で持つため、非同期ビューや sync_to_async のスレッドにも引き継がれる。
+# 終わったスパンはバッファにためて別スレッドでエクスポーター（既定は JSON Lines ファイル）に書き出し、
+# show_traces コマンドでリクエストごとのスパンの木と、スパン名ごとのパーセンタイルを確認できる。
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# バッファがこの件数になるか、FLUSH_INTERVAL 秒たったら書き出す
+FLUSH_BATCH = 256
+FLUSH_INTERVAL = 1.0
+# エクスポーターが詰まったときに捨てるまでにためておく最大件数
+MAX_BUFFERED = 10000
+
+_current = contextvars.ContextVar('language_archive_span', default=None)
+
+
+class Span:
+    """記録中の区間。attributes には描画したテンプレート名・送信したバイト数・DBのクエリ数などを入れる"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attributes', 'start_ns', 'duration_ms', 'error', '_started')
+
+    sampled = True
+
+    def __init__(self, name, parent, attributes):
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.duration_ms = None
+        self.error = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def rename(self, name):
+        self.name = name
+
+    def add(self, key, amount):
+        """数値の属性に加算する（DBのクエリ数・時間など）"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+
+    def as_dict(self):
+        return {
+            'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id, 'name': self.name,
+            'start_ns': self.start_ns, 'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes, 'error': self.error,
+        }
+
+
+class _NoopSpan:
+    """記録しないときのスパン（トレースが無効、またはサンプリングで外れたリクエスト）"""
+
+    sampled = False
+
+    def set(self, **attributes):
+        pass
+
+    def rename(self, name):
+        pass
+
+    def add(self, key, amount):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonLinesExporter:
+    """スパンを1行1件の JSON としてファイルに追記する（show_traces が読む形式）"""
+
+    def __init__(self, path=None):
+        self.path = path or settings.TRACING_FILE
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = ''.join(json.dumps(span.as_dict(), ensure_ascii=False, default=str) + '\n' for span in spans)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+
+class OtlpHttpExporter:
+    """OTLP/HTTP（JSON）でコレクター（OpenTelemetry Collector・Jaeger など）に送る"""
+
+    def __init__(self, endpoint=None, service_name='kikai-language-archive'):
+        self.endpoint = (endpoint or settings.TRACING_OTLP_ENDPOINT).rstrip('/') + '/v1/traces'
+        self.service_name = service_name
+
+    def _span(self, span):
+        end_ns = span.start_ns + int(span.duration_ms * 1_000_000)
+        return {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'parentSpanId': span.parent_id or '',
+            'name': span.name,
+            'kind': 2 if span.parent_id is None else 1,
+            'startTimeUnixNano': str(span.start_ns),
+            'endTimeUnixNano': str(end_ns),
+            'attributes': [
+                {'key': key, 'value': {'intValue': str(value)} if isinstance(value, int) and not isinstance(value, bool)
+                 else {'doubleValue': value} if isinstance(value, float) else {'stringValue': str(value)}}
+                for key, value in span.attributes.items()
+            ],
+            'status': {'code': 2, 'message': span.error} if span.error else {'code': 0},
+        }
+
+    def export(self, spans):
+        import requests
+
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+            'scopeSpans': [{'scope': {'name': 'language_archive.tracing'}, 'spans': [self._span(s) for s in spans]}],
+        }]}
+        requests.post(self.endpoint, json=payload, timeout=5).raise_for_status()
+
+
+EXPORTERS = {
+    'jsonl': JsonLinesExporter,
+    'otlp': OtlpHttpExporter,
+}
+
+_exporter = None
+_exporter_loaded = False
+_buffer = []
+_buffer_lock = threading.Lock()
+_flush_event = threading.Event()
+_flusher_pid = None
+
+
+def get_exporter():
+    """settings.TRACING_EXPORTER のエクスポーター（'jsonl'・'otlp'・クラスのドット区切りパス。空なら None）"""
+    global _exporter, _exporter_loaded
+    if not _exporter_loaded:
+        name = settings.TRACING_EXPORTER
+        if not name:
+            _exporter = None
+        elif name in EXPORTERS:
+            _exporter = EXPORTERS[name]()
+        else:
+            from django.utils.module_loading import import_string
+            _exporter = import_string(name)()
+        _exporter_loaded = True
+    return _exporter
+
+
+def reset_exporter():
+    """設定を変えたときに、次のスパンでエクスポーターを作り直す（テスト用）"""
+    global _exporter, _exporter_loaded
+    flush()
+    _exporter, _exporter_loaded = None, False
+
+
+def current_span():
+    """現在のスパン（リクエストの外、またはトレースが無効なら NOOP_SPAN）"""
+    return _current.get() or NOOP_SPAN
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    name の区間を記録する。親のスパンがなければ新しいトレースを始める（TRACING_SAMPLE_RATE でサンプリング）。
+
+        with span('storage.upload', bucket=bucket_name) as s:
+            ...
+            s.set(status=response.status_code)
+    """
+    parent = _current.get()
+    if parent is NOOP_SPAN or get_exporter() is None or (
+        parent is None and random.random() >= settings.TRACING_SAMPLE_RATE
+    ):
+        token = _current.set(NOOP_SPAN)
+        try:
+            yield NOOP_SPAN
+        finally:
+            _current.reset(token)
+        return
+
+    current = Span(name, parent, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        _current.reset(token)
+        current.finish()
+        _enqueue(current)
+
+
+def traced(name):
+    """関数全体を name のスパンで記録するデコレーター（async 関数にも使える）"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _enqueue(finished):
+    global _flusher_pid
+    with _buffer_lock:
+        if len(_buffer) >= MAX_BUFFERED:
+            return
+        _buffer.append(finished)
+        # 書き出しスレッドはプロセスごとに1つ（fork したワーカーには引き継がれないため pid で確かめる）
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_flush_loop, name='tracing-flush', daemon=True).start()
+            atexit.register(flush)
+        if len(_buffer) >= FLUSH_BATCH:
+            _flush_event.set()
+
+
+def _flush_loop():
+    while True:
+        _flush_event.wait(FLUSH_INTERVAL)
+        _flush_event.clear()
+        flush()
+
+
+def flush():
+    """たまっているスパンをエクスポーターに書き出す（失敗したらログに残して捨てる）"""
+    with _buffer_lock:
+        spans = _buffer[:]
+        _buffer.clear()
+    exporter = _exporter
+    if not spans or exporter is None:
+        return
+    try:
+        exporter.export(spans)
+    except Exception as e:
+        logger.warning("スパンを書き出せませんでした (%d件): %s", len(spans), e)
+
+
+def _record_query(execute, sql, params, many, context):
+    """DBの実行時間を、実行したときのスパン（テンプレートの描画中ならテンプレートのスパン）に加算する"""
+    current = _current.get()
+    if current is None or not current.sampled:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current.add('db.queries', 1)
+        current.add('db.ms', round((time.perf_counter() - started) * 1000, 3))
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created シグナルで、新しい接続にクエリ時間の記録を付ける"""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class _TracedTemplate:
+    """描画を template.render のスパンで記録するテンプレート"""
+
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        with span('template.render', template=self.template.origin.template_name):
+            return self.template.render(context, request)
+
+
+class TracedDjangoTemplates(DjangoTemplates):
+    """テンプレートの描画をスパンで記録する DjangoTemplates（settings.TEMPLATES の BACKEND に指定する）"""
+
+    def get_template(self, template_name):
+        return _TracedTemplate(super().get_template(template_name))
+
+    def from_string(self, template_code):
+        return _TracedTemplate(super().from_string(template_code))
@@ -1,15 +1,63 @@
 # language_archive/views.py
 
+import hashlib
+import json
+import re
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import content_disposition_header
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_http_methods
+from django.db.models import Case, When
 from django.db.models.functions import TruncYear
-from .models import LanguageRecord, GeographicRecord, Village, OnomatopoeiaType, Speaker
-from .forms import LanguageRecordForm, GeographicRecordForm
-from .services import upload_to_supabase, get_bucket_name, create_archive_map
+from .models import LanguageRecord, GeographicRecord, RecordCard, Village, Speaker
+from .forms import LanguageRecordForm, GeographicRecordForm, LanguageRecordBatchForm, LanguageRecordBatchItemForm
+from .analytics import latest_analytics
+from .api import API_VERSION, ApiError, get_resource, list_resource
+from .chunked_upload import (
+    OffsetMismatch, UploadError, describe, finalize_upload, get_upload, receive_chunk, start_upload,
+)
+from .autocomplete import SOURCES as AUTOCOMPLETE_SOURCES, matching_spellings, suggest
+from .annotations import WINDOW_LIMIT as SEGMENT_WINDOW_LIMIT, search_token, segments_in_window
+from .data_version import bump_data_version, get_data_version
+from .db_routers import read_replica
+from .fingerprint import schedule_fingerprint
+from .geo import MAX_RADIUS_M, format_distance, nearest, within_radius
+from .packages import CHUNK_SIZE as PACKAGE_CHUNK_SIZE, PACKAGE_BUCKET, current_package, latest_ready_package
+from .phonetic import SEARCH_LIMIT, phonetic_search
+from .record_cards import refresh_cards
+from .reference_data import get_reference_data
+from .tracing import span
+from .sync import (
+    DEFAULT_LIMIT as SYNC_DEFAULT_LIMIT, MAX_LIMIT as SYNC_MAX_LIMIT, ExpiredCursor, InvalidCursor, changes_since,
+)
+from .services import (
+    upload_to_supabase, upload_files_concurrently, get_bucket_name, create_archive_map, open_storage_object,
+)
 
 # 一覧ページの1ページあたりの件数
 PAGINATE_BY = 6
+SIMILAR_RECORDS_SHOWN = 6
+# 集落パッケージのダウンロード再開で受け付ける Range（単一範囲のみ）
+RANGE_PATTERN = re.compile(r'^bytes=\d*-\d*$')
+# 音声記号検索で選べる距離（分節）
+PHONETIC_DISTANCES = (0.0, 0.5, 1.0, 2.0)
+# 書き起こしAPIの既定の時間窓（ミリ秒）
+SEGMENT_WINDOW_MS = 60000
+# 集落ページで選べる「近くの集落の記録も表示する」半径（メートル）と、近くの地理環境データの表示件数・既定の半径
+NEARBY_RADII = (2000, 5000)
+NEARBY_GEOGRAPHIC_SHOWN = 6
+NEARBY_DEFAULT_RADIUS_M = 2000
+# 近傍検索API
+NEARBY_KINDS = ('village', 'geographic', 'record')
+NEARBY_MAX_K = 50
+NEARBY_RECORD_LIMIT = 200
 
 
 def _pagination_query(request):
@@ -18,8 +66,66 @@ def _pagination_query(request):
     q.pop('page', None)
     return q.urlencode()
 
-def index(request):
-    """トップページ"""
+
+def _paginate(request, queryset):
+    """GETパラメータのpageに応じて (paginator, page_obj) を返す（0件の場合 page_obj は None）"""
+    paginator = Paginator(queryset, PAGINATE_BY)
+    page_obj = None
+    if paginator.count > 0:
+        page = request.GET.get('page', 1)
+        try:
+            page_obj = paginator.page(page)
+        except PageNotAnInteger:
+            page_obj = paginator.page(1)
+        except EmptyPage:
+            page_obj = paginator.page(paginator.num_pages)
+    return paginator, page_obj
+
+
+def _phonetic_filter(records, request):
+    """
+    GETパラメータ phonetic（音声記号）があれば、距離 distance 以内の記録に絞り込み、近い順に並べる。
+    距離の計算はプロセス内の BK木 で行い、DBには一致したIDだけを渡す。
+    """
+    query = request.GET.get('phonetic', '').strip()
+    if not query:
+        return records
+    try:
+        distance = float(request.GET.get('distance', 1))
+    except ValueError:
+        distance = 1.0
+    if distance not in PHONETIC_DISTANCES:
+        distance = 1.0
+    with span('phonetic.search', distance=distance) as search_span:
+        ids = [record_id for record_id, _ in phonetic_search(query, distance, limit=SEARCH_LIMIT)]
+        search_span.set(hits=len(ids))
+    if not ids:
+        return records.none()
+    ordering = Case(*[When(pk=record_id, then=position) for position, record_id in enumerate(ids)])
+    return records.filter(pk__in=ids).order_by(ordering)
+
+
+def _onomatopoeia_filter(records, request):
+    """
+    GETパラメータ onomatopoeia があれば、その文字列で始まるオノマトペの記録に絞り込む。
+    カタカナ・ひらがなの違いは入力補完の索引で吸収し、DBには一致した表記だけを渡す（オノマトペの列の索引で引ける）。
+    """
+    query = request.GET.get('onomatopoeia', '').strip()
+    if not query:
+        return records
+    return records.filter(onomatopoeia_text__in=matching_spellings('onomatopoeia', query))
+
+
+def _form_error_messages(request, form):
+    """フォームエラーをメッセージに表示する"""
+    for _, errors in form.errors.items():
+        for error in errors:
+            messages.error(request, f'{error}')
+
+
+# 以下の _xxx_context と _prepare_xxx_record / _save_xxx_record は、同期版のビューと async_views.py の非同期版で共通に使う
+
+def _index_context(request):
     # 統計情報を取得
     total_records = LanguageRecord.objects.count()
     total_villages = Speaker.objects.filter(village__isnull=False).values('village').distinct().count()
@@ -30,26 +136,40 @@ def index(request):
         'speaker', 'onomatopoeia_type'
     ).order_by('-created_at')[:6]
     
-    context = {
+    return {
         'total_records': total_records,
         'total_villages': total_villages,
         'total_speakers': total_speakers,
         'recent_records': recent_records,
     }
-    return render(request, 'language_archive/index.html', context)
 
 
-def map_view(request):
-    """地図ビュー"""
-    geographic_records = GeographicRecord.objects.filter(latitude__isnull=False, longitude__isnull=False)
+@read_replica
+def index(request):
+    """トップページ"""
+    return render(request, 'language_archive/index.html', _index_context(request))
+
+
+def _map_querysets():
+    """地図に表示する (地理環境データ, 話者) のクエリセット（年でのフィルター前）"""
+    geographic_records = GeographicRecord.objects.select_related('village').filter(
+        latitude__isnull=False, longitude__isnull=False
+    )
     speakers = Speaker.objects.select_related('village').filter(village__isnull=False)
+    return geographic_records, speakers
+
+
+def _map_data(request):
+    """地図に表示する (地理環境データのリスト, 話者のリスト, 選べる年, 選択中の年)"""
+    geographic_records, speakers = _map_querysets()
 
     # データベースから存在する年をすべて取得
-    lang_years = LanguageRecord.objects.annotate(year=TruncYear('recorded_date')).values_list('year', flat=True).distinct()
-    geo_years = GeographicRecord.objects.annotate(year=TruncYear('captured_date')).values_list('year', flat=True).distinct()
-    
-    # setを使って重複をなくし、降順にソート
-    all_years = sorted(list(set([y.year for y in lang_years if y] + [y.year for y in geo_years if y])), reverse=True)
+    with span('map.years'):
+        lang_years = LanguageRecord.objects.annotate(year=TruncYear('recorded_date')).values_list('year', flat=True).distinct()
+        geo_years = GeographicRecord.objects.annotate(year=TruncYear('captured_date')).values_list('year', flat=True).distinct()
+
+        # setを使って重複をなくし、降順にソート
+        all_years = sorted(list(set([y.year for y in lang_years if y] + [y.year for y in geo_years if y])), reverse=True)
 
     # フィルター処理
     selected_year = request.GET.get('year')
@@ -58,17 +178,93 @@ def map_view(request):
         speakers_with_records_in_year = LanguageRecord.objects.filter(recorded_date__year=selected_year).values_list('speaker_id', flat=True)
         speakers = speakers.filter(id__in=speakers_with_records_in_year)
 
-    map_html = create_archive_map(
-        geographic_records=geographic_records,
-        speakers=speakers
-    )
+    return list(geographic_records), list(speakers), all_years, selected_year
 
-    context = {
+
+def _map_context(map_html, all_years, selected_year):
+    return {
         'map_html': map_html,
         'all_years': all_years,
         'selected_year': int(selected_year) if selected_year else None,
     }
-    return render(request, 'language_archive/map.html', context)
+
+
+@read_replica
+def map_view(request):
+    """地図ビュー"""
+    geographic_records, speakers, all_years, selected_year = _map_data(request)
+    map_html = create_archive_map(
+        geographic_records=geographic_records,
+        speakers=speakers
+    )
+    return render(request, 'language_archive/map.html', _map_context(map_html, all_years, selected_year))
+
+def _apply_youtube_language_fields(record, form):
+    """YouTube URLで登録する言語記録のフィールドを設定する（言語系項目は未定義にする）"""
+    record.youtube_url = form.cleaned_data.get('youtube_url')
+    record.file_path = None
+    record.title = (form.cleaned_data.get('title') or '').strip() or None
+    record.description = (form.cleaned_data.get('description') or '').strip() or None
+    record.onomatopoeia_text = None
+    record.meaning = None
+    record.usage_example = None
+    record.phonetic_notation = None
+    record.language_frequency = None
+    record.onomatopoeia_type = None
+
+
+def _apply_geographic_location(record, form):
+    """入力された緯度・経度、なければ集落の位置を地理環境データに設定する"""
+    lat = form.cleaned_data.get('latitude')
+    lon = form.cleaned_data.get('longitude')
+    village = form.cleaned_data.get('village')
+
+    if lat and lon:
+        record.latitude = lat
+        record.longitude = lon
+    elif village:
+        record.latitude = village.latitude
+        record.longitude = village.longitude
+
+
+def _upload_context(form):
+    # テンプレートに集落情報を渡す
+    return {'form': form, 'villages_data': get_reference_data().villages_data}
+
+
+def _prepare_language_record(form):
+    """
+    検証済みのフォームから保存前の言語記録を作る。
+    
+    Returns:
+        (言語記録, 登録後のメッセージ, ストレージに送るファイルの (ファイル, バケット名, プレフィックス)。なければ None)
+    """
+    record = form.save(commit=False)
+
+    # YouTube URLが入力されている場合
+    if form.cleaned_data.get('youtube_url'):
+        _apply_youtube_language_fields(record, form)
+        return record, '言語記録をYouTube URLで登録しました。', None
+
+    record.youtube_url = None  # YouTube URLをクリア
+    # ファイルがアップロードされている場合（Supabaseへの送信はビューが行う）
+    file = form.cleaned_data.get('file')
+    if file:
+        file_type = form.cleaned_data['file_type']
+        return record, '言語記録をアップロードしました。', (file, get_bucket_name(file_type), f"language/{file_type}/")
+
+    # 分割アップロードでストレージに送り終えている場合
+    record.file_path = form.cleaned_data['upload_id'].file_url
+    return record, '言語記録をアップロードしました。', None
+
+
+def _save_language_record(record, form):
+    """言語記録と ManyToMany フィールドを1トランザクションで保存し、コミット後の指紋の計算を予約する"""
+    with transaction.atomic():
+        record.save()
+        form.save_m2m()
+        schedule_fingerprint([record])
+
 
 def upload_language_record(request):
     """言語記録のアップロード"""
@@ -76,55 +272,157 @@ def upload_language_record(request):
         form = LanguageRecordForm(request.POST, request.FILES)
         
         if form.is_valid():
-            file = request.FILES.get('file')
-            youtube_url = form.cleaned_data.get('youtube_url')
-            
             try:
-                record = form.save(commit=False)
-                
-                # YouTube URLが入力されている場合
-                if youtube_url:
-                    record.youtube_url = youtube_url
-                    record.file_path = None
-                    record.title = (form.cleaned_data.get('title') or '').strip() or None
-                    record.description = (form.cleaned_data.get('description') or '').strip() or None
-                    record.onomatopoeia_text = None
-                    record.meaning = None
-                    record.usage_example = None
-                    record.phonetic_notation = None
-                    record.language_frequency = None
-                    record.onomatopoeia_type = None
-                    messages.success(request, '言語記録をYouTube URLで登録しました。')
-                
-                # ファイルがアップロードされている場合
-                elif file:
+                record, message, pending = _prepare_language_record(form)
+                if pending:
                     # Supabaseにアップロード
-                    file_type = form.cleaned_data['file_type']
-                    bucket_name = get_bucket_name(file_type)
-                    public_url = upload_to_supabase(file, bucket_name, f"language/{file_type}/")
-                    
-                    record.file_path = public_url
-                    record.youtube_url = None  # YouTube URLをクリア
-                    messages.success(request, '言語記録をアップロードしました。')
-                
-                record.save()
-                form.save_m2m() # ManyToManyフィールドがあれば保存
+                    record.file_path = upload_to_supabase(*pending)
+                _save_language_record(record, form)
+                messages.success(request, message)
                 return redirect('record_list')
                 
             except Exception as e:
                 messages.error(request, f'エラー: {str(e)}')
         else:
-            # フォームエラーを表示
-            for _, errors in form.errors.items():
-                for error in errors:
-                    messages.error(request, f'{error}')
+            _form_error_messages(request, form)
     else:
         form = LanguageRecordForm()
     
-    # テンプレートに集落情報を渡す
-    villages = Village.objects.all().values('id', 'name', 'latitude', 'longitude')
-    context = {'form' : form, 'villages_data': list(villages)}
-    return render(request, 'language_archive/upload_language.html', context)
+    return render(request, 'language_archive/upload_language.html', _upload_context(form))
+
+
+def _process_language_batch(request, form):
+    """
+    一括アップロードの各ファイルを検証・アップロードし、成功した分の言語記録を1トランザクションで登録する。
+    
+    Returns:
+        ファイルごとの結果（file_name, ok, record_id, file_path, error）のリスト
+    """
+    shared = form.cleaned_data
+    speaker = shared['speaker']
+    results = []
+    pending = []
+
+    for index, file in enumerate(shared['files']):
+        result = {'file_name': file.name, 'ok': False, 'record_id': None, 'file_path': None, 'error': None}
+        results.append(result)
+
+        item = LanguageRecordBatchItemForm(request.POST, prefix=f'items-{index}')
+        if not item.is_valid():
+            result['error'] = ' '.join(str(error) for errors in item.errors.values() for error in errors)
+            continue
+        onomatopoeia_type = item.cleaned_data['onomatopoeia_type'] or shared['onomatopoeia_type']
+        if not onomatopoeia_type:
+            result['error'] = 'オノマトペ型を選択してください。'
+            continue
+        file_type = item.cleaned_data['file_type'] or shared['file_type']
+        record = LanguageRecord(
+            onomatopoeia_text=item.cleaned_data['onomatopoeia_text'].strip(),
+            meaning=item.cleaned_data['meaning'].strip(),
+            usage_example=item.cleaned_data['usage_example'].strip(),
+            phonetic_notation=item.cleaned_data['phonetic_notation'].strip() or None,
+            language_frequency=shared['language_frequency'],
+            file_type=file_type,
+            speaker=speaker,
+            onomatopoeia_type=onomatopoeia_type,
+            recorded_date=shared['recorded_date'],
+            notes=shared['notes'],
+        )
+        # bulk_create は save() を通らないため、関連集落はここで合わせる
+        record.sync_village_from_speaker()
+        pending.append((index, file, record))
+
+    # Supabaseへの送信はスレッドプールで並行して行う
+    uploaded = upload_files_concurrently([
+        (index, file, get_bucket_name(record.file_type), f"language/{record.file_type}/")
+        for index, file, record in pending
+    ])
+
+    records = []
+    for index, file, record in pending:
+        url = uploaded[index]
+        if isinstance(url, Exception):
+            results[index]['error'] = f'アップロードエラー: {url}'
+            continue
+        record.file_path = url
+        results[index]['file_path'] = url
+        records.append((index, record))
+
+    # アップロードに成功した分だけをまとめて登録する
+    try:
+        with transaction.atomic():
+            LanguageRecord.objects.bulk_create([record for _, record in records])
+            # bulk_create は post_save を送らないため、一覧のカードとデータバージョンはここで更新する
+            refresh_cards([record.pk for _, record in records])
+            transaction.on_commit(bump_data_version, robust=True)
+            schedule_fingerprint([record for _, record in records])
+    except Exception as e:
+        for index, _ in records:
+            results[index]['error'] = f'登録エラー: {e}（アップロード済みのファイル: {results[index]["file_path"]}）'
+        return results
+
+    for index, record in records:
+        results[index]['ok'] = True
+        results[index]['record_id'] = record.pk
+    return results
+
+
+def upload_language_batch(request):
+    """言語記録の一括アップロード（同じ話者・収録日の複数ファイル）"""
+    results = None
+    if request.method == 'POST':
+        form = LanguageRecordBatchForm(request.POST, request.FILES)
+
+        if form.is_valid():
+            results = _process_language_batch(request, form)
+            succeeded = sum(1 for result in results if result['ok'])
+            failed = len(results) - succeeded
+
+            if 'application/json' in request.headers.get('Accept', ''):
+                return JsonResponse({'succeeded': succeeded, 'failed': failed, 'results': results})
+
+            if succeeded:
+                messages.success(request, f'{succeeded}件の言語記録を登録しました。')
+            if failed:
+                messages.error(request, f'{failed}件のファイルは登録できませんでした。下の結果を確認してください。')
+        else:
+            _form_error_messages(request, form)
+    else:
+        form = LanguageRecordBatchForm()
+
+    context = {'form': form, 'results': results}
+    return render(request, 'language_archive/upload_language_batch.html', context)
+
+
+def _prepare_geographic_record(form):
+    """
+    検証済みのフォームから保存前の地理環境データを作る。
+    
+    Returns:
+        (地理環境データ, 登録後のメッセージ, ストレージに送るファイルの (ファイル, バケット名, プレフィックス)。なければ None)
+    """
+    record = form.save(commit=False)
+
+    # 位置情報処理
+    _apply_geographic_location(record, form)
+
+    # YouTube URLが入力されている場合
+    youtube_url = form.cleaned_data.get('youtube_url')
+    if youtube_url:
+        record.youtube_url = youtube_url
+        record.file_path = None  # ファイルパスをクリア
+        return record, '地理環境データをYouTube URLで登録しました。', None
+
+    record.youtube_url = None  # YouTube URLをクリア
+    # ファイルがアップロードされている場合（Supabaseへの送信はビューが行う）
+    file = form.cleaned_data.get('file')
+    if file:
+        content_type = form.cleaned_data['content_type']
+        return record, '地理環境データをアップロードしました。', (file, get_bucket_name(content_type), f"geographic/{content_type}/")
+
+    # 分割アップロードでストレージに送り終えている場合
+    record.file_path = form.cleaned_data['upload_id'].file_url
+    return record, '地理環境データをアップロードしました。', None
 
 
 def upload_geographic_record(request):
@@ -133,64 +431,86 @@ def upload_geographic_record(request):
         form = GeographicRecordForm(request.POST, request.FILES)
         
         if form.is_valid():
-            file = request.FILES.get('file')
-            youtube_url = form.cleaned_data.get('youtube_url')
-            
             try:
-                record = form.save(commit=False)
-                
-                # 位置情報処理
-                lat = form.cleaned_data.get('latitude')
-                lon = form.cleaned_data.get('longitude')
-                village = form.cleaned_data.get('village')
-
-                if lat and lon:
-                    record.latitude = lat
-                    record.longitude = lon
-                elif village:
-                    record.latitude = village.latitude
-                    record.longitude = village.longitude
-
-                # YouTube URLが入力されている場合
-                if youtube_url:
-                    record.youtube_url = youtube_url
-                    record.file_path = None  # ファイルパスをクリア
-                    messages.success(request, '地理環境データをYouTube URLで登録しました。')
-                
-                # ファイルがアップロードされている場合
-                elif file:
+                record, message, pending = _prepare_geographic_record(form)
+                if pending:
                     # Supabaseにアップロード
-                    content_type = form.cleaned_data['content_type']
-                    bucket_name = get_bucket_name(content_type)
-                    public_url = upload_to_supabase(file, bucket_name, f"geographic/{content_type}/")
-                    
-                    record.file_path = public_url
-                    record.youtube_url = None  # YouTube URLをクリア
-                    messages.success(request, '地理環境データをアップロードしました。')
-                
+                    record.file_path = upload_to_supabase(*pending)
                 record.save()
+                messages.success(request, message)
                 return redirect('geographic_list')
                 
             except Exception as e:
                 messages.error(request, f'エラー: {str(e)}')
         else:
-            # フォームエラーを表示
-            for _, errors in form.errors.items():
-                for error in errors:
-                    messages.error(request, f'{error}')
+            _form_error_messages(request, form)
     else:
         form = GeographicRecordForm()
         
-    # テンプレートに集落情報を渡す
-    villages = Village.objects.all().values('id', 'name', 'latitude', 'longitude')
-    context = {'form': form, 'villages_data': list(villages)}
-    return render(request, 'language_archive/upload_geographic.html', context)
+    return render(request, 'language_archive/upload_geographic.html', _upload_context(form))
 
-def record_list(request):
-    """言語記録一覧"""
-    records = LanguageRecord.objects.select_related(
-        'speaker', 'onomatopoeia_type', 'village'
-    ).all()
+
+@require_http_methods(['POST'])
+def chunked_upload_start(request):
+    """
+    分割アップロードを始める。JSON の target（language / geographic）・category（ファイル種類・コンテンツ種類）・
+    file_name・size・content_type を受け取り、upload_id と1回に送る大きさを返す。
+    """
+    try:
+        params = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'JSON を送信してください。'}, status=400)
+    try:
+        upload = start_upload(
+            params.get('target'), params.get('category'), params.get('file_name'), params.get('size'),
+            params.get('content_type'),
+        )
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(describe(upload), status=201, json_dumps_params={'ensure_ascii': False})
+
+
+@require_http_methods(['GET', 'PUT'])
+def chunked_upload_detail(request, upload_id):
+    """
+    GET: 受信済みのバイト数（接続が切れた後の再開用）。
+    PUT: 本文を Upload-Offset ヘッダーの位置から追記する（X-Chunk-Sha256 ヘッダーがあれば照合する）。
+    開始位置が受信済みのバイト数と合わなければ 409 と受信済みのバイト数を返す。
+    """
+    try:
+        if request.method == 'GET':
+            return JsonResponse(describe(get_upload(upload_id)), json_dumps_params={'ensure_ascii': False})
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Upload-Offset と Content-Length を指定してください。'}, status=400)
+        # request.body は DATA_UPLOAD_MAX_MEMORY_SIZE で制限されメモリに読み込むため、本文はストリームから読む
+        upload = receive_chunk(upload_id, offset, request, length, request.headers.get('X-Chunk-Sha256'))
+    except KeyError:
+        return JsonResponse({'error': 'アップロードが見つかりません。'}, status=404)
+    except OffsetMismatch as e:
+        return JsonResponse({'error': str(e), 'offset': e.expected}, status=409, json_dumps_params={'ensure_ascii': False})
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400, json_dumps_params={'ensure_ascii': False})
+    return JsonResponse(describe(upload), json_dumps_params={'ensure_ascii': False})
+
+
+@require_http_methods(['POST'])
+def chunked_upload_finalize(request, upload_id):
+    """すべて受信したアップロードをストレージに送り、ファイルのURLを返す（フォームには upload_id を送る）"""
+    try:
+        upload = finalize_upload(upload_id)
+    except KeyError:
+        return JsonResponse({'error': 'アップロードが見つかりません。'}, status=404)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400, json_dumps_params={'ensure_ascii': False})
+    except Exception as e:
+        return JsonResponse({'error': f'ストレージに保存できませんでした: {e}'}, status=502, json_dumps_params={'ensure_ascii': False})
+    return JsonResponse(describe(upload), json_dumps_params={'ensure_ascii': False})
+
+def _record_list_context(request):
+    records = RecordCard.objects.all()
     
     # フィルタリング
     village_id = request.GET.get('village')
@@ -198,29 +518,22 @@ def record_list(request):
     onomatopoeia_type_code = request.GET.get('onomatopoeia_type')
     
     if village_id:
-        records = records.filter(speaker__village_id=village_id)
+        records = records.filter(village_id=village_id)
     if file_type:
         records = records.filter(file_type=file_type)
     if onomatopoeia_type_code:
-        records = records.filter(onomatopoeia_type__type_code=onomatopoeia_type_code)
+        records = records.filter(type_label=onomatopoeia_type_code)
+    records = _onomatopoeia_filter(records, request)
+    records = _phonetic_filter(records, request)
     
-    village_ids_with_records = LanguageRecord.objects.filter(speaker__village__isnull=False).values_list('speaker__village_id', flat=True).distinct()
+    village_ids_with_records = RecordCard.objects.filter(village_id__isnull=False).values_list('village_id', flat=True).distinct()
     villages = Village.objects.filter(id__in=village_ids_with_records).order_by('-name')
 
-    onomatopoeia_types = OnomatopoeiaType.objects.all()
+    onomatopoeia_types = get_reference_data().onomatopoeia_types
 
-    paginator = Paginator(records, PAGINATE_BY)
-    page_obj = None
-    if paginator.count > 0:
-        page = request.GET.get('page', 1)
-        try:
-            page_obj = paginator.page(page)
-        except PageNotAnInteger:
-            page_obj = paginator.page(1)
-        except EmptyPage:
-            page_obj = paginator.page(paginator.num_pages)
+    paginator, page_obj = _paginate(request, records)
     
-    context = {
+    return {
         'records': page_obj.object_list if page_obj else [],
         'page_obj': page_obj,
         'paginator': paginator,
@@ -228,20 +541,168 @@ def record_list(request):
         'villages': villages,
         'onomatopoeia_types': onomatopoeia_types,
     }
-    return render(request, 'language_archive/record_list.html', context)
 
 
-def record_detail(request, record_id):
-    """言語記録の詳細"""
+@read_replica
+def record_list(request):
+    """言語記録一覧（一覧のカードの表だけを読む）"""
+    return render(request, 'language_archive/record_list.html', _record_list_context(request))
+
+
+def _similar_links(record):
+    """詳細ページに表示する類似記録（事前計算済みのテーブルを (record, rank) の索引で1回だけ読む）"""
+    return record.similar_links.select_related('similar__village').order_by('rank')[:SIMILAR_RECORDS_SHOWN]
+
+
+def _record_detail_context(request, record_id):
     record = get_object_or_404(
-        LanguageRecord.objects.select_related('speaker', 'onomatopoeia_type'),
+        LanguageRecord.objects.select_related('speaker', 'onomatopoeia_type', 'village'),
         id=record_id
     )
+    similar_links = list(_similar_links(record))
+    annotation_tiers = list(record.annotation_tiers.all())
     
-    context = {'record': record}
-    return render(request, 'language_archive/record_detail.html', context)
+    return {'record': record, 'similar_links': similar_links, 'annotation_tiers': annotation_tiers}
+
+
+@read_replica
+def record_detail(request, record_id):
+    """言語記録の詳細"""
+    return render(request, 'language_archive/record_detail.html', _record_detail_context(request, record_id))
+
+
+@read_replica
+@gzip_page
+def record_segments(request, record_id):
+    """
+    詳細ページの書き起こしAPI。start〜end（ミリ秒）の時間窓と重なる区間だけを返す。
+    tier を指定するとその層だけを返す（複数指定可）。
+    """
+    record = get_object_or_404(LanguageRecord.objects.only('id'), id=record_id)
+    try:
+        start = max(int(request.GET.get('start', 0)), 0)
+        end = int(request.GET.get('end', start + SEGMENT_WINDOW_MS))
+    except ValueError:
+        return JsonResponse({'error': 'start と end はミリ秒の整数で指定してください。'}, status=400)
+    tiers, segments, truncated = segments_in_window(record, start, end, request.GET.getlist('tier') or None)
+    payload = {
+        'record': record.id,
+        'start': start,
+        'end': end,
+        'tiers': [{'name': tier.name, 'segment_count': tier.segment_count} for tier in tiers],
+        'segments': segments,
+        'truncated': truncated,
+        'limit': SEGMENT_WINDOW_LIMIT,
+    }
+    return JsonResponse(payload, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+@read_replica
+def segment_search(request):
+    """書き起こしの語の検索API。語 token を含む区間を、記録の詳細ページへのリンクとともに返す"""
+    token, segments = search_token(request.GET.get('token', ''))
+    results = [
+        {
+            'record': segment.tier.record_id,
+            'url': reverse('record_detail', args=[segment.tier.record_id]),
+            'tier': segment.tier.name,
+            'start_ms': segment.start_ms,
+            'end_ms': segment.end_ms,
+            'text': segment.text,
+        }
+        for segment in segments
+    ]
+    return JsonResponse({'token': token, 'results': results}, json_dumps_params={'ensure_ascii': False})
+
 
+def autocomplete(request):
+    """
+    入力補完API。source（onomatopoeia / speaker / village）の文字列のうち q で始まるものを返す。
+    話者・集落は選択に使う id も返す。索引はプロセス内にあるため、DBは索引の更新時にしか読まない。
+    """
+    source = request.GET.get('source', '')
+    if source not in AUTOCOMPLETE_SOURCES:
+        return JsonResponse({'error': f"source は {', '.join(AUTOCOMPLETE_SOURCES)} のいずれかを指定してください。"}, status=400)
+    try:
+        limit = max(int(request.GET.get('limit', 10)), 1)
+    except ValueError:
+        return JsonResponse({'error': 'limit は整数で指定してください。'}, status=400)
+    with_ids = source != 'onomatopoeia'
+    results = [
+        {'text': text, 'count': count, **({'id': ids[0]} if with_ids and count == 1 else {})}
+        for text, count, ids in suggest(source, request.GET.get('q', ''), limit, with_ids=with_ids)
+    ]
+    return JsonResponse({'source': source, 'results': results}, json_dumps_params={'ensure_ascii': False})
 
+
+@read_replica
+def nearby(request):
+    """
+    近傍検索API。lat・lon から radius（メートル）以内、または近い順に k 件の集落・地理環境データ・言語記録を返す。
+    radius と k を両方指定すると radius 以内で近い順に k 件。言語記録は自身の位置を持たないため関連集落の位置で測り、
+    radius でのみ検索できる（limit 件まで、近い集落・新しい収録日の順）。
+    """
+    kind = request.GET.get('kind', 'geographic')
+    if kind not in NEARBY_KINDS:
+        return JsonResponse({'error': f"kind は {', '.join(NEARBY_KINDS)} のいずれかを指定してください。"}, status=400)
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lon'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'lat と lon を数値で指定してください。'}, status=400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'lat は -90〜90、lon は -180〜180 で指定してください。'}, status=400)
+    try:
+        radius = float(request.GET['radius']) if 'radius' in request.GET else None
+        k = int(request.GET['k']) if 'k' in request.GET else None
+        limit = min(max(int(request.GET.get('limit', NEARBY_RECORD_LIMIT)), 1), NEARBY_RECORD_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'radius・k・limit は数値で指定してください。'}, status=400)
+    if radius is None and k is None:
+        radius = NEARBY_DEFAULT_RADIUS_M
+    if radius is not None and not 0 < radius <= MAX_RADIUS_M:
+        return JsonResponse({'error': f'radius は {MAX_RADIUS_M} メートル以下の正の数で指定してください。'}, status=400)
+    if k is not None and not 1 <= k <= NEARBY_MAX_K:
+        return JsonResponse({'error': f'k は 1〜{NEARBY_MAX_K} で指定してください。'}, status=400)
+    if kind == 'record' and radius is None:
+        return JsonResponse({'error': '言語記録は radius で検索してください。'}, status=400)
+
+    model = GeographicRecord if kind == 'geographic' else Village
+    with span('geo.search', kind=kind, k=k or 0) as search_span:
+        if k is None:
+            found = within_radius(model.objects.all(), latitude, longitude, radius)
+        else:
+            found = nearest(model.objects.all(), latitude, longitude, k, max_radius_m=radius or MAX_RADIUS_M)
+        search_span.set(hits=len(found))
+    objects = model.objects.in_bulk([pk for pk, _ in found])
+
+    if kind == 'village':
+        results = [
+            {'id': village.id, 'name': village.name, 'latitude': village.latitude, 'longitude': village.longitude,
+             'distance_m': round(distance, 1), 'url': reverse('village_records', args=[village.id])}
+            for village, distance in ((objects[pk], distance) for pk, distance in found)
+        ]
+    elif kind == 'geographic':
+        results = [
+            {'id': record.id, 'title': record.title, 'content_type': record.content_type,
+             'latitude': record.latitude, 'longitude': record.longitude, 'distance_m': round(distance, 1),
+             'url': record.youtube_url or record.file_path or ''}
+            for record, distance in ((objects[pk], distance) for pk, distance in found)
+        ]
+    else:
+        distances = dict(found)
+        ranking = Case(*[When(village_id=pk, then=position) for position, (pk, _) in enumerate(found)])
+        cards = RecordCard.objects.filter(village_id__in=distances).order_by(ranking, '-recorded_date', '-record_id')
+        results = [
+            {'id': card.record_id, 'title': card.display_title, 'village': card.village_name,
+             'recorded_date': card.recorded_date.isoformat(), 'distance_m': round(distances[card.village_id], 1),
+             'url': reverse('record_detail', args=[card.record_id])}
+            for card in cards[:limit]
+        ] if found else []
+    return JsonResponse({'kind': kind, 'results': results}, json_dumps_params={'ensure_ascii': False})
+
+
+@read_replica
 def geographic_list(request):
     """地理環境データ一覧"""
     geo_records = GeographicRecord.objects.select_related('village').all()
@@ -258,16 +719,7 @@ def geographic_list(request):
     village_ids_with_records = GeographicRecord.objects.filter(village__isnull=False).values_list('village_id', flat=True).distinct()
     villages = Village.objects.filter(id__in=village_ids_with_records).order_by('-name')
 
-    paginator = Paginator(geo_records, PAGINATE_BY)
-    page_obj = None
-    if paginator.count > 0:
-        page = request.GET.get('page', 1)
-        try:
-            page_obj = paginator.page(page)
-        except PageNotAnInteger:
-            page_obj = paginator.page(1)
-        except EmptyPage:
-            page_obj = paginator.page(paginator.num_pages)
+    paginator, page_obj = _paginate(request, geo_records)
     
     context = {
         'geo_records': page_obj.object_list if page_obj else [],
@@ -279,58 +731,213 @@ def geographic_list(request):
     return render(request, 'language_archive/geographic_list.html', context)
 
 
-def village_records(request, village_id):
-    """特定集落の言語記録一覧"""
+@read_replica
+def analytics(request):
+    """コーパスの集計（build_analytics で事前に計算したスナップショットを表示する）"""
+    snapshot, tables = latest_analytics()
+    context = {'snapshot': snapshot, 'tables': tables}
+    return render(request, 'language_archive/analytics.html', context)
+
+
+@gzip_page
+def sync_changes(request):
+    """
+    端末向けの差分同期API。cursor 以降の変更と削除を JSON で返す（gzip 対応の端末には圧縮して返す）。
+    レプリカの遅延で変更を読み飛ばさないよう、プライマリから読む。
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', SYNC_DEFAULT_LIMIT)), 1), SYNC_MAX_LIMIT)
+    except ValueError:
+        limit = SYNC_DEFAULT_LIMIT
+    try:
+        payload = changes_since(request.GET.get('cursor') or None, limit=limit)
+    except InvalidCursor:
+        return JsonResponse({'error': 'カーソルが正しくありません。'}, status=400)
+    except ExpiredCursor:
+        return JsonResponse({'error': 'カーソルの期限が切れています。カーソルなしで全件を取得し直してください。'}, status=410)
+    return JsonResponse(payload, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+def _api_etag(request, resource, pk=None):
+    """
+    読み取り専用APIの ETag。データバージョンと要求（パス・パラメータ）から作るため、
+    データが変わっていなければ If-None-Match に対して本体を作らず（DBを読まずに）304 を返せる。
+    """
+    request_key = hashlib.sha1(request.get_full_path().encode()).hexdigest()[:16]
+    return f'{API_VERSION}-{get_data_version()}-{request_key}'
+
+
+def _api_response(request, load):
+    try:
+        payload = load()
+    except KeyError:
+        return JsonResponse({'error': '見つかりません。'}, status=404)
+    except ApiError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if payload.get('cursor'):
+        params = request.GET.copy()
+        params['cursor'] = payload['cursor']
+        payload['next'] = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    response = JsonResponse(payload, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+    # キャッシュしてよいが、使う前に ETag で確認する
+    patch_cache_control(response, public=True, max_age=0)
+    return response
+
+
+@read_replica
+@gzip_page
+@condition(etag_func=_api_etag)
+def api_list(request, resource):
+    """
+    読み取り専用APIの一覧（records・geographic・speakers・villages・onomatopoeia_types）。
+    fields・fields[参照先]・include・limit・cursor を受け付ける（api.py）。
+    """
+    return _api_response(request, lambda: list_resource(resource, request.GET))
+
+
+@read_replica
+@gzip_page
+@condition(etag_func=_api_etag)
+def api_detail(request, resource, pk):
+    """読み取り専用APIの1件。fields・include は一覧と同じ"""
+    return _api_response(request, lambda: get_resource(resource, pk, request.GET))
+
+
+def _nearby_radius(request):
+    """GETパラメータ radius（近くの集落の記録も表示する半径）。NEARBY_RADII 以外は 0（この集落のみ）"""
+    try:
+        radius = int(request.GET.get('radius', 0))
+    except ValueError:
+        return 0
+    return radius if radius in NEARBY_RADII else 0
+
+
+def _village_nearby(village, radius):
+    """
+    集落ページの近傍。
+    radius 以内の集落（自身を含む）の ID と、自身以外の集落（近い順、distance_label 付き）、
+    近い順の地理環境データ（distance_label 付き。radius が 0 なら NEARBY_DEFAULT_RADIUS_M 以内）を返す。
+    """
+    village_ids, nearby_villages = [village.id], []
+    if radius:
+        found = within_radius(Village.objects.all(), village.latitude, village.longitude, radius)
+        villages = Village.objects.in_bulk([pk for pk, _ in found])
+        village_ids = list(villages)
+        for pk, distance in found:
+            if pk != village.id:
+                villages[pk].distance_label = format_distance(distance)
+                nearby_villages.append(villages[pk])
+
+    found = nearest(
+        GeographicRecord.objects.all(), village.latitude, village.longitude, NEARBY_GEOGRAPHIC_SHOWN,
+        max_radius_m=radius or NEARBY_DEFAULT_RADIUS_M,
+    )
+    records = GeographicRecord.objects.in_bulk([pk for pk, _ in found])
+    nearby_geographic = []
+    for pk, distance in found:
+        records[pk].distance_label = format_distance(distance)
+        nearby_geographic.append(records[pk])
+    return village_ids, nearby_villages, nearby_geographic
+
+
+def _village_records_context(request, village_id):
     village = get_object_or_404(Village, id=village_id)
-    records = LanguageRecord.objects.filter(speaker__village=village).select_related(
-        'speaker', 'onomatopoeia_type'
-    ).order_by('-recorded_date')
+    radius = _nearby_radius(request)
+    village_ids, nearby_villages, nearby_geographic = _village_nearby(village, radius)
+    records = RecordCard.objects.filter(village_id__in=village_ids) if radius else RecordCard.objects.filter(village_id=village.id)
 
-    paginator = Paginator(records, PAGINATE_BY)
-    page_obj = None
-    if paginator.count > 0:
-        page = request.GET.get('page', 1)
-        try:
-            page_obj = paginator.page(page)
-        except PageNotAnInteger:
-            page_obj = paginator.page(1)
-        except EmptyPage:
-            page_obj = paginator.page(paginator.num_pages)
+    paginator, page_obj = _paginate(request, records)
     
-    context = {
+    return {
         'village': village,
+        'radius': radius,
+        'nearby_radii': NEARBY_RADII,
+        'nearby_villages': nearby_villages,
+        'nearby_geographic': nearby_geographic,
         'records': page_obj.object_list if page_obj else [],
         'page_obj': page_obj,
         'paginator': paginator,
         'pagination_query': _pagination_query(request),
     }
-    return render(request, 'language_archive/village_records.html', context)
 
-def speaker_records(request, speaker_id):
-    """特定話者の言語記録一覧"""
-    speaker = get_object_or_404(Speaker, id=speaker_id)
-    records = LanguageRecord.objects.filter(speaker=speaker).select_related(
-        'onomatopoeia_type'
-    ).order_by('-recorded_date')
 
-    paginator = Paginator(records, PAGINATE_BY)
-    page_obj = None
-    if paginator.count > 0:
-        page = request.GET.get('page', 1)
+@read_replica
+def village_records(request, village_id):
+    """特定集落の言語記録一覧（radius を指定すると近くの集落の記録も含める）"""
+    return render(request, 'language_archive/village_records.html', _village_records_context(request, village_id))
+
+def village_package(request, village_id):
+    """
+    集落のオフライン用パッケージ（ZIP）をダウンロードする。
+    現在のデータのパッケージがまだなければ作成を予約し、以前のパッケージがあればそれを、なければ集落ページに戻る。
+    """
+    village = get_object_or_404(Village, id=village_id)
+    package = current_package(village)
+    if package.status != 'ready':
+        package = latest_ready_package(village)
+        if package is None:
+            messages.info(request, 'この集落のパッケージを準備しています。しばらくしてからもう一度お試しください。')
+            return redirect('village_records', village_id=village.id)
+    return _package_response(request, package)
+
+
+def _package_response(request, package):
+    """
+    ストレージのパッケージをそのまま中継する。Range（ダウンロードの再開）はストレージに転送し、
+    If-Range が別のバージョン（作り直し前）を指していれば全体を返す。
+    """
+    etag = f'"{package.version}"'
+    range_header = request.headers.get('Range', '')
+    if not RANGE_PATTERN.match(range_header) or request.headers.get('If-Range', etag) != etag:
+        range_header = None
+
+    with span('package.open', range=range_header or '') as open_span:
+        upstream = open_storage_object(PACKAGE_BUCKET, package.storage_path, range_header)
+        open_span.set(status=upstream.status_code)
+    if upstream.status_code not in (200, 206):
+        upstream.close()
+        if upstream.status_code == 416:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{package.size}'
+            return response
+        return HttpResponse('パッケージを読み込めませんでした。', status=502)
+
+    def body():
         try:
-            page_obj = paginator.page(page)
-        except PageNotAnInteger:
-            page_obj = paginator.page(1)
-        except EmptyPage:
-            page_obj = paginator.page(paginator.num_pages)
+            yield from upstream.iter_content(PACKAGE_CHUNK_SIZE)
+        finally:
+            upstream.close()
+
+    response = StreamingHttpResponse(body(), status=upstream.status_code, content_type='application/zip')
+    for header in ('Content-Length', 'Content-Range'):
+        if header in upstream.headers:
+            response[header] = upstream.headers[header]
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = content_disposition_header(
+        True, f"kikai-archive-{package.village.name}-{package.built_at:%Y%m%d}.zip",
+    )
+    return response
+
+
+def _speaker_records_context(request, speaker_id):
+    speaker = get_object_or_404(Speaker.objects.select_related('village'), id=speaker_id)
+    records = RecordCard.objects.filter(speaker_id=speaker.id)
+
+    paginator, page_obj = _paginate(request, records)
     
-    context = {
+    return {
         'speaker': speaker,
         'records': page_obj.object_list if page_obj else [],
         'page_obj': page_obj,
         'paginator': paginator,
         'pagination_query': _pagination_query(request),
     }
-    return render(request, 'language_archive/speaker_records.html', context)
+
+
+@read_replica
+def speaker_records(request, speaker_id):
+    """特定話者の言語記録一覧"""
+    return render(request, 'language_archive/speaker_records.html', _speaker_records_context(request, speaker_id))
 
 
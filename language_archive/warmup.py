@@ -0,0 +1,103 @@
+# language_archive/warmup.py
+# ワーカー起動直後のウォームアップ。
+# デプロイ直後の最初のリクエストが、テンプレートのコンパイルや folium の読み込みを肩代わりしないようにする。
+# gunicorn の post_worker_init フック（gunicorn.conf.py）と manage.py warmup から呼ばれる。
+
+import logging
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path(__file__).resolve().parent / 'templates'
+
+
+def _load_url_resolver():
+    """URL設定を読み込む（views・services など、リクエスト処理で使うモジュールの import も済ませる）"""
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+
+def _compile_templates():
+    """アプリのテンプレートをすべてコンパイルしてテンプレートローダーのキャッシュに載せる"""
+    from django.template.loader import get_template
+    for path in sorted(TEMPLATE_DIR.rglob('*.html')):
+        get_template(path.relative_to(TEMPLATE_DIR).as_posix())
+
+
+def _prime_reference_data():
+    """
+    参照データのキャッシュを温める（ContentType はadmin・権限チェックで毎回参照される。
+    集落・話者・オノマトペ型はアップロード画面・記録一覧で使う）
+    """
+    from django.apps import apps
+    from django.contrib.contenttypes.models import ContentType
+
+    from .reference_data import get_reference_data
+    ContentType.objects.get_for_models(*apps.get_app_config('language_archive').get_models())
+    get_reference_data()
+
+
+def _render_default_map():
+    """年フィルターなしの地図を一度描画する（folium の import とテンプレートのコンパイルを済ませる）"""
+    from .services import create_archive_map
+    from .views import _map_querysets
+    geographic_records, speakers = _map_querysets()
+    create_archive_map(geographic_records=geographic_records, speakers=speakers)
+
+
+def _build_phonetic_index_in_thread():
+    from django.db import connections
+
+    from .phonetic import get_phonetic_index
+    try:
+        get_phonetic_index()
+    except Exception as e:
+        logger.warning("ウォームアップ失敗 (phonetic_index): %s", e)
+    finally:
+        # このスレッドで開いた接続を閉じる
+        connections.close_all()
+
+
+def _build_phonetic_index():
+    """
+    音声記号検索の索引を別スレッドで作り始める（最初の検索が作成を待たないようにする）。
+    10万件で20秒ほどかかるため、post_worker_init の中で待つと gunicorn のタイムアウトでワーカーが止められる。
+    """
+    threading.Thread(target=_build_phonetic_index_in_thread, name='phonetic-index-warmup', daemon=True).start()
+
+
+WARMUP_STEPS = [
+    ('urls', _load_url_resolver),
+    ('templates', _compile_templates),
+    ('reference_data', _prime_reference_data),
+    ('default_map', _render_default_map),
+    ('phonetic_index', _build_phonetic_index),
+]
+
+
+def warm_up():
+    """
+    ウォームアップの各ステップを実行する。
+    失敗したステップはログに記録して次に進む（ワーカーの起動は止めない）。
+
+    Returns:
+        (ステップ名, 所要時間[ms], エラー or None) のリスト
+    """
+    from django.db import connections
+
+    results = []
+    for name, step in WARMUP_STEPS:
+        started = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as e:
+            error = e
+            logger.warning("ウォームアップ失敗 (%s): %s", name, e)
+        results.append((name, (time.perf_counter() - started) * 1000, error))
+
+    # ウォームアップで開いた接続をリクエスト処理に持ち越さない
+    connections.close_all()
+    return results